@@ -206,6 +206,8 @@ class GangaRepository(object):
         if 'id' in obj._schema.allItemNames():
             obj.setSchemaAttribute('id', this_id)  # Don't set the object as dirty
         obj._setRegistry(self.registry)
+        if self.registry is not None:
+            self.registry._markIndexStale(this_id)
 
     def _internal_del__(self, id):
         """ Internal function for repository classes to (logically) delete items to the repository.
@@ -217,6 +219,8 @@ class GangaRepository(object):
         else:
             self.objects[id]._setRegistry(None)
             del self.objects[id]
+        if self.registry is not None:
+            self.registry._markIndexStale(id)
 
 
 class GangaRepositoryTransient(object):
@@ -1,182 +1,577 @@
-
 # Note: Following stuff must be considered in a GangaRepository:
 #
 # * lazy loading
 # * locking
+#
+# Objects are stored as XML (see VStreamer) in an SQLite database in WAL mode.
+# The index cache and the most commonly queried attributes are kept in their own
+# columns so that the index can be read and simple queries answered without parsing
+# any XML. Subjobs are stored in their own table keyed by the id of their master.
 
-from .GangaRepository import GangaRepository, RepositoryError
+from GangaCore.Core.GangaRepository import GangaRepository, RepositoryError, InaccessibleObjectError
 import os
 import os.path
+import time
+import threading
+from contextlib import contextmanager
+from io import StringIO
 
 import sqlite3
 
-try:
-    import pickle as pickle
-except:
-    import pickle
+import pickle
+
+from GangaCore.Core.GangaRepository.SessionLock import SessionLockManager, dry_run_unix_locks
+from GangaCore.Core.GangaRepository.FixedLock import FixedLockManager
+from GangaCore.Core.GangaRepository.VStreamer import to_file as xml_to_file
+from GangaCore.Core.GangaRepository.VStreamer import from_file as xml_from_file
+from GangaCore.Core.GangaRepository.VStreamer import EmptyGangaObject
+from GangaCore.Core.GangaRepository.SubJobXMLList import SubJobSQLiteList
+from GangaCore.GPIDev.Base.Objects import GangaObject, Node
+from GangaCore.GPIDev.Base.Proxy import isType, stripProxy, getName
+from GangaCore.GPIDev.Lib.GangaList.GangaList import makeGangaListByRef
+from GangaCore.Utility.Config import getConfig
+from GangaCore.Utility.Plugin import PluginManagerError
 
 import GangaCore.Utility.logging
 logger = GangaCore.Utility.logging.getLogger()
 
+# Attributes which are stored in their own, indexed, columns
+_indexed_columns = ('status', 'backend', 'application', 'name')
+
+_schema_statements = [
+    "CREATE TABLE IF NOT EXISTS objects (id INTEGER PRIMARY KEY, classname TEXT, category TEXT, "
+    "status TEXT, backend TEXT, application TEXT, name TEXT, idx BLOB, data TEXT, modified REAL)",
+    "CREATE INDEX IF NOT EXISTS objects_status ON objects (status)",
+    "CREATE INDEX IF NOT EXISTS objects_backend ON objects (backend)",
+    "CREATE INDEX IF NOT EXISTS objects_application ON objects (application)",
+    "CREATE INDEX IF NOT EXISTS objects_name ON objects (name)",
+    "CREATE TABLE IF NOT EXISTS subjobs (master_id INTEGER NOT NULL, id INTEGER NOT NULL, classname TEXT, category TEXT, "
+    "status TEXT, backend TEXT, application TEXT, name TEXT, idx BLOB, data TEXT, PRIMARY KEY (master_id, id))",
+    "CREATE INDEX IF NOT EXISTS subjobs_status ON subjobs (master_id, status)",
+]
+
+
+class SQLiteConnectionPool(object):
+
+    """A bounded pool of connections to one SQLite database shared by all threads using a repository"""
+
+    def __init__(self, filename, size):
+        """
+        Args:
+            filename (str): path of the database file
+            size (int): maximum number of connections which are open at the same time
+        """
+        self.filename = filename
+        self.size = max(1, size)
+        self._idle = []
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        """Open a new connection with the settings used by the repository"""
+        con = sqlite3.connect(self.filename, timeout=60, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection from the pool, waiting for one to be returned if all of them are in use"""
+        con = None
+        with self._cond:
+            while not self._idle and self._count >= self.size:
+                self._cond.wait()
+            if self._idle:
+                con = self._idle.pop()
+            else:
+                self._count += 1
+        if con is None:
+            try:
+                con = self._connect()
+            except Exception:
+                with self._cond:
+                    self._count -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield con
+        finally:
+            with self._cond:
+                self._idle.append(con)
+                self._cond.notify()
+
+    def close(self):
+        """Close all of the connections which aren't in use"""
+        with self._cond:
+            for con in self._idle:
+                con.close()
+            self._count -= len(self._idle)
+            self._idle = []
+
 
 class GangaRepositorySQLite(GangaRepository):
 
     """GangaRepository SQLite"""
 
-    def startup(self):
-        """ Starts an repository and reads in a directory structure."""
-        self._load_timestamp = {}
+    def __init__(self, registry):
+        """
+        Initialize a Repository from within a Registry and keep a reference to the Registry which 'owns' it
+        Args:
+            registry (Registry): This is the registry which manages this Repo
+        """
+        super(GangaRepositorySQLite, self).__init__(registry)
+        self.sub_split = "subjobs"
+        self.root = os.path.join(self.registry.location, "1.0", self.registry.name)
+        self.lockroot = os.path.join(self.registry.location, "1.0")
+        self.dbfile = os.path.join(self.root, "database.db")
+        self._pool = None
+        self._fully_loaded = {}
         self._cache_load_timestamp = {}
+        self.known_bad_ids = []
+
+    def startup(self):
+        """ Starts a repository and connects to the database.
+        Raise RepositoryError"""
         self._fully_loaded = {}
+        self._cache_load_timestamp = {}
         self.known_bad_ids = []
-        self.root = os.path.join(
-            self.registry.location, "0.1", self.registry.name)
         try:
             os.makedirs(self.root)
         except OSError as x:
-            pass
-        self.con = sqlite3.connect(os.path.join(self.root, "database.db"))
-        logger.debug("Connected to ", os.path.join(self.root, "database.db"))
-        self.cur = self.con.cursor()
-        tables = self.cur.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' and name LIKE 'objects'")
-        if len(self.cur.fetchall()) == 0:
-            self.cur.execute(
-                "CREATE TABLE objects (id INTEGER PRIMARY KEY, classname VARCHAR(30), category VARCHAR(20), idx VARCHAR(100), data VARCHAR(1000))")
-        self.con.commit()
-        self.update_index(verbose=True)
+            if not os.path.isdir(self.root):
+                raise RepositoryError(self, "OSError on directory create: %s" % x)
+
+        if getConfig('Configuration')['lockingStrategy'] == "UNIX":
+            try:
+                dry_run_unix_locks(self.lockroot)
+            except Exception as err:
+                logger.error("Error: %s" % err)
+                msg = "\n\nUnable to launch due to underlying filesystem not working with unix locks."
+                msg += "Please try launching again with [Configuration]lockingStrategy=FIXED to start Ganga without multiple session support."
+                raise RepositoryError(self, msg)
+            self.sessionlock = SessionLockManager(self, self.lockroot, self.registry.name)
+        elif getConfig('Configuration')['lockingStrategy'] == "FIXED":
+            self.sessionlock = FixedLockManager(self, self.lockroot, self.registry.name)
+        else:
+            raise RepositoryError(self, "Unable to launch due to unknown file-locking Strategy: \"%s\"" % getConfig('Configuration')['lockingStrategy'])
+        self.sessionlock.startup()
+
+        self._pool = SQLiteConnectionPool(self.dbfile, getConfig('Registry')['SQLiteConnections'])
+        try:
+            with self._pool.connection() as con, con:
+                for statement in _schema_statements:
+                    con.execute(statement)
+        except sqlite3.Error as err:
+            raise RepositoryError(self, "Error setting up the database '%s': %s" % (self.dbfile, err))
+        logger.debug("Connected to %s" % self.dbfile)
+
+        self.update_index(None, True, True)
 
     def shutdown(self):
         """Shutdown the repository. Flushing is done by the Registry
         Raise RepositoryError"""
-        self.cur.close()
-        self.con.close()
+        logger.debug("Shutting Down GangaRepositorySQLite: %s" % self.registry.name)
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self.sessionlock.shutdown()
 
-    def update_index(self, id=None, verbose=False):
-        """ Update the list of available objects
-        Raise RepositoryError"""
-        # First locate and load the index files
+    def updateLocksNow(self):
+        """
+        Trigger the session locks to all be updated now
+        """
+        self.sessionlock.updateNow()
+
+    def _execute(self, query, params=()):
+        """Run a read only query and return all of the rows
+        Raise RepositoryError
+        Args:
+            query (str): the SQL query
+            params (tuple): the parameters of the query
+        """
+        try:
+            with self._pool.connection() as con:
+                return con.execute(query, params).fetchall()
+        except sqlite3.Error as err:
+            raise RepositoryError(self, "Error reading from the database '%s': %s" % (self.dbfile, err))
+
+    def update_index(self, this_id=None, verbose=False, firstRun=False):
+        """ Update the list of available objects from the index columns of the database
+        Only the index cache is read, the objects themselves are loaded when they are accessed
+        Returns a list of ids of objects that changed/removed/added
+        Raise RepositoryError
+        Args:
+            this_id (int): This is the id we want to explicitly check the index for, None for all objects
+            verbose (bool): Should we be verbose
+            firstRun (bool): Is this the call from startup
+        """
         logger.debug("updating index...")
-        self.cur.execute("SELECT id,classname,category,idx FROM objects")
-        for e in self.cur:
-            id = int(e[0])
-            if e[1] is None:  # deleted object
+        query = "SELECT id, classname, category, idx, modified FROM objects WHERE data IS NOT NULL"
+        params = ()
+        if this_id is not None:
+            query += " AND id = ?"
+            params = (this_id,)
+        rows = self._execute(query, params)
+
+        changed_ids = []
+        deleted_ids = set(self.objects.keys()) if this_id is None else set([this_id]) & set(self.objects.keys())
+        summary = []
+        locked_ids = self.sessionlock.locked
+
+        for _id, classname, category, idx, modified in rows:
+            deleted_ids.discard(_id)
+            if _id >= self.sessionlock.count:
+                self.sessionlock.count = _id + 1
+            # Locked IDs can be ignored, skip corrupt IDs
+            if _id in locked_ids or _id in self.incomplete_objects:
                 continue
-            # Locked IDs can be ignored
-            # if id in self.sessionlock.locked:
-            #    continue
-            # Now we treat unlocked IDs
-            if id in self.objects:
-                obj = self.objects[id]
-            else:
-                obj = self._make_empty_object_(id, e[2], e[1])
-            obj._index_cache = pickle.loads(e[3])
+            if _id in self.objects and self._cache_load_timestamp.get(_id) == modified:
+                continue
+            try:
+                if _id in self.objects:
+                    obj = self.objects[_id]
+                else:
+                    obj = self._make_empty_object_(_id, category, classname)
+                obj._index_cache = pickle.loads(idx) if idx is not None else {}
+            except PluginManagerError as err:
+                logger.debug("PluginManagerError: Failed to load index %i: %s" % (_id, err))
+                summary.append((_id, err))
+                continue
+            except Exception as err:
+                logger.debug("Failed to load index %i: %s" % (_id, err))
+                summary.append((_id, err))
+                continue
+            self._cache_load_timestamp[_id] = modified
+            changed_ids.append(_id)
+
+        # Objects which have been added in this session but not flushed yet aren't deleted
+        for _id in deleted_ids:
+            if _id in locked_ids:
+                continue
+            self._internal_del__(_id)
+            self._fully_loaded.pop(_id, None)
+            changed_ids.append(_id)
+
+        for _id, err in summary:
+            if _id in self.known_bad_ids:
+                continue
+            self.known_bad_ids.append(_id)
+            if _id not in self.incomplete_objects:
+                self.incomplete_objects.append(_id)
+            logger.error("Registry '%s': Failed to load index of id %s due to '%s': %s" % (self.registry.name, _id, getName(err), err))
+
         logger.debug("updated index done")
+        return changed_ids
 
-    def constructDataDict(self, obj):
-        data_dict = {}
-        for attr_name, attr in obj._schema.allItems():
-            if not attr['getter']:
-                data_dict[attr_name] = getattr(obj, attr_name)
-        return data_dict
+    def _columns(self, obj):
+        """Return the values of the indexed columns for this object
+        Args:
+            obj (GangaObject): the object which is being stored
+        """
+        values = []
+        for attr in _indexed_columns:
+            value = None
+            if obj._schema.hasAttribute(attr):
+                value = getattr(obj, attr)
+                if isinstance(value, GangaObject):
+                    value = getName(value)
+                elif not isinstance(value, str):
+                    value = None
+            values.append(value)
+        return tuple(values)
+
+    def _to_xml(self, obj, ignore_subs=''):
+        """Return the XML representation of this object
+        Args:
+            obj (GangaObject): the object to be written
+            ignore_subs (str): the name of the attribute of obj not to write
+        """
+        sio = StringIO()
+        xml_to_file(obj, sio, ignore_subs)
+        return sio.getvalue()
 
     def add(self, objs, force_ids=None):
         """ Add the given objects to the repository, forcing the IDs if told to.
-        Raise RepositoryError"""
-        ids = []
-        # assume the ids are already locked by Registry
-        if not force_ids is None:
+        The data of the objects is written when they are flushed
+        Raise RepositoryError
+        Args:
+            objs (list): GangaObject-s which we want to add to the Repo
+            force_ids (list, None): IDs to assign to object, None for auto-assign
+        """
+        if force_ids not in [None, []]:  # assume the ids are already locked by Registry
             if not len(objs) == len(force_ids):
-                raise RepositoryError(
-                    self, "Internal Error: add with different number of objects and force_ids!")
+                raise RepositoryError(self, "Internal Error: add with different number of objects and force_ids!")
             ids = force_ids
+        else:
+            ids = self.sessionlock.make_new_ids(len(objs))
+
+        try:
+            with self._pool.connection() as con, con:
+                for i in range(0, len(objs)):
+                    con.execute("INSERT OR REPLACE INTO objects (id, classname, category) VALUES (?, ?, ?)",
+                                (ids[i], getName(objs[i]), objs[i]._category))
+                    con.execute("DELETE FROM subjobs WHERE master_id = ?", (ids[i],))
+        except sqlite3.Error as err:
+            raise RepositoryError(self, "Error adding objects to the database '%s': %s" % (self.dbfile, err))
+
         for i in range(0, len(objs)):
-            cls = objs[i]._name
-            cat = objs[i]._category
-            objs[i]._index_cache = self.registry.getIndexCache(objs[i])
-            data = pickle.dumps(self.constructDataDict(obj)).replace("'", "''")
-            idx = pickle.dumps(objs[i]._index_cache).replace("'", "''")
-            if force_ids is None:
-                self.cur.execute("INSERT INTO objects (id,classname,category,idx,data) VALUES (NULL,'%s','%s','%s','%s')" % (
-                    cls, cat, idx, data))
-            else:
-                self.cur.execute("INSERT INTO objects (id,classname,category,idx,data) VALUES (%i,'%s','%s','%s','%s')" % (
-                    force_ids[i], cls, cat, idx, data))
-            ids.append(self.cur.lastrowid)
             self._internal_setitem__(ids[i], objs[i])
-        self.con.commit()
+
+            # Set subjobs dirty - they will not be flushed if they are not.
+            if self.sub_split and hasattr(objs[i], self.sub_split):
+                try:
+                    for sj in getattr(objs[i], self.sub_split):
+                        stripProxy(sj)._dirty = True
+                except (AttributeError, TypeError) as err:
+                    logger.debug("RepoSQLite add Exception: %s" % err)
+
         return ids
 
     def flush(self, ids):
-        for id in ids:
-            obj = self.objects[id]
-            if obj._name != "EmptyGangaObject":
-                obj._index_cache = self.registry.getIndexCache(obj)
-                data = pickle.dumps(self.constructDataDict(obj)).replace("'", "''")
-                idx = pickle.dumps(obj._index_cache).replace("'", "''")
-                self.cur.execute(
-                    "UPDATE objects SET idx='%s',data='%s' WHERE id=%s" % (idx, data, id))
-                # print "flushing id ", id, " backend ", obj.backend._name
-        self.con.commit()
+        """
+        Write the objects with these ids and their dirty subjobs to the database
+        Raise RepositoryError
+        Args:
+            ids (list): List of integers, used as keys to objects in the self.objects dict
+        """
+        from GangaCore.Core.GangaRepository.GangaRepositoryXML import check_app_hash
 
-    def load(self, ids):
-        self.cur.execute("SELECT id,classname,category,data FROM objects WHERE id IN (%s)" % (
-            ",".join(map(str, ids))))
-        for e in self.cur:
-            # print "load: ",e
-            _id = int(e[0])
-            if e[1] is None:  # deleted object
+        logger.debug("Flushing: %s" % ids)
+        for this_id in ids:
+            if this_id in self.incomplete_objects:
+                logger.debug("Should NEVER re-flush an incomplete object, it's now 'bad' respect this!")
                 continue
-            if not _id in self.objects:
-                obj = self._make_empty_object_(_id, e[2], e[1])
+            obj = self.objects[this_id]
+            if isType(obj, EmptyGangaObject):
+                raise RepositoryError(self, "Cannot flush an Empty object for ID: %s" % this_id)
+
+            check_app_hash(obj)
+            modified = time.time()
+            idx = pickle.dumps(self.registry.getIndexCache(obj))
+            row = (this_id, getName(obj), obj._category) + self._columns(obj) + (idx, self._to_xml(obj, self.sub_split), modified)
+
+            sj_rows = []
+            subjobs = []
+            num_subjobs = 0
+            if obj._schema.hasAttribute(self.sub_split):
+                all_subjobs = getattr(obj, self.sub_split) or []
+                num_subjobs = len(all_subjobs)
+                if isType(all_subjobs, SubJobSQLiteList):
+                    # The subjobs which haven't been loaded haven't changed either
+                    indices = sorted(all_subjobs._cachedJobs)
+                    subjobs = [all_subjobs._cachedJobs[index] for index in indices]
+                else:
+                    indices = range(num_subjobs)
+                    subjobs = [stripProxy(sj) for sj in all_subjobs]
+                for index, sj in zip(indices, subjobs):
+                    if not sj._dirty:
+                        continue
+                    check_app_hash(sj)
+                    sj_idx = pickle.dumps(self.registry.getIndexCache(sj))
+                    sj_rows.append((this_id, index, getName(sj), sj._category) + self._columns(sj) + (sj_idx, self._to_xml(sj)))
+
+            try:
+                with self._pool.connection() as con, con:
+                    con.execute("INSERT OR REPLACE INTO objects (id, classname, category, status, backend, application, name, idx, data, modified) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+                    con.executemany("INSERT OR REPLACE INTO subjobs (master_id, id, classname, category, status, backend, application, name, idx, data) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", sj_rows)
+                    # clean subjobs which have gone away
+                    con.execute("DELETE FROM subjobs WHERE master_id = ? AND id >= ?", (this_id, num_subjobs))
+            except sqlite3.Error as err:
+                raise RepositoryError(self, "Error of type: %s on flushing id '%s': %s" % (type(err), this_id, err))
+
+            self._cache_load_timestamp[this_id] = modified
+            if this_id not in self._fully_loaded:
+                self._fully_loaded[this_id] = obj
+            for sj in subjobs:
+                sj._setFlushed()
+            obj._setFlushed()
+
+    def _parse_object(self, this_id, data):
+        """Return the object read from this XML, raise InaccessibleObjectError if it couldn't be read correctly
+        Args:
+            this_id (int): id of the object (or its master) for error reporting
+            data (str): the XML stored in the database
+        """
+        tmpobj, errs = xml_from_file(StringIO(data))
+        if len(errs) > 0:
+            logger.error("#%s Error(s) Loading object: %s" % (len(errs), this_id))
+            for err in errs:
+                logger.error("err: %s" % err)
+            raise InaccessibleObjectError(self, this_id, errs[0])
+        return tmpobj
+
+    def load(self, ids):
+        """
+        Load the objects with these ids and their subjobs from the database
+        Raise KeyError
+        Raise RepositoryError
+        Args:
+            ids (list): The object keys which we want to iterate over from the objects dict
+        """
+        logger.debug("Loading Repo object(s): %s" % ids)
+
+        for this_id in ids:
+
+            if this_id in self.incomplete_objects:
+                raise RepositoryError(self, "Trying to re-load a corrupt repository id: %s" % this_id)
+
+            rows = self._execute("SELECT data, modified FROM objects WHERE id = ?", (this_id,))
+            if not rows or rows[0][0] is None:
+                if this_id in self.objects and this_id not in self.sessionlock.locked:
+                    self._internal_del__(this_id)
+                raise KeyError(this_id)
+            data, modified = rows[0]
+            # Only the index of the subjobs is read here, SubJobSQLiteList parses each of them when it is first accessed
+            sj_rows = self._execute("SELECT id, idx FROM subjobs WHERE master_id = ? ORDER BY id", (this_id,))
+
+            try:
+                tmpobj = self._parse_object(this_id, data)
+            except Exception as err:
+                logger.error("Adding id: %s to Corrupt IDs will not attempt to re-load this session" % this_id)
+                self.incomplete_objects.append(this_id)
+                if isinstance(err, InaccessibleObjectError):
+                    raise
+                raise InaccessibleObjectError(self, this_id, err)
+
+            if this_id in self.objects:
+                obj = self.objects[this_id]
+                # Keep the object at this_id the same object in memory but replace its schema content
+                for key, val in tmpobj._data.items():
+                    obj.setSchemaAttribute(key, val)
+                for attr_name, attr_val in obj._schema.allItems():
+                    if attr_name not in tmpobj._data:
+                        obj.setSchemaAttribute(attr_name, obj._schema.getDefaultValue(attr_name))
             else:
-                obj = self.objects[_id]
-            if _id not in self._fully_loaded:
-                new_data = pickle.loads(e[3])
-                for k, v in new_data:
-                    setattr(obj, k, v)
-            self._fully_loaded[_id] = obj
-            ids.remove(_id)
-        if len(ids) > 0:
-            raise KeyError(ids[0])
+                obj = tmpobj
+                self._internal_setitem__(this_id, obj)
+
+            if obj._schema.hasAttribute(self.sub_split):
+                # NB Keep be a SetSchemaAttribute to bypass the list manipulation
+                if sj_rows:
+                    obj.setSchemaAttribute(self.sub_split, SubJobSQLiteList(self, this_id, sj_rows, obj))
+                else:
+                    obj.setSchemaAttribute(self.sub_split, makeGangaListByRef([]))
+
+            from GangaCore.GPIDev.Base.Objects import do_not_copy
+            for node_key, node_val in obj._data.items():
+                if isType(node_val, Node):
+                    if node_key not in do_not_copy:
+                        node_val._setParent(obj)
+
+            obj._index_cache = {}
+            self._cache_load_timestamp[this_id] = modified
+            self._fully_loaded[this_id] = obj
+            obj._setFlushed()
+
+        logger.debug("Finished 'load'-ing of: %s" % ids)
 
     def delete(self, ids):
-        for id in ids:
-            self.cur.execute(
-                "UPDATE objects SET classname=NULL,category=NULL,idx=NULL,data=NULL WHERE id=%s" % (id))
-            self._internal_del__(id)
-        self.con.commit()
+        """
+        Delete the objects with these ids and their subjobs from the database
+        Args:
+            ids (list): The object keys which we want to iterate over from the objects dict
+        """
+        try:
+            with self._pool.connection() as con, con:
+                for this_id in ids:
+                    con.execute("DELETE FROM objects WHERE id = ?", (this_id,))
+                    con.execute("DELETE FROM subjobs WHERE master_id = ?", (this_id,))
+        except sqlite3.Error as err:
+            raise RepositoryError(self, "Error deleting objects from the database '%s': %s" % (self.dbfile, err))
+        for this_id in ids:
+            self._internal_del__(this_id)
+            self._fully_loaded.pop(this_id, None)
+            self._cache_load_timestamp.pop(this_id, None)
+            if this_id in self.objects:
+                del self.objects[this_id]
+
+    def select_ids(self, **attrs):
+        """
+        Return the set of ids of the stored objects whose indexed columns match all of the attrs
+        String values are matched as shell-style wildcards on status and name, component values (e.g. backend=Dirac()) by class name.
+        Returns None if any of the attrs can't be answered from the indexed columns
+        Args:
+            attrs (dict): attribute name -> value as passed to select()
+        """
+        clauses = []
+        params = []
+        for attr, value in attrs.items():
+            if attr in ('status', 'name'):
+                # [!...] negation has a different syntax in GLOB
+                if not isinstance(value, str) or '[!' in value:
+                    return None
+                clauses.append("%s GLOB ?" % attr)
+            elif attr in ('backend', 'application'):
+                if not isinstance(stripProxy(value), GangaObject):
+                    return None
+                value = getName(stripProxy(value))
+                clauses.append("%s = ?" % attr)
+            else:
+                return None
+            params.append(value)
+        query = "SELECT id FROM objects WHERE data IS NOT NULL"
+        for clause in clauses:
+            query += " AND " + clause
+        return set(_id for (_id,) in self._execute(query, tuple(params)))
 
     def lock(self, ids):
-        return ids
+        """
+        Request a session lock for the following ids
+        Args:
+            ids (list): The object keys which we want to iterate over from the objects dict
+        """
+        return self.sessionlock.lock_ids(ids)
 
     def unlock(self, ids):
-        return ids
+        """
+        Unlock (release file locks of) the following ids
+        Args:
+            ids (list): The object keys which we want to iterate over from the objects dict
+        """
+        released_ids = self.sessionlock.release_ids(ids)
+        if len(released_ids) < len(ids):
+            logger.error("The write locks of some objects could not be released!")
 
-    def get_lock_session(self, id):
+    def get_lock_session(self, this_id):
         """get_lock_session(id)
         Tries to determine the session that holds the lock on id for information purposes, and return an informative string.
         Returns None on failure
+        Args:
+            this_id (int): Get the id of the session which has a lock on the object with this id
         """
-        return ""
+        return self.sessionlock.get_lock_session(this_id)
 
     def get_other_sessions(self):
         """get_session_list()
         Tries to determine the other sessions that are active and returns an informative string for each of them.
         """
-        return []
+        return self.sessionlock.get_other_sessions()
 
     def reap_locks(self):
         """reap_locks() --> True/False
         Remotely clear all foreign locks from the session.
         WARNING: This is not nice.
         Returns True on success, False on error."""
-        return False
+        return self.sessionlock.reap_locks()
 
     def clean(self):
         """clean() --> True/False
         Clear EVERYTHING in this repository, counter, all jobs, etc.
         WARNING: This is not nice."""
         self.shutdown()
-        os.unlink(os.path.join(self.root, "database.db"))
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.unlink(self.dbfile + suffix)
+            except OSError as err:
+                logger.debug("Failed to remove %s: %s" % (self.dbfile + suffix, err))
         self.startup()
+
+    def isObjectLoaded(self, obj):
+        """
+        This will return a true false if an object has been fully loaded into memory
+        Args:
+            obj (GangaObject): The object we want to know if it was loaded into memory
+        """
+        return any(o is obj for o in self._fully_loaded.values())
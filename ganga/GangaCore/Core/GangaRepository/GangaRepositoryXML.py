@@ -26,6 +26,8 @@ from GangaCore.Core.GangaRepository.VStreamer import to_file as xml_to_file
 from GangaCore.Core.GangaRepository.VStreamer import from_file as xml_from_file
 from GangaCore.Core.GangaRepository.VStreamer import XMLFileError
 
+from GangaCore.Core.GangaRepository.IndexSegment import IndexSegment, LazyIndexCache
+
 from GangaCore.GPIDev.Base.Objects import Node
 from GangaCore.Core.GangaRepository.SubJobXMLList import SubJobXMLList
 
@@ -87,34 +89,53 @@ def safe_save(fn, _obj, to_file, ignore_subs=''):
         ignore_subs (str): This is the name(s) of the attribute of _obj we want to ignore in writing to disk
     """
 
-    # Add a global lock to make absolutely sure we don't have multiple threads writing files
-    # See Github Issue 185
-    with safe_save.lock:
+    # Add a lock to make absolutely sure we don't have multiple threads writing the same files
+    # See Github Issue 185. The lock is shared by all files in the same directory so different
+    # directories (e.g. subjobs) can be written concurrently
+    with safe_save.locks[hash(os.path.dirname(fn)) % len(safe_save.locks)]:
 
         obj = stripProxy(_obj)
         check_app_hash(obj)
 
-        # Create the dirs
-        dirname = os.path.dirname(fn)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+        _replace_file(fn, lambda tmpfile: to_file(obj, tmpfile, ignore_subs))
+
+def safe_write(fn, content):
+    """Save some XML which has already been generated (e.g. by to_file) in the same way as safe_save
+    This doesn't touch the object which the XML describes so it can be done by a thread which can't take its lock
+    Args:
+        fn (str): This is the name of the file we are to save the XML to
+        content (str): This is the XML to write
+    """
+    with safe_save.locks[hash(os.path.dirname(fn)) % len(safe_save.locks)]:
+        _replace_file(fn, lambda tmpfile: tmpfile.write(content))
+
+def _replace_file(fn, write):
+    """Write a new version of a file through fn.new, keeping the previous one as fn~, this must be called with the lock for fn
+    Args:
+        fn (str): This is the name of the file to replace
+        write (function): This writes the new content to the open file it's given
+    """
+    # Create the dirs
+    dirname = os.path.dirname(fn)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
 
-        # Prepare new data file
-        new_name = fn + '.new'
-        with open(new_name, "w") as tmpfile:
-            to_file(obj, tmpfile, ignore_subs)
+    # Prepare new data file
+    new_name = fn + '.new'
+    with open(new_name, "w") as tmpfile:
+        write(tmpfile)
 
-        # everything ready so create new data file and backup old one
-        if os.path.exists(new_name):
+    # everything ready so create new data file and backup old one
+    if os.path.exists(new_name):
 
-            # Do we have an old one to backup?
-            if os.path.exists(fn):
-                os.rename(fn, fn + "~")
+        # Do we have an old one to backup?
+        if os.path.exists(fn):
+            os.rename(fn, fn + "~")
 
-            os.rename(new_name, fn)
+        os.rename(new_name, fn)
 
-# Global lock for above function - See issue #185
-safe_save.lock = threading.Lock()
+# Locks for above function sharded by directory - See issue #185
+safe_save.locks = [threading.Lock() for _ in range(64)]
 
 def rmrf(name, count=0):
     """
@@ -208,6 +229,9 @@ class GangaRepositoryLocal(GangaRepository):
         self._cache_load_timestamp = {}
         self.printed_explanation = False
         self._fully_loaded = {}
+        self._index_segment = None
+        self._legacy_index_ids = set()
+        self._keep_legacy_index = False
 
     def startup(self):
         """ Starts a repository and reads in a directory structure.
@@ -248,6 +272,13 @@ class GangaRepositoryLocal(GangaRepository):
         else:
             raise RepositoryError(self, "Unable to launch due to unknown file-locking Strategy: \"%s\"" % getConfig('Configuration')['lockingStrategy'])
         self.sessionlock.startup()
+        if getConfig('Registry')['IndexSegment']:
+            try:
+                self._index_segment = IndexSegment(os.path.join(self.root, 'index.seg'))
+            except (IOError, OSError) as err:
+                logger.warning("Unable to use the index segment for '%s', falling back to index files: %s" % (self.registry.name, err))
+                self._index_segment = None
+            self._keep_legacy_index = getConfig('Registry')['IndexSegmentLegacyFiles']
         # Load the list of files, this time be verbose and print out a summary
         # of errors
         self.update_index(True, True)
@@ -269,6 +300,14 @@ class GangaRepositoryLocal(GangaRepository):
             self._write_master_cache(True)
         except Exception as err:
             logger.warning("Warning: Failed to write master index due to: %s" % err)
+        if self._index_segment is not None:
+            try:
+                if self._index_segment.needs_compaction():
+                    self._index_segment.compact()
+            except (IOError, OSError) as err:
+                logger.debug("Failed to compact index segment: %s" % err)
+            self._index_segment.close()
+            self._index_segment = None
         self.sessionlock.shutdown()
 
     def get_fn(self, this_id):
@@ -300,6 +339,8 @@ class GangaRepositoryLocal(GangaRepository):
             this_id (int): This is the id for which we want to load the index file from disk
         """
         #logger.debug("Loading index %s" % this_id)
+        if self._index_segment is not None and this_id in self._index_segment and not self._legacy_index_newer(this_id):
+            return self._index_load_segment(this_id)
         fn = self.get_idxfn(this_id)
         # index timestamp changed
         fn_ctime = os.stat(fn).st_ctime
@@ -314,24 +355,11 @@ class GangaRepositoryLocal(GangaRepository):
             except Exception as x:
                 logger.warning("index_load Exception: %s" % x)
                 raise IOError("Error on unpickling: %s %s" %(getName(x), x))
-            if this_id in self.objects:
-                obj = self.objects[this_id]
-                setattr(obj, "_registry_refresh", True)
-            else:
-                try:
-                    obj = self._make_empty_object_(this_id, cat, cls)
-                except Exception as err:
-                    raise IOError('Failed to Parse information in Index file: %s. Err: %s' % (fn, err))
-            this_cache = obj._index_cache
-            this_data = this_cache if this_cache else {}
-            for k, v in cache.items():
-                this_data[k] = v
-            #obj.setNodeData(this_data)
-            obj._index_cache = cache
-            self._cache_load_timestamp[this_id] = fn_ctime
-            self._cached_cat[this_id] = cat
-            self._cached_cls[this_id] = cls
-            self._cached_obj[this_id] = cache
+            self._set_index(this_id, cat, cls, cache, fn_ctime)
+            if self._index_segment is not None:
+                # Migrate the old index file into the segment
+                self._cache_load_timestamp[this_id] = self._index_segment.write(this_id, cat, cls, cache)
+                self._retire_legacy_index(this_id)
             return True
         elif this_id not in self.objects:
             self.objects[this_id] = self._make_empty_object_(this_id, self._cached_cat[this_id], self._cached_cls[this_id])
@@ -343,6 +371,93 @@ class GangaRepositoryLocal(GangaRepository):
             logger.debug("Just silently continuing")
         return False
 
+    def _legacy_index_newer(self, this_id):
+        """ True if the object has an index file which was written after its entry in the index segment, e.g. by a session
+            which doesn't use the segment
+        Args:
+            this_id (int): This is the id of the object whose indexes are compared
+        """
+        if this_id not in self._legacy_index_ids:
+            return False
+        try:
+            newer = os.stat(self.get_idxfn(this_id)).st_ctime > self._index_segment.get_record(this_id).mtime
+        except OSError:
+            self._legacy_index_ids.discard(this_id)
+            return False
+        if not newer:
+            self._retire_legacy_index(this_id)
+        return newer
+
+    def _retire_legacy_index(self, this_id):
+        """ Remove the index file of this object once its content is in the index segment, unless the index files are
+            kept for sessions not using the segment ([Registry]IndexSegmentLegacyFiles)
+        Args:
+            this_id (int): This is the id of the object whose index file is removed
+        """
+        if self._keep_legacy_index:
+            self._legacy_index_ids.add(this_id)
+            return
+        self._legacy_index_ids.discard(this_id)
+        try:
+            rmrf(self.get_idxfn(this_id))
+        except OSError as err:
+            logger.debug("Failed to remove index file of %s: %s" % (this_id, err))
+
+    def _index_load_segment(self, this_id):
+        """ load the index for this object from the index segment if it has changed since it was last read
+            Only the fixed width columns are read here, the cache itself is unpickled when it's first accessed
+            Returns True if this object has been changed, False if not
+            Raise IOError on access or unpickling error
+            Raise PluginManagerError if the class name is not found
+        Args:
+            this_id (int): This is the id for which we want to load the index from the segment
+        """
+        rec = self._index_segment.get_record(this_id)
+        if self._cache_load_timestamp.get(this_id, 0) == rec.mtime and this_id in self.objects:
+            return False
+        if 'category' in rec.exact and 'classname' in rec.exact:
+            cat, cls = rec.category, rec.classname
+        else:
+            cat, cls, _ = self._index_segment.read(this_id)
+        self._set_index(this_id, cat, cls, LazyIndexCache(self._index_segment, this_id, rec), rec.mtime)
+        return True
+
+    def _set_index(self, this_id, cat, cls, cache, timestamp):
+        """ Assign a freshly read index cache to the object with this id, creating an empty object if needed
+        Args:
+            this_id (int): This is the id of the object the index belongs to
+            cat (str): category of the object's class
+            cls (str): name of the object's class
+            cache (dict): the index cache which has been read
+            timestamp (float): ctime/mtime of the index which has been read
+        """
+        if this_id in self.objects:
+            obj = self.objects[this_id]
+            setattr(obj, "_registry_refresh", True)
+        else:
+            try:
+                obj = self._make_empty_object_(this_id, cat, cls)
+            except Exception as err:
+                raise IOError('Failed to Parse information in Index for: %s. Err: %s' % (this_id, err))
+        #obj.setNodeData(this_data)
+        obj._index_cache = cache
+        self._cache_load_timestamp[this_id] = timestamp
+        self._cached_cat[this_id] = cat
+        self._cached_cls[this_id] = cls
+        self._cached_obj[this_id] = cache
+
+    def _delete_index(self, this_id):
+        """ Remove the on-disk index of this object so we do not continue working with wrong information
+        Args:
+            this_id (int): This is the id of the object whose index is removed
+        """
+        if self._index_segment is not None:
+            try:
+                self._index_segment.remove(this_id)
+            except (IOError, OSError) as err:
+                logger.debug("Failed to remove %s from the index segment: %s" % (this_id, err))
+        rmrf(self.get_idxfn(this_id))
+
     def index_write(self, this_id, shutdown=False):
         """ write an index file for this object (must be locked).
             Should not raise any Errors,
@@ -356,7 +471,17 @@ class GangaRepositoryLocal(GangaRepository):
         try:
             ifn = self.get_idxfn(this_id)
             new_idx_cache = self.registry.getIndexCache(stripProxy(obj))
-            if not os.path.exists(ifn) or shutdown:
+            if self._index_segment is not None:
+                if self._keep_legacy_index and this_id in self._legacy_index_ids:
+                    # Keep the index file seen by sessions not using the segment up to date, it's written first so that
+                    # it isn't taken as newer than the segment
+                    with open(ifn, "wb") as this_file:
+                        pickle_to_file((obj._category, getName(obj), new_idx_cache), this_file)
+                # Updates to the segment are cheap so we always write them
+                self._cache_load_timestamp[this_id] = self._index_segment.write(this_id, obj._category, getName(obj), new_idx_cache)
+                self._cached_cat[this_id] = obj._category
+                self._cached_cls[this_id] = getName(obj)
+            elif not os.path.exists(ifn) or shutdown:
                 new_cache = new_idx_cache
                 with open(ifn, "wb") as this_file:
                     new_index = (obj._category, getName(obj), new_cache)
@@ -365,13 +490,22 @@ class GangaRepositoryLocal(GangaRepository):
                 self._cached_obj[this_id] = new_cache
                 obj._index_cache = {}
             self._cached_obj[this_id] = new_idx_cache
-        except IOError as err:
+        except (IOError, OSError) as err:
             logger.error("Index saving to '%s' failed: %s %s" % (ifn, getName(err), err))
 
     def get_index_listing(self):
         """Get dictionary of possible objects in the Repository: True means index is present,
             False if not present
         Raise RepositoryError"""
+        segment_ids = []
+        if self._index_segment is not None:
+            # Read before listing the directories: an index is only written once the data file is there so every id
+            # in the segment is then also in the listing, unless it has been deleted
+            try:
+                self._index_segment.refresh()
+            except (IOError, OSError) as err:
+                raise RepositoryError(self, "Could not read index segment '%s': %s" % (self._index_segment.filename, err))
+            segment_ids = self._index_segment.ids()
         try:
             if not os.path.exists(self.root):
                 os.makedirs(self.root)
@@ -380,6 +514,7 @@ class GangaRepositoryLocal(GangaRepository):
             logger.debug("get_index_listing Exception: %s" % err)
             raise RepositoryError(self, "Could not list repository '%s'!" % (self.root))
         objs = {}  # True means index is present, False means index not present
+        legacy_index_ids = set()
         for c in obj_chunks:
             try:
                 listing = os.listdir(os.path.join(self.root, c))
@@ -392,18 +527,33 @@ class GangaRepositoryLocal(GangaRepository):
                     this_id = int(l[:-6])
                     if this_id in objs:
                         objs[this_id] = True
+                        legacy_index_ids.add(this_id)
                     else:
                         try:
                             rmrf(self.get_idxfn(this_id))
                             logger.warning("Deleted index file without data file: %s" % self.get_idxfn(this_id))
                         except OSError as err:
                             logger.debug("get_index_listing delete Exception: %s" % err)
+        self._legacy_index_ids = legacy_index_ids
+        # The directories remain the list of objects, the segment only tells which of them have an index
+        for this_id in segment_ids:
+            if this_id in objs:
+                objs[this_id] = True
+            else:
+                try:
+                    self._index_segment.remove(this_id)
+                    logger.warning("Deleted index entry without data file: %s" % this_id)
+                except (IOError, OSError) as err:
+                    logger.debug("get_index_listing delete Exception: %s" % err)
         return objs
 
     def _read_master_cache(self):
         """
         read in the master cache to reduce significant I/O over many indexes separately on startup
         """
+        if self._index_segment is not None:
+            # The segment already provides everything in one file
+            return
         try:
             _master_idx = os.path.join(self.root, 'master.idx')
             if os.path.isfile(_master_idx):
@@ -447,6 +597,8 @@ class GangaRepositoryLocal(GangaRepository):
         Args:
             shutdown (boool): True causes this to be written now
         """
+        if self._index_segment is not None:
+            return
         try:
             _master_idx = os.path.join(self.root, 'master.idx')
             this_master_cache = []
@@ -639,12 +791,37 @@ class GangaRepositoryLocal(GangaRepository):
                 self.printed_explanation = True
         logger.debug("updated index done")
 
+        if self._index_segment is not None and self._index_segment.created:
+            self._migrate_index_files(objs)
+
         if len(changed_ids) != 0:
             isShutdown = not firstRun
             self._write_master_cache(isShutdown)
 
         return changed_ids
 
+    def _migrate_index_files(self, objs):
+        """
+        Copy all remaining per-object .index files into the freshly created index segment.
+        This covers the objects locked by other sessions which update_index skips. The index files are then removed unless
+        [Registry]IndexSegmentLegacyFiles keeps them for sessions which do not use the segment
+        Args:
+            objs (dict): The listing of objects returned by get_index_listing
+        """
+        for this_id, has_index in objs.items():
+            if this_id in self._index_segment or not has_index:
+                continue
+            fn = self.get_idxfn(this_id)
+            try:
+                with open(fn, 'rb') as fobj:
+                    cat, cls, cache = pickle_from_file(fobj)[0]
+                self._index_segment.write(this_id, cat, cls, cache)
+            except Exception as err:
+                logger.debug("Failed to migrate index file %s: %s" % (fn, err))
+                continue
+            self._retire_legacy_index(this_id)
+        self._index_segment.created = False
+
     def add(self, objs, force_ids=None):
         """ Add the given objects to the repository, forcing the IDs if told to.
         Raise RepositoryError
@@ -712,20 +889,8 @@ class GangaRepositoryLocal(GangaRepository):
                     getattr(obj, self.sub_split).flush()
                 else:
                     # I have been constructed in this session, I don't know how to flush!
-                    if hasattr(getattr(obj, self.sub_split)[0], "_dirty"):
-                        split_cache = getattr(obj, self.sub_split)
-                        for i in range(len(split_cache)):
-                            if not split_cache[i]._dirty:
-                                continue
-                            sfn = os.path.join(os.path.dirname(fn), str(i), self.dataFileName)
-                            if not os.path.exists(os.path.dirname(sfn)):
-                                logger.debug("Constructing Folder: %s" % os.path.dirname(sfn))
-                                os.makedirs(os.path.dirname(sfn))
-                            else:
-                                logger.debug("Using Folder: %s" % os.path.dirname(sfn))
-                            safe_save(sfn, split_cache[i], self.to_file)
-                            split_cache[i]._setFlushed()
-                    # Now generate an index file to take advantage of future non-loading goodness
+                    # Hand the subjobs to a SubJobXMLList which writes the dirty ones in parallel and
+                    # generates an index file to take advantage of future non-loading goodness
                     tempSubJList = SubJobXMLList(os.path.dirname(fn), self.registry, self.dataFileName, False, obj)
                     ## equivalent to for sj in job.subjobs
                     tempSubJList._setParent(obj)
@@ -734,6 +899,8 @@ class GangaRepositoryLocal(GangaRepository):
                         job_dict[sj.id] = stripProxy(sj)
                     tempSubJList._reset_cachedJobs(job_dict)
                     tempSubJList.flush(ignore_disk=True)
+                    for sj in job_dict.values():
+                        sj._setFlushed()
                     del tempSubJList
 
                 safe_save(fn, obj, self.to_file, self.sub_split)
@@ -976,7 +1143,7 @@ class GangaRepositoryLocal(GangaRepository):
                 try:
                     # remove internal representation
                     self._internal_del__(this_id)
-                    rmrf(os.path.dirname(fn) + ".index")
+                    self._delete_index(this_id)
                 except OSError as err:
                     logger.debug("load unlink Error: %s" % err)
                     pass
@@ -1109,7 +1276,7 @@ class GangaRepositoryLocal(GangaRepository):
             self.incomplete_objects.append(this_id)
             # remove index so we do not continue working with wrong
             # information
-            rmrf(os.path.dirname(fn) + ".index")
+            self._delete_index(this_id)
             raise InaccessibleObjectError(self, this_id, err)
 
         return False
@@ -1125,7 +1292,7 @@ class GangaRepositoryLocal(GangaRepository):
             # KeyError
             fn = self.get_fn(this_id)
             try:
-                rmrf(os.path.dirname(fn) + ".index")
+                self._delete_index(this_id)
             except OSError as err:
                 logger.debug("Delete Error: %s" % err)
             self._internal_del__(this_id)
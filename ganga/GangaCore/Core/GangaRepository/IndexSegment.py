@@ -0,0 +1,477 @@
+##########################################################################
+# Ganga Project. http://cern.ch/ganga
+#
+# Single-file, memory-mapped store for the per-object index caches of a
+# GangaRepositoryLocal. This replaces the one-pickle-per-object '<id>.index'
+# files which have to be opened and unpickled one at a time on startup.
+##########################################################################
+
+# Layout of the segment file:
+#
+#   header   : MAGIC (8 bytes), format version (uint32), reserved (uint32)
+#   records  : appended one after the other, each one is
+#              RECORD header (fixed width, see _RECORD below) holding the id,
+#              modification time, class and the columns, followed by
+#              'capacity' bytes of which the first 'blob_len' hold the pickled
+#              (category, classname, index_cache) tuple
+#
+# The fixed width columns (status, backend, application, name) are a copy of
+# the most commonly requested index values so that they can be read without
+# unpickling anything.
+# Records are updated in place when the new blob fits in the existing slot,
+# otherwise the old record is marked dead and a new one is appended.
+# The id -> offset table is rebuilt from the record headers only, the blobs
+# are unpickled on demand (see LazyIndexCache).
+
+import os
+import mmap
+import time
+import errno
+import fcntl
+import struct
+import pickle
+import threading
+from contextlib import contextmanager
+
+from GangaCore.Utility.logging import getLogger
+
+logger = getLogger()
+
+MAGIC = b'GANGAIDX'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<8sII')
+_RECORD = struct.Struct('<4sBxxxqdII16s48s16s32s32s64s')
+_RECORD_MAGIC = b'GREC'
+
+# record flags
+_LIVE = 1
+
+# Blobs are given some headroom so that most updates can happen in place
+_SLOT_ROUNDING = 256
+
+# names of the fixed width columns and the index_cache keys they are taken from
+COLUMNS = (('status', 'status', 16),
+           ('backend', 'display:backend', 32),
+           ('application', 'display:application', 32),
+           ('name', 'name', 64))
+
+_FIELD_OFFSET = 8 # position of the first column in the unpacked record
+
+
+def _encode_column(value, width):
+    """ Encode a column value into its fixed width representation
+    Args:
+        value (str, None): the value to be stored
+        width (int): the width of the column in bytes
+    """
+    if not isinstance(value, str):
+        return b''
+    return value.encode('utf-8')[:width]
+
+
+def _decode_column(raw):
+    """ Decode a fixed width column back into a str
+    Args:
+        raw (bytes): the stored bytes
+    """
+    return raw.rstrip(b'\0').decode('utf-8', 'ignore')
+
+
+class IndexRecord(object):
+
+    """ In-memory description of one record in the segment """
+
+    __slots__ = ('offset', 'mtime', 'blob_len', 'capacity', 'category', 'classname', 'columns', 'exact')
+
+    def __init__(self, offset, mtime, blob_len, capacity, category, classname, columns, exact):
+        self.offset = offset
+        self.mtime = mtime
+        self.blob_len = blob_len
+        self.capacity = capacity
+        self.category = category
+        self.classname = classname
+        # dict of column name -> str
+        self.columns = columns
+        # the columns which hold the full value and not a truncated copy
+        self.exact = exact
+
+
+class IndexSegment(object):
+
+    """
+    Append-only, memory-mapped segment holding the index caches of all objects in a repository.
+    Only one file is opened regardless of the number of objects, and the pickled caches are only read when requested.
+    Writes are protected by a lockf lock on the file so several Ganga sessions can share one segment.
+    """
+
+    def __init__(self, filename):
+        """
+        Open (or create) the segment file
+        Args:
+            filename (str): full path of the segment file
+        """
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._fd = None
+        self._inode = None
+        self._map = None
+        self._mapped_size = 0
+        self._records = {}
+        self._dead_bytes = 0
+        # True when the segment did not exist before we opened it, i.e. the repository still has to be migrated
+        self.created = False
+        self._open()
+
+    def _open(self):
+        """ Open the file, write a header if it's new and read the record table """
+        dirname = os.path.dirname(self.filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self.created = not os.path.isfile(self.filename)
+        self._fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        self._inode = os.fstat(self._fd).st_ino
+        with self._locked_segment():
+            if os.fstat(self._fd).st_size == 0:
+                os.pwrite(self._fd, _HEADER.pack(MAGIC, FORMAT_VERSION, 0), 0)
+        self.refresh()
+
+    def close(self):
+        """ Release the memory map and the file descriptor """
+        with self._lock:
+            self._unmap()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _unmap(self):
+        """ Drop the current memory map """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._mapped_size = 0
+
+    def _is_current(self):
+        """ False if the file we have open is no longer the one at self.filename (i.e. it's been compacted) """
+        try:
+            return os.stat(self.filename).st_ino == self._inode
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return False
+
+    def _check_replaced(self):
+        """ Re-open the segment if another session has compacted it into a new file """
+        if self._is_current():
+            return False
+        logger.debug("Index segment %s has been replaced, re-opening" % self.filename)
+        self.close()
+        self._open()
+        return True
+
+    @contextmanager
+    def _locked_segment(self, shared=False):
+        """
+        Hold a lockf lock on the current segment file against other sessions, exclusive for writers and shared for
+        readers so that they never see a record which is half written.
+        If the file has been replaced while waiting for the lock, the new file is opened and locked instead.
+        POSIX locks are per process and aren't nested, so this must not be re-entered while the lock is held.
+        Args:
+            shared (bool): Take a shared (read) lock rather than an exclusive one
+        """
+        while True:
+            fcntl.lockf(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            if self._is_current():
+                break
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            self._check_replaced()
+        fd = self._fd
+        try:
+            yield
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+
+    def _remap(self):
+        """ (Re)map the file if it has grown since it was last mapped """
+        size = os.fstat(self._fd).st_size
+        if size != self._mapped_size:
+            self._unmap()
+            if size > 0:
+                self._map = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+            self._mapped_size = size
+        return size
+
+    def refresh(self):
+        """
+        Re-read the record table from the headers in the segment.
+        This picks up records written by other sessions, no pickled data is read.
+        """
+        with self._lock:
+            self._check_replaced()
+            with self._locked_segment(shared=True):
+                self._refresh()
+
+    def _refresh(self):
+        """ Re-read the record table, the caller holds self._lock and the file lock """
+        with self._lock:
+            size = self._remap()
+            records = {}
+            dead = 0
+            if size < _HEADER.size:
+                self._records = records
+                return
+            magic, version, _ = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise IOError("Index segment %s has an unknown format" % self.filename)
+            offset = _HEADER.size
+            this_map = self._map
+            while offset + _RECORD.size <= size:
+                fields = _RECORD.unpack_from(this_map, offset)
+                if fields[0] != _RECORD_MAGIC:
+                    # A torn append from a crashed session, nothing valid follows
+                    logger.debug("Truncated record found in %s at %s" % (self.filename, offset))
+                    break
+                capacity = fields[5]
+                if offset + _RECORD.size + capacity > size:
+                    break
+                if fields[1] & _LIVE:
+                    this_id = fields[2]
+                    if this_id in records:
+                        dead += records[this_id].capacity + _RECORD.size
+                    records[this_id] = self._make_record(offset, fields)
+                else:
+                    dead += capacity + _RECORD.size
+                offset += _RECORD.size + capacity
+            self._records = records
+            self._dead_bytes = dead
+
+    @staticmethod
+    def _make_record(offset, fields):
+        """ Construct an IndexRecord from the unpacked record header """
+        columns = {}
+        exact = set()
+        for i, (col_name, _key, width) in enumerate(COLUMNS):
+            raw = fields[_FIELD_OFFSET + i]
+            columns[col_name] = _decode_column(raw)
+            if len(raw.rstrip(b'\0')) < width:
+                exact.add(col_name)
+        for i, (col_name, width) in enumerate((('category', 16), ('classname', 48))):
+            if len(fields[6 + i].rstrip(b'\0')) < width:
+                exact.add(col_name)
+        return IndexRecord(offset, fields[3], fields[4], fields[5],
+                           _decode_column(fields[6]), _decode_column(fields[7]), columns, exact)
+
+    def ids(self):
+        """ Return the ids of all objects with a live record """
+        with self._lock:
+            return list(self._records.keys())
+
+    def __contains__(self, this_id):
+        return this_id in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def get_record(self, this_id):
+        """ Return the IndexRecord for this id or None
+        Args:
+            this_id (int): id of the object
+        """
+        return self._records.get(this_id)
+
+    def read(self, this_id):
+        """
+        Unpickle and return the (category, classname, index_cache) stored for this id
+        Raise KeyError if there is no record, IOError if the record can't be read
+        Args:
+            this_id (int): id of the object
+        """
+        with self._lock:
+            with self._locked_segment(shared=True):
+                rec = self._records[this_id]
+                if rec.offset + _RECORD.size + rec.blob_len > self._mapped_size:
+                    self._remap()
+                # Another session may have moved or rewritten the record since the table was read
+                fields = _RECORD.unpack_from(self._map, rec.offset)
+                if fields[0] != _RECORD_MAGIC or not fields[1] & _LIVE or fields[2] != this_id:
+                    self._refresh()
+                    rec = self._records[this_id]
+                    fields = _RECORD.unpack_from(self._map, rec.offset)
+                start = rec.offset + _RECORD.size
+                blob = self._map[start:start + fields[4]]
+            try:
+                return pickle.loads(blob)
+            except Exception as err:
+                raise IOError("Error on unpickling index %s from %s: %s" % (this_id, self.filename, err))
+
+    def write(self, this_id, category, classname, cache):
+        """
+        Store the index cache of an object. The record is overwritten in place when possible.
+        Returns the modification time stored with the record
+        Args:
+            this_id (int): id of the object
+            category (str): category of the object's class
+            classname (str): name of the object's class
+            cache (dict): the index cache
+        """
+        blob = pickle.dumps((category, classname, cache), pickle.HIGHEST_PROTOCOL)
+        mtime = time.time()
+        cols = [_encode_column(category, 16), _encode_column(classname, 48)]
+        cols += [_encode_column(cache.get(key), width) for (_col, key, width) in COLUMNS]
+        with self._lock:
+            with self._locked_segment():
+                # pick up any appends/updates from other sessions first
+                self._refresh()
+                old = self._records.get(this_id)
+                if old is not None and len(blob) <= old.capacity:
+                    header = _RECORD.pack(_RECORD_MAGIC, _LIVE, this_id, mtime, len(blob), old.capacity, *cols)
+                    os.pwrite(self._fd, blob, old.offset + _RECORD.size)
+                    os.pwrite(self._fd, header, old.offset)
+                    offset = old.offset
+                    capacity = old.capacity
+                else:
+                    capacity = ((len(blob) // _SLOT_ROUNDING) + 1) * _SLOT_ROUNDING
+                    offset = os.fstat(self._fd).st_size
+                    header = _RECORD.pack(_RECORD_MAGIC, _LIVE, this_id, mtime, len(blob), capacity, *cols)
+                    os.pwrite(self._fd, header + blob + b'\0' * (capacity - len(blob)), offset)
+                    if old is not None:
+                        self._kill(old)
+                self._records[this_id] = self._make_record(offset, _RECORD.unpack(header))
+            return mtime
+
+    def _kill(self, rec):
+        """ Mark the record as dead on disk (caller holds the file lock) """
+        os.pwrite(self._fd, struct.pack('<B', 0), rec.offset + 4)
+        self._dead_bytes += rec.capacity + _RECORD.size
+
+    def remove(self, this_id):
+        """
+        Remove the record for this id, if any
+        Args:
+            this_id (int): id of the object
+        """
+        with self._lock:
+            with self._locked_segment():
+                self._refresh()
+                rec = self._records.pop(this_id, None)
+                if rec is not None:
+                    self._kill(rec)
+
+    def needs_compaction(self):
+        """ True if more than half of the segment is taken by dead records """
+        return self._dead_bytes > 1024 * 1024 and self._dead_bytes * 2 > self._mapped_size
+
+    def compact(self):
+        """
+        Rewrite the segment without dead records. The new file replaces the old one atomically,
+        other sessions notice the change of inode and re-open it.
+        """
+        with self._lock:
+            with self._locked_segment():
+                self._refresh()
+                new_name = self.filename + '.new'
+                fd = os.open(new_name, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    chunks = [_HEADER.pack(MAGIC, FORMAT_VERSION, 0)]
+                    for this_id in sorted(self._records):
+                        rec = self._records[this_id]
+                        chunks.append(self._map[rec.offset:rec.offset + _RECORD.size + rec.capacity])
+                    os.write(fd, b''.join(chunks))
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                os.rename(new_name, self.filename)
+            # Our file lock was on the old inode, move over to the new file
+            self._check_replaced()
+
+
+class LazyIndexCache(dict):
+
+    """
+    Index cache which is only unpickled from the IndexSegment when a value is requested.
+    Values held exactly in the fixed width columns (e.g. 'status') are served without loading the rest.
+    """
+
+    __slots__ = ('_segment', '_this_id', '_loaded')
+
+    def __init__(self, segment, this_id, record):
+        """
+        Args:
+            segment (IndexSegment): segment which holds the data
+            this_id (int): id of the object
+            record (IndexRecord): header of the record for this id
+        """
+        super(LazyIndexCache, self).__init__()
+        self._segment = segment
+        self._this_id = this_id
+        self._loaded = False
+        for col_name, key, _width in COLUMNS:
+            if col_name in record.exact and record.columns[col_name] and key in ('status',):
+                dict.__setitem__(self, key, record.columns[col_name])
+
+    def _load(self):
+        """ Fetch the full cache from the segment """
+        if not self._loaded:
+            self._loaded = True
+            try:
+                cache = self._segment.read(self._this_id)[2]
+            except (KeyError, IOError) as err:
+                logger.debug("Lazy index load failed for %s: %s" % (self._this_id, err))
+                return
+            dict.update(self, cache)
+
+    def __getitem__(self, key):
+        if not self._loaded and not dict.__contains__(self, key):
+            self._load()
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if not self._loaded and not dict.__contains__(self, key):
+            self._load()
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if not self._loaded and not dict.__contains__(self, key):
+            self._load()
+        return dict.get(self, key, default)
+
+    def __iter__(self):
+        self._load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._load()
+        return dict.__len__(self)
+
+    def __eq__(self, other):
+        self._load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def keys(self):
+        self._load()
+        return dict.keys(self)
+
+    def values(self):
+        self._load()
+        return dict.values(self)
+
+    def items(self):
+        self._load()
+        return dict.items(self)
+
+    def copy(self):
+        self._load()
+        return dict(self)
+
+    def __repr__(self):
+        self._load()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        self._load()
+        return (dict, (dict(self),))
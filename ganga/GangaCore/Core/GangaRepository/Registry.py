@@ -11,10 +11,11 @@ import time
 import threading
 
 from GangaCore.Core.GangaThread.GangaThread import GangaThread
+from GangaCore.Core.GangaRepository.RegistryIndex import RegistryIndex
 from GangaCore.GPIDev.Lib.GangaList.GangaList import GangaList
 from GangaCore.GPIDev.Base.Objects import GangaObject
 from GangaCore.GPIDev.Schema import Schema, Version
-from GangaCore.GPIDev.Base.Proxy import isType, getName
+from GangaCore.GPIDev.Base.Proxy import isType, getName, stripProxy
 from GangaCore.Utility.Config import getConfig
 
 logger = getLogger()
@@ -279,7 +280,14 @@ class Registry(object):
     Base class providing a dict-like locked and lazy-loading interface to a Ganga repository
     """
 
-    __slots__ = ('name', 'doc', '_hasStarted', '_needs_metadata', 'metadata', '_read_lock', '_flush_lock', '_parent', 'repository', '_objects', '_incomplete_objects', 'flush_thread', 'type', 'location')
+    __slots__ = ('name', 'doc', '_hasStarted', '_needs_metadata', 'metadata', '_read_lock', '_flush_lock', '_parent', 'repository', '_objects', '_incomplete_objects', 'flush_thread', 'type', 'location', '_index', '_index_stale')
+
+    # Attributes which select() can answer from the in-memory index, see getIndexColumns
+    _index_columns = ()
+    # Those of the _index_columns which are components, they are indexed by class name
+    _index_components = ()
+    # Values of the 'status' index column of the objects which are returned by getActiveIds
+    _active_states = ()
 
     def __init__(self, name, doc):
         """Registry constructor, giving public name and documentation
@@ -300,6 +308,9 @@ class Registry(object):
         self.repository = None
         self._objects = None
         self._incomplete_objects = None
+        self._index = RegistryIndex()
+        # ids whose object or index cache has been replaced since they were last indexed
+        self._index_stale = set()
 
         self.flush_thread = None
 
@@ -453,6 +464,11 @@ class Registry(object):
         obj._registry_locked = True
 
         self.repository.flush(ids)
+        self._indexObject(ids[0], obj)
+
+        shareref = self._getShareRef()
+        if shareref is not None:
+            shareref.itemAdded(self.name, ids[0], obj)
 
         return ids[0]
 
@@ -485,6 +501,25 @@ class Registry(object):
 
             logger.debug('deleting the object %d from the registry %s', this_id, self.name)
             self.repository.delete([this_id])
+            self._index.remove(this_id)
+
+            shareref = self._getShareRef()
+            if shareref is not None:
+                shareref.itemRemoved(self.name, this_id)
+
+    def _getShareRef(self):
+        """
+        Return the shareref table which keeps the ShareDirs referenced by the objects of this registry,
+        or None if the objects of this registry can't reference a ShareDir
+        """
+        from GangaCore.GPIDev.Lib.Registry.PrepRegistry import referring_registries
+        if self.name not in referring_registries:
+            return None
+        from GangaCore.Core.GangaRepository import allRegistries
+        prep = allRegistries.get('prep')
+        if prep is None or not prep.hasStarted():
+            return None
+        return prep.getShareRef()
 
     @synchronised_flush_lock
     def _flush(self, objs):
@@ -518,6 +553,7 @@ class Registry(object):
                 obj_id = self.find(obj)
                 self.repository.flush([obj_id])
                 obj._setFlushed()
+                self._indexObject(obj_id, obj)
 
     def flush_all(self):
         """
@@ -604,6 +640,150 @@ class Registry(object):
         This can and should be overwritten by derived Registries to provide more index values."""
         return {}
 
+    def getIndexColumns(self, obj, cache=None):
+        """Returns a dictionary of the values of the _index_columns of obj, None for values which aren't known.
+        If cache is given the values have to be taken from it, as obj is not loaded.
+        This should be overwritten by derived Registries which define _index_columns.
+        Args:
+            obj (GangaObject): The object whose values are requested
+            cache (dict): The index cache of obj if it isn't loaded
+        """
+        return {}
+
+    def _indexObject(self, this_id, obj):
+        """Store the index values of obj in the in-memory index used by select()
+        Args:
+            this_id (int): The id of obj in this registry
+            obj (GangaObject): The object to index
+        """
+        if not self._index_columns:
+            return
+        cache = self._indexSource(obj)
+        try:
+            values = self.getIndexColumns(obj, cache)
+        except Exception as err:
+            logger.debug("Failed to get the index values of %s #%s: %s" % (self.name, this_id, err))
+            values = dict.fromkeys(self._index_columns)
+        self._index.update(this_id, obj, cache, values)
+
+    @staticmethod
+    def _indexSource(obj):
+        """Returns the index cache the index values of obj have to be taken from, None if obj is loaded
+        Args:
+            obj (GangaObject): The object to index
+        """
+        # Loaded objects have an empty index cache, their values are read from the object itself.
+        # Don't take the len() of any other cache, a lazy cache would be unpickled from the index segment
+        cache = obj._index_cache_dict
+        if cache is None or (type(cache) is dict and not cache):
+            return None
+        return cache
+
+    def _markIndexStale(self, this_id):
+        """Called by the repository when the object or the index cache of this_id is replaced, e.g. by another session
+        Args:
+            this_id (int): The id of the object
+        """
+        if self._index_columns and this_id is not None:
+            self._index_stale.add(this_id)
+
+    def _updateIndex(self, obj):
+        """Refresh the in-memory index entry of obj after one of its _index_columns has changed, e.g. its status
+        Args:
+            obj (GangaObject): The object which has changed
+        """
+        this_id = self._index.find(obj)
+        if this_id is not None:
+            self._indexObject(this_id, obj)
+
+    @synchronised_read_lock
+    def _select_ids(self, **attrs):
+        """Returns a tuple (matched, unknown) of sets of ids for a select() on this registry, or None if
+        attrs can't be answered without looking at the objects themselves.
+        matched are the ids of the objects matching all attrs, the objects in unknown have to be checked by the caller.
+        Status and name are matched as shell-style wildcards, components (e.g. backend=Dirac()) by their class name.
+        Args:
+            attrs (dict): attribute name -> value as passed to select()
+        """
+        if not self._index_columns or not self.hasStarted():
+            return None
+
+        wanted = {}
+        for attr, value in attrs.items():
+            if attr not in self._index_columns:
+                return None
+            if attr in self._index_components:
+                if not isinstance(stripProxy(value), GangaObject):
+                    return None
+                value = getName(stripProxy(value))
+            elif not isinstance(value, str):
+                return None
+            wanted[attr] = value
+
+        # A repository which keeps the columns in its storage can answer directly, only objects which
+        # have been modified since they were stored need to be checked
+        if hasattr(self.repository, 'select_ids'):
+            matched = self.repository.select_ids(**attrs)
+            if matched is not None:
+                return matched, set(this_id for this_id, obj in self._objects.items() if obj._dirty)
+
+        self._refreshIndex()
+
+        # Loaded objects can be changed in this session without the index hearing of it, they are checked directly
+        matched, unknown = self._index.select(**wanted)
+        unknown.update(this_id for this_id, obj in self._objects.items() if obj._dirty or self._indexSource(obj) is None)
+        return matched, unknown
+
+    def _refreshIndex(self, full=False):
+        """Bring the index up to date with objects which were reloaded, added or removed behind our back.
+        Only the ids marked as stale by the repository are looked at, unless the index doesn't cover the same
+        objects as the registry (e.g. the first time) or full is True.
+        Args:
+            full (bool): Check every object in the registry
+        """
+        if full or len(self._index) != len(self._objects):
+            self._index_stale.clear()
+            to_check = list(self._objects.keys())
+            self._index.retain(to_check)
+        else:
+            to_check = []
+            while self._index_stale:
+                try:
+                    to_check.append(self._index_stale.pop())
+                except KeyError:
+                    break
+        for this_id in to_check:
+            obj = self._objects.get(this_id)
+            if obj is None:
+                self._index.remove(this_id)
+                continue
+            cache = self._indexSource(obj)
+            if cache is None or not self._index.is_current(this_id, obj, cache):
+                self._indexObject(this_id, obj)
+
+    @synchronised_read_lock
+    def getActiveIds(self, group_by=None):
+        """Returns the ids of the objects whose status is one of the _active_states, e.g. the jobs which need monitoring.
+        The index is built from the index caches the first time, which the repository keeps on disk, so this doesn't load
+        any object. From then on it's kept up to date as objects are added, flushed, removed or change their status, so
+        this only costs as much as there are active objects. Objects whose status isn't known are always returned.
+        Args:
+            group_by (str): One of the _index_columns, if given a dict of its value -> set of ids is returned instead of a set
+        """
+        if not self._active_states or not self.hasStarted():
+            return {} if group_by else set()
+
+        self._refreshIndex()
+
+        active_ids = self._index.lookup('status', self._active_states + (None,))
+        if group_by is None:
+            return active_ids
+
+        grouped = {}
+        for this_id in active_ids:
+            grouped.setdefault(self._index.value(this_id, group_by), set()).add(this_id)
+        return grouped
+
     @synchronised_complete_lock
     def startup(self):
         """Connect the repository to the registry. Called from Repository_runtime.py"""
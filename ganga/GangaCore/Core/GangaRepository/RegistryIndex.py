@@ -0,0 +1,156 @@
+##########################################################################
+# Ganga Project. http://cern.ch/ganga
+#
+# In-memory index used by Registry to answer select() queries from the
+# index caches of the objects without loading them from disk.
+##########################################################################
+import fnmatch
+import re
+import threading
+
+
+class RegistryIndex(object):
+
+    """In-memory inverted index over a few columns of the objects in a Registry.
+    For every column a dict maps each distinct value to the set of ids having it, so a select()
+    only has to compare the query against the distinct values instead of against every object.
+    A value of None means the column isn't known for that object, such ids are reported separately
+    so that the caller can check them by other means.
+    """
+
+    __slots__ = ('_entries', '_columns', '_ids_by_obj', '_lock')
+
+    def __init__(self):
+        # id -> (obj, source, values) where source is the index cache the values were taken from
+        self._entries = {}
+        # column -> value -> set of ids
+        self._columns = {}
+        # id(obj) -> id, so that objects can be found without scanning the registry
+        self._ids_by_obj = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, this_id):
+        return this_id in self._entries
+
+    def find(self, obj):
+        """Returns the id under which obj is indexed, or None if it isn't
+        Args:
+            obj (GangaObject): The object we want to look for
+        """
+        this_id = self._ids_by_obj.get(id(obj))
+        if this_id is not None:
+            entry = self._entries.get(this_id)
+            if entry is not None and entry[0] is obj:
+                return this_id
+        return None
+
+    def is_current(self, this_id, obj, source):
+        """Returns True if the entry of this_id was made from this obj and this index cache
+        Args:
+            this_id (int): The id of the object
+            obj (GangaObject): The object currently stored under this_id
+            source (dict): The index cache the values would be taken from, None for live objects
+        """
+        entry = self._entries.get(this_id)
+        return entry is not None and entry[0] is obj and entry[1] is source
+
+    def update(self, this_id, obj, source, values):
+        """Store the column values of an object, replacing any previous entry of this_id
+        Args:
+            this_id (int): The id of the object
+            obj (GangaObject): The object the values belong to
+            source (dict): The index cache the values were taken from, None for live objects
+            values (dict): column -> value, None for values which aren't known
+        """
+        with self._lock:
+            self._discard(this_id)
+            self._entries[this_id] = (obj, source, values)
+            self._ids_by_obj[id(obj)] = this_id
+            for column, value in values.items():
+                self._columns.setdefault(column, {}).setdefault(value, set()).add(this_id)
+
+    def remove(self, this_id):
+        """Forget about the object with this_id
+        Args:
+            this_id (int): The id of the object
+        """
+        with self._lock:
+            self._discard(this_id)
+
+    def _discard(self, this_id):
+        entry = self._entries.pop(this_id, None)
+        if entry is None:
+            return
+        obj, _source, values = entry
+        if self._ids_by_obj.get(id(obj)) == this_id:
+            del self._ids_by_obj[id(obj)]
+        for column, value in values.items():
+            ids = self._columns[column][value]
+            ids.discard(this_id)
+            if not ids:
+                del self._columns[column][value]
+
+    def retain(self, ids):
+        """Drop the entries of all ids which aren't in ids
+        Args:
+            ids (iterable): The ids which are still present
+        """
+        with self._lock:
+            for this_id in set(self._entries).difference(ids):
+                self._discard(this_id)
+
+    def lookup(self, column, values):
+        """Returns the set of ids whose value of column is exactly one of values
+        Args:
+            column (str): The column to look in
+            values (iterable): The values to look for, None finds the ids for which the column isn't known
+        """
+        with self._lock:
+            found = set()
+            ids_by_value = self._columns.get(column, {})
+            for value in values:
+                found.update(ids_by_value.get(value, ()))
+            return found
+
+    def value(self, this_id, column):
+        """Returns the value of column stored for this_id, None if it isn't known
+        Args:
+            this_id (int): The id of the object
+            column (str): The column we want the value of
+        """
+        entry = self._entries.get(this_id)
+        if entry is None:
+            return None
+        return entry[2].get(column)
+
+    def select(self, **attrs):
+        """Returns (matched, unknown) sets of ids.
+        matched are the ids whose values match all of attrs, unknown those for which one of the requested
+        columns isn't known. String values are matched as shell-style wildcards against the string of the
+        stored value, any other value by equality.
+        Args:
+            attrs (dict): column -> value to look for
+        """
+        with self._lock:
+            matched = None
+            unknown = set()
+            for column, wanted in attrs.items():
+                values = self._columns.get(column, {})
+                if isinstance(wanted, str):
+                    reobj = re.compile(fnmatch.translate(wanted))
+                    match = lambda value: reobj.match(str(value))
+                else:
+                    match = lambda value: value == wanted
+                found = set()
+                for value, ids in values.items():
+                    if value is None:
+                        unknown.update(ids)
+                    elif match(value):
+                        found.update(ids)
+                matched = found if matched is None else matched & found
+            if matched is None:
+                matched = set(self._entries)
+            return matched - unknown, unknown
@@ -14,7 +14,6 @@ import os
 import time
 import errno
 import fcntl
-import random
 import datetime
 import getpass
 from pipes import quote
@@ -99,6 +98,14 @@ def getGlobalSessionFiles():
 
 class SessionLockRefresher(GangaThread):
 
+    """Keeps the session files of all the repositories of this session alive and removes those of dead sessions.
+    The files are refreshed together with os.utime on file descriptors which are kept open, every SessionLockRefresh
+    seconds or when asked to with updateNow. The session directory is swept every SessionLockCleanup seconds.
+    """
+
+    # updateNow does nothing if the files were refreshed less than this many seconds ago
+    min_refresh_interval = 3
+
     def __init__(self, session_name, sdir, fn, repo, afs):
         super(SessionLockRefresher, self).__init__(name='SessionLockRefresher', critical=True)
         self.session_name = session_name
@@ -106,11 +113,14 @@ class SessionLockRefresher(GangaThread):
         self.fns = [fn]
         self.repos = [repo]
         self.afs = afs
-        self.FileCheckTimes = {}
+        # session file -> open file descriptor
+        self._fds = {}
+        self._refresh_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._last_refresh = None
+        self._last_now = None
+        self._last_cleanup = None
 
-    # This function attempts to grab the ctime from a file which should exist
-    # As we don't want this to fail outright it attempts to re-read every 1s
-    # for 30sec before failing
     def run(self):
 
         try:
@@ -119,63 +129,96 @@ class SessionLockRefresher(GangaThread):
                 self.updateNow()
                 self.checkAndReap()
 
-                sleeptime = 1  # +random.random()
-
-                for i in range(int(sleeptime * 200)):
-                    if not self.should_stop():
-                        time.sleep(0.05 + random.random() * 0.05)
-                    else:
-                        break
+                self._wake.wait(getConfig('Configuration')['SessionLockRefresh'])
         finally:
+            self._closeFiles()
             self.unregister()
 
+    def stop(self):
+        super(SessionLockRefresher, self).stop()
+        self._wake.set()
+
     def checkAndReap(self):
         # TODO: Check for services active/inactive
         try:
-            for index in range(len(self.fns)):
+            if self._last_cleanup is not None and \
+                    time.time() - self._last_cleanup < getConfig('Configuration')['SessionLockCleanup']:
+                return
+            self._last_cleanup = time.time()
 
-                now = self.delayedUpdateLocks(index)
+            now = self.updateNow()
 
-                # Clear expired session files if monitoring is active
+            # Clear expired session files if monitoring is active
+            if now is not None:
                 self.clearDeadLocks(now)
 
         except Exception as x:
             logger.warning( "Internal exception in session lock thread: %s %s" % (getName(x), x))
 
     def updateNow(self):
+        """Refresh all the session files unless that was done a moment ago, returns their modification time"""
         try:
-            for index in range(len(self.fns)):
-                now = self.delayedUpdateLocks(index)
+            with self._refresh_lock:
+                if self._last_refresh is None or abs(time.time() - self._last_refresh) >= self.min_refresh_interval:
+                    for index in range(len(self.fns)):
+                        now = self.updateLocksNow(index)
+                        if now is not None:
+                            self._last_now = now
+                    self._last_refresh = time.time()
+                return self._last_now
         except Exception as x:
             logger.warning("Internal exception in Updating session lock thread: %s %s" % ( getName(x), x))
 
-    def delayedUpdateLocks(self, index):
-
-        this_index_file = self.fns[index]
-        if this_index_file in self.FileCheckTimes:
-            if abs(self.FileCheckTimes[this_index_file]-time.time()) >= 3:
-                now = self.updateLocksNow(index)
-                self.FileCheckTimes[this_index_file] = now
+    def _touch(self, fn):
+        """Set the times of a session file to now through a file descriptor held open for it, returns its mtime"""
+        fd = self._fds.get(fn)
+        if fd is None:
+            fd = os.open(fn, os.O_RDONLY)
+            self._fds[fn] = fd
+        if os.utime in os.supports_fd:
+            os.utime(fd)
         else:
-            now = self.updateLocksNow(index)
-            self.FileCheckTimes[this_index_file] = now
+            os.utime(fn)
+        stat = os.fstat(fd)
+        # Somebody removed the file, we've been refreshing a file which no longer has that name.
+        # st_nlink alone isn't enough, NFS keeps a removed file which is still open under another name
+        try:
+            path_stat = os.stat(fn)
+        except OSError as err:
+            self._closeFile(fn)
+            if err.errno == errno.ENOENT:
+                raise OSError(errno.ENOENT, "Session file was removed", fn)
+            raise
+        if stat.st_nlink == 0 or (path_stat.st_ino, path_stat.st_dev) != (stat.st_ino, stat.st_dev):
+            self._closeFile(fn)
+            raise OSError(errno.ENOENT, "Session file was removed", fn)
+        return stat.st_mtime
+
+    def _closeFile(self, fn):
+        fd = self._fds.pop(fn, None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError as err:
+                logger.debug("Failed to close session file %s: %s" % (fn, err))
 
-        return self.FileCheckTimes[this_index_file]
+    def _closeFiles(self):
+        with self._refresh_lock:
+            for fn in list(self._fds):
+                self._closeFile(fn)
 
     def updateLocksNow(self, index, failCount=0):
         this_index_file = self.fns[index]
         now = None
         try:
-            oldnow = os.stat(this_index_file).st_ctime
-            os.system('touch "%s"' % this_index_file)
-            now = os.stat(this_index_file).st_ctime # os.stat(self.fn).st_ctime
+            now = self._touch(this_index_file)
         except OSError as x:
             if x.errno != errno.ENOENT:
+                self._closeFile(this_index_file)
                 logger.debug("Session file timestamp could not be updated! Locks could be lost!")
                 if now is None and failCount < 4:
                     try:
                         logger.debug("Attempting to lock file again, unknown error:\n'%s'" % x)
-                        import time
                         time.sleep(0.5)
                         failcount=failCount+1
                         now = self.updateLocksNow(index, failcount)
@@ -238,16 +281,21 @@ class SessionLockRefresher(GangaThread):
         return len(self.fns)
 
     def addRepo(self, fn, repo):
-        #logger.debug("Adding Repo: %s" % repo )
-        self.repos.append(repo)
-        #logger.debug("Adding fn: %s" % fn )
-        self.fns.append(fn)
+        with self._refresh_lock:
+            #logger.debug("Adding Repo: %s" % repo )
+            self.repos.append(repo)
+            #logger.debug("Adding fn: %s" % fn )
+            self.fns.append(fn)
+            # Make sure that the new file is refreshed by the next updateNow
+            self._last_refresh = None
 
     def removeRepo(self, fn, repo):
-        #logger.debug("Removing fn: %s" % fn )
-        self.fns.remove(fn)
-        #logger.debug("Removing fn: %s" % fn )
-        self.repos.remove(repo)
+        with self._refresh_lock:
+            #logger.debug("Removing fn: %s" % fn )
+            self.fns.remove(fn)
+            #logger.debug("Removing fn: %s" % fn )
+            self.repos.remove(repo)
+            self._closeFile(fn)
 
         try:
             assert(len(self.fns) == len(self.repos))
@@ -457,6 +505,7 @@ class SessionLockManager(object):
             if session_lock_refresher is not None:
                 session_lock_refresher.removeRepo(self.fn, self.repo)
                 if session_lock_refresher.numberRepos() <= 1:
+                    session_lock_refresher._closeFiles()
                     session_lock_refresher = None
             os.unlink(self.fn)
         except OSError as x:
@@ -5,11 +5,15 @@ from GangaCore.Core.GangaRepository.GangaRepository import RepositoryError
 from GangaCore.Core.exceptions import GangaException
 from GangaCore.GPIDev.Base.Proxy import stripProxy
 from GangaCore.Core.GangaRepository.VStreamer import XMLFileError
+from GangaCore.Utility.Config import getConfig
 import errno
 import copy
 import threading
 import shutil
-from os import listdir, path, stat
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from os import listdir, path, stat, rename, remove
 
 logger = getLogger()
 
@@ -49,6 +53,9 @@ class SubJobXMLList(GangaObject):
 
     _schema = Schema(Version(1, 0), {})
 
+    # Subjobs in these states are kept in the set of active subjobs which are monitored
+    _activeStates = ('submitting', 'submitted', 'running')
+
     def __init__(self, jobDirectory='', registry=None, dataFileName='data', load_backup=False, parent=None):
         """ Constructor for SubjobXMLList
         Args:
@@ -70,6 +77,10 @@ class SubJobXMLList(GangaObject):
         self._definedParent = None
 
         self._subjob_master_index_name = "subjobs.idx"
+        # Number of entries appended to the index journal since the index was last written in full, None if it must be rewritten
+        self._journal_entries = None
+        # Ids of the subjobs in one of the _activeStates, None until they have been looked up in the index
+        self._activeIds = None
 
         if jobDirectory == '' and registry is None:
             return
@@ -101,6 +112,8 @@ class SubJobXMLList(GangaObject):
         obj._load_backup = copy.deepcopy(self._load_backup, memo)
         obj._cached_filenames = copy.deepcopy(self._cached_filenames, memo)
         obj._stored_len = copy.deepcopy(self._stored_len, memo)
+        obj._journal_entries = self._journal_entries
+        obj._activeIds = None
 
         ## Manually define unsafe/uncopyable objects
         obj._definedParent = None
@@ -124,6 +137,7 @@ class SubJobXMLList(GangaObject):
     def load_subJobIndex(self):
         """Load the index from all sujobs ynto _subjobIndexData or empty it is an error occurs"""
         index_file = path.join(self._jobDirectory, self._subjob_master_index_name )
+        self._activeIds = None
         if path.isfile( index_file ):
             index_file_obj = None
             try:
@@ -132,6 +146,7 @@ class SubJobXMLList(GangaObject):
                 try:
                     index_file_obj = open(index_file, "rb" )
                     self._subjobIndexData = from_file( index_file_obj )[0]
+                    self.__load_journal(index_file)
                 except IOError as err:
                     self._subjobIndexData = None
                     self._setDirty()
@@ -187,42 +202,123 @@ class SubJobXMLList(GangaObject):
             logger.debug("Can't write Index. Moving on as this is not essential to functioning it's a performance bug")
             logger.debug("Error: %s" % err)
 
+    def __journal_name(self):
+        """Return the name of the journal holding the index entries changed since the index was last written in full"""
+        return path.join(self._jobDirectory, self._subjob_master_index_name + '.journal')
+
+    @staticmethod
+    def __index_signature(index_file):
+        """Identify the version of the full index file a journal belongs to
+        Args:
+            index_file (str): path of the full index file
+        """
+        index_stat = stat(index_file)
+        return (index_stat.st_ino, index_stat.st_size, index_stat.st_mtime)
+
+    def __load_journal(self, index_file):
+        """Apply the entries from the journal on top of the full index which has just been loaded into _subjobIndexData
+        A journal written for an older version of the full index is ignored and a damaged one causes the index to be rewritten
+        Args:
+            index_file (str): path of the full index file which has been loaded
+        """
+        self._journal_entries = None
+        journal_file = self.__journal_name()
+        if not path.isfile(journal_file):
+            self._journal_entries = 0
+            return
+
+        with open(journal_file, 'rb') as journal:
+            try:
+                header = pickle.load(journal)
+            except Exception as err:
+                logger.debug("Cannot read subjob index journal header: %s" % err)
+                return
+            if header != (self._subjob_master_index_name, self.__index_signature(index_file)):
+                logger.debug("Ignoring subjob index journal written for a different index: %s" % journal_file)
+                return
+            entries = 0
+            while True:
+                try:
+                    changes = pickle.load(journal)
+                except EOFError:
+                    break
+                except Exception as err:
+                    # Most likely a partially written record, keep what we have and rewrite the index on the next flush
+                    logger.debug("Damaged subjob index journal record: %s" % err)
+                    return
+                self._subjobIndexData.update(changes)
+                entries += len(changes)
+        self._journal_entries = entries
+
     def __really_writeIndex(self, ignore_disk=False):
         """Do the actual work of writing the index for all subjobs
+        Only the entries which have changed are appended to the journal, the full index is written when there is no usable
+        journal or once the journal has grown as large as the index itself
         Args:
             ignore_disk (bool): Optional flag to force the class to ignore all on-disk data when flushing
         """
 
-        all_caches = {}
         if ignore_disk:
             range_limit = list(self._cachedJobs.keys())
         else:
             range_limit = list(range(len(self)))
 
+        index_file = path.join(self._jobDirectory, self._subjob_master_index_name)
+        full_write = ignore_disk or self._journal_entries is None or not path.isfile(index_file)
+
+        changes = {}
         for sj_id in range_limit:
+            old_cache = self._subjobIndexData.get(sj_id)
             if sj_id in self._cachedJobs:
                 this_cache = self._registry.getIndexCache(self.__getitem__(sj_id))
-                all_caches[sj_id] = this_cache
-                disk_location = self.__get_dataFile(sj_id)
-                all_caches[sj_id]['modified'] = stat(disk_location).st_ctime
+                if old_cache is not None and this_cache == dict((k, v) for k, v in old_cache.items() if k != 'modified'):
+                    continue
+            elif old_cache is not None:
+                continue
             else:
-                if sj_id in self._subjobIndexData:
-                    all_caches[sj_id] = self._subjobIndexData[sj_id]
-                else:
-                    this_cache = self._registry.getIndexCache(self.__getitem__(sj_id))
-                    all_caches[sj_id] = this_cache
-                    disk_location = self.__get_dataFile(sj_id)
-                    all_caches[sj_id]['modified'] = stat(disk_location).st_ctime
-
-        try:
-            from GangaCore.Core.GangaRepository.PickleStreamer import to_file
-            index_file = path.join(self._jobDirectory, self._subjob_master_index_name)
-            index_file_obj = open(index_file, "wb")
-            to_file(all_caches, index_file_obj)
-            index_file_obj.close()
-        ## Once I work out what the other exceptions here are I'll add them
-        except (IOError,) as err:
-            logger.debug("cache write error: %s" % err)
+                this_cache = self._registry.getIndexCache(self.__getitem__(sj_id))
+            disk_location = self.__get_dataFile(sj_id)
+            this_cache['modified'] = stat(disk_location).st_ctime
+            changes[sj_id] = this_cache
+
+        if not full_write:
+            if not changes:
+                return
+            # Subjobs have gone away or the journal is too big, start from a clean index
+            full_write = len(self._subjobIndexData) + len([k for k in changes if k not in self._subjobIndexData]) != len(range_limit) \
+                or self._journal_entries + len(changes) > max(len(range_limit), 100)
+
+        from GangaCore.Core.GangaRepository.PickleStreamer import to_file
+        journal_file = self.__journal_name()
+
+        if full_write:
+            all_caches = {}
+            for sj_id in range_limit:
+                all_caches[sj_id] = changes[sj_id] if sj_id in changes else self._subjobIndexData[sj_id]
+            try:
+                new_index_file = index_file + '.new'
+                with open(new_index_file, "wb") as index_file_obj:
+                    to_file(all_caches, index_file_obj)
+                rename(new_index_file, index_file)
+                # A journal left behind from here on doesn't match the new index and is ignored when loading
+                if path.isfile(journal_file):
+                    remove(journal_file)
+                self._subjobIndexData = all_caches
+                self._journal_entries = 0
+            ## Once I work out what the other exceptions here are I'll add them
+            except (IOError,) as err:
+                logger.debug("cache write error: %s" % err)
+        else:
+            try:
+                with open(journal_file, "ab") as journal:
+                    if journal.tell() == 0:
+                        to_file((self._subjob_master_index_name, self.__index_signature(index_file)), journal)
+                    to_file(changes, journal)
+                self._subjobIndexData.update(changes)
+                self._journal_entries += len(changes)
+            except (IOError,) as err:
+                logger.debug("cache journal write error: %s" % err)
+                self._journal_entries = None
 
     def __iter__(self):
         """Return iterator for this class"""
@@ -465,22 +561,57 @@ class SubJobXMLList(GangaObject):
 
         return None
 
-    def getAllCachedData(self):
-        """Get the cached data from the index for all subjobs"""
+    def getAllCachedData(self, indices=None):
+        """Get the cached data from the index for all subjobs
+        Args:
+            indices (list): Only return the data of these subjobs, in this order, e.g. those from getActiveIds()
+        """
         cached_data = []
+        if indices is None:
+            indices = range(len(self))
         #logger.debug("Cache: %s" % self._subjobIndexData)
         if len(self._subjobIndexData) == len(self):
-            for i in range(len(self)):
+            for i in indices:
                 if self.isLoaded(i):
                     cached_data.append( self._registry.getIndexCache( self.__getitem__(i) ) )
                 else:
                     cached_data.append( self._subjobIndexData[i] )
         else:
-            for i in range(len(self)):
+            for i in indices:
                 cached_data.append(self._registry.getIndexCache( self.__getitem__(i) ) )
 
         return cached_data
 
+    def getActiveIds(self):
+        """
+        Returns the sorted ids of the subjobs in one of the _activeStates. The set is built once from the statuses stored
+        in the subjob index and afterwards kept up to date by subjobStatusChanged, so finding the few active subjobs of a
+        large job doesn't mean looking at all of them in every monitoring step.
+        """
+        if self._activeIds is None:
+            self._activeIds = set(sj_id for sj_id, status in enumerate(self.getAllSJStatus()) if status in self._activeStates)
+        return sorted(self._activeIds)
+
+    def subjobStatusChanged(self, subjob):
+        """
+        Keep the set of active subjobs up to date, called by Job.updateStatus when the status of a subjob changes
+        Args:
+            subjob (Job): The subjob which has changed its status
+        """
+        if self._activeIds is None:
+            return
+        if subjob.status in self._activeStates:
+            self._activeIds.add(subjob.id)
+        else:
+            self._activeIds.discard(subjob.id)
+
+    def resetActiveIds(self):
+        """
+        Forget the set of active subjobs so that it's looked up again, e.g. after the subjobs were (re)submitted as the
+        backends may set their status directly
+        """
+        self._activeIds = None
+
     def getAllSJStatus(self):
         """
         Returns the cached statuses of the subjobs whilst respecting the Lazy loading
@@ -497,12 +628,33 @@ class SubJobXMLList(GangaObject):
                 sj_statuses.append(self.__getitem__(i).status)
         return sj_statuses
 
+    def getAllSJStatusTimestamps(self):
+        """
+        Returns the list of the (status, timestamps) of the subjobs whilst respecting the Lazy loading. Subjobs whose
+        index entry predates the timestamps being stored there are loaded.
+        """
+        sj_data = []
+        if len(self._subjobIndexData) == len(self):
+            for i in range(len(self)):
+                index_data = self._subjobIndexData[i]
+                if not self.isLoaded(i) and 'timestamps' in index_data:
+                    sj_data.append((index_data['status'], index_data['timestamps']))
+                else:
+                    subjob = self.__getitem__(i)
+                    sj_data.append((subjob.status, subjob.time.timestamps))
+        else:
+            for i in range(len(self)):
+                subjob = self.__getitem__(i)
+                sj_data.append((subjob.status, subjob.time.timestamps))
+        return sj_data
+
     def flush(self, ignore_disk=False):
         """Flush all subjobs to disk using XML methods
+        The dirty subjobs are written in parallel by up to Registry.SubjobFlushThreads threads and the index is written once at the end
         Args:
             ignore_disk (bool): Optional flag to force the class to ignore all on-disk data when flushing
         """
-        from GangaCore.Core.GangaRepository.GangaRepositoryXML import safe_save
+        from GangaCore.Core.GangaRepository.GangaRepositoryXML import safe_save, safe_write, check_app_hash
 
         from GangaCore.Core.GangaRepository.VStreamer import to_file
 
@@ -511,6 +663,7 @@ class SubJobXMLList(GangaObject):
         else:
             range_limit = list(range(len(self)))
 
+        to_save = []
         for index in range_limit:
             if index in self._cachedJobs:
                 ## If it ain't dirty skip it
@@ -523,7 +676,27 @@ class SubJobXMLList(GangaObject):
                 if subjob_obj is subjob_obj._getRoot():
                     raise GangaException(self, "Subjob parent not set correctly in flush.")
 
-                safe_save( subjob_data, subjob_obj, to_file )
+                to_save.append((subjob_data, subjob_obj))
+
+        num_threads = min(getConfig('Registry')['SubjobFlushThreads'], len(to_save))
+        if num_threads > 1:
+            # Reading a subjob needs the lock of its master job, which is held while flushing, so the XML is generated
+            # here and only the writing is done in parallel. Each subjob lives in its own directory so safe_write
+            # doesn't serialise these writes
+            to_write = []
+            for subjob_data, subjob_obj in to_save:
+                check_app_hash(subjob_obj)
+                xml = StringIO()
+                to_file(subjob_obj, xml)
+                to_write.append((subjob_data, xml.getvalue()))
+            with ThreadPoolExecutor(max_workers=num_threads) as pool:
+                futures = [pool.submit(safe_write, subjob_data, xml) for subjob_data, xml in to_write]
+            # Raise the first error only once all of the writes have finished
+            for future in futures:
+                future.result()
+        else:
+            for subjob_data, subjob_obj in to_save:
+                safe_save(subjob_data, subjob_obj, to_file)
 
         self.write_subJobIndex(ignore_disk)
 
@@ -615,3 +788,99 @@ class SubJobXMLList(GangaObject):
         else:
             raise GangaException("Missing subjobs data file in %s" % jobDirectory)
 
+
+class SubJobSQLiteList(SubJobXMLList):
+
+    """
+    SubJobXMLList which reads the subjobs from the subjobs table of a GangaRepositorySQLite. Only the index blobs are
+    read up front, the XML of a subjob is read and parsed the first time the subjob is accessed
+    """
+
+    _name = 'SubJobSQLiteList'
+
+    _schema = Schema(Version(1, 0), {})
+
+    def __init__(self, repository=None, master_id=None, index_rows=(), parent=None):
+        """ Constructor for SubJobSQLiteList
+        Args:
+            repository (GangaRepositorySQLite): the repository holding the subjobs
+            master_id (int): id of the master job of the subjobs
+            index_rows (list): (id, idx) rows of the subjobs as read from the subjobs table
+            parent (Job): parent of self after construction
+        """
+        super(SubJobSQLiteList, self).__init__()
+
+        self._repository = repository
+        self._master_id = master_id
+        self._registry = repository.registry if repository is not None else None
+
+        self._subjobIndexData = {}
+        for sj_id, idx in index_rows:
+            try:
+                self._subjobIndexData[sj_id] = pickle.loads(idx)
+            except Exception as err:
+                # The subjob is loaded when its index data is asked for
+                logger.debug("Failed to load index of subjob %s.%s: %s" % (master_id, sj_id, err))
+        self._length = len(index_rows)
+
+        self._cached_filenames = {}
+        self._stored_len = []
+        self._storedKeys = {}
+        self._load_lock = threading.Lock()
+
+        if parent:
+            self._setParent(parent)
+
+    def __deepcopy__(self, memo=None):
+        obj = super(SubJobSQLiteList, self).__deepcopy__(memo)
+        obj._repository = self._repository
+        obj._master_id = self._master_id
+        obj._length = self._length
+        obj._storedKeys = {}
+        obj._load_lock = threading.Lock()
+        return obj
+
+    def load_subJobIndex(self):
+        """The index of the subjobs is read together with their master by GangaRepositorySQLite.load"""
+        pass
+
+    def write_subJobIndex(self, ignore_disk=False):
+        """The index of the subjobs is written with the subjobs by GangaRepositorySQLite.flush"""
+        pass
+
+    def flush(self, ignore_disk=False):
+        """The dirty subjobs are written together with their master by GangaRepositorySQLite.flush"""
+        pass
+
+    def __len__(self):
+        """Return the number of subjobs stored for the master job"""
+        return self._length
+
+    def _getItem(self, index):
+        """Read the subjob from the database and parse it the first time it is asked for, keep it in memory afterwards
+        Args:
+            index (int): The index corresponding to the subjob object we want
+        """
+        if index not in self._cachedJobs:
+
+            # obtain a lock to make sure multiple loads of the same object don't happen
+            with self._load_lock:
+
+                # just make sure we haven't loaded this object already while waiting on the lock
+                if index in self._cachedJobs:
+                    return self._cachedJobs[index]
+
+                if index < 0 or index >= len(self):
+                    raise GangaException("Subjob: %s does NOT exist" % index)
+
+                logger.debug("Loading subjob #%s of job #%s from the database" % (index, self._master_id))
+                rows = self._repository._execute("SELECT data FROM subjobs WHERE master_id = ? AND id = ?", (self._master_id, index))
+                if not rows or rows[0][0] is None:
+                    raise RepositoryError(self._repository, "Subjob %s of job %s is missing from the database" % (index, self._master_id))
+
+                loaded_sj = self._repository._parse_object(self._master_id, rows[0][0])
+                loaded_sj._setParent(self._definedParent)
+                loaded_sj._setFlushed()
+                self._cachedJobs[index] = loaded_sj
+
+        return self._cachedJobs[index]
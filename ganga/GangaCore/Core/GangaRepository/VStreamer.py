@@ -1,4 +1,5 @@
 import re
+import sys
 from GangaCore.Core.exceptions import GangaException
 from GangaCore.Utility.logging import getLogger
 from GangaCore.GPIDev.Base.Proxy import addProxy, stripProxy, isType, getName
@@ -18,12 +19,21 @@ from .GangaRepository import SchemaVersionError
 
 import xml.sax.saxutils
 import copy
-from io import StringIO
+import json
 
 logger = getLogger()
 
 _cached_eval_strings = {}
 
+# (category, name, version) -> class for the <class> elements seen so far
+_cached_classes = {}
+
+# Used to fix up Python 2 long integers e.g. {1L} in old files
+_long_int_re = re.compile(r'(\d)L(\})')
+
+# Characters which can't be stored verbatim as XML character data (\r is normalised away by the parser)
+_xml_unsafe_re = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\r\ud800-\udfff\ufffe\uffff]')
+
 ##########################################################################
 # Ganga Project. http://cern.ch/ganga
 #
@@ -49,12 +59,15 @@ class XMLFileError(GangaException):
         return "XMLFileError: %s %s" % (self.message, err)
 
 def _raw_to_file(j, fobj=None, ignore_subs=[]):
-    sio = StringIO()
-    vstreamer = VStreamer(out=sio, selection=ignore_subs)
+    vstreamer = VStreamer(selection=ignore_subs)
     vstreamer.begin_root()
     j.accept(vstreamer)
     vstreamer.end_root()
-    print(sio.getvalue(), file=fobj)
+    # Files have always ended with an empty line, keep it so that the output doesn't change
+    vstreamer.write('\n')
+    if fobj is None:
+        fobj = sys.stdout
+    fobj.write(vstreamer.getvalue())
 
 def to_file(j, fobj=None, ignore_subs=[]):
     #used to debug write problems - rcurrie
@@ -110,6 +123,92 @@ def escape(s):
 def unescape(s):
     return xml.sax.saxutils.unescape(s)
 
+
+def _is_json_exact(x):
+    """Return True if x survives a round trip through json unchanged (no tuples, non-str keys etc)"""
+    t = type(x)
+    if t in (str, bool, int) or x is None:
+        return True
+    if t is float:
+        return x == x and x not in (float('inf'), float('-inf'))
+    if t is list:
+        return all(_is_json_exact(v) for v in x)
+    if t is dict:
+        return all(type(k) is str and _is_json_exact(v) for k, v in x.items())
+    return False
+
+
+def value_element(x):
+    """
+    Return the <value> element holding x.
+    Simple types are tagged with their type so that the Loader can decode them without eval,
+    anything else is stored as its repr and evaluated on loading.
+    Args:
+        x (unknown): the value to be stored
+    """
+    t = type(x)
+    if x is None:
+        return '<value type="none">None</value>'
+    elif t is str:
+        if not _xml_unsafe_re.search(x):
+            return '<value type="str">%s</value>' % escape(x)
+    elif t is bool:
+        return '<value type="bool">%s</value>' % x
+    elif t is int:
+        return '<value type="int">%d</value>' % x
+    elif t is float:
+        return '<value type="float">%r</value>' % x
+    elif t in (list, dict):
+        if _is_json_exact(x):
+            return '<value type="json">%s</value>' % escape(json.dumps(x))
+    return '<value>%s</value>' % escape(repr(x))
+
+
+def decode_value(value_type, s):
+    """
+    Decode the content of a <value type="..."> element written by value_element
+    Args:
+        value_type (str): the type attribute of the element
+        s (str): the (already unescaped) content of the element
+    """
+    if value_type == 'str':
+        return s
+    elif value_type == 'int':
+        return int(s)
+    elif value_type == 'float':
+        return float(s)
+    elif value_type == 'bool':
+        return s == 'True'
+    elif value_type == 'none':
+        return None
+    elif value_type == 'json':
+        return json.loads(s)
+    raise ValueError("Unknown value type: %s" % value_type)
+
+
+def find_class(category, name, version_str):
+    """
+    Return the plugin class for a <class> element, caching the lookup and the schema version check
+    Raise PluginManagerError if the class is not known, SchemaVersionError if the versions are incompatible
+    Args:
+        category (str): category attribute of the element
+        name (str): name attribute of the element
+        version_str (str): version attribute of the element
+    """
+    key = (category, name, version_str)
+    try:
+        return _cached_classes[key]
+    except KeyError:
+        pass
+    cls = allPlugins.find(category, name)
+    version = Version(*[int(v) for v in version_str.split('.')])
+    if not cls._schema.version.isCompatible(version):
+        currversion = '%s.%s' % (cls._schema.version.major, cls._schema.version.minor)
+        raise SchemaVersionError('Incompatible schema of %s, repository is %s currently in use is %s' % (name, version_str, currversion))
+    # Only successful lookups are cached as plugins may be loaded later on
+    _cached_classes[key] = cls
+    return cls
+
 # An experimental, fast way to print a tree of Ganga Objects to file
 # Unused at the moment
 
@@ -143,7 +242,7 @@ def fastXML(obj, indent='', ignore_subs=''):
         sl.append('</class>')
         return sl
     else:
-        return ["<value>", escape(repr(obj)), "</value>"]
+        return [value_element(obj)]
 
 ##########################################################################
 # A visitor to print the object tree into XML.
@@ -152,24 +251,32 @@ def fastXML(obj, indent='', ignore_subs=''):
 
 class VStreamer(object):
     # Arguments:
-    # out: file-like output stream where to print, default sys.stdout
+    # out: file-like output stream where to write the document when end_root() is called
+    #      if None the document is only kept in memory, see getvalue()
     # selection: string specifying the name of properties which should not be printed
     # e.g. 'subjobs' - will not print subjobs
+    #
+    # The document is built up in a list of strings and written out in one go,
+    # the output is identical to the one produced by printing each token separately
 
     def __init__(self, out=None, selection=[]):
         self.level = 0
         self.selection = selection
-        if out is not None:
-            self.out = out
-        else:
-            import sys
-            self.out = sys.stdout
+        self.out = out
+        self._buffer = []
+        self.write = self._buffer.append
+
+    def getvalue(self):
+        """Return the document as built up so far"""
+        return ''.join(self._buffer)
 
     def begin_root(self):
-        print('<root>', file=self.out)
+        self.write('<root>\n')
 
     def end_root(self):
-        print('</root>', file=self.out)
+        self.write('</root>\n')
+        if self.out is not None:
+            self.out.write(self.getvalue())
 
     def indent(self):
         return ' ' * (self.level - 1) * 3
@@ -177,15 +284,15 @@ class VStreamer(object):
     def nodeBegin(self, node):
         self.level += 1
         s = node._schema
-        print(self.indent(), '<class name="%s" version="%d.%d" category="%s">' % (s.name, s.version.major, s.version.minor, s.category), file=self.out)
+        self.write('%s <class name="%s" version="%d.%d" category="%s">\n' % (self.indent(), s.name, s.version.major, s.version.minor, s.category))
 
     def nodeEnd(self, node):
-        print(self.indent(), '</class>', file=self.out)
+        self.write(self.indent() + ' </class>\n')
         self.level -= 1
         return
 
     def print_value(self, x):
-        print('\n', self.indent(), '<value>%s</value>' % escape(repr(x)), file=self.out)
+        self.write('\n %s %s\n' % (self.indent(), value_element(x)))
 
     def showAttribute(self, node, name):
         return (self.level > 1 or name not in self.selection) and not node._schema.getItem(name)['transient']
@@ -193,27 +300,25 @@ class VStreamer(object):
     def simpleAttribute(self, node, name, value, sequence):
         if self.showAttribute(node, name):
             self.level += 1
-            print(self.indent(), end=' ', file=self.out)
-            print('<attribute name="%s">' % name, end=' ', file=self.out)
+            indent = self.indent()
             if sequence:
                 self.level += 1
-                print(file=self.out)
-                print(self.indent(), '<sequence>', file=self.out)
+                self.write('%s <attribute name="%s"> \n%s <sequence>\n' % (indent, name, self.indent()))
                 for v in value:
                     self.acceptOptional(v)
-                print(self.indent(), '</sequence>', file=self.out)
+                self.write(self.indent() + ' </sequence>\n')
                 self.level -= 1
-                print(self.indent(), '</attribute>', file=self.out)
+                self.write(indent + ' </attribute>\n')
             else:
+                self.write('%s <attribute name="%s"> ' % (indent, name))
                 self.level += 1
                 if isinstance(value, GangaObject):
-                    print("", file=self.out)
+                    self.write('\n')
                     self.acceptOptional(value)
                 else:
                     self.print_value(value)
                 self.level -= 1
-                print(self.indent(), end=' ', file=self.out)
-                print('</attribute>', file=self.out)
+                self.write(indent + ' </attribute>\n')
             self.level -= 1
 
     def sharedAttribute(self, node, name, value, sequence):
@@ -222,17 +327,18 @@ class VStreamer(object):
     def acceptOptional(self, s):
         self.level += 1
         if s is None:
-            print(self.indent(), '<value>None</value>', file=self.out)
+            self.write('%s %s\n' % (self.indent(), value_element(None)))
         else:
             if isType(s, str):
-                print(self.indent(), '<value>%s</value>' % escape(repr(s)), file=self.out)
+                self.write('%s %s\n' % (self.indent(), value_element(s)))
             elif hasattr(s, 'accept'):
                 s.accept(self)
             elif isType(s, (list, tuple, GangaList)):
-                print(self.indent(), '<sequence>', file=self.out)
+                indent = self.indent()
+                self.write(indent + ' <sequence>\n')
                 for sub_s in s:
                     self.acceptOptional(sub_s)
-                print(self.indent(), '</sequence>', file=self.out)
+                self.write(indent + ' </sequence>\n')
             else:
                 self.print_value(s)
         self.level -= 1
@@ -240,17 +346,18 @@ class VStreamer(object):
     def componentAttribute(self, node, name, subnode, sequence):
         if self.showAttribute(node, name):
             self.level += 1
-            print(self.indent(), '<attribute name="%s">' % name, file=self.out)
+            indent = self.indent()
+            self.write('%s <attribute name="%s">\n' % (indent, name))
             if sequence:
                 self.level += 1
-                print(self.indent(), '<sequence>', file=self.out)
+                self.write(self.indent() + ' <sequence>\n')
                 for s in subnode:
                     self.acceptOptional(s)
-                print(self.indent(), '</sequence>', file=self.out)
+                self.write(self.indent() + ' </sequence>\n')
                 self.level -= 1
             else:
                 self.acceptOptional(subnode)
-            print(self.indent(), '</attribute>', file=self.out)
+            self.write(indent + ' </attribute>\n')
             self.level -= 1
 
 
@@ -282,8 +389,9 @@ class Loader(object):
         # ignore nested XML elements in case of data errors at a higher level
         self.ignore_count = 0
         self.errors = []  # list of exception objects in case of data errors
-        # buffer for <value> elements (evaled as python expressions)
+        # buffer for <value> elements (evaled as python expressions unless they have a type)
         self.value_construct = None
+        self.value_type = None
         # buffer for building sequences (FIXME: what about nested sequences?)
         self.sequence_start = []
 
@@ -313,8 +421,8 @@ class Loader(object):
             # on the stack
             if name == 'class':
                 try:
-                    cls = allPlugins.find(attrs['category'], attrs['name'])
-                except PluginManagerError as e:
+                    cls = find_class(attrs['category'], attrs['name'], attrs['version'])
+                except (PluginManagerError, SchemaVersionError) as e:
                     self.errors.append(e)
                     #self.errors.append('Unknown class: %(name)s'%attrs)
                     obj = EmptyGangaObject()
@@ -322,17 +430,8 @@ class Loader(object):
                     # element (</class>) is reached
                     self.ignore_count = 1
                 else:
-                    version = Version(*[int(v) for v in attrs['version'].split('.')])
-                    if not cls._schema.version.isCompatible(version):
-                        attrs['currversion'] = '%s.%s' % (cls._schema.version.major, cls._schema.version.minor)
-                        self.errors.append(SchemaVersionError('Incompatible schema of %(name)s, repository is %(version)s currently in use is %(currversion)s' % attrs))
-                        obj = EmptyGangaObject()
-                        # ignore all elemenents until the corresponding ending
-                        # element (</class>) is reached
-                        self.ignore_count = 1
-                    else:
-                        # Initialize and cache a c class instance to use as a classs factory
-                        obj = cls.getNew()
+                    # Initialize and cache a c class instance to use as a classs factory
+                    obj = cls.getNew()
                 self.stack.append(obj)
 
             # push the attribute name on the stack
@@ -342,6 +441,7 @@ class Loader(object):
             # start value_contruct mode and initialize the value buffer
             if name == 'value':
                 self.value_construct = ''
+                self.value_type = attrs.get('type')
 
             # save a marker where the sequence begins on the stack
             if name == 'sequence':
@@ -371,11 +471,19 @@ class Loader(object):
 
             # when </value> is seen the value_construct buffer (CDATA) should
             # be a python expression (e.g. quoted string)
-            if name == 'value':
+            if name == 'value' and self.value_type is not None:
+                # typed values are decoded directly, expat has already unescaped the content
+                try:
+                    self.stack.append(decode_value(self.value_type, self.value_construct))
+                except:
+                    raise GangaException("ERROR in loading XML, failed to correctly parse %s attribute value: \'%s\'" % (self.value_type, str(self.value_construct)))
+                self.value_construct = None
+                self.value_type = None
+            elif name == 'value':
                 try:
                     # unescape the special characters
                     s = unescape(self.value_construct)
-                    s = re.sub('(\d)L(\})', r'\1\2', s)
+                    s = _long_int_re.sub(r'\1\2', s)
                     if s not in _cached_eval_strings:
                         # This is ugly and classes which use this are bad, but this needs to be fixed in another PR
                         # TODO Make the scope of objects a lot better than whatever is in the config
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 import queue
+import time
 import traceback
 import threading
 import collections
+from concurrent import futures
 from GangaCore.Core.exceptions import GangaException, GangaTypeError
 from GangaCore.Core.GangaThread import GangaThread
 from GangaCore.Utility.execute import execute
@@ -25,6 +27,85 @@ class FunctionInput(namedtuple('FunctionInput', ['function', 'args', 'kwargs']))
         pass
 
 
+class TaskFuture(futures.Future):
+
+    """
+    The Future of a function run by a WorkerThreadPool, which also records when the function was queued, started and
+    finished so that the time spent waiting for a worker thread can be told from the time spent running
+    """
+
+    def __init__(self, name=None):
+        super(TaskFuture, self).__init__()
+        self.name = name
+        self.queued = time.time()
+        self.started = None
+        self.finished = None
+
+    def wait_time(self):
+        """Returns the seconds spent in the queue, up to now if the task hasn't started"""
+        return (self.started or self.finished or time.time()) - self.queued
+
+    def run_time(self):
+        """Returns the seconds spent running, up to now if the task hasn't finished, None if it hasn't started"""
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+
+def _run_task(future, function, args, kwargs):
+    """
+    Run a function submitted to a WorkerThreadPool and resolve its future with the result or the exception
+    Args:
+        future (TaskFuture): The future of the task
+        function (callable): The function to run
+        args (tuple): The arguments of function
+        kwargs (dict): The keyword arguments of function
+    """
+    if not future.set_running_or_notify_cancel():
+        return
+    future.started = time.time()
+    try:
+        result = function(*args, **kwargs)
+    except BaseException as err:
+        future.finished = time.time()
+        future.set_exception(err)
+    else:
+        future.finished = time.time()
+        future.set_result(result)
+
+
+def wait_for_tasks(tasks, progress=None, report_interval=60.):
+    """
+    Wait for all of the tasks to finish, whether they succeed or not. If none of them finishes for report_interval
+    seconds the number still queued and running, and for how long the longest one has been running, are logged so that
+    slow tasks can be told from stuck ones.
+    Args:
+        tasks (list): The TaskFutures to wait for
+        progress (callable): Called with the number of finished tasks, the number of tasks and the future as each
+                             task finishes, in the calling thread
+        report_interval (float): Seconds without any task finishing after which the state of the tasks is logged
+    """
+    total = len(tasks)
+    finished = 0
+    pending = set(tasks)
+    while pending:
+        done, pending = futures.wait(pending, timeout=report_interval, return_when=futures.FIRST_COMPLETED)
+        if not done:
+            running = [task.run_time() for task in pending if task.started is not None]
+            logger.info("Waiting for %d of %d tasks: %d queued, %d running (the longest for %.0fs)",
+                        len(pending), total, len(pending) - len(running), len(running), max(running or [0.]))
+            continue
+        for task in done:
+            finished += 1
+            if progress is not None:
+                progress(finished, total, task)
+
+    if tasks:
+        run_times = [task.run_time() for task in tasks if task.started is not None]
+        logger.debug("%d tasks finished, waited at most %.2fs for a thread, ran for %.2fs on average and %.2fs at most",
+                     total, max(task.wait_time() for task in tasks),
+                     sum(run_times) / len(run_times) if run_times else 0., max(run_times or [0.]))
+
 
 class WorkerThreadPool(object):
 
@@ -105,7 +186,10 @@ class WorkerThreadPool(object):
                 continue
 
             if isinstance(item.command_input, FunctionInput):
-                thread._command = getName(item.command_input.function)
+                if item.command_input.function is _run_task:
+                    thread._command = getName(item.command_input.args[1])
+                else:
+                    thread._command = getName(item.command_input.function)
             elif isinstance(item.command_input, CommandInput):
                 thread._command = item.command_input.command
                 thread._timeout = item.command_input.timeout
@@ -190,6 +274,31 @@ class WorkerThreadPool(object):
                                       fallback_func=FunctionInput(fallback_func, fallback_args, fallback_kwargs), name=name
                                       ))
 
+    def submit(self, function, args=(), kwargs={}, priority=5, name=None):
+        """
+        Run function in a worker thread and return its TaskFuture, which gets the value returned by function or the
+        exception it raised. The exception is left to the owner of the future rather than being logged by the thread.
+        If the queue is frozen the future is failed straight away.
+        Args:
+            function (callable): The function to run
+            args (tuple): The arguments of function
+            kwargs (dict): The keyword arguments of function
+            priority (int): The priority of the task in the queue, lower numbers are run first
+            name (str): The name of the task shown by the thread status
+        """
+        future = TaskFuture(name)
+        if self.isfrozen() is True:
+            future.set_running_or_notify_cancel()
+            future.set_exception(GangaException("Cannot run '%s' as the queue is frozen" % (name or getName(function))))
+            return future
+        self.__queue.put(QueueElement(priority=priority,
+                                      command_input=FunctionInput(_run_task, (future, function, args, kwargs), {}),
+                                      callback_func=FunctionInput(None, (), {}),
+                                      fallback_func=FunctionInput(None, (), {}),
+                                      name=name or getName(function)
+                                      ))
+        return future
+
     def add_process(self,
                     command, timeout=None, env=None, cwd=None, shell=False,
                     python_setup='', eval_includes=None, update_env=False, priority=5,
@@ -225,9 +334,17 @@ class WorkerThreadPool(object):
 
     def clear_queue(self):
         """
-        Purges the thread pools queue.
+        Purges the thread pools queue, the futures of the tasks which are dropped are cancelled.
         """
-        self.__queue.queue = []
+        with self.__queue.mutex:
+            dropped = self.__queue.queue
+            self.__queue.queue = []
+        for item in dropped:
+            if isinstance(item, QueueElement) and item.command_input.function is _run_task:
+                # The waiters of a cancelled future are only woken up once it's been notified
+                future = item.command_input.args[0]
+                if future.cancel():
+                    future.set_running_or_notify_cancel()
 
     def get_queue(self):
         """
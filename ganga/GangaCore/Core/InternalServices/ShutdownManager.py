@@ -16,6 +16,7 @@ from GangaCore.Runtime import Repository_runtime, bootstrap
 from GangaCore.Utility import stacktracer
 from GangaCore.Utility.logging import getLogger, requires_shutdown, final_shutdown
 from GangaCore.Utility.Config import setConfigOption
+from GangaCore.Utility.ProcessEngine import stopProcessEngine
 from GangaCore.Core.MonitoringComponent.Local_GangaMC_Service import getStackTrace, _purge_actions_queue,\
     stop_and_free_thread_pool
 from GangaCore.GPIDev.Lib.Tasks import stopTasks
@@ -123,6 +124,12 @@ def _unprotected_ganga_exitfuncs():
     except Exception as err:
         logger.exception("Exception raised while clearing the credential store: %s" % err)
 
+    # stop the thread running the shell commands
+    try:
+        stopProcessEngine()
+    except Exception as err:
+        logger.exception("Exception raised while stopping the process engine: %s" % err)
+
     # shutdown SessionLock
     try:
         removeGlobalSessionFileHandlers()
@@ -14,6 +14,7 @@ from GangaCore.Utility.threads import SynchronisedObject
 from GangaCore.GPIDev.Credentials import credential_store, get_needed_credentials
 from GangaCore.GPIDev.Credentials.AfsToken import AfsToken
 from GangaCore.Core.InternalServices import Coordinator
+from GangaCore.Core.MonitoringComponent.MonitoringScheduler import MonitoringScheduler
 
 from GangaCore.GPIDev.Base.Proxy import isType, stripProxy, getName, getRuntimeGPIObject
 
@@ -496,7 +497,10 @@ class JobRegistry_Monitor(GangaThread):
     minPollRate = 1.
     global_count = 0
 
-    __slots__ = ('registry_slice', '__sleepCounter', '__updateTimeStamp', 'progressCallback', 'callbackHookDict', 'clientCallbackDict', 'alive', 'enabled', 'steps', 'activeBackends', 'updateJobStatus', 'errors', 'updateDict_ts', '__mainLoopCond', '__cleanUpEvent', '__monStepsTerminatedEvent', 'stopIter', '_runningNow')
+    # Jobs in these states are monitored
+    activeStates = ('submitted', 'running')
+
+    __slots__ = ('registry_slice', '__sleepCounter', '__updateTimeStamp', 'progressCallback', 'callbackHookDict', 'clientCallbackDict', 'alive', 'enabled', 'steps', 'activeBackends', 'updateJobStatus', 'errors', 'updateDict_ts', '__mainLoopCond', '__cleanUpEvent', '__monStepsTerminatedEvent', 'stopIter', '_runningNow', '_scheduler')
 
     def __init__(self, registry_slice):
         GangaThread.__init__(self, name="JobRegistry_Monitor")
@@ -519,6 +523,12 @@ class JobRegistry_Monitor(GangaThread):
 
         self.updateDict_ts = SynchronisedObject(UpdateDict())
 
+        # synch objects
+        # main loop mutex
+        self.__mainLoopCond = threading.Condition()
+        # when the callback hooks and backends are next due
+        self._scheduler = MonitoringScheduler()
+
         # Create the default backend update method and add to callback hook.
         self.makeUpdateJobStatusFunction()
 
@@ -531,9 +541,6 @@ class JobRegistry_Monitor(GangaThread):
         log.debug("Setting callback hook for disk space checking")
         self.setCallbackHook(JobRegistry_Monitor.diskSpaceCheckJobInsertor, {'thisMonitor': self}, True, timeout=config['diskspace_poll_rate'])
 
-        # synch objects
-        # main loop mutex
-        self.__mainLoopCond = threading.Condition()
         # cleanup synch
         self.__cleanUpEvent = threading.Event()
         # asynch mon loop running synch
@@ -588,8 +595,10 @@ class JobRegistry_Monitor(GangaThread):
                 # we are blocked here while the loop is disabled
                 while not self.enabled and self.steps <= 0:
                     log.debug("Not enabled")
-                    self.__cleanUp()
+                    # The actions queued by the last step run on demand are still waited for by runMonitoring, so the
+                    # queue is only purged once the loop is stopped. disableMonitoring purges it on its own.
                     if not self.alive:  # stopped?
+                        self.__cleanUp()
                         return
                     # disabled,but still alive, so we keep waiting
                     # for i in range( int(self.uPollRate*20) ):
@@ -598,38 +607,31 @@ class JobRegistry_Monitor(GangaThread):
                     #    self.__mainLoopCond.wait( self.uPollRate*0.05 )
                     self.__mainLoopCond.wait()
 
+                # When running continuously sleep until a callback hook or a backend is due. We are woken up
+                # earlier by jobs becoming active, update requests and by disabling or stopping the loop.
+                if self.steps <= 0:
+                    delay = self.__nextDelay()
+                    if delay is None or delay > 0.0:
+                        log.debug("Wait Condition: %s" % delay)
+                        self.progressCallback(delay)
+                        self.__mainLoopCond.wait(delay)
+                        continue
+
                 log.debug("Launching Monitoring Step")
                 self.__monStep()
 
                 log.debug("Finished Step")
 
-                # delay here the monitoring steps according to the
-                # configuration
-                while self.__sleepCounter > 0.0:
-                    log.debug("Wait Condition")
-                    self.progressCallback(self.__sleepCounter)
-                    for i in range(int(self.uPollRate * 20)):
-                        if self.enabled:
-                            self.__mainLoopCond.wait(self.uPollRate * 0.05)
-                    if not self.enabled:
-                        if not self.alive:  # stopped?
-                            self.__cleanUp()
-                        # disabled, break to the outer while
-                        break
-                    else:
-                        self.__sleepCounter -= self.uPollRate
-
-                else:
-                    log.debug("Run on Demand")
-                    # run on demand?
-                    if self.steps > 0:
-                        # decrement the remaining number of steps to run
-                        self.steps -= 1
-                        # requested number of steps executed, disabling...
-                        if self.steps <= 0:
-                            self.enabled = False
-                            # notify the blocking call of runMonitoring()
-                            self.__monStepsTerminatedEvent.set()
+                log.debug("Run on Demand")
+                # run on demand?
+                if self.steps > 0:
+                    # decrement the remaining number of steps to run
+                    self.steps -= 1
+                    # requested number of steps executed, disabling...
+                    if self.steps <= 0:
+                        self.enabled = False
+                        # notify the blocking call of runMonitoring()
+                        self.__monStepsTerminatedEvent.set()
 
         log.debug("Monitoring Cleanup")
         # final cleanup
@@ -685,7 +687,74 @@ class JobRegistry_Monitor(GangaThread):
         self.__updateTimeStamp = time.time()
         self.__sleepCounter = config['base_poll_rate']
 
-    
+        # The job status update hook is run when a backend is due, see _checkActiveBackends
+        for func_name, (func, cbHookEntry) in self.callbackHookDict.items():
+            if cbHookEntry.enabled and func is not self.updateJobStatus:
+                self._scheduler.schedule(func_name, cbHookEntry._lastRun + max(cbHookEntry.timeout, config['base_poll_rate']))
+            else:
+                self._scheduler.cancel(func_name)
+
+    def __nextDelay(self):
+        """
+        Returns the time in seconds until the next callback hook or backend is due, None if nothing is scheduled
+        """
+        next_due = self._scheduler.next_due()
+        delay = None if next_due is None else max(next_due - time.time(), 0.0)
+        if GANGA_SWAN_INTEGRATION:
+            # Jobs from other sessions are only found by looking at the repository
+            delay = config['base_poll_rate'] if delay is None else min(delay, config['base_poll_rate'])
+        return delay
+
+    def __scheduleAllNow(self, hooks=True):
+        """
+        Make all backends due now so that they are checked in the next step regardless of their poll rate
+        Args:
+            hooks (bool): Also schedule the other callback hooks, they are still only run once their timeout has passed
+        """
+        now = time.time()
+        self._scheduler.clear(lambda key: isinstance(key, tuple))
+        for func_name, (func, cbHookEntry) in self.callbackHookDict.items():
+            if cbHookEntry.enabled and (hooks or func is self.updateJobStatus):
+                self._scheduler.schedule(func_name, now)
+
+    def __wakeUp(self):
+        """
+        Wake up the monitoring loop so that it reconsiders what is due. This is called from other threads which may hold
+        locks the loop is waiting for, so only wait a short time for the loop to release its lock. If it doesn't,
+        it's running a step and will look at the schedule again when it's finished.
+        """
+        if self.__mainLoopCond.acquire(True, 1.0):
+            try:
+                self.__mainLoopCond.notifyAll()
+            finally:
+                self.__mainLoopCond.release()
+
+    def jobStatusChanged(self, job):
+        """
+        Called by Job.updateStatus when the status of a master job changes. The registry keeps track of the active jobs,
+        here a backend which wasn't monitoring any job is made due straight away.
+        Args:
+            job (Job): The job which has changed its status
+        """
+        if job.status not in self.activeStates or job._getRegistry() is not stripProxy(self.registry_slice).objects:
+            return
+        backend_key = ('backend', getName(job.backend))
+        if self._scheduler.get(backend_key) is None:
+            self._scheduler.schedule(backend_key, time.time())
+            if self.enabled:
+                self.__wakeUp()
+
+    def backendDue(self, backend_name):
+        """
+        Make a backend due straight away, e.g. when it has been notified that one of its jobs has finished. This may be
+        called from any thread.
+        Args:
+            backend_name (str): The name of the backend
+        """
+        self._scheduler.schedule(('backend', backend_name), time.time())
+        if self.enabled:
+            self.__wakeUp()
+
     def reloadJob(self, i):
         """
         Reload a Job from disk.
@@ -779,8 +848,6 @@ class JobRegistry_Monitor(GangaThread):
             self.steps = steps
             # enable job list iterators
             self.stopIter.clear()
-            # Start backend update timeout checking.
-            self.setCallbackHook(UpdateDict.timeoutCheck, {'thisDict': self.updateDict_ts}, True)
 
             log.debug("Waking up Main Loop")
             # wake up the mon loop
@@ -817,8 +884,8 @@ class JobRegistry_Monitor(GangaThread):
             # enable job list iterators
             self.stopIter.clear()
             log.debug('Monitoring loop enabled')
-            # Start backend update timeout checking.
-            self.setCallbackHook(UpdateDict.timeoutCheck, {'thisDict': self.updateDict_ts}, True)
+            # run everything which is due straight away
+            self.__scheduleAllNow()
             self.__mainLoopCond.notifyAll()
 
         return True
@@ -968,12 +1035,15 @@ class JobRegistry_Monitor(GangaThread):
         if func_name in self.callbackHookDict:
             log.debug('Replacing existing callback hook function %s with %s' % (str(self.callbackHookDict[func_name]), func_name))
         self.callbackHookDict[func_name] = [func, CallbackHookEntry(argDict=argDict, enabled=enabled, timeout=timeout)]
+        if enabled:
+            self._scheduler.schedule(func_name, time.time())
 
     def removeCallbackHook(self, func):
         func_name = getName(func)
         log.debug('Removing Callback hook function %s.' % func_name)
         if func_name in self.callbackHookDict:
             del self.callbackHookDict[func_name]
+            self._scheduler.cancel(func_name)
         else:
             log.error('Callback hook function does not exist.')
 
@@ -981,7 +1051,11 @@ class JobRegistry_Monitor(GangaThread):
         func_name = getName(func)
         log.debug('Enabling Callback hook function %s.' % func_name)
         if func_name in self.callbackHookDict:
-            self.callbackHookDict[func_name][1].enabled = True
+            cbHookEntry = self.callbackHookDict[func_name][1]
+            cbHookEntry.enabled = True
+            if self.callbackHookDict[func_name][0] is not self.updateJobStatus:
+                self._scheduler.schedule(func_name, cbHookEntry._lastRun + cbHookEntry.timeout)
+                self.__wakeUp()
         else:
             log.error('Callback hook function does not exist.')
 
@@ -990,6 +1064,7 @@ class JobRegistry_Monitor(GangaThread):
         log.debug('Disabling Callback hook function %s.' % func_name)
         if func_name in self.callbackHookDict:
             self.callbackHookDict[func_name][1].enabled = False
+            self._scheduler.cancel(func_name)
         else:
             log.error('Callback hook function does not exist.')
 
@@ -1025,6 +1100,9 @@ class JobRegistry_Monitor(GangaThread):
         # iteration exception is raised
         if jobSlice is not None:
             fixed_ids = jobSlice.ids()
+        elif not GANGA_SWAN_INTEGRATION:
+            # Only the jobs which the registry knows to be active, it keeps track of them as their status changes
+            fixed_ids = sorted(stripProxy(self.registry_slice).objects.getActiveIds())
         else:
             fixed_ids = self.registry_slice.ids()
         #log.debug("Registry: %s" % str(self.registry_slice))
@@ -1201,6 +1279,10 @@ class JobRegistry_Monitor(GangaThread):
         summary += '}'
         log.debug("Active Backends: %s" % summary)
 
+        now = time.time()
+        # Backends without active jobs don't need to be woken up for anymore
+        active_names = set(getName(jList[0].backend) for jList in activeBackends.values())
+        thisMonitor._scheduler.clear(lambda key: isinstance(key, tuple) and key[1] not in active_names)
         for jList in activeBackends.values():
 
             #log.debug("backend: %s" % str(jList))
@@ -1211,6 +1293,13 @@ class JobRegistry_Monitor(GangaThread):
             else:
                 pRate = config['default_backend_poll_rate']
 
+            # Only check the backends which are due according to their poll rate, steps run on demand check all of them
+            backend_key = ('backend', b_name)
+            due = thisMonitor._scheduler.get(backend_key)
+            if due is not None and due > now and thisMonitor.steps <= 0:
+                continue
+            thisMonitor._scheduler.schedule(backend_key, now + pRate)
+
             # TODO: To include an if statement before adding entry to
             #       updateDict. Entry is added only if credential requirements
             #       of the particular backend is satisfied.
@@ -1297,6 +1386,9 @@ class JobRegistry_Monitor(GangaThread):
     def updateJobs(self):
         if time.time() - self.__updateTimeStamp >= self.minPollRate:
             self.__sleepCounter = 0.0
+            # all backends are due now
+            self.__scheduleAllNow(hooks=False)
+            self.__wakeUp()
         else:
             self.progressCallback("Processing... Please wait.")
             log.debug("Updates too close together... skipping latest update request.")
@@ -0,0 +1,51 @@
+import heapq
+import itertools
+import threading
+
+
+class MonitoringScheduler(object):
+
+    """
+    Priority queue of the monitoring tasks (callback hooks and backends) ordered by the time at which they are next due.
+    The monitoring loop sleeps until the earliest of them is due instead of waking up at a fixed rate.
+    Entries are replaced lazily, an outdated heap entry is dropped when it reaches the top.
+    """
+
+    __slots__ = ('_heap', '_due', '_counter', '_lock')
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def schedule(self, key, due):
+        """(Re)schedule the task key at the time due"""
+        with self._lock:
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, next(self._counter), key))
+
+    def cancel(self, key):
+        """Remove the task key from the schedule"""
+        with self._lock:
+            self._due.pop(key, None)
+
+    def get(self, key):
+        """Returns the time at which key is due, None if it isn't scheduled"""
+        return self._due.get(key)
+
+    def next_due(self):
+        """Returns the earliest due time of all scheduled tasks, None if nothing is scheduled"""
+        with self._lock:
+            while self._heap:
+                due, _, key = self._heap[0]
+                if self._due.get(key) == due:
+                    return due
+                heapq.heappop(self._heap)
+            return None
+
+    def clear(self, match=lambda key: True):
+        """Remove all tasks for which match(key) is True"""
+        with self._lock:
+            for key in [k for k in self._due if match(k)]:
+                del self._due[key]
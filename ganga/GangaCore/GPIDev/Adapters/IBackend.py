@@ -22,12 +22,14 @@ import os
 import itertools
 import time
 from collections import defaultdict
+from concurrent import futures
 
 from GangaCore.Core.GangaThread.WorkerThreads import getQueues
 from GangaCore.Utility.Config import getConfig
 
 logger = GangaCore.Utility.logging.getLogger()
 
+
 class IBackend(GangaObject):
 
     """
@@ -69,19 +71,17 @@ class IBackend(GangaObject):
 
     def _parallel_submit(self, b, sj, sc, master_input_sandbox, fqid, logger):
 
-        try:
-            sj.updateStatus('submitting')
-            if b.submit(sc, master_input_sandbox):
-                sj.info.increment()
-                return 1
-            else:
-                raise IncompleteJobSubmissionError(fqid, 'submission failed')
-        except Exception as err:
-            logger.error("Parallel Job Submission Failed: %s" % err)
-            return 0
+        sj.updateStatus('submitting')
+        if b.submit(sc, master_input_sandbox):
+            sj.info.increment()
+            return 1
+        else:
+            raise IncompleteJobSubmissionError(fqid, 'submission failed')
 
-    def _successfulSubmit(self, out, sj, incomplete_subjobs):
-        if out == 0:
+    def _successfulSubmit(self, task, sj, incomplete_subjobs):
+        err = futures.CancelledError('the submission was dropped from the queue') if task.cancelled() else task.exception()
+        if err is not None:
+            logger.error("Parallel Job Submission Failed for %s: %s" % (sj.getFQID('.'), err))
             incomplete_subjobs.append(sj.getFQID('.'))
             sj.updateStatus('new', update_master = False)
         else:
@@ -146,10 +146,9 @@ class IBackend(GangaObject):
         # Shall we submit in parallel
         if parallel_submit:
 
-            from GangaCore.Core.GangaThread.WorkerThreads import getQueues
-
-            threads_before = getQueues().totalNumIntThreads()
+            from GangaCore.Core.GangaThread.WorkerThreads.WorkerThreadPool import wait_for_tasks
 
+            submitting = {}
             for sc, sj in zip(subjobconfigs, rjobs):
 
                 b = sj.backend
@@ -164,19 +163,15 @@ class IBackend(GangaObject):
 
                 fqid = sj.getFQID('.')
                 # FIXME would be nice to move this to the internal threads not user ones
-                getQueues()._monitoring_threadpool.add_function(self._parallel_submit, (b, sj, sc, master_input_sandbox, fqid, logger), callback_func = self._successfulSubmit, callback_args = (sj, incomplete_subjobs))
+                task = getQueues()._monitoring_threadpool.submit(self._parallel_submit, (b, sj, sc, master_input_sandbox, fqid, logger), name="Submit %s" % fqid)
+                submitting[task] = sj
 
-            def subjob_status_check(rjobs):
-                has_submitted = True
-                for sj in rjobs:
-                    if sj.status not in ["submitted","failed","completed","running","completing"] and sj.getFQID('.') not in incomplete_subjobs:
-                        has_submitted = False
-                        break
-                return has_submitted
+            # The status of each subjob is set from the outcome of its submission as soon as it is known
+            def progress(done, total, task):
+                logger.debug("Submitted %s/%s subjobs (%s in %.2fs)" % (done, total, task.name, task.run_time() or 0.))
+                self._successfulSubmit(task, submitting[task], incomplete_subjobs)
 
-            while not subjob_status_check(rjobs):
-                import time
-                time.sleep(1.)
+            wait_for_tasks(list(submitting), progress)
 
             if incomplete_subjobs:
                 raise IncompleteJobSubmissionError(
@@ -437,6 +432,12 @@ class IBackend(GangaObject):
 
         queues = getQueues()
 
+        # The monitoring tasks handed to the worker threads, we wait for these to finish at the end
+        monitoring_tasks = []
+
+        def _monitor_in_thread(function, these_jobs):
+            monitoring_tasks.append(queues._monitoring_threadpool.submit(function, (these_jobs,), name="Backend Monitor"))
+
         for j in jobs:
             ## All subjobs should have same backend
             if len(j.subjobs) > 0:
@@ -444,8 +445,10 @@ class IBackend(GangaObject):
                 monitorable_subjob_ids = []
 
                 if isType(j.subjobs, SubJobXMLList):
-                    cache = j.subjobs.getAllCachedData()
-                    for sj_id in range(0,len(j.subjobs)):
+                    # Only look at the subjobs which are still active rather than at all of them
+                    active_ids = j.subjobs.getActiveIds()
+                    cache = dict(zip(active_ids, j.subjobs.getAllCachedData(active_ids)))
+                    for sj_id in active_ids:
                         if cache[sj_id]['status'] in ['submitted', 'running']:
                             if j.subjobs.isLoaded(sj_id):
                                 ## SJ may have changed from cache in memory
@@ -491,7 +494,7 @@ class IBackend(GangaObject):
                             subjobs_to_monitor.append(j.subjobs[sj_id])
                         if multiThreadMon:
                             if queues.totalNumIntThreads() < getConfig("Queues")['NumWorkerThreads']:
-                                queues._addSystem(j.backend.updateMonitoringInformation, args=(subjobs_to_monitor,), name="Backend Monitor")
+                                _monitor_in_thread(j.backend.updateMonitoringInformation, subjobs_to_monitor)
                         else:
                             j.backend.updateMonitoringInformation(subjobs_to_monitor)
                     except Exception as err:
@@ -510,8 +513,8 @@ class IBackend(GangaObject):
                 logger.debug('Monitoring jobs: %s', repr([jj._repr() for jj in simple_jobs[this_backend]]))
                 if multiThreadMon:
                     if queues.totalNumIntThreads() < getConfig("Queues")['NumWorkerThreads']:
-                        queues._addSystem(stripProxy(simple_jobs[this_backend][0].backend).updateMonitoringInformation,
-                                          args=(simple_jobs[this_backend],), name="Backend Monitor")
+                        _monitor_in_thread(stripProxy(simple_jobs[this_backend][0].backend).updateMonitoringInformation,
+                                           simple_jobs[this_backend])
                 else:
                     stripProxy(simple_jobs[this_backend][0].backend).updateMonitoringInformation(simple_jobs[this_backend])
 
@@ -520,14 +523,17 @@ class IBackend(GangaObject):
         if not multiThreadMon:
             return
 
-        loop = True
-        while loop:
-            for stat in queues._monitoring_threadpool.worker_status():
-                loop = False;
-                if stat[0] is not None and stat[0].startswith("Backend Monitor"):
-                    loop = True;
-                    break;
-            time.sleep(1.)
+        # Wait for our tasks to complete. The timeout only matters if the queue was frozen or the monitoring stopped
+        # while the tasks were queued, as they are never run then.
+        pending = monitoring_tasks
+        while pending:
+            done, pending = futures.wait(pending, timeout=poll_config['base_poll_rate'])
+            if queues.isfrozen() or (was_monitoring_running and not monitoring_component.isEnabled(False)):
+                return
+
+        for task in monitoring_tasks:
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Monitoring Error: %s" % task.exception())
 
     @staticmethod
     def updateMonitoringInformation(jobs):
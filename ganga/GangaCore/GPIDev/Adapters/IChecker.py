@@ -6,6 +6,7 @@
 from GangaCore.GPIDev.Adapters.IPostProcessor import PostProcessException, IPostProcessor
 from GangaCore.GPIDev.Schema import Schema, Version, SimpleItem
 from GangaCore.GPIDev.Base.Proxy import getName
+from GangaCore.Utility import FileScan
 import os
 import glob
 
@@ -56,6 +57,26 @@ class IChecker(IPostProcessor):
         """
         raise NotImplementedError
 
+    def checkJobs(self, jobs):
+        """
+        Check many jobs (e.g. the subjobs of a job) and return the list of the results.
+        Args:
+            jobs (list): The jobs to check
+        """
+        return [self.check(job) for job in jobs]
+
+    def scanFiles(self, filepaths, patterns, stop_on_match=False, stop_on_miss=False):
+        """
+        Search files for regular expressions, reading each file only once whatever the number of patterns.
+        Returns the list of (path, set of the indices of the patterns found) for the files which were scanned.
+        Args:
+            filepaths (list): The files to search
+            patterns (list): The regular expressions to look for
+            stop_on_match (bool): Stop after the first file in which a pattern is found
+            stop_on_miss (bool): Stop after the first file in which a pattern is missing
+        """
+        return FileScan.scan_files(filepaths, patterns, stop_on_match=stop_on_match, stop_on_miss=stop_on_miss)
+
 
 class IFileChecker(IChecker):
 
@@ -8,9 +8,13 @@ from GangaCore.Utility.Config import ConfigError, getConfig
 from GangaCore.GPIDev.Adapters.IPostProcessor import PostProcessException, IPostProcessor
 from GangaCore.GPIDev.Schema import Schema, Version, SimpleItem
 import GangaCore.Utility.logging
+import threading
+import shutil
+import glob
+import json
 import os
 
-from GangaCore.GPIDev.Base.Proxy import isType
+from GangaCore.GPIDev.Base.Proxy import isType, getName
 from posixpath import curdir, sep, pardir, join, abspath, commonprefix
 
 logger = GangaCore.Utility.logging.getLogger()
@@ -31,6 +35,9 @@ def relpath(path, start=curdir):
 # set the mergers config up
 config = getConfig("Mergers")
 
+# the partial merges of a job are updated by one subjob at a time
+_partials_lock = threading.RLock()
+
 def getDefaultMergeDir():
     """Gets the default location of the mergers outputdir from the config"""
 
@@ -55,6 +62,10 @@ class IMerger(IPostProcessor):
     # auto merge
     set_outputdir_for_automerge = True
 
+    # a class defining mergefiles(file_list, output_file) which gives the same result whichever way the files are
+    # grouped sets this flag, so that its merges can be done incrementally
+    supports_incremental = False
+
     _category = 'postprocessor'
     _exportmethods = ['merge']
     _name = 'IMerger'
@@ -63,6 +74,11 @@ class IMerger(IPostProcessor):
         'files': SimpleItem(defvalue=[], typelist=[str], sequence=1, doc='A list of files to merge.'),
         'ignorefailed': SimpleItem(defvalue=False, doc='Jobs that are in the failed or killed states will be excluded from the merge when this flag is set to True.'),
         'overwrite': SimpleItem(defvalue=False, doc='The default behaviour for this Merger object. Will overwrite output files.'),
+        'incremental': SimpleItem(defvalue=False, doc='Merge the files of the subjobs as they complete, the merge done when the job completes '
+                                                      'then only combines these partial merges. The merge must give the same result '
+                                                      'whichever way the files are grouped.'),
+        'partial_size': SimpleItem(defvalue=100, typelist=[int], doc='Number of files of completed subjobs merged together '
+                                                                     'into each partial merge when merging incrementally.'),
     })
     order = 1
 
@@ -72,16 +88,224 @@ class IMerger(IPostProcessor):
         """
         Execute
         """
+        if job.master is not None:
+            if self.incremental and newstatus == 'completed' and self._incrementalSupported():
+                self._foldSubjob(job, self._partialsDir(job.master))
+            return True
         if (len(job.subjobs) != 0):
+            partials_dir = None
+            if self.incremental:
+                if self._incrementalSupported():
+                    partials_dir = self._partialsDir(job)
+                else:
+                    logger.warning('%s can not merge incrementally, the files of all the subjobs of Job %s are merged now.',
+                                   getName(self), job.fqid)
             try:
-                return self.merge(job.subjobs, job.outputdir)
+                if partials_dir is None:
+                    result = self.merge(job.subjobs, job.outputdir)
+                else:
+                    result = self._merge(job.subjobs, job.outputdir, partials_dir=partials_dir)
             except PostProcessException as e:
                 logger.error("%s" % e)
                 return self.failure
+            if partials_dir is not None:
+                shutil.rmtree(partials_dir, ignore_errors=True)
+            return result
         else:
             return True
 
+    @classmethod
+    def _incrementalSupported(cls):
+        """
+        True if the merges of this class can be done incrementally. Classes overriding merge() or whose mergefiles()
+        doesn't come from a class setting supports_incremental are merged in one go as before.
+        """
+        if cls.merge is not IMerger.merge:
+            return False
+        for klass in cls.__mro__:
+            if 'mergefiles' in vars(klass):
+                return vars(klass).get('supports_incremental', False)
+        return False
+
+    @staticmethod
+    def _partialsDir(job):
+        """The directory holding the partial merges of the subjobs of a job"""
+        return os.path.join(job.outputdir, '.merge_partials')
+
+    @staticmethod
+    def _partialsState(partials_dir, relname):
+        """The file recording the partial merges of one of the files to merge"""
+        return os.path.join(partials_dir, relname + '.partials.json')
+
+    def _loadPartials(self, partials_dir, relname):
+        try:
+            with open(self._partialsState(partials_dir, relname)) as state_file:
+                state = json.load(state_file)
+        except (IOError, ValueError):
+            return None
+        return state if 'signatures' in state else None
+
+    def _savePartials(self, partials_dir, relname, state):
+        state_name = self._partialsState(partials_dir, relname)
+        if not os.path.isdir(os.path.dirname(state_name)):
+            os.makedirs(os.path.dirname(state_name))
+        with open(state_name + '.new', 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(state_name + '.new', state_name)
+
+    @staticmethod
+    def _signature(filename):
+        """The modification time and size of a file, which tell if it was written again since it was merged"""
+        stat = os.stat(filename)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    @staticmethod
+    def _dropFiles(state, dropped):
+        """
+        Forget some files and the partial merges holding them, the other files of these partial merges are pending again
+        Args:
+            state (dict): The partial merges, the files still pending and the signatures of all these files
+            dropped (iterable): The files to forget
+        """
+        dropped = set(dropped)
+        if not dropped:
+            return
+        for partial in list(state['partials']):
+            if dropped.intersection(partial['files']):
+                state['partials'].remove(partial)
+                if os.path.exists(partial['file']):
+                    os.remove(partial['file'])
+                state['pending'].extend(f for f in partial['files'] if f not in dropped)
+        state['pending'] = [f for f in state['pending'] if f not in dropped]
+        for f in dropped:
+            state['signatures'].pop(f, None)
+
+    def _foldPending(self, partials_dir, relname, state):
+        """
+        Merge the files waiting in a state into a new partial merge
+        Args:
+            partials_dir (str): The directory holding the partial merges
+            relname (str): The name of the file being merged, relative to the outputdir of the jobs
+            state (dict): The partial merges, the files still pending and the signatures of all these files
+        """
+        partial = os.path.join(partials_dir, os.path.dirname(relname),
+                               'partial%d_%s' % (state['count'], os.path.basename(relname)))
+        self.mergepartial(state['pending'], partial)
+        state['partials'].append({'file': partial, 'files': state['pending']})
+        state['pending'] = []
+        state['count'] += 1
+
+    def _foldSubjob(self, job, partials_dir):
+        """
+        Add the files of a completed subjob to the partial merges of its master.
+        The files of a subjob which completes again replace the ones merged before, together with their partial merges.
+        If something goes wrong the partial merges are dropped and the final merge goes through all the files.
+        Args:
+            job (Job): The subjob which completed
+            partials_dir (str): The directory holding the partial merges
+        """
+        with _partials_lock:
+            try:
+                for relname, matched in self._jobFiles(job, ignorefailed=True).items():
+                    state = self._loadPartials(partials_dir, relname) or {'partials': [], 'pending': [], 'signatures': {}, 'count': 0}
+                    self._dropFiles(state, [f for f in matched if f in state['signatures']])
+                    for f in matched:
+                        state['signatures'][f] = self._signature(f)
+                    state['pending'].extend(matched)
+                    if len(state['pending']) >= max(1, self.partial_size):
+                        self._foldPending(partials_dir, relname, state)
+                    self._savePartials(partials_dir, relname, state)
+            except Exception as err:
+                logger.warning('Could not merge the output of Job %s incrementally, it will be merged when the job completes: %s', job.fqid, err)
+                shutil.rmtree(partials_dir, ignore_errors=True)
+
+    def _mergeFromPartials(self, partials_dir, relname, file_list, outputfile):
+        """
+        Merge file_list into outputfile reusing the partial merges, return False if there are none which can be used.
+        The partial merges holding files which aren't to be merged any more or which changed since are left out.
+        Args:
+            partials_dir (str): The directory holding the partial merges
+            relname (str): The name of the file being merged, relative to the outputdir of the jobs
+            file_list (list): The files to merge
+            outputfile (str): The result of the merge
+        """
+        with _partials_lock:
+            state = self._loadPartials(partials_dir, relname)
+            if state is None:
+                return False
+            wanted = set(file_list)
+            self._dropFiles(state, [f for f, signature in state['signatures'].items()
+                                    if f not in wanted or not os.path.exists(f) or self._signature(f) != signature])
+            self._dropFiles(state, [f for partial in state['partials'] if not os.path.exists(partial['file'])
+                                    for f in partial['files']])
+            if not state['partials']:
+                return False
+            state['pending'].extend(f for f in file_list if f not in state['signatures'])
+            if state['pending']:
+                self._foldPending(partials_dir, relname, state)
+            logger.info('Merging %d partial merges of %d files into %s', len(state['partials']), len(file_list), outputfile)
+            self.mergepartials([partial['file'] for partial in state['partials']], outputfile)
+            return True
+
+    def mergepartial(self, file_list, partial_file):
+        """
+        Merge files into a partial merge, which mergepartials will combine with other ones.
+        Mergers whose output can be merged again as any other file don't need to override this.
+        Args:
+            file_list (list): The files to merge
+            partial_file (str): The partial merge to write
+        """
+        if not os.path.isdir(os.path.dirname(partial_file)):
+            os.makedirs(os.path.dirname(partial_file))
+        self.mergefiles(file_list, partial_file)
+
+    def mergepartials(self, partial_list, output_file):
+        """
+        Combine partial merges written by mergepartial into the final merge.
+        Args:
+            partial_list (list): The partial merges
+            output_file (str): The result of the merge
+        """
+        self.mergefiles(partial_list, output_file)
+
+    def _jobFiles(self, j, ignorefailed):
+        """
+        Return the dict of the name relative to the outputdir of the job to the list of files matching it, for the files to merge
+        Args:
+            j (Job): The job whose files are to be merged
+            ignorefailed (bool): Ignore the files which are missing rather than fail
+        """
+        files = {}
+        for f in self.files:
+
+            for matchedFile in glob.glob(os.path.join(j.outputdir, f)):
+                relMatchedFile = ''
+                try:
+                    relMatchedFile = os.path.relpath(
+                        matchedFile, j.outputdir)
+                except Exception as err:
+                    logger.debug("Err: %s" % err)
+                    GangaCore.Utility.logging.log_unknown_exception()
+                    relMatchedFile = relpath(matchedFile, j.outputdir)
+                if relMatchedFile in files:
+                    files[relMatchedFile].append(matchedFile)
+                else:
+                    files[relMatchedFile] = [matchedFile]
+
+            if not len(glob.glob(os.path.join(j.outputdir, f))):
+                if ignorefailed:
+                    logger.warning('The file pattern %s in Job %s was not found. The file will be ignored.', f, j.fqid)
+                    continue
+                else:
+                    raise PostProcessException('The file pattern %s in Job %s was not found and so the merge can not continue. '
+                                               'This can be overridden with the ignorefailed flag.' % (f, j.fqid))
+            # files[f].extend(matchedFiles)
+        return files
+
     def merge(self, jobs, outputdir=None, ignorefailed=None, overwrite=None):
+        return self._merge(jobs, outputdir, ignorefailed, overwrite)
+
+    def _merge(self, jobs, outputdir=None, ignorefailed=None, overwrite=None, partials_dir=None):
 
         if ignorefailed is None:
             ignorefailed = self.ignorefailed
@@ -105,7 +329,7 @@ class IMerger(IPostProcessor):
         if isType(jobs, Job):
             if outputdir is None:
                 outputdir = jobs.outputdir
-            return self.merge(jobs.subjobs, outputdir=outputdir, ignorefailed=ignorefailed, overwrite=overwrite)
+            return self._merge(jobs.subjobs, outputdir=outputdir, ignorefailed=ignorefailed, overwrite=overwrite, partials_dir=partials_dir)
 
         if not len(jobs):
             logger.warning('The jobslice given was empty. The merge will not continue.')
@@ -133,31 +357,8 @@ class IMerger(IPostProcessor):
                     raise PostProcessException('The merge of Job %s failed and so the merge can not continue. '
                                                'This can be overridden with the ignorefailed flag.' % j.fqid)
 
-            import glob
-            for f in self.files:
-
-                for matchedFile in glob.glob(os.path.join(j.outputdir, f)):
-                    relMatchedFile = ''
-                    try:
-                        relMatchedFile = os.path.relpath(
-                            matchedFile, j.outputdir)
-                    except Exception as err:
-                        logger.debug("Err: %s" % err)
-                        GangaCore.Utility.logging.log_unknown_exception()
-                        relMatchedFile = relpath(matchedFile, j.outputdir)
-                    if relMatchedFile in files:
-                        files[relMatchedFile].append(matchedFile)
-                    else:
-                        files[relMatchedFile] = [matchedFile]
-
-                if not len(glob.glob(os.path.join(j.outputdir, f))):
-                    if ignorefailed:
-                        logger.warning('The file pattern %s in Job %s was not found. The file will be ignored.', f, j.fqid)
-                        continue
-                    else:
-                        raise PostProcessException('The file pattern %s in Job %s was not found and so the merge can not continue. '
-                                                   'This can be overridden with the ignorefailed flag.' % (f, j.fqid))
-                # files[f].extend(matchedFiles)
+            for relMatchedFile, matchedFiles in self._jobFiles(j, ignorefailed).items():
+                files.setdefault(relMatchedFile, []).extend(matchedFiles)
 
         for k in files.keys():
             # make sure we are not going to over write anything
@@ -189,7 +390,8 @@ class IMerger(IPostProcessor):
             # merge the lists of files with a merge tool into outputfile
             msg = None
             try:
-                self.mergefiles(files[k], outputfile)
+                if partials_dir is None or not self._mergeFromPartials(partials_dir, k, files[k], outputfile):
+                    self.mergefiles(files[k], outputfile)
 
                 # create a log file of the merge
                 # we only get to here if the merge_tool ran ok
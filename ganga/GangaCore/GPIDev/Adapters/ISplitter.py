@@ -23,16 +23,18 @@ class ISplitter(GangaObject):
 
     def createSubjob(self, job, additional_skip_args=None):
         """ Create a new subjob by copying the master job and setting all fields correctly.
+        The subjob is built with getNew() and gets a single copy of each component of the master.
         """
         from GangaCore.GPIDev.Lib.Job.Job import Job
         if additional_skip_args is None:
             additional_skip_args = []
 
-        j = Job()
+        # Every attribute is either copied from the master or set below, no need to build the defaults
+        j = Job.getNew()
         skipping_args = ['splitter', 'inputsandbox', 'inputfiles', 'inputdata', 'subjobs']
         for arg in additional_skip_args:
             skipping_args.append(arg)
-        j.copyFrom(job, skipping_args)
+        j.copyFrom(job, skipping_args, _is_new=True)
         j.splitter = None
         j.inputsandbox = []
         j.inputfiles = []
@@ -801,15 +801,18 @@ class GangaObject(Node, metaclass=ObjectMetaclass):
 
         visitor.nodeEnd(self)
 
-    def copyFrom(self, srcobj, _ignore_atts=None):
-        # type: (GangaObject, Optional[Sequence[str]]) -> None
+    def copyFrom(self, srcobj, _ignore_atts=None, _is_new=False):
+        # type: (GangaObject, Optional[Sequence[str]], bool) -> None
         """
         copy all the properties recursively from the srcobj
         if schema of self and srcobj are not compatible raises a ValueError
         ON FAILURE LEAVES SELF IN INCONSISTENT STATE
+        With _is_new self was built with getNew(): the properties which aren't copied are set to their default values
+        and the copies are set without being cloned again (see _copyAttribute).
         Args:
             srcobj (GangaObject): This is the ganga object which is to have it's contents from
             _ignore_atts (list): This is a list of attribute names which are to not be copied
+            _is_new (bool): Was self built with getNew() rather than fully initialised
         """
 
         if _ignore_atts is None:
@@ -836,7 +839,7 @@ class GangaObject(Node, metaclass=ObjectMetaclass):
             self._schema = None
             return
 
-        self._actually_copyFrom(_srcobj, _ignore_atts)
+        self._actually_copyFrom(_srcobj, _ignore_atts, _is_new)
 
         ## Fix some objects losing parent knowledge
         src_dict = srcobj.__dict__
@@ -847,11 +850,13 @@ class GangaObject(Node, metaclass=ObjectMetaclass):
                 if this_attr._getParent() is not srcobj:
                     this_attr._setParent(srcobj)
 
-    def _actually_copyFrom(self, _srcobj, _ignore_atts):
-        # type: (GangaObject, Optional[Sequence[str]]) -> None
+    def _actually_copyFrom(self, _srcobj, _ignore_atts, _is_new=False):
+        # type: (GangaObject, Optional[Sequence[str]], bool) -> None
 
         for name, item in self._schema.allItems():
             if name in _ignore_atts:
+                if _is_new:
+                    self._setMissingDefault(name, item)
                 continue
 
             #logger.debug("Copying: %s : %s" % (name, item))
@@ -869,16 +874,46 @@ class GangaObject(Node, metaclass=ObjectMetaclass):
                     if this_attr._getParent() is not self:
                         this_attr._setParent(self)
             elif not item['copyable']: ## Default of '1' instead of True...
-                if not hasattr(self, name):
+                if _is_new:
+                    self._setMissingDefault(name, item)
+                elif not hasattr(self, name):
                     setattr(self, name, self._schema.getDefaultValue(name))
                 this_attr = getattr(self, name)
                 if isinstance(this_attr, Node) and name not in do_not_copy:
                     if this_attr._getParent() is not self:
                         this_attr._setParent(self)
+            elif _is_new:
+                self._copyAttribute(name, getattr(_srcobj, name))
             else:
                 copy_obj = deepcopy(getattr(_srcobj, name))
                 setattr(self, name, copy_obj)
 
+        if _is_new:
+            self._setDirty()
+
+    def _setMissingDefault(self, name, item):
+        """
+        Set an attribute to its default value if it isn't in the data of self, e.g. if self was built with getNew()
+        Args:
+            name (str): The name of the attribute
+            item (Item): The schema item of the attribute
+        """
+        if not item['getter'] and name not in self._data:
+            setattr(self, name, self._schema.getDefaultValue(name))
+
+    def _copyAttribute(self, name, value):
+        """
+        Set an attribute to a copy of the value of the same attribute of another object.
+        Immutable values are shared, anything else is deep-copied once. The copy is set without going through the
+        descriptor, which would clone it a second time.
+        Args:
+            name (str): The name of the schema attribute
+            value (unknown): The value of the other object
+        """
+        if value is not None and not isinstance(value, (str, int, float, bool)):
+            value = deepcopy(value)
+        self.setSchemaAttribute(name, value)
+
     def __eq__(self, obj):
         """
         Compare this object to an other object obj
@@ -973,6 +1008,9 @@ class GangaObject(Node, metaclass=ObjectMetaclass):
         if self._fullyLoadedFromDisk():
             logger.debug("Warning: Setting IndexCache data on live object, please avoid!")
         self._index_cache_dict = new_index_cache
+        reg = self._getRegistry()
+        if reg is not None and hasattr(reg, '_markIndexStale'):
+            reg._markIndexStale(getattr(self, '_registry_id', None))
 
     def _fullyLoadedFromDisk(self):
         # type: () -> bool
@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 
 import GangaCore.Utility.logging
 from GangaCore.GPIDev.Schema import SimpleItem
-from GangaCore.Utility import GridShell
+from GangaCore.Utility import GridShell, x509
 from GangaCore.Utility.Config import getConfig
 
 from GangaCore.GPIDev.Adapters.ICredentialInfo import ICredentialInfo, cache, retry_command
@@ -82,40 +82,96 @@ class VomsProxyInfo(ICredentialInfo):
         if os.path.isfile(self.location):
             os.remove(self.location)
 
-    @cache
+    def _proxy(self):
+        """
+        Returns the ProxyInfo read from the proxy file by GangaCore.Utility.x509, or None if it can't be read that way
+        The file is only parsed again once it has changed on disk
+        """
+        try:
+            return x509.read_proxy(self.location)
+        except (OSError, IOError, x509.ProxyError) as err:
+            logger.debug("Falling back to voms-proxy-info for %s: %s", self.location, err)
+            return None
+
     def info(self):
         """
         This returns the full proxy info with all information from a given proxy on disk
         """
-        status, output, message = self.shell.cmd1('voms-proxy-info -all -file "%s"' % self.location)
-        return output
+        proxy = self._proxy()
+        if proxy is not None:
+            return proxy.text()
+        return self._shell_info()
 
     @property
-    @cache
     def identity(self):
         """
         This returns the identity associated with the voms proxy on disk
         """
-        status, output, message = self.shell.cmd1('voms-proxy-info -file "%s" -identity' % self.location)
-        return output.strip()
+        proxy = self._proxy()
+        if proxy is not None:
+            return proxy.identity
+        return self._shell_identity()
 
     @property
-    @cache
     def vo(self):
         """
         This returns the vo associated with a voms proxy on disk
         """
-        status, output, message = self.shell.cmd1('voms-proxy-info -file "%s" -vo' % self.location)
-        if status != 0:
-            return None
-        return output.split(':')[0].strip()
+        proxy = self._proxy()
+        if proxy is not None:
+            return proxy.vo
+        return self._shell_vo()
 
     @property
-    @cache
     def role(self):
         """
         This returns the role associated with a voms proxy on disk
         """
+        proxy = self._proxy()
+        if proxy is not None:
+            return proxy.role
+        return self._shell_role()
+
+    @property
+    def group(self):
+        """
+        This returns the group associated with a voms proxy on disk
+        """
+        proxy = self._proxy()
+        if proxy is not None:
+            return proxy.group
+        return self._shell_group()
+
+    def expiry_time(self):
+        """
+        This returns the time that a proxy will expire at in seconds
+        """
+        proxy = self._proxy()
+        if proxy is not None:
+            return datetime.now() + proxy.time_left()
+        return self._shell_expiry_time()
+
+    # The voms-proxy-info fallbacks for proxies which can't be read directly
+
+    @cache
+    def _shell_info(self):
+        status, output, message = self.shell.cmd1('voms-proxy-info -all -file "%s"' % self.location)
+        return output
+
+    @cache
+    def _shell_identity(self):
+        status, output, message = self.shell.cmd1('voms-proxy-info -file "%s" -identity' % self.location)
+        return output.strip()
+
+    @cache
+    def _shell_vo(self):
+        status, output, message = self.shell.cmd1('voms-proxy-info -file "%s" -vo' % self.location)
+        if status != 0:
+            return None
+        return output.split(':')[0].strip()
+
+    @cache
+    def _shell_role(self):
         status, output, message = self.shell.cmd1('voms-proxy-info -file "%s" -vo' % self.location)
         if status != 0:
             return None  # No VO
@@ -124,12 +180,8 @@ class VomsProxyInfo(ICredentialInfo):
             return None  # No command after VO
         return vo_list[1].split('/')[-1].split('=')[-1].strip()
 
-    @property
     @cache
-    def group(self):
-        """
-        This returns the group associated with a voms proxy on disk
-        """
+    def _shell_group(self):
         status, output, message = self.shell.cmd1('voms-proxy-info -file "%s" -vo' % self.location)
         if status != 0:
             return None  # No VO
@@ -143,10 +195,7 @@ class VomsProxyInfo(ICredentialInfo):
         return group_role_list[-1].strip()
 
     @cache
-    def expiry_time(self):
-        """
-        This returns the time that a proxy will expire at in seconds
-        """
+    def _shell_expiry_time(self):
         status, output, message = self.shell.cmd1('voms-proxy-info -file "%s" -timeleft' % self.location)
         if status != 0:
             return datetime.now()
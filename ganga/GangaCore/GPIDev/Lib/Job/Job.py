@@ -28,6 +28,7 @@ from GangaCore.Utility.Config import ConfigError, getConfig
 from GangaCore.Utility.logging import getLogger, log_user_exception
 
 from .JobTime import JobTime
+from .SubJobSummary import SubJobSummary
 from GangaCore.Lib.Localhost import Localhost
 from GangaCore.Lib.Executable import Executable
 
@@ -235,7 +236,7 @@ class Job(GangaObject):
 
     default_registry = 'jobs'
 
-    _additional_slots = ['_storedRTHandler', '_storedJobSubConfig', '_storedAppSubConfig', '_storedJobMasterConfig', '_storedAppMasterConfig', '_stored_subjobs_proxy']
+    _additional_slots = ['_storedRTHandler', '_storedJobSubConfig', '_storedAppSubConfig', '_storedJobMasterConfig', '_storedAppMasterConfig', '_stored_subjobs_proxy', '_subjobSummary']
 
     # TODO: usage of **kwds may be envisaged at this level to optimize the
     # overriding of values, this must be reviewed
@@ -609,12 +610,36 @@ class Job(GangaObject):
             log_user_exception()
             raise JobStatusError(x)
 
+        self._statusChanged(initial_status)
+
+        if update_master and self.master is not None:
+            self.master.updateMasterJobStatus()
+
+    def _statusChanged(self, initial_status):
+        """
+        Keep the registry index, the monitoring and the master's view of its subjobs up to date after self.status has
+        been changed from initial_status, whether through updateStatus or by reverting it
+        Args:
+            initial_status (str): The status the job had before
+        """
         final_status = self.status
 
         if final_status != initial_status and self.master is None:
             logger.info('job %s status changed to "%s"', self.getFQID('.'), final_status)
-        if update_master and self.master is not None:
-            self.master.updateMasterJobStatus()
+            if self._getRegistry() is not None:
+                self._getRegistry()._updateIndex(self)
+            from GangaCore.Core import monitoring_component
+            if monitoring_component is not None:
+                monitoring_component.jobStatusChanged(self)
+            # The backends may set the status of the subjobs they submit directly, look them up again
+            if final_status in ('submitting', 'submitted'):
+                self._subjobSummary = None
+                if isinstance(self.subjobs, SubJobXMLList):
+                    self.subjobs.resetActiveIds()
+        if final_status != initial_status and self.master is not None:
+            if isinstance(self.master.subjobs, SubJobXMLList):
+                self.master.subjobs.subjobStatusChanged(self)
+            self.master.subjobStatusChanged(self, initial_status)
 
     def transition_update(self, new_status):
         """Propagate status transitions"""
@@ -730,26 +755,43 @@ class Job(GangaObject):
 
         return postprocessFailure
 
-    def getSubJobStatuses(self):
+    def getSubJobSummary(self):
         """
-        This returns a set of all of the different subjob statuses whilst respecting lazy loading
+        Returns the SubJobSummary of the statuses and timestamps of the subjobs. It is built from the subjobs (or the
+        subjob index, respecting lazy loading) the first time and then updated as the subjobs change their status.
         """
+        summary = getattr(self, '_subjobSummary', None)
+        if summary is None or summary.total() != len(self.subjobs):
+            summary = SubJobSummary()
+            if isinstance(self.subjobs, SubJobXMLList):
+                for status, timestamps in self.subjobs.getAllSJStatusTimestamps():
+                    summary.add(status, timestamps)
+            else:
+                for sj in self.subjobs:
+                    summary.add(sj.status, sj.time.timestamps)
+            self._subjobSummary = summary
+        return summary
 
-        if isinstance(self.subjobs, SubJobXMLList):
-            stats = set(self.subjobs.getAllSJStatus())
-        else:
-            stats = set(sj.status for sj in self.subjobs)
+    def subjobStatusChanged(self, subjob, old_status):
+        """
+        Keep the SubJobSummary up to date, called by Job.updateStatus when the status of a subjob changes
+        Args:
+            subjob (Job): The subjob which has changed its status
+            old_status (str): The status the subjob had before
+        """
+        summary = getattr(self, '_subjobSummary', None)
+        if summary is not None:
+            summary.statusChanged(old_status, subjob.status, subjob.time.timestamps)
 
-        return stats
+    def getSubJobStatuses(self):
+        """
+        This returns a set of all of the different subjob statuses whilst respecting lazy loading
+        """
+        return self.getSubJobSummary().statuses()
 
     def returnSubjobStatuses(self):
-        stats = []
-        if isinstance(self.subjobs, SubJobXMLList):
-            stats = self.subjobs.getAllSJStatus()
-        else:
-            stats = [sj.status for sj in self.subjobs]
-
-        return "%s/%s/%s/%s" % (stats.count('running'), stats.count('failed') + stats.count('killed'), stats.count('completing'), stats.count('completed'))
+        counts = self.getSubJobSummary().counts
+        return "%s/%s/%s/%s" % (counts['running'], counts['failed'] + counts['killed'], counts['completing'], counts['completed'])
 
     def updateMasterJobStatus(self):
         """
@@ -1237,11 +1279,10 @@ class Job(GangaObject):
         return jobmasterconfig
 
     @staticmethod
-    def _prepare_sj( rtHandler, i, app, sub_c, app_master_c, job_master_c, finished):
+    def _prepare_sj(rtHandler, app, sub_c, app_master_c, job_master_c):
         if app.is_prepared in [None, False]:
             app.prepare()
-        finished[i] = rtHandler.prepare(app, sub_c, app_master_c, job_master_c)
-        return
+        return rtHandler.prepare(app, sub_c, app_master_c, job_master_c)
 
     def _getJobSubConfig(self, subjobs):
 
@@ -1264,19 +1305,24 @@ class Job(GangaObject):
                     jobsubconfig = [rtHandler.prepare(sub_job.application, sub_conf, appmasterconfig, jobmasterconfig) for (sub_job, sub_conf) in zip(subjobs, appsubconfig)]
                 else:
 
-                    finished = {}
-
                     from GangaCore.Core.GangaThread.WorkerThreads import getQueues
-                    index = 0
-                    for sub_j, sub_conf in zip(subjobs, appsubconfig):
-                        getQueues()._monitoring_threadpool.add_function(self._prepare_sj, (rtHandler, index, sub_j.application, sub_conf, appmasterconfig, jobmasterconfig, finished))
-                        index += 1
+                    from GangaCore.Core.GangaThread.WorkerThreads.WorkerThreadPool import wait_for_tasks
+                    tasks = [getQueues()._monitoring_threadpool.submit(self._prepare_sj, (rtHandler, sub_j.application, sub_conf, appmasterconfig, jobmasterconfig),
+                                                                       name="Prepare %s" % sub_j.getFQID('.'))
+                             for sub_j, sub_conf in zip(subjobs, appsubconfig)]
 
-                    while len(finished) != len(subjobs):
-                        time.sleep(0.25)
+                    def progress(done, total, task):
+                        logger.debug("Prepared %s/%s subjobs (%s in %.2fs)" % (done, total, task.name, task.run_time() or 0.))
 
-                    for index in finished.keys():
-                        jobsubconfig[index] = finished[index]
+                    wait_for_tasks(tasks, progress)
+
+                    failed = [(sub_j, task.exception()) for sub_j, task in zip(subjobs, tasks) if task.exception() is not None]
+                    for sub_j, err in failed:
+                        logger.error("Failed to prepare subjob %s: %s" % (sub_j.getFQID('.'), err))
+                    if failed:
+                        raise failed[0][1]
+
+                    jobsubconfig = [task.result() for task in tasks]
 
         else:
             #   I am a sub-job, lets calculate my config
@@ -2030,7 +2076,15 @@ class Job(GangaObject):
         except GangaException as x:
             logger.error("failed to resubmit job, %s" % x)
             logger.warning('reverting job %s to the %s status', fqid, oldstatus)
+            # The transition back isn't in the status graph, set it directly but keep the index up to date
+            failed_status = self.status
             self.status = oldstatus
+            self._statusChanged(failed_status)
+            # The backend may have set the status of some subjobs directly before failing, count them again
+            if self.master is None:
+                self._subjobSummary = None
+                if isinstance(self.subjobs, SubJobXMLList):
+                    self.subjobs.resetActiveIds()
             raise
 
     def auto_kill(self):
@@ -2178,6 +2232,7 @@ class Job(GangaObject):
         """
         A method for copying the job object. This is a copy of the generic GangaObject method with 
         some checks removed for maximum speed. This should therefore be used with great care!
+        Each attribute is copied once, see GangaObject._copyAttribute
         """
 
         if _ignore_atts is None:
@@ -2188,8 +2243,8 @@ class Job(GangaObject):
             if name in _ignore_atts:
                 continue
 
-            copy_obj = copy.deepcopy(getattr(_srcobj, name))
-            setattr(self, name, copy_obj)
+            self._copyAttribute(name, getattr(_srcobj, name))
+        self._setDirty()
 
         ## Fix some objects losing parent knowledge
         src_dict = other_job.__dict__
@@ -175,28 +175,14 @@ class JobTime(GangaObject):
                         pass
 
     def sjStatList_return(self, status):
-        list = []
-        final = ['backend_final', 'final']
+        """Returns the earliest timestamp of status among the subjobs, the latest one for the final states.
+           These are kept by the SubJobSummary of the master job rather than looked up in every subjob.
+        """
         j = self.getJobObject()
-        for sjs in j.subjobs:
-            try:
-                if isinstance(sjs.time.timestamps[status], datetime.datetime):
-                    list.append(sjs.time.timestamps[status])
-                else:
-                    logger.debug(
-                        'Attempt to add a non datetime object in the timestamp, job=%d, subjob=%d', j.id, sjs.id)
-            except KeyError:
-                logger.debug(
-                    "Status '%s' not found in timestamps of job %d.%d.", status, sjs.master.id, sjs.id)
-        list.sort()
-        try:
-            if status in final:
-                return list[-1]
-            return list[0]
-        except IndexError:
-            # change this to a more appropriate debug.
-            logger.debug(
-                "IndexError: ID: %d, Status: '%s', length of list: %d", j.id, status, len(list))
+        t = j.getSubJobSummary().timestamp(status)
+        if t is None:
+            logger.debug("Status '%s' not found in the timestamps of the subjobs of job %d.", status, j.id)
+        return t
 
     def display(self, format="%Y/%m/%d %H:%M:%S"):
         return self._display(format)
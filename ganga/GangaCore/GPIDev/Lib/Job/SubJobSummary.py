@@ -0,0 +1,78 @@
+import collections
+import datetime
+
+
+class SubJobSummary(object):
+
+    """
+    Running counts of the statuses of the subjobs of a master job, with the earliest and latest of each of their
+    timestamps. It is built once from the subjobs (or from their entries in the subjob index) and then kept up to date
+    by the status transitions of the subjobs, so the status and the timestamps of the master job are worked out without
+    looking at all of its subjobs.
+    """
+
+    __slots__ = ('counts', 'earliest', 'latest')
+
+    # The timestamps for which the master job takes the latest of its subjobs, the earliest for the others
+    final_states = ('backend_final', 'final')
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.earliest = {}
+        self.latest = {}
+
+    def add(self, status, timestamps):
+        """
+        Count one more subjob
+        Args:
+            status (str): The status of the subjob
+            timestamps (dict): The timestamps of the subjob
+        """
+        self.counts[status] += 1
+        self.addTimestamps(timestamps)
+
+    def addTimestamps(self, timestamps):
+        """
+        Take the timestamps of a subjob into account
+        Args:
+            timestamps (dict): The timestamps of the subjob
+        """
+        for state, t in timestamps.items():
+            if not isinstance(t, datetime.datetime):
+                continue
+            if state not in self.earliest or t < self.earliest[state]:
+                self.earliest[state] = t
+            if state not in self.latest or t > self.latest[state]:
+                self.latest[state] = t
+
+    def statusChanged(self, old_status, new_status, timestamps):
+        """
+        Move a subjob from one status to another
+        Args:
+            old_status (str): The status the subjob had
+            new_status (str): The status the subjob has now
+            timestamps (dict): The timestamps of the subjob, including the one of its new status
+        """
+        self.counts[old_status] -= 1
+        if self.counts[old_status] <= 0:
+            del self.counts[old_status]
+        self.counts[new_status] += 1
+        self.addTimestamps(timestamps)
+
+    def statuses(self):
+        """Returns the set of the statuses of the subjobs"""
+        return set(self.counts)
+
+    def total(self):
+        """Returns the number of subjobs counted"""
+        return sum(self.counts.values())
+
+    def timestamp(self, state):
+        """
+        Returns the timestamp of the master job for state from those of its subjobs, None if none of them has it
+        Args:
+            state (str): The name of the timestamp
+        """
+        if state in self.final_states:
+            return self.latest.get(state)
+        return self.earliest.get(state)
@@ -11,7 +11,7 @@ from GangaCore.Utility.external.OrderedDict import OrderedDict as oDict
 from GangaCore.Core.exceptions import GangaException
 from GangaCore.Core.GangaRepository.Registry import Registry, RegistryKeyError, RegistryAccessError, RegistryFlusher
 
-from GangaCore.GPIDev.Base.Proxy import stripProxy, isType
+from GangaCore.GPIDev.Base.Proxy import stripProxy, isType, getName
 
 import GangaCore.Utility.logging
 
@@ -29,6 +29,11 @@ logger = GangaCore.Utility.logging.getLogger()
 
 class JobRegistry(Registry):
 
+    _index_columns = ('status', 'name', 'backend', 'application')
+    _index_components = ('backend', 'application')
+    # Jobs in these states are returned by getActiveIds for the monitoring
+    _active_states = ('submitting', 'submitted', 'running')
+
     def __init__(self, name, doc):
         super(JobRegistry, self).__init__(name, doc)
         self.stored_slice = JobRegistrySlice(self.name)
@@ -49,6 +54,9 @@ class JobRegistry(Registry):
             #print("cv: %s" % str(cv))
             cache[cv] = getattr(obj, cv)
             #logger.info("Setting: %s = %s" % (str(cv), str(cache[cv])))
+        # class names of the components, independent of the display columns, used by select()
+        for cv in self._index_components:
+            cache["index:" + cv] = getName(getattr(obj, cv))
         this_slice = JobRegistrySlice("jobs")
         for dpv in this_slice._display_columns:
             #logger.debug("Storing: %s" % str(dpv))
@@ -59,6 +67,10 @@ class JobRegistry(Registry):
                 value = None
         del this_slice
 
+        # timestamps of the subjobs, for the SubJobSummary of their master job
+        if getattr(obj, "master", None) is not None:
+            cache["timestamps"] = dict(obj.time.timestamps)
+
         # store subjob status
         if hasattr(obj, "subjobs"):
             cache["subjobs:status"] = []
@@ -72,6 +84,24 @@ class JobRegistry(Registry):
         #print("Cache: %s" % str(cache))
         return cache
 
+    def getIndexColumns(self, obj, cache=None):
+        """Returns the status, name and backend and application class names of a job for the in-memory index
+        Args:
+            obj (Job): The job whose values are requested
+            cache (dict): The index cache of the job if it isn't loaded
+        """
+        if cache is None:
+            values = {'status': obj.status, 'name': obj.name}
+            for cv in self._index_components:
+                values[cv] = getName(getattr(obj, cv))
+            return values
+
+        values = {'status': cache.get('status'), 'name': cache.get('name')}
+        for cv in self._index_components:
+            # Index caches written before the class names were stored only have them as display columns
+            values[cv] = cache.get("index:" + cv) or cache.get("display:" + cv) or None
+        return values
+
     def startup(self):
         """
             This is the main startup method of the Registry
@@ -12,6 +12,52 @@ import GangaCore.Utility.Config
 from GangaCore.GPIDev.Lib.File import getSharedPath
 logger = GangaCore.Utility.logging.getLogger()
 
+# The registries holding objects which can reference a ShareDir, and the name the lookup reports them as
+referring_registries = {'jobs': 'job', 'box': 'box', 'tasks': 'task'}
+
+
+def _preparedOwner(obj):
+    """
+    Return the object (obj itself, its application or its analysis' application) holding the ShareDir obj references, or None
+    Args:
+        obj (GangaObject): A Job, Box or Task repository item
+    """
+    for owner in (obj, getattr(obj, 'application', None), getattr(getattr(obj, 'analysis', None), 'application', None)):
+        if owner is not None and hasattr(owner, 'is_prepared'):
+            if hasattr(owner.is_prepared, 'name'):
+                return owner
+            return None
+    return None
+
+
+def _referrer(shareddir):
+    """
+    Return the 'registry:id' key of the repository item a ShareDir object is attached to, or None if it isn't in a registry.
+    Only items in the referring registries count, ShareDirs of subjobs are attributed to their master job.
+    Args:
+        shareddir (ShareDir): The ShareDir object
+    """
+    root = shareddir._getRoot()
+    if root is shareddir:
+        return None
+    return _itemKey(root)
+
+
+def _itemKey(obj):
+    """
+    Return the 'registry:id' key of a repository item, or None if it isn't in one of the referring registries
+    Args:
+        obj (GangaObject): The repository item
+    """
+    registry = obj._getRegistry()
+    if registry is None or registry.name not in referring_registries:
+        return None
+    try:
+        return '%s:%d' % (registry.name, registry.find(obj))
+    except Exception as err:
+        logger.debug("Not yet in %s: %s" % (registry.name, err))
+        return None
+
 
 class PrepRegistry(Registry):
 
@@ -52,8 +98,11 @@ class ShareRef(GangaObject):
     When a Shared Directory is associated with a persisted Ganga object (e.g. Job, Box) its 
     reference counter is incremented by 1. Shared Directories with a reference counter of 0 will
     be removed (i.e. the directory deleted) the next time Ganga exits.
+    Alongside the counters the table keeps, for each Shared Directory, the repository items
+    referencing it so that these can be found without loading every job.
     """
-    _schema = Schema(Version(1, 2), {'name': SimpleItem({}, protected=1, copyable=1, hidden=1)})
+    _schema = Schema(Version(1, 3), {'name': SimpleItem({}, protected=1, copyable=1, hidden=1),
+                                     'refs': SimpleItem(None, protected=1, copyable=1, hidden=1)})
 
     _category = 'sharerefs'
     _name = 'ShareRef'
@@ -65,6 +114,7 @@ class ShareRef(GangaObject):
     def __init__(self):
         super(ShareRef, self).__init__()
         self.name = {}
+        self.refs = {}
         self.removal_list = []
 
     def __setattr__(self, attr, value):
@@ -79,6 +129,113 @@ class ShareRef(GangaObject):
             self.name = {}
         return self.name
 
+    def __getRefs(self):
+        """
+        Return the map of ShareDir name to the {'registry:id': None} of the items referencing it.
+        Tables written before this map existed are indexed once by going through the referring registries.
+        """
+        if self.refs is None:
+            self.refs = self._indexReferences()
+        return self.refs
+
+    @staticmethod
+    def _indexReferences():
+        """Build the map of ShareDir references from the objects of the referring registries"""
+        from GangaCore.Core.GangaRepository import getRegistry
+        logger.debug("Indexing the ShareDir references of the %s registries" % list(referring_registries.keys()))
+        refs = {}
+        for registry_name in referring_registries:
+            try:
+                registry = getRegistry(registry_name)
+            except KeyError:
+                continue
+            for this_id in registry.ids():
+                try:
+                    owner = _preparedOwner(registry[this_id])
+                except Exception as err:
+                    logger.debug("Could not check %s #%s for a ShareDir: %s" % (registry_name, this_id, err))
+                    continue
+                if owner is not None:
+                    refs.setdefault(os.path.basename(owner.is_prepared.name), {})['%s:%d' % (registry_name, this_id)] = None
+        return refs
+
+    def _addReference(self, basedir, ref):
+        """
+        Record that the item ref references basedir
+        Args:
+            basedir (str): The name of the ShareDir
+            ref (str): The 'registry:id' of the item, ignored if None
+        """
+        if ref is not None and self.refs is not None:
+            self.refs.setdefault(basedir, {})[ref] = None
+
+    def _dropReference(self, basedir, ref):
+        """
+        Record that the item ref no longer references basedir
+        Args:
+            basedir (str): The name of the ShareDir
+            ref (str): The 'registry:id' of the item, ignored if None
+        """
+        if ref is not None and self.refs is not None and basedir in self.refs:
+            self.refs[basedir].pop(ref, None)
+            if not self.refs[basedir]:
+                del self.refs[basedir]
+
+    def _dropReferences(self, basedir):
+        """
+        Forget all the items referencing basedir
+        Args:
+            basedir (str): The name of the ShareDir
+        """
+        if self.refs is not None:
+            self.refs.pop(basedir, None)
+
+    @synchronised
+    def itemAdded(self, registry_name, this_id, obj):
+        """
+        Record the ShareDir referenced by an item which has just been added to one of the referring registries
+        Args:
+            registry_name (str): The name of the registry
+            this_id (int): The id of the item in the registry
+            obj (GangaObject): The item
+        """
+        owner = _preparedOwner(obj)
+        if owner is None or self.refs is None:
+            return
+        self._getSessionLock()
+        self._addReference(os.path.basename(owner.is_prepared.name), '%s:%d' % (registry_name, this_id))
+        self._setDirty()
+        self._releaseSessionLockAndFlush()
+
+    @synchronised
+    def itemRemoved(self, registry_name, this_id):
+        """
+        Forget the references of an item which has been removed from one of the referring registries
+        Args:
+            registry_name (str): The name of the registry
+            this_id (int): The id the item had in the registry
+        """
+        if not self.refs:
+            return
+        ref = '%s:%d' % (registry_name, this_id)
+        basedirs = [basedir for basedir, referrers in self.refs.items() if ref in referrers]
+        if not basedirs:
+            return
+        self._getSessionLock()
+        for basedir in basedirs:
+            self._dropReference(basedir, ref)
+        self._setDirty()
+        self._releaseSessionLockAndFlush()
+
+    def referrers(self, sharedir):
+        """
+        Return the (registry name, id) of the Job, Box and Task repository items which reference a given ShareDir
+        Args:
+            sharedir (str): The name of the ShareDir
+        """
+        refs = self.__getRefs().get(os.path.basename(sharedir), {})
+        return sorted((ref.split(':')[0], int(ref.split(':')[1])) for ref in refs)
+
     @synchronised
     def registerForRemoval(self, shareddir):
         """
@@ -92,7 +249,8 @@ class ShareRef(GangaObject):
     @synchronised
     def cleanUpOrphans(self, orphans=None):
         """
-        This cleans up the orphan share dir objects on shutdown
+        This cleans up the orphan share dir objects on shutdown.
+        Directories which have since been picked up by a repository item are kept.
         Args:
             orphans (list): An optional list of the orphans to remove from the list
         """
@@ -103,6 +261,9 @@ class ShareRef(GangaObject):
             to_remove = self.removal_list
 
         for shareddir in to_remove:
+            if self.refs and self.refs.get(os.path.basename(shareddir)):
+                logger.debug("Keeping Shared Dir %s which is referenced by %s" % (shareddir, list(self.refs[os.path.basename(shareddir)])))
+                continue
             if os.path.exists(os.path.join(getSharedPath(), shareddir)):
                 try:
                     shutil.rmtree(os.path.join(getSharedPath(), shareddir))
@@ -154,6 +315,9 @@ class ShareRef(GangaObject):
         else:
             logger.error('Directory %s does not exist' % shareddirname)
 
+        if basedir in self.__getName():
+            self._addReference(basedir, _referrer(shareddir))
+
         self._setDirty()
         self._releaseSessionLockAndFlush()
 
@@ -184,6 +348,10 @@ class ShareRef(GangaObject):
 #                    shutil.rmtree(shareddir, ignore_errors=True)
                     shareddir.remove()
                     logger.info("Removed: %s" % shareddir.name)
+                    self._dropReferences(basedir)
+                elif _preparedOwner(shareddir._getRoot()) is shareddir._getParent():
+                    # The item itself (not one of its subjobs) has stopped referencing the ShareDir
+                    self._dropReference(basedir, _referrer(shareddir))
         # if we try to decrease a shareref that doesn't exist, we just set the
         # corresponding shareref to 0
         except KeyError as err:
@@ -199,51 +367,24 @@ class ShareRef(GangaObject):
         Report Job, Box and Task repository items which reference a given ShareDir object. 
         The optional parameter 'unprepare=True' can be set to call the unprepare method 
         on the returned objects.
+        The items are found from the references kept in the shareref table, only the ones
+        being unprepared are loaded.
         """
-        from GangaCore.Core.GangaRepository import getRegistryProxy
-        objectlist = []
-        for thing in getRegistryProxy('jobs').select():
-            objectlist.append({thing: 'job'})
-        for thing in getRegistryProxy('box').select():
-            objectlist.append({thing: 'box'})
-        for thing in getRegistryProxy('tasks').select():
-            objectlist.append({thing: 'task'})
-
-        run_unp = None
+        from GangaCore.Core.GangaRepository import getRegistry
         master_index = 0
-        for item in objectlist:
-            try:
-                list(item.keys())[0].is_prepared.name
-                if list(item.keys())[0].is_prepared.name == sharedir:
-                    logger.info('ShareDir %s is referenced by item #%s in %s repository' % (sharedir, stripProxy(list(item.keys())[0])._registry_id, list(item.values())[0]))
-                    run_unp = list(item.keys())[0]
-                    master_index += 1
+        for registry_name, this_id in self.referrers(sharedir):
+            logger.info('ShareDir %s is referenced by item #%s in %s repository' % (sharedir, this_id, referring_registries[registry_name]))
+            master_index += 1
 
-            except AttributeError as err:
-                logger.debug("Err: %s" % err)
+            if unprepare is True:
                 try:
-                    list(item.keys())[0].application.is_prepared.name
-                    if list(item.keys())[0].application.is_prepared.name == sharedir:
-                        logger.info('ShareDir %s is referenced by item #%s in %s repository' % (sharedir, stripProxy(list(item.keys())[0])._registry_id, list(item.values())[0]))
-                        run_unp = list(item.keys())[0].application
-                        master_index += 1
-                except AttributeError as err2:
-                    logger.debug("Err2: %s" % err2)
-                    try:
-                        list(item.keys())[0].analysis.application.is_prepared.name
-                        if list(item.keys())[0].analysis.application.is_prepared.name == sharedir:
-                            logger.info('ShareDir %s is referenced by item #%s in %s repository' % (sharedir, stripProxy(list(item.keys())[0])._registry_id, list(item.values())[0]))
-                            run_unp = list(item.keys())[0].analysis.application
-                            master_index += 1
-                    except AttributeError as err3:
-                        logger.debug("Err3: %s" % err3)
-                        pass
-
-            if run_unp is not None and unprepare is True:
-                logger.info('Unpreparing %s repository object #%s associated with ShareDir %s' % (list(item.values())[0],  stripProxy(list(item.keys())[0])._registry_id, sharedir))
-#                stripProxy(item.keys()[0]).unprepare()
-                run_unp.unprepare()
-                run_unp = None
+                    run_unp = _preparedOwner(getRegistry(registry_name)[this_id])
+                except Exception as err:
+                    logger.debug("Err: %s" % err)
+                    run_unp = None
+                if run_unp is not None and os.path.basename(run_unp.is_prepared.name) == os.path.basename(sharedir):
+                    logger.info('Unpreparing %s repository object #%s associated with ShareDir %s' % (referring_registries[registry_name], this_id, sharedir))
+                    run_unp.unprepare()
 
         if unprepare is not True:
             logger.info('%s item(s) found referencing ShareDir %s', master_index, sharedir)
@@ -299,6 +440,7 @@ class ShareRef(GangaObject):
         self._getSessionLock()
         # clear the shareref table
         self.name = {}
+        self.refs = {}
         lookup_input = []
 
         from GangaCore.GPIDev.Lib.File import getSharedPath
@@ -337,6 +479,7 @@ class ShareRef(GangaObject):
                         logger.debug("Path Error: %s" % err)
                         GangaCore.Utility.logging.log_unknown_exception()
                         numsubjobs = 0
+                    self._addReference(os.path.basename(shortname), _itemKey(stripProxy(list(item.keys())[0])))
                     self.helper(shortname, unp=unprepare, numsubjobs=numsubjobs)
             except Exception as err:
                 logger.debug("-Error: %s" % err)
@@ -458,6 +601,7 @@ class ShareRef(GangaObject):
         self._getSessionLock()
         for element in cleanup_list:
             del self.name[element]
+            self._dropReferences(element)
         allnames = copy.deepcopy(self.__getName())
         for element in allnames:
             del self.name[element]
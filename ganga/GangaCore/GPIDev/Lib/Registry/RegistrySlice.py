@@ -198,11 +198,23 @@ class RegistrySlice(object):
                 maxid = sys.maxsize
             select = select_by_range
 
+        # Let the registry answer the query from its index without loading the objects
+        indexed_ids, unknown_ids = None, None
+        if attrs and self.name != 'box' and hasattr(self.objects, '_select_ids'):
+            selection = self.objects._select_ids(**attrs)
+            if selection is not None:
+                indexed_ids, unknown_ids = selection
+
         for this_id in self.objects.keys():
             obj = self.objects[this_id]
             logger.debug("id, obj: %s, %s" % (this_id, obj))
             if select(int(this_id)):
                 logger.debug("Selected: %s" % this_id)
+                # Objects the index doesn't know enough about are checked below
+                if indexed_ids is not None and this_id not in unknown_ids:
+                    if this_id in indexed_ids:
+                        callback(this_id, obj)
+                    continue
                 selected = True
                 if self.name == 'box':
                     name_str = obj._getRegistry()._getName(obj)
@@ -19,6 +19,24 @@ from GangaCore.GPIDev.Lib.File.File import File
 
 logger = getLogger()
 
+
+def _parseReqUnit(req):
+    """
+    Returns the (transform id, unit id) key of a required unit, the unit id being 'ALL' when all of the units of the
+    transform are required. None is returned, with a warning, if req can't be parsed
+    Args:
+        req (str): The required unit as held in IUnit.req_units, 'TRF_ID:UNIT_ID' or 'TRF_ID:ALL'
+    """
+    try:
+        trf_id, unit_id = req.split(":")
+        if unit_id == "ALL":
+            return int(trf_id), unit_id
+        return int(trf_id), int(unit_id)
+    except ValueError:
+        logger.warning("Ignoring the malformed required unit '%s', expected 'TRF_ID:UNIT_ID' or 'TRF_ID:ALL'" % req)
+        return None
+
+
 class ITransform(GangaObject):
     _schema = Schema(Version(1, 0), {
         'status': SimpleItem(defvalue='new', protected=1, copyable=1, doc='Status - running, pause or completed', typelist=[str]),
@@ -59,6 +77,7 @@ class ITransform(GangaObject):
                       'setMajorRunLimit', 'getID', 'overview', 'resetUnitsByStatus', 'removeUnusedJobs',
                       'showInfo', 'showUnitInfo', 'pause', 'n_all', 'n_status' ]
     _hidden = 0
+    _additional_slots = ['_chained_units', '_chained_units_count']
 
     def showInfo(self):
         """Print out the info in a nice way"""
@@ -171,10 +190,8 @@ class ITransform(GangaObject):
 
         # find any chained units and mark for recreation
         for trf in self._getParent().transforms:
-            for u2 in trf.units:
-                for req in u2.req_units:
-                    if req == "%d:%d" % (self.getID(), u.getID()) or req == "%d:ALL" % (self.getID()):
-                        trf.resetUnit(u2.getID())
+            for u2 in trf.getChainedUnits(self.getID(), u.getID()) + trf.getChainedUnits(self.getID()):
+                trf.resetUnit(u2.getID())
 
         self.updateStatus("running")
 
@@ -292,13 +309,11 @@ class ITransform(GangaObject):
                     # is there a unit already linked?
                     done = False
                     rec_unit = None
-                    for out_unit in self.units:
-                        if '%d:ALL' % (ds.input_trf_id) in out_unit.req_units:
-                            done = True
-                            # check if the unit is being recreated
-                            if out_unit.status == "recreating":
-                                rec_unit = out_unit
-                            break
+                    for out_unit in self.getChainedUnits(ds.input_trf_id)[:1]:
+                        done = True
+                        # check if the unit is being recreated
+                        if out_unit.status == "recreating":
+                            rec_unit = out_unit
 
                     if not done or rec_unit:
                         new_unit = self.createChainUnit(
@@ -316,13 +331,11 @@ class ITransform(GangaObject):
                         # is there a unit already linked?
                         done = False
                         rec_unit = None
-                        for out_unit in self.units:
-                            if '%d:%d' % (ds.input_trf_id, in_unit.getID()) in out_unit.req_units:
-                                done = True
-                                # check if the unit is being recreated
-                                if out_unit.status == "recreating":
-                                    rec_unit = out_unit
-                                break
+                        for out_unit in self.getChainedUnits(ds.input_trf_id, in_unit.getID())[:1]:
+                            done = True
+                            # check if the unit is being recreated
+                            if out_unit.status == "recreating":
+                                rec_unit = out_unit
 
                         if not done or rec_unit:
                             new_unit = self.createChainUnit(
@@ -347,6 +360,51 @@ class ITransform(GangaObject):
 
         self.addUnitToTRF(unit, prev_unit)
 
+    def getChainedUnits(self, trf_id, unit_id="ALL"):
+        """
+        Returns the units of this transform which require a unit of another transform, in the order of this transform
+        Args:
+            trf_id (int): The id of the required transform
+            unit_id (int): The id of the required unit, 'ALL' for the units requiring all of the units of the transform
+        """
+        req = "%d:%s" % (trf_id, unit_id)
+        positions = self._getChainedUnitsIndex().get((trf_id, unit_id), ())
+        # The requirements of a unit may have been changed since it was indexed
+        return [self.units[i] for i in sorted(positions) if i < len(self.units) and req in self.units[i].req_units]
+
+    def _getChainedUnitsIndex(self):
+        """
+        Returns the positions in self.units of the units requiring each (transform id, unit id), building the index
+        from the req_units of the units if it isn't there yet or units have been added other than by addUnitToTRF
+        """
+        index = getattr(self, '_chained_units', None)
+        if index is None or getattr(self, '_chained_units_count', None) != len(self.units):
+            index = {}
+            for position, unit in enumerate(self.units):
+                for req in unit.req_units:
+                    key = _parseReqUnit(req)
+                    if key is not None:
+                        index.setdefault(key, set()).add(position)
+            self._chained_units = index
+            self._chained_units_count = len(self.units)
+        return index
+
+    def _indexChainedUnit(self, position, added):
+        """
+        Add a unit put in self.units at position to the index of the chained units, if the index is up to date
+        Args:
+            position (int): The position of the unit in self.units
+            added (bool): Whether the unit was appended to self.units rather than replacing another one
+        """
+        index = getattr(self, '_chained_units', None)
+        if index is None or getattr(self, '_chained_units_count', None) != len(self.units) - int(added):
+            return
+        for req in self.units[position].req_units:
+            key = _parseReqUnit(req)
+            if key is not None:
+                index.setdefault(key, set()).add(position)
+        self._chained_units_count = len(self.units)
+
     def addInputData(self, inDS):
         """Add the given input dataset to the list"""
         self.inputdata.append(inDS)
@@ -398,9 +456,11 @@ class ITransform(GangaObject):
         if prev_unit:
             unit.prev_job_ids += prev_unit.prev_job_ids
             self.units[prev_unit.getID()] = unit
+            self._indexChainedUnit(prev_unit.getID(), False)
         else:
             self.units.append(unit)
             stripProxy(unit).id = len(self.units) - 1
+            self._indexChainedUnit(len(self.units) - 1, True)
 
 # Information methods
     def fqn(self):
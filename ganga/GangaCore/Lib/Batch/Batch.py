@@ -12,43 +12,53 @@ from GangaCore.GPIDev.Adapters.IBackend import IBackend
 from GangaCore.GPIDev.Base.Proxy import isType, getName, stripProxy
 from GangaCore.GPIDev.Schema import Schema, Version, SimpleItem
 from GangaCore.Core.exceptions import BackendError
+from GangaCore.Utility.ProcessEngine import getProcessEngine
 
 logger = GangaCore.Utility.logging.getLogger()
 
 # A trival implementation of shell command with stderr/stdout capture
 # This is a self-contained function (with logging).
 #
-# return (exitcode,soutfile,exeflag)
-# soutfile - path where the stdout/stderr is stored
+# return (exitcode,output,exeflag)
+# output - the stdout/stderr of the command
 # exeflag - 0 if the command failed to execute, 1 if it executed
-def shell_cmd(cmd, soutfile=None, allowed_exit=[0]):
-
-    if not soutfile:
-        import tempfile
-        soutfile = tempfile.mktemp()
-
-    # FIXME: garbbing stdout is done by shell magic and probably should be
-    # implemented in python directly
-    cmd = "%s > %s 2>&1" % (cmd, soutfile)
+def shell_cmd1(cmd, allowed_exit=[0]):
 
     logger.debug("running shell command: %s", cmd)
-    rc = os.system(cmd)
+    result = getProcessEngine().run(cmd)
+    rc = result.returncode
+    output = result.text()
+    result.discard()
 
     if not rc in allowed_exit:
         logger.debug('exit status [%d] of command %s', rc, cmd)
-        logger.debug('full output is in file: %s', soutfile)
-        with open(soutfile) as sout_file:
-            logger.debug('<first 255 bytes of output>\n%s', sout_file.read(255))
+        logger.debug('<first 255 bytes of output>\n%s', output[:255])
         logger.debug('<end of first 255 bytes of output>')
 
     m = None
 
     if rc != 0:
         logger.debug('non-zero [%d] exit status of command %s ', rc, cmd)
-        with open(soutfile) as sout_file:
-            m = re.compile(r"command not found$", re.M).search(sout_file.read())
+        m = re.compile(r"command not found$", re.M).search(output)
+
+    return rc, output, m is None
+
+
+# As shell_cmd1 but the output is stored in a file
+#
+# return (exitcode,soutfile,exeflag)
+# soutfile - path where the stdout/stderr is stored
+def shell_cmd(cmd, soutfile=None, allowed_exit=[0]):
+
+    if not soutfile:
+        import tempfile
+        soutfile = tempfile.mktemp()
+
+    rc, output, ef = shell_cmd1(cmd, allowed_exit)
+    with open(soutfile, 'w') as sout_file:
+        sout_file.write(output)
 
-    return rc, soutfile, m is None
+    return rc, soutfile, ef
 
 
 class Batch(IBackend):
@@ -102,7 +112,13 @@ class Batch(IBackend):
     _name = 'Batch'
     _hidden = 1
 
+    # The most job ids given to a single status_str command
+    status_chunk_size = 500
+
     def __init__(self):
+        # Add a volatile variable recording when a job was first found finished by the batch system without an exit code
+        self._missing_since = 0
+
         super(Batch, self).__init__()
 
     def command(klass, cmd, soutfile=None, allowed_exit=None):
@@ -114,11 +130,39 @@ class Batch(IBackend):
                 'Problem submitting batch job. Maybe your chosen batch system is not available or you have configured it wrongly')
             with open(soutfile) as sout_file:
                 logger.error(sout_file.read())
-                raiseable = BackendError(klass._name, 'It seems that %s commands are not installed properly:%s' % (klass._name, sout_file.readline()))
         return rc, soutfile
 
     command = classmethod(command)
 
+    def command_output(klass, cmd, allowed_exit=None):
+        """As command but the output is returned as a string rather than in a file"""
+        if allowed_exit is None:
+            allowed_exit = [0]
+        rc, sout, ef = shell_cmd1(cmd, allowed_exit)
+        if not ef:
+            logger.error(
+                'Problem submitting batch job. Maybe your chosen batch system is not available or you have configured it wrongly')
+            logger.error(sout)
+        return rc, sout
+
+    command_output = classmethod(command_output)
+
+    async def command_async(klass, cmd, allowed_exit=None):
+        """Coroutine version of command_output, the command is run by the shared ProcessEngine"""
+        if allowed_exit is None:
+            allowed_exit = [0]
+        logger.debug("running shell command: %s", cmd)
+        result = await getProcessEngine().run_async(cmd)
+        sout = result.text()
+        result.discard()
+        if result.returncode != 0 and re.compile(r"command not found$", re.M).search(sout):
+            logger.error(
+                'Problem submitting batch job. Maybe your chosen batch system is not available or you have configured it wrongly')
+            logger.error(sout)
+        return result.returncode, sout
+
+    command_async = classmethod(command_async)
+
     def submit(self, jobconfig, master_input_sandbox):
 
         job = self.getJobObject()
@@ -185,9 +229,7 @@ class Batch(IBackend):
 
         command_str = self.config['submit_str'] % (inw.getPath(), queue_option, stderr_option, stdout_option, script_cmd)
         self.command_string = command_str
-        rc, soutfile = self.command(command_str)
-        with open(soutfile) as sout_file:
-            sout = sout_file.read()
+        rc, sout = self.command_output(command_str)
         m = re.compile(self.config['submit_res_pattern'], re.M).search(sout)
         if m is None:
             logger.warning('could not match the output and extract the Batch job identifier!')
@@ -206,10 +248,6 @@ class Batch(IBackend):
             except IndexError:
                 logger.info('could not match the output and extract the Batch queue name')
 
-        # clean up the tmp file
-        if os.path.exists(soutfile):
-            os.remove(soutfile)
-
         return rc == 0
 
     def resubmit(self):
@@ -283,11 +321,9 @@ class Batch(IBackend):
         command_str = self.config['submit_str'] % (
             inw.getPath(), queue_option, stderr_option, stdout_option, script_cmd)
         self.command_string = command_str
-        rc, soutfile = self.command(command_str)
+        rc, sout = self.command_output(command_str)
         logger.debug('from command get rc: "%d"', rc)
         if rc == 0:
-            with open(soutfile) as sout_file:
-                sout = sout_file.read()
             import re
             m = re.compile(
                 self.config['submit_res_pattern'], re.M).search(sout)
@@ -308,23 +344,13 @@ class Batch(IBackend):
                 except IndexError:
                     logger.info('could not match the output and extract the Batch queue name')
         else:
-            with open(soutfile) as sout_file:
-                logger.warning(sout_file.read())
-
-        # clean up the tmp file
-        if os.path.exists(soutfile):
-            os.remove(soutfile)
+            logger.warning(sout)
 
         return rc == 0
 
     def kill(self):
-        rc, soutfile = self.command(self.config['kill_str'] % (self.id))
+        rc, sout = self.command_output(self.config['kill_str'] % (self.id))
 
-        with open(soutfile) as sout_file:
-            sout = sout_file.read()
-        # clean up the tmp file
-        if os.path.exists(soutfile):
-            os.remove(soutfile)
         logger.debug('while killing job %s: rc = %d', self.getJobObject().getFQID('.'), rc)
         if rc == 0:
             return True
@@ -486,6 +512,50 @@ class Batch(IBackend):
 
         return job.getInputWorkspace().writefile(FileBuffer('__jobscript__', text), executable=1)
 
+    @staticmethod
+    def queryBatchStates(config, ids):
+        """Ask the batch system for the state of the given jobs with status_str commands of at most status_chunk_size ids
+        Returns a dict of batch id to 'pending', 'running' or 'finished' for the jobs found in the output, jobs the
+        batch system has forgotten about are missing. None is returned if the output of one of the commands couldn't
+        be used.
+        Args:
+            config (Config): The configuration of the batch system
+            ids (list): The batch ids of the jobs
+        """
+        ids = [str(_id) for _id in ids]
+        if '%s' in config['status_str']:
+            chunks = [ids[start:start + Batch.status_chunk_size] for start in range(0, len(ids), Batch.status_chunk_size)]
+        else:
+            chunks = [ids]
+
+        re_running = re.compile('(?:%s)$' % config['status_running_pattern'])
+        re_pending = re.compile('(?:%s)$' % config['status_pending_pattern'])
+        re_result = re.compile(config['status_res_pattern'], re.M)
+        states = {}
+        for chunk in chunks:
+            cmd = config['status_str'].replace('%s', ' '.join(chunk))
+            rc, sout, ef = shell_cmd1(cmd)
+            if not ef:
+                logger.warning('Could not query the batch system for the job states: %s', sout.strip())
+                return None
+
+            chunk_states = {}
+            for m in re_result.finditer(sout):
+                status = m.group('status')
+                if re_running.match(status):
+                    chunk_states[m.group('id')] = 'running'
+                elif re_pending.match(status):
+                    chunk_states[m.group('id')] = 'pending'
+                else:
+                    chunk_states[m.group('id')] = 'finished'
+
+            # Asking for jobs which are long gone makes some batch systems fail, that's only a problem if nothing was found
+            if rc != 0 and not chunk_states:
+                logger.debug('Batch status query failed with exit status [%d]: %s', rc, sout)
+                return None
+            states.update(chunk_states)
+        return states
+
     @staticmethod
     def updateMonitoringInformation(jobs):
 
@@ -541,9 +611,36 @@ class Batch(IBackend):
 
             return pid, queue, actualCE, exitcode
 
+        def gone_for_good(j):
+            """In bulk mode, True once the batch system has been finished with a job which hasn't written its exit
+            code for longer than the timeout, the status file may only show up late on a shared filesystem"""
+            if not j.backend._missing_since:
+                j.backend._missing_since = time.time()
+            return time.time() - j.backend._missing_since > getConfig(getName(j.backend))['timeout']
+
         from GangaCore.Utility.Config import getConfig
+
+        # In bulk mode the batch system tells us which jobs have finished, only their status files are read
+        batch_states = None
+        if jobs:
+            config = getConfig(getName(jobs[0].backend))
+            if config['bulk_status']:
+                batch_states = Batch.queryBatchStates(config, [j.backend.id for j in jobs])
+
         for j in jobs:
             stripProxy(j)._getSessionLock()
+
+            if batch_states is not None:
+                batch_state = batch_states.get(str(j.backend.id), 'finished')
+                if batch_state != 'finished':
+                    j.backend._missing_since = 0
+                if batch_state == 'pending':
+                    continue
+                if batch_state == 'running':
+                    if j.status == 'submitted':
+                        j.updateStatus('running')
+                    continue
+
             outw = j.getOutputWorkspace()
 
             statusfile = os.path.join(outw.getPath(), '__jobstatus__')
@@ -572,14 +669,23 @@ class Batch(IBackend):
                     else:
                         j.updateStatus('failed')
                 else:
-                    # Job is still running. Check if alive
-                    time = get_last_alive(heartbeatfile)
+                    # Job is still running. Check if alive, in bulk mode the batch system has already finished with it
                     config = getConfig(getName(j.backend))
-                    if time > config['timeout']:
+                    if batch_states is not None:
+                        gone = gone_for_good(j)
+                    else:
+                        gone = get_last_alive(heartbeatfile) > config['timeout']
+                    if gone:
                         logger.warning(
                             'Job %s has disappeared from the batch system.', str(j.getFQID('.')))
                         j.updateStatus('failed')
 
+            if j.status == 'submitted' and batch_states is not None and gone_for_good(j):
+                # The batch system has finished with the job but it never got to write its status file
+                logger.warning(
+                    'Job %s has disappeared from the batch system.', str(j.getFQID('.')))
+                j.updateStatus('failed')
+
 #_________________________________________________________________________
 
 class LSF(Batch):
@@ -30,6 +30,17 @@ class CustomChecker(IChecker):
 
        When the job is about to be completed, Ganga will call this function and fail the job if False is returned.
 
+       To search the output files of the job, the function scanFiles(filepaths, patterns) is available in the module.
+       It reads each file once whatever the number of regular expressions and returns, for each file,
+       the indices of the patterns found in it:
+
+       def check(j):
+           import os
+           for path, found in scanFiles([os.path.join(j.outputdir, 'stdout')], ['ERROR', 'Segmentation']):
+               if found:
+                   return False
+           return True
+
     """
     _category = 'postprocessor'
     _name = 'CustomChecker'
@@ -46,7 +57,7 @@ class CustomChecker(IChecker):
         result = None
 
         try:
-            ns = {'job': job}
+            ns = {'job': job, 'scanFiles': self.scanFiles}
             exec(compile(open(self.module.name).read(), self.module.name, 'exec'), ns)
             exec('_result = check(job)', ns)
             result = ns.get('_result', result)
@@ -7,9 +7,7 @@ from GangaCore.GPIDev.Adapters.IPostProcessor import PostProcessException
 from GangaCore.GPIDev.Adapters.IChecker import IFileChecker
 from GangaCore.GPIDev.Schema import SimpleItem
 from GangaCore.Utility.logging import getLogger
-import subprocess
-import copy
-import os
+from GangaCore.Utility import FileScan
 import re
 
 
@@ -32,34 +30,47 @@ class FileChecker(IFileChecker):
         True, doc='Toggle whether job fails if string is found or not found.')
     _category = 'postprocessor'
     _name = 'FileChecker'
-    _exportmethods = ['check']
-
-    def check(self, job):
-        """
-        Check that a string is in a file, takes the job object as input.
-        """
+    _exportmethods = ['check', 'checkJobs']
 
+    def _checkInput(self):
         if not len(self.searchStrings):
             raise PostProcessException('No searchStrings specified, FileChecker will do nothing!')
+        for searchString in self.searchStrings:
+            try:
+                FileScan.compile_pattern(searchString)
+            except re.error as err:
+                raise PostProcessException('The searchString %s is not a valid regular expression (%s), FileChecker will do nothing!' % (searchString, err))
+
+    def _findJobFiles(self, job):
         filepaths = self.findFiles(job)
         if not len(filepaths):
             raise PostProcessException('None of the files to check exist, FileChecker will do nothing!')
-        for filepath in filepaths:
-            for searchString in self.searchStrings:
-                stringFound = False
-                # self.findFiles() guarantees that file at filepath exists,
-                # hence no exception handling
-                with open(filepath) as file:
-                    for line in file:
-                        if re.search(searchString, line):
-                            if self.failIfFound is True:
-                                logger.info(
-                                    'The string %s has been found in file %s, FileChecker will fail job(%s)', searchString, filepath, job.fqid)
-                                return self.failure
-                            stringFound = True
-                if not stringFound and self.failIfFound is False:
-                    logger.info('The string %s has not been found in file %s, FileChecker will fail job(%s)', searchString, filepath, job.fqid)
-                    return self.failure
-        return self.result
+        return filepaths
 
+    def _result(self, job, scanned):
+        """
+        Decide on the outcome of the check from the patterns found in the files of the job
+        Args:
+            job (Job): The job being checked
+            scanned (list): The (path, indices of the searchStrings found) of the files scanned
+        """
+        for filepath, found in scanned:
+            if self.failIfFound is True and found:
+                logger.info('The string %s has been found in file %s, FileChecker will fail job(%s)', self.searchStrings[min(found)], filepath, job.fqid)
+                return self.failure
+            if self.failIfFound is False and len(found) < len(self.searchStrings):
+                missing = [searchString for i, searchString in enumerate(self.searchStrings) if i not in found]
+                logger.info('The string %s has not been found in file %s, FileChecker will fail job(%s)', missing[0], filepath, job.fqid)
+                return self.failure
+        return self.result
 
+    def check(self, job):
+        """
+        Check that a string is in a file, takes the job object as input.
+        """
+        self._checkInput()
+        filepaths = self._findJobFiles(job)
+        # self.findFiles() guarantees that file at filepath exists,
+        # hence no exception handling
+        scanned = self.scanFiles(filepaths, self.searchStrings, stop_on_match=self.failIfFound is True, stop_on_miss=self.failIfFound is False)
+        return self._result(job, scanned)
@@ -14,6 +14,7 @@ __version__ = "2.5"
 import subprocess
 import inspect
 import os
+import shlex
 import shutil
 import time
 import datetime
@@ -32,6 +33,8 @@ from GangaCore.Core.exceptions import BackendError
 from GangaCore.Utility.Config import getConfig
 from GangaCore.GPIDev.Lib.File import File
 from GangaCore.Core.Sandbox.WNSandbox import PYTHON_DIR
+from GangaCore.Utility.ProcessEngine import getProcessEngine
+from GangaCore.Lib.Condor.CondorLog import user_log, forget_user_log
 
 logger = GangaCore.Utility.logging.getLogger()
 
@@ -84,7 +87,9 @@ class Condor(IBackend):
             "2": "Running",
             "3": "Removed",
             "4": "Completed",
-            "5": "Held"
+            "5": "Held",
+            "6": "Transferring Output",
+            "7": "Suspended"
         }
 
     def __init__(self):
@@ -215,6 +220,7 @@ class Condor(IBackend):
         if os.path.exists(outDir):
             os.remove(outDir)
         os.mkdir(outDir)
+        forget_user_log(os.path.join(outDir, "condorLog"))
 
         # Determine path to job's Condor Description File
         cdfpath = os.path.join(inpDir, "__cdf__")
@@ -511,51 +517,162 @@ class Condor(IBackend):
 
         return cdfString
 
+    # The ClassAd attributes asked for when monitoring the jobs
+    queryAttributes = ["ClusterId", "ProcId", "JobStatus", "RemoteHost", "RemoteUserCpu"]
+
+    @staticmethod
+    def splitId(id):
+        """Return the schedd ('' if not known) and the local 'cluster.proc' id of a Condor job
+        Args:
+            id (str): The global ('schedd#cluster.proc#time') or local id of the job
+        """
+        idElementList = id.split("#")
+        if 3 == len(idElementList):
+            return idElementList[0], idElementList[1]
+        return "", idElementList[0]
+
+    # The most clusters asked about by a single condor_q or condor_history, so that the constraint stays far below the
+    # length allowed for a command line argument
+    queryChunkSize = 500
+
+    @staticmethod
+    def clusterConstraint(clusters):
+        """Return a ClassAd constraint matching the jobs of some clusters, runs of consecutive cluster ids are written as ranges
+        Args:
+            clusters (list): The sorted cluster ids
+        """
+        terms = []
+        first = last = None
+        for cluster in clusters + [None]:
+            if last is not None and cluster == last + 1:
+                last = cluster
+                continue
+            if first is not None:
+                if first == last:
+                    terms.append("ClusterId == %d" % first)
+                else:
+                    terms.append("(ClusterId >= %d && ClusterId <= %d)" % (first, last))
+            first = last = cluster
+        return " || ".join(terms)
+
+    @staticmethod
+    def queryJobs(command, schedd, clusters, jobCounts=None):
+        """Ask condor_q or condor_history about the jobs of some clusters with constrained queries of at most
+        queryChunkSize clusters each
+        Returns a dict of local 'cluster.proc' id to the dict of the queryAttributes of the jobs found, or None if
+        one of the queries failed.
+        Args:
+            command (str): condor_q or condor_history
+            schedd (str): The schedd to ask, the local one (or all of them if query_global_queues is set) if empty
+            clusters (set): The cluster ids of the jobs
+            jobCounts (dict): cluster id -> number of jobs wanted, the queries are limited to the jobs wanted so that
+                              condor_history can stop early
+        """
+        commandList = [command]
+        if schedd:
+            commandList.extend(["-name", schedd])
+        elif "condor_q" == command and getConfig("Condor")["query_global_queues"]:
+            commandList.append("-global")
+
+        found = {}
+        sortedClusters = sorted(clusters)
+        for start in range(0, len(sortedClusters), Condor.queryChunkSize):
+            chunk = sortedClusters[start:start + Condor.queryChunkSize]
+            chunkCommandList = commandList + ["-constraint", Condor.clusterConstraint(chunk)]
+            if jobCounts:
+                chunkCommandList.extend(["-limit", str(sum(jobCounts[cluster] for cluster in chunk))])
+            chunkCommandList.append("-af")
+            chunkCommandList.extend(Condor.queryAttributes)
+            queryCommand = " ".join(shlex.quote(arg) for arg in chunkCommandList)
+
+            try:
+                result = getProcessEngine().run(queryCommand, merge_stderr=False)
+            except OSError as err:
+                logger.debug("Query '%s' couldn't be run: %s" % (queryCommand, err))
+                return None
+            if 0 != result.returncode:
+                logger.debug("Query '%s' failed with return code %s: %s" %
+                             (queryCommand, result.returncode, result.stderr.decode('utf-8', 'replace')))
+                return None
+
+            for line in result.text().splitlines():
+                values = line.split()
+                if len(values) != len(Condor.queryAttributes):
+                    continue
+                info = dict((name, "" if "undefined" == value else value)
+                            for name, value in zip(Condor.queryAttributes, values))
+                found["%s.%s" % (info["ClusterId"], info["ProcId"])] = info
+            result.discard()
+        return found
+
+    @staticmethod
+    def checkExit(job):
+        """Work out from the end of its stdout if a job which has left Condor completed
+        Returns 'completed', 'failed' or None if the stdout file is still empty and may yet be written.
+        Args:
+            job (Job): The job to check
+        """
+        stdoutPath = os.path.join(job.getOutputWorkspace().getPath(), "stdout")
+        if not os.path.isfile(stdoutPath):
+            return "failed"
+
+        # The exit code is on the last line, the rest of the file isn't needed
+        with open(stdoutPath, "rb") as stdout:
+            stdout.seek(0, os.SEEK_END)
+            stdout.seek(max(0, stdout.tell() - 4096))
+            lineList = stdout.read().decode("utf-8", "replace").splitlines()
+        try:
+            exitLine = lineList[-1]
+            exitCode = exitLine.strip().split()[-1]
+        except IndexError:
+            exitCode = '-1'
+
+        if exitCode.isdigit():
+            return "completed"
+
+        # Some filesystems/setups have the file created but empty - only worry if it's been 10mins
+        # since we first checked the file
+        if len(lineList) == 0:
+            if not job.backend._stdout_check_time:
+                job.backend._stdout_check_time = time.time()
+
+            if (time.time() - job.backend._stdout_check_time) < 10*60:
+                return None
+            logger.error("Empty stdout file from job %s after waiting 10mins. Marking job as"
+                         "failed." % job.fqid)
+        else:
+            logger.error("Problem extracting exit code from job %s. Line found was '%s'." % (
+                job.fqid, exitLine))
+        return "failed"
+
     def updateMonitoringInformation(jobs):
 
         jobDict = {}
         for job in jobs:
-            if job.backend.id:
+            if job.backend.id and job.status != "killed":
                 jobDict[job.backend.id] = job
 
-        idList = list(jobDict.keys())
-
-        if not idList:
-            return
-
-        queryCommand = " ".join\
-            ([
-                "condor_q -global" if getConfig(
-                    "Condor")["query_global_queues"] else "condor_q",
-                "-format \"%s \" GlobalJobId",
-                "-format \"%s \" RemoteHost",
-                "-format \"%d \" JobStatus",
-                "-format \"%f\\n\" RemoteUserCpu"
-            ])
-        status, output = subprocess.getstatusoutput(queryCommand)
-        if 0 != status:
-            logger.error("Problem retrieving status for Condor jobs")
+        if not jobDict:
             return
 
-        if ("All queues are empty" == output):
-            infoList = []
-        else:
-            infoList = output.split("\n")
-
-        allDict = {}
-        for infoString in infoList:
-            tmpList = infoString.split()
-            id, host, status, cputime = ("", "", "", "")
-            if 3 == len(tmpList):
-                if not 'Failure' in tmpList[0]:
-                    id, status, cputime = tmpList
-            if 4 == len(tmpList):
-                id, host, status, cputime = tmpList
-            if id:
-                allDict[id] = {}
-                allDict[id]["status"] = Condor.statusDict[status]
-                allDict[id]["cputime"] = cputime
-                allDict[id]["host"] = host
+        # One condor_q per schedd, constrained to the clusters of our jobs
+        clusters = {}
+        for id in list(jobDict):
+            schedd, localId = Condor.splitId(id)
+            cluster = localId.split(".")[0]
+            if cluster.isdigit():
+                clusters.setdefault(schedd, set()).add(int(cluster))
+            else:
+                logger.warning("Job %s has an unexpected Condor id '%s'" % (jobDict[id].fqid, id))
+                del jobDict[id]
+
+        queueDict = {}
+        for schedd, scheddClusters in clusters.items():
+            found = Condor.queryJobs("condor_q", schedd, scheddClusters)
+            if found is None:
+                logger.error("Problem retrieving status for Condor jobs%s" % (" from %s" % schedd if schedd else ""))
+            else:
+                queueDict[schedd] = found
 
         fg = Foreground()
         fx = Effects()
@@ -563,115 +680,108 @@ class Condor(IBackend):
                           'running': fg.green,
                           'completed': fg.blue}
 
-        for id in idList:
+        def printStatus(job):
+            if job.backend.actualCE:
+                hostInfo = job.backend.actualCE
+            else:
+                hostInfo = "Condor"
+            status = job.status
+            if status in status_colours:
+                colour = status_colours[status]
+            else:
+                colour = fg.magenta
+            if "submitted" == status:
+                preposition = "to"
+            else:
+                preposition = "on"
+
+            if job.backend.status:
+                backendStatus = "".join\
+                    ([" (", job.backend.status, ") "])
+            else:
+                backendStatus = ""
+
+            logger.info(colour + 'Job %s %s%s %s %s - %s' + fx.normal,
+                        job.fqid, status, backendStatus, preposition, hostInfo,
+                        time.strftime('%c'))
 
-            printStatus = False
-            if jobDict[id].status == "killed":
+        def finish(job, log, removed=False):
+            if log.cputime:
+                job.backend.cputime = log.cputime
+            if removed or "aborted" == log.finished:
+                jobStatus = "failed"
+            else:
+                jobStatus = Condor.checkExit(job)
+                if jobStatus is None:
+                    return
+            job.updateStatus(jobStatus)
+            forget_user_log(log.path)
+            printStatus(job)
+
+        leftQueue = {}
+        for id, job in jobDict.items():
+
+            schedd, localId = Condor.splitId(id)
+            if schedd not in queueDict:
                 continue
 
-            localId = id.split("#")[-1]
-            globalId = id
-
-            if globalId == localId:
-                queryCommand = " ".join\
-                    ([
-                        "condor_q -global" if getConfig(
-                            "Condor")["query_global_queues"] else "condor_q",
-                        "-format \"%s\" GlobalJobId",
-                        id
-                    ])
-                status, output = subprocess.getstatusoutput(queryCommand)
-                if 0 == status:
-                    globalId = output
-
-            if globalId in allDict.keys():
-                status = allDict[globalId]["status"]
-                host = allDict[globalId]["host"]
-                cputime = allDict[globalId]["cputime"]
-                if status != jobDict[id].backend.status:
-                    printStatus = True
-                    stripProxy(jobDict[id])._getSessionLock()
-                    jobDict[id].backend.status = status
-                    if jobDict[id].backend.status == "Running":
-                        jobDict[id].updateStatus("running")
+            if localId in queueDict[schedd]:
+                info = queueDict[schedd][localId]
+                status = Condor.statusDict.get(info["JobStatus"], info["JobStatus"])
+                host = info["RemoteHost"]
+                changed = False
+                if status != job.backend.status:
+                    changed = True
+                    stripProxy(job)._getSessionLock()
+                    job.backend.status = status
+                    if job.backend.status == "Running":
+                        job.updateStatus("running")
 
                 if host:
-                    if jobDict[id].backend.actualCE != host:
-                        jobDict[id].backend.actualCE = host
-                jobDict[id].backend.cputime = cputime
+                    if job.backend.actualCE != host:
+                        job.backend.actualCE = host
+                job.backend.cputime = info["RemoteUserCpu"]
+                if changed:
+                    printStatus(job)
             else:
-                jobDict[id].backend.status = ""
-                outDir = jobDict[id].getOutputWorkspace().getPath()
-                condorLogPath = "".join([outDir, "condorLog"])
-                checkExit = True
-                if os.path.isfile(condorLogPath):
-                    checkExit = False
-                    for line in open(condorLogPath):
-                        if -1 != line.find("terminated"):
-                            checkExit = True
-                            break
-                        if -1 != line.find("aborted"):
-                            checkExit = True
-                            break
-
-                if checkExit:
-                    printStatus = True
-                    stdoutPath = "".join([outDir, "stdout"])
-                    jobStatus = "failed"
-                    if os.path.isfile(stdoutPath):
-                        with open(stdoutPath) as stdout:
-                            lineList = stdout.readlines()
-                        try:
-                            exitLine = lineList[-1]
-                            exitCode = exitLine.strip().split()[-1]
-                        except IndexError:
-                            exitCode = '-1'
-
-                        if exitCode.isdigit():
-                            jobStatus = "completed"
-                        else:
-                            # Some filesystems/setups have the file created but empty - only worry if it's been 10mins
-                            # since we first checked the file
-                            if len(lineList) == 0:
-                                if not jobDict[id].backend._stdout_check_time:
-                                    jobDict[id].backend._stdout_check_time = time.time()
-
-                                if (time.time() - jobDict[id].backend._stdout_check_time) < 10*60:
-                                    continue
-                                else:
-                                    logger.error("Empty stdout file from job %s after waiting 10mins. Marking job as"
-                                                 "failed." % jobDict[id].fqid)
-                            else:
-                                logger.error("Problem extracting exit code from job %s. Line found was '%s'." % (
-                                    jobDict[id].fqid, exitLine))
-
-                    jobDict[id].updateStatus(jobStatus)
-
-            if printStatus:
-                if jobDict[id].backend.actualCE:
-                    hostInfo = jobDict[id].backend.actualCE
-                else:
-                    hostInfo = "Condor"
-                status = jobDict[id].status
-                if status in status_colours:
-                    colour = status_colours[status]
-                else:
-                    colour = fg.magenta
-                if "submitted" == status:
-                    preposition = "to"
+                # Only the events written to the job's log since the last cycle are read
+                job.backend.status = ""
+                log = user_log(os.path.join(job.getOutputWorkspace().getPath(), "condorLog"))
+                log.update()
+                if log.finished or not log.exists:
+                    finish(job, log)
                 else:
-                    preposition = "on"
+                    leftQueue[id] = (job, log)
 
-                if jobDict[id].backend.status:
-                    backendStatus = "".join\
-                        ([" (", jobDict[id].backend.status, ") "])
-                else:
-                    backendStatus = ""
+        if not leftQueue or not getConfig("Condor")["query_history"]:
+            return None
 
-                logger.info(colour + 'Job %s %s%s %s %s - %s' + fx.normal,
-                            jobDict[
-                                id].fqid, status, backendStatus, preposition, hostInfo,
-                            time.strftime('%c'))
+        # The jobs which left the queue without their log saying how they ended are looked up with
+        # one condor_history per schedd
+        historyJobs = {}
+        for id, (job, log) in leftQueue.items():
+            schedd, localId = Condor.splitId(id)
+            historyJobs.setdefault(schedd, []).append((localId, job, log))
+
+        for schedd, scheddJobs in historyJobs.items():
+            jobCounts = {}
+            for localId, job, log in scheddJobs:
+                cluster = int(localId.split(".")[0])
+                jobCounts[cluster] = jobCounts.get(cluster, 0) + 1
+            found = Condor.queryJobs("condor_history", schedd, set(jobCounts), jobCounts=jobCounts)
+            if found is None:
+                logger.debug("Problem retrieving the history of Condor jobs%s" % (" from %s" % schedd if schedd else ""))
+                continue
+            for localId, job, log in scheddJobs:
+                info = found.get(localId)
+                if info is None:
+                    continue
+                if "3" == info["JobStatus"]:
+                    finish(job, log, removed=True)
+                elif "4" == info["JobStatus"]:
+                    if info["RemoteUserCpu"]:
+                        job.backend.cputime = info["RemoteUserCpu"]
+                    finish(job, log)
 
         return None
 
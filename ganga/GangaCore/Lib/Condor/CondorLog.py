@@ -0,0 +1,144 @@
+###############################################################################
+# Ganga Project. http://cern.ch/ganga
+#
+# File: CondorLog.py
+###############################################################################
+
+"""Incremental reading of the Condor user (event) logs of the jobs.
+
+Each monitoring cycle only reads the events written since the previous one: the reader of a log remembers the byte
+offset up to which it has read and the outcome of the events seen so far (termination, exit code, CPU time).
+"""
+
+import os
+import re
+from collections import namedtuple
+
+from GangaCore.Utility.logging import getLogger
+
+logger = getLogger()
+
+# The event codes of the user log used by Ganga
+SUBMIT = '000'
+EXECUTE = '001'
+TERMINATED = '005'
+ABORTED = '009'
+
+# First line of an event, e.g. "005 (123.000.000) 10/17 08:05:00 Job terminated."
+_header_re = re.compile(r'^(?P<code>\d{3}) \((?P<cluster>\d+)\.(?P<proc>\d+)\.\d+\) (?P<date>\S+) (?P<time>\S+)')
+_normal_re = re.compile(r'Normal termination \(return value (?P<value>-?\d+)\)')
+_abnormal_re = re.compile(r'Abnormal termination \(signal (?P<signal>\d+)\)')
+_usage_re = re.compile(r'Usr (?P<days>\d+) (?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>\d+),.*Total Remote Usage')
+
+# Line ending an event
+_separator = b'\n...\n'
+
+Event = namedtuple('Event', ['code', 'cluster', 'proc', 'date', 'time', 'lines'])
+
+
+class CondorUserLog(object):
+
+    """The events of a Condor user log, read incrementally from the offset reached by the previous update"""
+
+    def __init__(self, path):
+        self.path = path
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self._inode = None
+        self.exists = False
+        self.times = {}
+        self.finished = None
+        self.exit_code = None
+        self.signal = None
+        self.cputime = None
+
+    def update(self):
+        """
+        Read the events appended to the log since the last update and return them, an event which is still being written
+        is left for the next update. The log is read again from the start if it has been replaced or truncated.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            if self.exists:
+                self._reset()
+            return []
+
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._inode or stat.st_size < self.offset:
+                self._reset()
+                self._inode = stat.st_ino
+            self.exists = True
+            if stat.st_size == self.offset:
+                return []
+            f.seek(self.offset)
+            data = f.read()
+
+        # Only complete events are taken, the log always starts with one so a separator ends the last of them
+        end = data.rfind(_separator)
+        if end == -1:
+            return []
+        end += len(_separator)
+        self.offset += end
+
+        events = []
+        for chunk in data[:end].decode('utf-8', 'replace').split('\n...\n'):
+            lines = chunk.strip('\n').split('\n')
+            m = _header_re.match(lines[0])
+            if m is None:
+                continue
+            event = Event(m.group('code'), m.group('cluster'), m.group('proc'), m.group('date'), m.group('time'), lines)
+            self._add(event)
+            events.append(event)
+        return events
+
+    def _add(self, event):
+        """
+        Record the outcome of an event
+        Args:
+            event (Event): The event read from the log
+        """
+        self.times.setdefault(event.code, (event.date, event.time))
+        if event.code == TERMINATED:
+            self.finished = 'terminated'
+            for line in event.lines[1:]:
+                m = _normal_re.search(line)
+                if m:
+                    self.exit_code = int(m.group('value'))
+                m = _abnormal_re.search(line)
+                if m:
+                    self.signal = int(m.group('signal'))
+                m = _usage_re.search(line)
+                if m:
+                    seconds = ((int(m.group('days')) * 24 + int(m.group('hours'))) * 60 + int(m.group('minutes'))) * 60 \
+                        + int(m.group('seconds'))
+                    self.cputime = '%f' % seconds
+        elif event.code == ABORTED:
+            self.finished = 'aborted'
+
+
+# The readers of the logs of the jobs being monitored, by path
+_user_logs = {}
+
+
+def user_log(path):
+    """
+    Return the reader of the user log at path, which carries on from where the last one left off
+    Args:
+        path (str): The path of the log
+    """
+    if path not in _user_logs:
+        _user_logs[path] = CondorUserLog(path)
+    return _user_logs[path]
+
+
+def forget_user_log(path):
+    """
+    Drop the reader of the user log at path, once its job is no longer monitored
+    Args:
+        path (str): The path of the log
+    """
+    _user_logs.pop(path, None)
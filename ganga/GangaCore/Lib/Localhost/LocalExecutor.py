@@ -0,0 +1,243 @@
+##########################################################################
+# Ganga Project. http://cern.ch/ganga
+#
+# Running the processes of the local jobs in a limited number of slots.
+##########################################################################
+"""
+The jobs of the Local backend are run by a LocalExecutor which has a fixed number of slots, the jobs submitted while
+all of them are taken wait in a queue and are started as the running ones exit.
+
+The exit of a child is noticed through a pidfd polled by a watcher thread (or, where pidfds aren't available, by a thread
+blocked in wait4 for that child) rather than by looking at files. The child is reaped with os.wait4 which also gives
+its wall clock time, CPU time and maximum resident set size.
+"""
+
+import collections
+import os
+import select
+import subprocess
+import threading
+import time
+
+from GangaCore.Utility.Config import getConfig
+from GangaCore.Utility.logging import getLogger
+
+logger = getLogger()
+
+
+def _exit_code(status):
+    """
+    Returns the exit code of a process from its wait status, minus the signal number if it was killed by a signal
+    Args:
+        status (int): The status returned by wait4
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class LocalProcess(object):
+
+    """A job run by the LocalExecutor, queued, running or exited"""
+
+    __slots__ = ('key', 'args', 'process', 'pid', 'start', 'exitcode', 'walltime', 'cputime', 'maxrss', 'error')
+
+    def __init__(self, key, args):
+        self.key = key
+        self.args = args
+        self.process = None
+        self.pid = None
+        self.start = None
+        self.exitcode = None
+        self.walltime = None
+        self.cputime = None
+        self.maxrss = None
+        self.error = None
+
+    @property
+    def queued(self):
+        return self.pid is None and self.error is None
+
+    @property
+    def exited(self):
+        return self.walltime is not None or self.error is not None
+
+
+class LocalExecutor(object):
+
+    """
+    Runs the processes of the jobs with at most slots of them at the same time, the others wait in a queue.
+    The jobs are identified by a key, their LocalProcess stays known until it is discarded.
+    """
+
+    def __init__(self, slots, on_exit=None):
+        """
+        Args:
+            slots (int): The number of processes which may run at the same time
+            on_exit (callable): Called with the key of a job when its process has exited, from the watcher thread
+        """
+        self.slots = slots
+        self.on_exit = on_exit
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._running = {}
+        self._processes = {}
+        self._fds = {}
+        self._poller = None
+        self._wakeup = None
+
+    def submit(self, key, args):
+        """
+        Run the command args for the job key as soon as a slot is free. An OSError is raised if a free slot was there
+        but the command couldn't be started.
+        Args:
+            key (str): The key of the job
+            args (list): The program to run and its arguments
+        """
+        proc = LocalProcess(key, args)
+        with self._lock:
+            self._processes[key] = proc
+            if len(self._running) >= self.slots:
+                logger.debug('All %d local slots are taken, queueing job %s', self.slots, key)
+                self._queue.append(proc)
+                return proc
+            try:
+                self._start(proc)
+            except OSError:
+                del self._processes[key]
+                raise
+        return proc
+
+    def get(self, key):
+        """Returns the LocalProcess of the job key, None if it isn't known"""
+        return self._processes.get(key)
+
+    def cancel(self, key):
+        """Remove the job key from the queue, returns True if it was waiting there and hadn't been started"""
+        with self._lock:
+            proc = self._processes.get(key)
+            if proc is None or not proc.queued:
+                return False
+            self._queue.remove(proc)
+            del self._processes[key]
+            return True
+
+    def discard(self, key):
+        """Forget about the job key once its exit has been dealt with (or it's been killed)"""
+        with self._lock:
+            self._processes.pop(key, None)
+
+    def queued(self):
+        """Returns the number of jobs waiting for a slot"""
+        return len(self._queue)
+
+    def _start(self, proc):
+        """Start the process of a job, called with the lock held"""
+        proc.process = subprocess.Popen(proc.args, stdin=subprocess.DEVNULL)
+        proc.pid = proc.process.pid
+        proc.start = time.time()
+        self._running[proc.pid] = proc
+        self._watch(proc)
+
+    def _start_queued(self):
+        """Start the queued jobs while there are free slots, called with the lock held"""
+        while self._queue and len(self._running) < self.slots:
+            proc = self._queue.popleft()
+            try:
+                self._start(proc)
+            except OSError as x:
+                logger.error('cannot start a job process: %s', str(x))
+                proc.error = str(x)
+
+    def _watch(self, proc):
+        """Get notified of the exit of the process of a job, through a pidfd if possible"""
+        if hasattr(os, 'pidfd_open'):
+            try:
+                fd = os.pidfd_open(proc.pid)
+            except OSError:
+                pass
+            else:
+                if self._poller is None:
+                    self._poller = select.poll()
+                    self._wakeup = os.pipe()
+                    self._poller.register(self._wakeup[0], select.POLLIN)
+                    threading.Thread(target=self._poll, name='LocalExecutor', daemon=True).start()
+                self._fds[fd] = proc
+                self._poller.register(fd, select.POLLIN)
+                # The watcher thread may be blocked in poll() without this fd
+                os.write(self._wakeup[1], b'x')
+                return
+        threading.Thread(target=self._wait, args=(proc,), name='LocalExecutor-%d' % proc.pid, daemon=True).start()
+
+    def _poll(self):
+        """Body of the watcher thread polling the pidfds of the running processes"""
+        while True:
+            for fd, event in self._poller.poll():
+                if fd == self._wakeup[0]:
+                    os.read(fd, 4096)
+                    continue
+                with self._lock:
+                    proc = self._fds.pop(fd)
+                    self._poller.unregister(fd)
+                    os.close(fd)
+                self._reap(proc, os.WNOHANG)
+
+    def _wait(self, proc):
+        """Body of the thread waiting for a process where there are no pidfds"""
+        self._reap(proc, 0)
+
+    def _reap(self, proc, options):
+        """Collect the exit status and the resource usage of an exited process and start the queued jobs in its slot"""
+        try:
+            pid, status, rusage = os.wait4(proc.pid, options)
+        except ChildProcessError:
+            # Somebody else has reaped it, the resource usage is lost
+            logger.debug('process %d of job %s was already reaped', proc.pid, proc.key)
+            pid, status, rusage = proc.pid, 0, None
+        if pid == 0:
+            logger.debug('process %d of job %s was notified as exited but is still there', proc.pid, proc.key)
+            pid, status, rusage = os.wait4(proc.pid, 0)
+
+        proc.exitcode = _exit_code(status)
+        proc.process.returncode = proc.exitcode
+        if rusage is not None:
+            proc.cputime = rusage.ru_utime + rusage.ru_stime
+            proc.maxrss = rusage.ru_maxrss
+        proc.walltime = time.time() - proc.start
+
+        with self._lock:
+            del self._running[proc.pid]
+            self._start_queued()
+
+        if self.on_exit is not None:
+            try:
+                self.on_exit(proc.key)
+            except Exception as err:
+                logger.debug('error notifying the exit of job %s: %s', proc.key, err)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _notify_monitoring(key):
+    """Make the monitoring check the Local backend now that one of its jobs has exited"""
+    from GangaCore.Core import monitoring_component
+    if monitoring_component is not None:
+        monitoring_component.backendDue('Local')
+
+
+def getLocalExecutor():
+    """Returns the LocalExecutor of the Local backend, with the number of slots set in the configuration"""
+    global _executor
+    slots = getConfig('Local')['slots'] or os.cpu_count() or 1
+    with _executor_lock:
+        if _executor is None:
+            _executor = LocalExecutor(slots, on_exit=_notify_monitoring)
+        elif slots > _executor.slots:
+            _executor.slots = slots
+            with _executor._lock:
+                _executor._start_queued()
+        else:
+            _executor.slots = slots
+        return _executor
@@ -23,6 +23,7 @@ import GangaCore.Utility.Config
 import GangaCore.Utility.Virtualization
 
 from GangaCore.GPIDev.Base.Proxy import getName, stripProxy
+from GangaCore.Lib.Localhost.LocalExecutor import getLocalExecutor
 
 logger = GangaCore.Utility.logging.getLogger()
 config = GangaCore.Utility.Config.getConfig('Local')
@@ -39,6 +40,9 @@ class Localhost(IBackend):
                                      'workdir': SimpleItem(defvalue='', protected=1, copyable=0, doc='Working directory.'),
                                      'actualCE': SimpleItem(defvalue='', protected=1, copyable=0, doc='Hostname where the job was submitted.'),
                                      'wrapper_pid': SimpleItem(defvalue=-1, protected=1, copyable=0, hidden=1, doc='(internal) process id of the execution wrapper'),
+                                     'walltime': SimpleItem(defvalue=None, typelist=[float, None], protected=1, copyable=0, doc='Wall clock time in seconds taken by the job process.'),
+                                     'cputime': SimpleItem(defvalue=None, typelist=[float, None], protected=1, copyable=0, doc='CPU time in seconds used by the job process and its children.'),
+                                     'maxrss': SimpleItem(defvalue=None, typelist=[int, None], protected=1, copyable=0, doc='Maximum resident set size in kB of the job process and its children.'),
                                      'nice': SimpleItem(defvalue=0, doc='adjust process priority using nice -n command'),
                                      'force_parallel': SimpleItem(defvalue=False, doc='should jobs really be submitted in parallel')
                                      })
@@ -81,12 +85,16 @@ class Localhost(IBackend):
         return self.run(job.getInputWorkspace().getPath('__jobscript__'))
 
     def run(self, scriptpath):
+        """Hand the job wrapper to the local executor, it waits in its queue if all the slots are taken"""
+        job = self.getJobObject()
+        self.wrapper_pid = -1
         try:
-            process = subprocess.Popen(["python2", scriptpath, 'subprocess'], stdin=subprocess.DEVNULL)
+            proc = getLocalExecutor().submit(job.getFQID('.'), ["python2", scriptpath, 'subprocess'])
         except OSError as x:
             logger.error('cannot start a job process: %s', str(x))
             return 0
-        self.wrapper_pid = process.pid
+        if proc.pid is not None:
+            self.wrapper_pid = proc.pid
         self.actualCE = GangaCore.Utility.util.hostname()
         return 1
 
@@ -258,6 +266,16 @@ class Localhost(IBackend):
 
         job = self.getJobObject()
 
+        executor = getLocalExecutor()
+        proc = executor.get(job.getFQID('.'))
+        if executor.cancel(job.getFQID('.')) or (proc is not None and proc.pid is None) or (proc is None and self.wrapper_pid == -1):
+            # The job was still waiting for a slot (maybe in a previous session) or couldn't be started
+            executor.discard(job.getFQID('.'))
+            self.remove_workdir()
+            return 1
+        if proc is not None:
+            self.wrapper_pid = proc.pid
+
         ok = True
         try:
             # kill the wrapper script
@@ -268,11 +286,14 @@ class Localhost(IBackend):
             logger.warning('while killing wrapper script for job %s: pid=%d, %s', job.getFQID('.'), self.wrapper_pid, str(x))
             ok = False
 
-        # waitpid to avoid zombies
-        try:
-            ws = os.waitpid(self.wrapper_pid, 0)
-        except OSError as x:
-            logger.warning('problem while waitpid %s: %s', job.getFQID('.'), x)
+        # waitpid to avoid zombies, the executor reaps the processes it started
+        if proc is not None:
+            executor.discard(job.getFQID('.'))
+        else:
+            try:
+                ws = os.waitpid(self.wrapper_pid, 0)
+            except OSError as x:
+                logger.warning('problem while waitpid %s: %s', job.getFQID('.'), x)
 
         from GangaCore.Utility.files import recursive_copy
 
@@ -299,10 +320,69 @@ class Localhost(IBackend):
     @staticmethod
     def updateMonitoringInformation(jobs):
 
-        def get_exit_code(f):
-            import re
-            with open(f) as statusfile:
-                stat = statusfile.read()
+        logger.debug('local ping: %s', str(jobs))
+
+        executor = getLocalExecutor()
+        for j in jobs:
+            key = j.getFQID('.')
+            proc = executor.get(key)
+            statusfile = os.path.join(j.getOutputWorkspace().getPath(), '__jobstatus__')
+
+            if proc is None and j.status == 'submitted' and j.backend.wrapper_pid == -1 and not os.path.exists(statusfile):
+                # The job was waiting for a slot when the previous session ended
+                logger.debug('Queueing job %s again', key)
+                stripProxy(j.backend).run(j.getInputWorkspace().getPath('__jobscript__'))
+                continue
+
+            if proc is None:
+                # Started by another session, the status file tells how it's doing
+                Localhost.updateFromStatusFile(j, statusfile)
+                continue
+
+            if proc.queued:
+                continue
+
+            if proc.error is not None:
+                logger.error('could not start the process of job %s: %s', key, proc.error)
+                executor.discard(key)
+                j.updateStatus('failed')
+                j.backend.remove_workdir()
+                continue
+
+            if j.backend.wrapper_pid != proc.pid:
+                j.backend.wrapper_pid = proc.pid
+
+            if not proc.exited:
+                # The application pid is in the status file once the wrapper has started it
+                if j.status == 'submitted':
+                    Localhost.updateFromStatusFile(j, statusfile, reap=False)
+                continue
+
+            executor.discard(key)
+            j.backend.walltime = proc.walltime
+            j.backend.cputime = proc.cputime
+            j.backend.maxrss = proc.maxrss
+            if proc.exitcode != 0:
+                logger.critical('wrapper script for job %s exit with code %d', str(key), proc.exitcode)
+                logger.critical('report this as a bug at https://github.com/ganga-devs/ganga/issues/')
+                j.updateStatus('failed')
+                j.backend.remove_workdir()
+            elif not Localhost.updateFromStatusFile(j, statusfile, reap=False):
+                logger.warning('wrapper script for job %s exited without writing the exit code of the application', str(key))
+                j.updateStatus('failed')
+                j.backend.remove_workdir()
+
+    @staticmethod
+    def updateFromStatusFile(j, statusfile, reap=True):
+        """
+        Update a job from its __jobstatus__ file, returns True if the file says that the application finished
+        Args:
+            j (Job): The job to update
+            statusfile (str): The path of the status file of the job
+            reap (bool): Check the exit of the wrapper script with waitpid, not for the processes of the executor
+        """
+
+        def get_exit_code(stat):
             m = re.compile(
                 r'^EXITCODE: (?P<exitcode>-?\d*)', re.M).search(stat)
 
@@ -311,10 +391,7 @@ class Localhost(IBackend):
             else:
                 return int(m.group('exitcode'))
 
-        def get_pid(f):
-            import re
-            with open(f) as statusfile:
-                stat = statusfile.read()
+        def get_pid(stat):
             m = re.compile(r'^PID: (?P<pid>\d*)', re.M).search(stat)
 
             if m is None:
@@ -322,35 +399,31 @@ class Localhost(IBackend):
             else:
                 return int(m.group('pid'))
 
-        logger.debug('local ping: %s', str(jobs))
-
-        for j in jobs:
-            outw = j.getOutputWorkspace()
-
-            # try to get the application exit code from the status file
-            try:
-                statusfile = os.path.join(outw.getPath(), '__jobstatus__')
-                if j.status == 'submitted':
-                    pid = get_pid(statusfile)
-                    if pid:
-                        j.backend.id = pid
-                        #logger.info('Local job %s status changed to running, pid=%d',j.getFQID('.'),pid)
-                        j.updateStatus('running')  # bugfix: 12194
-                exitcode = get_exit_code(statusfile)
-                with open(statusfile) as status_file:
-                    logger.debug('status file: %s %s', statusfile, status_file.read())
-            except IOError as x:
-                logger.debug('problem reading status file: %s (%s)', statusfile, str(x))
-                exitcode = None
-            except Exception as x:
-                logger.critical('problem during monitoring: %s', str(x))
-                import traceback
-                traceback.print_exc()
-                raise x
+        # try to get the application exit code from the status file
+        try:
+            with open(statusfile) as status_file:
+                stat = status_file.read()
+            logger.debug('status file: %s %s', statusfile, stat)
+            if j.status == 'submitted':
+                pid = get_pid(stat)
+                if pid:
+                    j.backend.id = pid
+                    #logger.info('Local job %s status changed to running, pid=%d',j.getFQID('.'),pid)
+                    j.updateStatus('running')  # bugfix: 12194
+            exitcode = get_exit_code(stat)
+        except IOError as x:
+            logger.debug('problem reading status file: %s (%s)', statusfile, str(x))
+            exitcode = None
+        except Exception as x:
+            logger.critical('problem during monitoring: %s', str(x))
+            import traceback
+            traceback.print_exc()
+            raise x
 
-            # check if the exit code of the wrapper script is available (non-blocking check)
-            # if the wrapper script exited with non zero this is an error
-            try:
+        # check if the exit code of the wrapper script is available (non-blocking check)
+        # if the wrapper script exited with non zero this is an error
+        try:
+            if reap:
                 ws = os.waitpid(stripProxy(j.backend).wrapper_pid, os.WNOHANG)
                 if not GangaCore.Utility.logic.implies(ws[0] != 0, ws[1] == 0):
                     # FIXME: for some strange reason the logger DOES NOT LOG (checked in python 2.3 and 2.5)
@@ -359,26 +432,27 @@ class Localhost(IBackend):
                     logger.critical('wrapper script for job %s exit with code %d', str(j.getFQID('.')), ws[1])
                     logger.critical('report this as a bug at https://github.com/ganga-devs/ganga/issues/')
                     j.updateStatus('failed')
-            except OSError as x:
-                if x.errno != errno.ECHILD:
-                    logger.warning('cannot do waitpid for %d: %s', stripProxy(j.backend).wrapper_pid, str(x))
-
-            # if the exit code was collected for the application get the exit
-            # code back
+        except OSError as x:
+            if x.errno != errno.ECHILD:
+                logger.warning('cannot do waitpid for %d: %s', stripProxy(j.backend).wrapper_pid, str(x))
 
-            if not exitcode is None:
-                # status file indicates that the application finished
-                j.backend.exitcode = exitcode
+        # if the exit code was collected for the application get the exit
+        # code back
 
-                if exitcode == 0:
-                    j.updateStatus('completed')
-                else:
-                    j.updateStatus('failed')
+        if not exitcode is None:
+            # status file indicates that the application finished
+            j.backend.exitcode = exitcode
 
-                #logger.info('Local job %s finished with exitcode %d',j.getFQID('.'),exitcode)
+            if exitcode == 0:
+                j.updateStatus('completed')
+            else:
+                j.updateStatus('failed')
 
-                # if j.outputdata:
-                # j.outputdata.fill()
+            #logger.info('Local job %s finished with exitcode %d',j.getFQID('.'),exitcode)
 
-                j.backend.remove_workdir()
+            # if j.outputdata:
+            # j.outputdata.fill()
 
+            j.backend.remove_workdir()
+            return True
+        return False
@@ -14,12 +14,23 @@ from GangaCore.GPIDev.Adapters.IGangaFile import IGangaFile
 from GangaCore.Utility.Config import ConfigError, getConfig
 from GangaCore.Utility.Plugin import allPlugins
 from GangaCore.Utility.logging import getLogger
-import subprocess
+from GangaCore.Utility.ProcessEngine import getProcessEngine
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+import shlex
+import json
+import re
+import tempfile
+import shutil
+import gzip
 import os
 import copy
 
 logger = getLogger()
 
+# whether the hadd run with a given ROOT prefix can merge with several threads (-j)
+_hadd_has_threads = {}
+
 
 def getMergerObject(file_ext):
     """Returns an instance of the correct merger tool, or None if there is not one"""
@@ -88,11 +99,22 @@ class TextMerger(IMerger):
     If outputdir is not specified, the default location specfied
     in the [Mergers] section of the .gangarc file will be used.
 
+    When the incremental flag is set the files of the subjobs are merged as
+    the subjobs complete, and so they appear in the order the subjobs completed in.
+
     For large text files it may be desirable to compress the merge
     result using gzip. This can be done by setting the compress
     flag on the TextMerger object. In this case, the merged file
     will have a '.gz' appended to its filename.
 
+    Setting the gzip_members flag as well writes each file as a gzip member of
+    its own, which is much quicker when the files to merge are already compressed
+    as they are then copied as they are. The result is read back as any other gzip file.
+
+    Files are merged in blocks, compressed files being decompressed by several threads
+    (text_merge_threads in the [Mergers] section of the .gangarc file) ahead of the
+    file being written out.
+
     A summary of all the files merged will be created for each entry in files.
     This will be created when the merge of those files completes
     successfully. The name of this is the same as the output file, with the
@@ -102,41 +124,125 @@ class TextMerger(IMerger):
     """
     _category = 'postprocessor'
     _name = 'TextMerger'
+    supports_incremental = True
     _schema = IMerger._schema.inherit_copy()
     _schema.datadict['compress'] = SimpleItem(
         defvalue=False, doc='Output should be compressed with gzip.')
-
-    def mergefiles(self, file_list, output_file):
-
-        import time
-
-        if self.compress or output_file.lower().endswith('.gz'):
-            # use gzip
-            import gzip
-            if not output_file.lower().endswith('.gz'):
-                output_file += '.gz'
-            out_file = gzip.GzipFile(output_file, 'w')
+    _schema.datadict['gzip_members'] = SimpleItem(
+        defvalue=False, doc='When compressing, write each file as a gzip member of its own. Files which are already '
+                            'compressed are then copied without being decompressed and compressed again.')
+
+    # size of the blocks in which the files are copied
+    block_size = 1024 * 1024
+    # size above which a decompressed (or compressed) file is spooled to disk instead of held in memory
+    spool_size = 8 * 1024 * 1024
+
+    def _spool(self, f, compress):
+        """
+        Return a temporary file holding the (de)compressed content of f, rewound to its start
+        Args:
+            f (str): The file to read
+            compress (bool): Compress the content of f into a gzip member rather than decompress it
+        """
+        spooled = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        if compress:
+            with open(f, 'rb') as in_file, gzip.GzipFile(fileobj=spooled, mode='wb') as out_file:
+                shutil.copyfileobj(in_file, out_file, self.block_size)
         else:
-            out_file = open(output_file, 'w')
-
-        out_file.write('# Ganga TextMergeTool - %s #\n' % time.asctime())
-        for f in file_list:
+            with gzip.GzipFile(f, 'rb') as in_file:
+                shutil.copyfileobj(in_file, spooled, self.block_size)
+        spooled.seek(0)
+        return spooled
+
+    def _ordered(self, prepare, file_list):
+        """
+        Run prepare on each file in a pool of threads and return the results in the order of the files.
+        Only a few files more than there are threads are prepared ahead of the one being written out.
+        Args:
+            prepare (function): Returns the file object to copy from for a file
+            file_list (list): The files to merge
+        """
+        threads = max(1, getConfig('Mergers')['text_merge_threads'])
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            pending = deque()
+            try:
+                for f in file_list:
+                    pending.append((f, pool.submit(prepare, f)))
+                    if len(pending) > 2 * threads:
+                        this_f, future = pending.popleft()
+                        yield this_f, future.result()
+                while pending:
+                    this_f, future = pending.popleft()
+                    yield this_f, future.result()
+            finally:
+                for this_f, future in pending:
+                    if not future.cancel() and future.exception() is None:
+                        future.result().close()
+
+    def _write(self, file_list, output_file, compress, framed=True, labelled=True, plain_inputs=False):
+        """
+        Write the files one after the other into output_file
+        Args:
+            file_list (list): The files to merge
+            output_file (str): The file to write
+            compress (bool): Compress output_file with gzip
+            framed (bool): Start and end output_file with the lines of the TextMergeTool
+            labelled (bool): Start each file with a line giving its name
+            plain_inputs (bool): The files are known not to be compressed, whatever their names
+        """
+        import time
 
-            if not f.lower().endswith('.gz'):
-                in_file = open(f)
-            else:
-                import gzip
-                in_file = gzip.GzipFile(f)
+        as_members = compress and self.gzip_members
+
+        def prepare(f):
+            is_gz = f.lower().endswith('.gz') and not plain_inputs
+            if as_members and not is_gz:
+                return self._spool(f, compress=True)
+            if not as_members and is_gz:
+                return self._spool(f, compress=False)
+            return open(f, 'rb')
+
+        def text(string):
+            if as_members:
+                return gzip.compress(string.encode())
+            return string.encode()
+
+        with open(output_file, 'wb') as raw_file:
+            out_file = gzip.GzipFile(fileobj=raw_file, mode='wb') if compress and not as_members else raw_file
+            try:
+                if framed:
+                    out_file.write(text('# Ganga TextMergeTool - %s #\n' % time.asctime()))
+                for f, in_file in self._ordered(prepare, file_list):
+                    with in_file:
+                        if labelled:
+                            out_file.write(text('# Start of file %s #\n' % str(f)))
+                        shutil.copyfileobj(in_file, out_file, self.block_size)
+                        if labelled:
+                            out_file.write(text('\n'))
+                if framed:
+                    out_file.write(text('# Ganga Merge Ended Successfully #\n'))
+            finally:
+                if out_file is not raw_file:
+                    out_file.close()
+
+    def _outputName(self, output_file):
+        if (self.compress or output_file.lower().endswith('.gz')) and not output_file.lower().endswith('.gz'):
+            output_file += '.gz'
+        return output_file
 
-            out_file.write('# Start of file %s #\n' % str(f))
-            out_file.write(in_file.read())
-            out_file.write('\n')
+    def mergefiles(self, file_list, output_file):
+        output_file = self._outputName(output_file)
+        self._write(file_list, output_file, compress=output_file.lower().endswith('.gz'))
 
-            in_file.close()
+    def mergepartial(self, file_list, partial_file):
+        """The partial merges hold the uncompressed files with their labels, without the first and last lines"""
+        if not os.path.isdir(os.path.dirname(partial_file)):
+            os.makedirs(os.path.dirname(partial_file))
+        self._write(file_list, partial_file, compress=False, framed=False)
 
-        out_file.write('# Ganga Merge Ended Successfully #\n')
-        out_file.flush()
-        out_file.close()
+    def mergepartials(self, partial_list, output_file):
+        output_file = self._outputName(output_file)
+        self._write(partial_list, output_file, compress=output_file.lower().endswith('.gz'), labelled=False, plain_inputs=True)
 
 
 class RootMerger(IMerger):
@@ -187,27 +293,50 @@ class RootMerger(IMerger):
     If outputdir is not specified, the default location specfied
     in the [Mergers] section of the .gangarc file will be used.
 
+    When there are more than fan_in files they are merged in groups of fan_in
+    files, up to parallel groups at the same time, and the resulting files are
+    merged in turn. If such a merge fails part way through, running it again
+    reuses the groups which had been merged. hadd is given several threads (-j)
+    when the version of ROOT used supports it.
+
     """
 
     _category = 'postprocessor'
     _name = 'RootMerger'
+    supports_incremental = True
     _schema = IMerger._schema.inherit_copy()
     _schema.datadict['args'] = SimpleItem(defvalue=None, doc='Arguments to be passed to hadd.',
                                           typelist=[str, None])
-
-    def mergefiles(self, file_list, output_file):
-
-        from GangaCore.Utility.root import getrootprefix, checkrootprefix
-        rc, rootprefix = getrootprefix()
-
-        if rc != 0:
-            raise PostProcessException(
-                'ROOT has not been properly configured. Check your .gangarc file.')
-
-        if checkrootprefix():
-            raise PostProcessException(
-                'Can not run ROOT correctly. Check your .gangarc file.')
-
+    _schema.datadict['fan_in'] = SimpleItem(defvalue=100, doc='Maximum number of files merged by one hadd. More files are merged in groups, '
+                                                              'the results of which are merged in turn (0 to merge all files at once).',
+                                            typelist=[int])
+    _schema.datadict['parallel'] = SimpleItem(defvalue=4, doc='Number of groups of files merged at the same time.',
+                                              typelist=[int])
+
+    def _haddThreads(self, rootprefix):
+        """
+        Return the number of threads to give to each hadd, 1 if hadd can't use more or the args already set it
+        Args:
+            rootprefix (str): The prefix to run the commands of ROOT with
+        """
+        if self.args and '-j' in self.args.split():
+            return 1
+        if rootprefix not in _hadd_has_threads:
+            # hadd lists its options when run without arguments
+            usage = getProcessEngine().run(rootprefix + 'hadd').text()
+            _hadd_has_threads[rootprefix] = re.search(r'(^|[\s\[])-j\b', usage, re.MULTILINE) is not None
+        if not _hadd_has_threads[rootprefix]:
+            return 1
+        return max(1, (os.cpu_count() or 1) // max(1, self.parallel))
+
+    def _haddCommand(self, rootprefix, output_file, file_list):
+        """
+        Return the hadd command merging file_list into output_file
+        Args:
+            rootprefix (str): The prefix to run the commands of ROOT with
+            output_file (str): The file to write
+            file_list (list): The files to merge
+        """
         # we always force as the overwrite is handled by our parent
         default_arguments = '-f'
         merge_cmd = rootprefix + 'hadd '
@@ -218,23 +347,123 @@ class RootMerger(IMerger):
         if not default_arguments in merge_cmd:
             merge_cmd += ' %s ' % default_arguments
 
+        threads = self._haddThreads(rootprefix)
+        if threads > 1:
+            merge_cmd += ' -j %d ' % threads
+
         # add the list of files, output file first
         arg_list = [output_file]
         arg_list.extend(file_list)
-        merge_cmd += ' '.join(arg_list)
-
-        rc, out = subprocess.getstatusoutput(merge_cmd)
+        merge_cmd += ' '.join(shlex.quote(arg) for arg in arg_list)
+        return merge_cmd
 
+    @staticmethod
+    def _log(output_file, merge_cmd, out):
         log_file = '%s.hadd_output' % output_file
-        with open(log_file, 'w') as log:
+        with open(log_file, 'a') as log:
             log.write('# -- Hadd output -- #\n')
+            log.write('# %s\n' % merge_cmd)
             log.write('%s\n' % out)
 
-        if rc:
+    def _treeMerge(self, rootprefix, file_list, output_file):
+        """
+        Merge the files in groups of fan_in files, running up to parallel hadd at once, until few enough are left
+        to be merged into output_file. The groups merged are recorded in a manifest next to the output so that
+        a merge which failed part way through picks up where it stopped when it is run again.
+        Returns the files left to merge into output_file.
+        Args:
+            rootprefix (str): The prefix to run the commands of ROOT with
+            file_list (list): The files to merge
+            output_file (str): The file the merge will be written to
+        """
+        parts_dir = '%s.merge_parts' % output_file
+        manifest_file = os.path.join(parts_dir, 'manifest.json')
+        if not os.path.isdir(parts_dir):
+            os.makedirs(parts_dir)
+        try:
+            with open(manifest_file) as manifest_in:
+                manifest = json.load(manifest_in)
+        except (IOError, ValueError):
+            manifest = {}
+
+        def save_manifest():
+            with open(manifest_file + '.new', 'w') as manifest_out:
+                json.dump(manifest, manifest_out)
+            os.replace(manifest_file + '.new', manifest_file)
+
+        # the groups merged by this run, the groups merging them must be merged again
+        merged = set()
+        level = 0
+        while len(file_list) > self.fan_in:
+            groups = [file_list[i:i + self.fan_in] for i in range(0, len(file_list), self.fan_in)]
+            # a file left on its own doesn't need merging
+            outputs = [os.path.join(parts_dir, 'level%d_group%d.root' % (level, index)) if len(group) > 1 else group[0]
+                       for index, group in enumerate(groups)]
+            todo = [(group, part) for group, part in zip(groups, outputs)
+                    if len(group) > 1 and (manifest.get(part) != group or not os.path.exists(part) or merged.intersection(group))]
+            logger.info('Merging %d files in %d groups (%d already merged)', len(file_list), len(groups), len(groups) - len(todo))
+
+            running = {}
+            failed = []
+            while todo or running:
+                while todo and len(running) < max(1, self.parallel) and not failed:
+                    group, part = todo.pop(0)
+                    merge_cmd = self._haddCommand(rootprefix, part, group)
+                    running[getProcessEngine().submit(merge_cmd)] = (group, part, merge_cmd)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group, part, merge_cmd = running.pop(future)
+                    result = future.result()
+                    self._log(output_file, merge_cmd, result.text())
+                    if result.returncode != 0:
+                        logger.error(result.text())
+                        failed.append(merge_cmd)
+                    else:
+                        manifest[part] = group
+                        merged.add(part)
+                        save_manifest()
+            if failed:
+                raise PostProcessException('The ROOT merge failed to complete. The command used was %s. '
+                                           'Merging again will reuse the %s groups already merged.' % (failed[0], parts_dir))
+            file_list = outputs
+            level += 1
+        return file_list
+
+    def mergefiles(self, file_list, output_file):
+
+        from GangaCore.Utility.root import getrootprefix, checkrootprefix
+        rc, rootprefix = getrootprefix()
+
+        if rc != 0:
+            raise PostProcessException(
+                'ROOT has not been properly configured. Check your .gangarc file.')
+
+        if checkrootprefix():
+            raise PostProcessException(
+                'Can not run ROOT correctly. Check your .gangarc file.')
+
+        log_file = '%s.hadd_output' % output_file
+        if os.path.exists(log_file):
+            os.remove(log_file)
+
+        file_list = list(file_list)
+        if self.fan_in > 1 and len(file_list) > self.fan_in:
+            file_list = self._treeMerge(rootprefix, file_list, output_file)
+
+        merge_cmd = self._haddCommand(rootprefix, output_file, file_list)
+        result = getProcessEngine().run(merge_cmd)
+        out = result.text()
+        self._log(output_file, merge_cmd, out)
+
+        if result.returncode:
             logger.error(out)
             raise PostProcessException(
                 'The ROOT merge failed to complete. The command used was %s.' % merge_cmd)
 
+        shutil.rmtree('%s.merge_parts' % output_file, ignore_errors=True)
+
 
 class CustomMerger(IMerger):
 
@@ -257,12 +486,17 @@ class CustomMerger(IMerger):
     merge will fail. If the merge cannot proceed, then the function should return a 
     non-zero integer.
 
+    If the incremental flag is set, the function is called on the files of groups of
+    subjobs as they complete, and then on the outputs of these calls. It then has to
+    accept the files it wrote itself as inputs.
+
     Clearly this tool is provided for advanced ganga usage only, and should be used with
     this in mind.
 
     """
     _category = 'postprocessor'
     _name = 'CustomMerger'
+    supports_incremental = True
     _schema = IMerger._schema.inherit_copy()
     _schema.datadict['module'] = FileItem(
         defvalue=None, doc='Path to a python module to perform the merge.')
@@ -356,18 +590,12 @@ class SmartMerger(IMerger):
     _name = 'SmartMerger'
     _schema = IMerger._schema.inherit_copy()
 
-    def merge(self, jobs, outputdir=None, ignorefailed=None, overwrite=None):
-
-        if ignorefailed is None:
-            ignorefailed = self.ignorefailed
-
-        if overwrite is None:
-            overwrite = self.overwrite
-
-        # make a guess of what to merge if nothing is specified
-        if not self.files:
-            self.files = findFilesToMerge(jobs)
-
+    def _typeMap(self, ignorefailed):
+        """
+        Return the dict of the merger (by extension or per file config) to the files it merges, None if a file can't be merged
+        Args:
+            ignorefailed (bool): Ignore the files without a merger rather than fail
+        """
         type_map = {}
         for f in self.files:
 
@@ -387,7 +615,7 @@ class SmartMerger(IMerger):
                     else:
                         logger.warning('File extension not found for file %s and so the merge will fail. '
                                        'Check the name of the file or set the ignorefailed flag.', f)
-                        return self.failure
+                        return None
 
                 file_ext = file_ext.lower()  # treat as lowercase
 
@@ -397,6 +625,39 @@ class SmartMerger(IMerger):
 
             # store the file association
             type_map.setdefault(file_ext, []).append(f)
+        return type_map
+
+    @classmethod
+    def _incrementalSupported(cls):
+        # each of the mergers the files are handed to is asked in turn
+        return cls.merge is IMerger.merge
+
+    def _foldSubjob(self, job, partials_dir):
+        # the files to merge are only guessed from all the jobs at the end
+        if not self.files:
+            return
+        for ext, files in (self._typeMap(ignorefailed=True) or {}).items():
+            merge_object = getMergerObject(ext)
+            if merge_object is not None and merge_object._incrementalSupported():
+                merge_object.files = files
+                merge_object.partial_size = self.partial_size
+                merge_object._foldSubjob(job, partials_dir)
+
+    def _merge(self, jobs, outputdir=None, ignorefailed=None, overwrite=None, partials_dir=None):
+
+        if ignorefailed is None:
+            ignorefailed = self.ignorefailed
+
+        if overwrite is None:
+            overwrite = self.overwrite
+
+        # make a guess of what to merge if nothing is specified
+        if not self.files:
+            self.files = findFilesToMerge(jobs)
+
+        type_map = self._typeMap(ignorefailed)
+        if type_map is None:
+            return self.failure
 
         merge_results = []
         for ext in type_map:
@@ -408,8 +669,10 @@ class SmartMerger(IMerger):
             else:
                 logger.debug('Extension %s matched and using appropriate object: %s' % (str(ext), str(merge_object)))
             merge_object.files = type_map[ext]
-            merge_result = merge_object.merge(jobs, outputdir, ignorefailed, overwrite)
+            if partials_dir is not None and merge_object._incrementalSupported():
+                merge_result = merge_object._merge(jobs, outputdir, ignorefailed, overwrite, partials_dir)
+            else:
+                merge_result = merge_object.merge(jobs, outputdir, ignorefailed, overwrite)
             merge_results.append(merge_result)
 
         return not False in merge_results
-
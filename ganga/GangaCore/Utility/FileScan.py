@@ -0,0 +1,126 @@
+"""
+Searching files for several regular expressions at once.
+
+Each file is read once, whatever the number of patterns, instead of once per pattern. It is read as UTF-8
+text with universal newlines, as when the file is read line by line.
+The patterns keep the meaning they have when searched line by line: each one is compiled on its own and
+searched in the whole file, falling back to a search line by line when its first match runs over the end
+of a line or when the pattern could match differently in a line than in the whole file (e.g. \\A).
+"""
+
+import re
+from functools import lru_cache
+
+# Patterns which can match differently in a line than in the whole file: \A, \Z, \B, the lookarounds and the inline
+# multiline and dotall flags look beyond the line, as does a $ after the newline ending it
+_line_context = re.compile(r'\\[ABZ]|\(\?<?[=!]|\(\?[aiLmsux]*[ms]')
+_line_end = re.compile(r'\$')
+# Anything which may match the newline ending a line, ranges of characters included
+_newline = re.compile(r'\\[^AbBdSwZ.^$*+?{}()\[\]|\\-]|\[\^|\[[^\]]*-|\n')
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern):
+    """
+    Returns the compiled regex to search a line with and the one to search the whole file with, None if the pattern
+    has to be searched line by line. Raises re.error if the pattern is not a valid regular expression
+    Args:
+        pattern (str): The regular expression
+    """
+    line_regex = re.compile(pattern)
+    if _line_context.search(pattern) or (_line_end.search(pattern) and _newline.search(pattern)):
+        return line_regex, None
+    return line_regex, re.compile(pattern, re.MULTILINE)
+
+
+def _search_lines(data, regex, pos):
+    """
+    Search the lines of data one by one from pos, returns True at the first one matching regex
+    Args:
+        data (str): The content of the file
+        regex (Pattern): The compiled pattern
+        pos (int): The start of the first line to search
+    """
+    size = len(data)
+    while pos < size:
+        end = data.find('\n', pos)
+        end = size if end == -1 else end + 1
+        if regex.search(data[pos:end]):
+            return True
+        pos = end
+    return False
+
+
+def _contains(data, pattern):
+    """
+    Returns True if pattern matches one of the lines of data
+    Args:
+        data (str): The content of the file
+        pattern (str): The regular expression
+    """
+    line_regex, file_regex = compile_pattern(pattern)
+    if file_regex is None:
+        return _search_lines(data, line_regex, 0)
+    match = file_regex.search(data)
+    if match is None:
+        return False
+    if match.start() == len(data):
+        # An empty match at the very end, which is the end of the last line rather than the start of another one
+        return _search_lines(data, line_regex, data.rfind('\n', 0, len(data) - 1) + 1)
+    newline = data.find('\n', match.start(), match.end())
+    if newline == -1 or newline == match.end() - 1:
+        return True
+    # The match runs over the end of its line, look for one within a line from the line it started on
+    return _search_lines(data, line_regex, data.rfind('\n', 0, match.start()) + 1)
+
+
+def _search(data, patterns, stop_on_match):
+    """
+    Return the set of the indices of the patterns found in data
+    Args:
+        data (str): The content of the file
+        patterns (list): The patterns to look for
+        stop_on_match (bool): Return as soon as one of the patterns has been found
+    """
+    found = set()
+    # Like a file read line by line, an empty file has no line to match
+    if not len(data):
+        return found
+    for index, pattern in enumerate(patterns):
+        if _contains(data, pattern):
+            found.add(index)
+            if stop_on_match:
+                break
+    return found
+
+
+def scan_file(path, patterns, stop_on_match=False):
+    """
+    Return the set of the indices of the patterns which are found in a line of a file.
+    The patterns are python regular expressions, matched against each line as re.search would do.
+    Args:
+        path (str): The file to search
+        patterns (list): The patterns to look for
+        stop_on_match (bool): Stop scanning the file as soon as one of the patterns has been found
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return _search(f.read(), patterns, stop_on_match)
+
+
+def scan_files(paths, patterns, stop_on_match=False, stop_on_miss=False):
+    """
+    Scan files one after the other and return the list of (path, set of indices found) for the files scanned.
+    Scanning stops after the first file which decides the outcome of the scan.
+    Args:
+        paths (list): The files to search
+        patterns (list): The patterns to look for
+        stop_on_match (bool): Stop after the first file in which one of the patterns is found
+        stop_on_miss (bool): Stop after the first file in which one of the patterns is missing
+    """
+    results = []
+    for path in paths:
+        found = scan_file(path, patterns, stop_on_match=stop_on_match)
+        results.append((path, found))
+        if (stop_on_match and found) or (stop_on_miss and len(found) < len(patterns)):
+            break
+    return results
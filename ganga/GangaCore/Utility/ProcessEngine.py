@@ -0,0 +1,353 @@
+##########################################################################
+# Ganga Project. http://cern.ch/ganga
+#
+# Shared engine running external commands on an asyncio event loop in a
+# background thread.
+##########################################################################
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+
+from GangaCore.Core.exceptions import GangaException
+from GangaCore.Utility.Config import getConfig
+from GangaCore.Utility.logging import getLogger
+
+logger = getLogger()
+
+# Size of the chunks the output of a command is read in
+_read_size = 65536
+
+
+class CommandResult(object):
+
+    """The outcome of a command run by the ProcessEngine.
+    The output is kept in memory unless it grew larger than the spill threshold, in which case it's in output_file.
+    """
+
+    __slots__ = ('returncode', 'timed_out', '_output', 'output_file', 'stderr')
+
+    def __init__(self, returncode, timed_out, output, output_file, stderr):
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self._output = output
+        self.output_file = output_file
+        self.stderr = stderr
+
+    def output(self):
+        """Returns the output of the command as bytes, reading it back from disk if it was spilled there"""
+        if self.output_file is None:
+            return self._output
+        with open(self.output_file, 'rb') as out_file:
+            return out_file.read()
+
+    def text(self):
+        """Returns the output of the command as a string"""
+        return self.output().decode('utf-8', 'replace')
+
+    def head(self, size):
+        """Returns the first size bytes of the output as a string
+        Args:
+            size (int): The number of bytes wanted
+        """
+        if self.output_file is None:
+            return self._output[:size].decode('utf-8', 'replace')
+        with open(self.output_file, 'rb') as out_file:
+            return out_file.read(size).decode('utf-8', 'replace')
+
+    def write_to(self, filename):
+        """Store the output of the command in the file filename, the spilled output file is moved there
+        Args:
+            filename (str): The file to write the output to
+        """
+        if self.output_file is None:
+            with open(filename, 'wb') as out_file:
+                out_file.write(self._output)
+        elif self.output_file != filename:
+            shutil.move(self.output_file, filename)
+            self.output_file = filename
+
+    def discard(self):
+        """Remove the file the output was spilled to, if any"""
+        if self.output_file is not None:
+            try:
+                os.remove(self.output_file)
+            except OSError:
+                pass
+            self.output_file = None
+            self._output = b''
+
+
+class _OutputBuffer(object):
+
+    """Collects the output of a stream in memory and moves it to a file once it's larger than spill_threshold"""
+
+    __slots__ = ('_chunks', '_size', '_spill_threshold', '_spill_file', 'filename', '_file')
+
+    def __init__(self, spill_threshold, spill_file):
+        self._chunks = []
+        self._size = 0
+        self._spill_threshold = spill_threshold
+        self._spill_file = spill_file
+        self.filename = None
+        self._file = None
+
+    def write(self, data):
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._spill_threshold is not None and self._size > self._spill_threshold:
+            if self._spill_file is None:
+                fd, self.filename = tempfile.mkstemp(suffix='.out')
+                self._file = os.fdopen(fd, 'wb')
+            else:
+                self.filename = self._spill_file
+                self._file = open(self.filename, 'wb')
+            self._file.write(b''.join(self._chunks))
+            self._chunks = []
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        return b''.join(self._chunks)
+
+
+if sys.version_info < (3, 8):
+
+    class _ThreadedChildWatcher(asyncio.AbstractChildWatcher):
+
+        """Child watcher waiting for each process in a thread of its own, as Python 3.8 does by default.
+        The child watchers of older versions can only be attached to a loop from the main thread, which isn't where the
+        ProcessEngine runs its loop.
+        """
+
+        def add_child_handler(self, pid, callback, *args):
+            thread = threading.Thread(target=self._wait, args=(pid, callback, args), name='GangaProcessWaiter-%d' % pid)
+            thread.daemon = True
+            thread.start()
+
+        def remove_child_handler(self, pid):
+            return True
+
+        def attach_loop(self, loop):
+            pass
+
+        def close(self):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, a, b, c):
+            pass
+
+        @staticmethod
+        def _wait(pid, callback, args):
+            try:
+                _, status = os.waitpid(pid, 0)
+            except ChildProcessError:
+                # Reaped by someone else, the exit status is lost
+                returncode = 255
+            else:
+                if os.WIFSIGNALED(status):
+                    returncode = -os.WTERMSIG(status)
+                elif os.WIFEXITED(status):
+                    returncode = os.WEXITSTATUS(status)
+                else:
+                    returncode = status
+            # The callback of the loop hands the exit code over with call_soon_threadsafe
+            callback(pid, returncode, *args)
+
+
+class ProcessEngine(object):
+
+    """Runs external commands as asyncio subprocesses on an event loop owned by a background thread.
+    The output is read from pipes, timeouts are handled by the loop rather than by polling, and no more than
+    max_concurrent commands run at the same time, the others wait for their turn.
+    Commands can be run from any thread with run(), which blocks, or submit(), which returns a concurrent Future.
+    Coroutines can await run_async() from any event loop.
+    """
+
+    def __init__(self, max_concurrent):
+        """
+        Args:
+            max_concurrent (int): The number of commands which may run at the same time
+        """
+        self._max_concurrent = max_concurrent
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """Start the event loop thread if it isn't running yet, returns the loop"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if sys.version_info < (3, 8) and not isinstance(asyncio.get_child_watcher(), _ThreadedChildWatcher):
+                    asyncio.set_child_watcher(_ThreadedChildWatcher())
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self._max_concurrent)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+                    loop.close()
+
+                self._thread = threading.Thread(target=run_loop, name='GangaProcessEngine')
+                self._thread.daemon = True
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+
+    def stop(self):
+        """Stop the event loop thread, commands which are still running are left alone"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+            self._thread = None
+            self._loop = None
+
+    def submit(self, command, **kwargs):
+        """Start running a command and return a concurrent.futures.Future for its CommandResult, see run() for the arguments"""
+        return asyncio.run_coroutine_threadsafe(self._run(command, **kwargs), self._start())
+
+    def run(self, command, **kwargs):
+        """Run a command and wait for its CommandResult
+        Args:
+            command (str, list): A shell command line if shell is True, else the list of the program and its arguments
+            shell (bool): Run the command with /bin/sh (default True)
+            env (dict): The environment to run the command in, the current one if None
+            cwd (str): The directory to run the command in
+            input (bytes, str): Data to feed to the standard input of the command, it gets /dev/null if None
+            timeout (float): Seconds after which the command is killed, None to wait forever
+            kill_grace (float): Seconds between sending SIGTERM and SIGKILL when the command timed out, 0 to SIGKILL straight away
+            merge_stderr (bool): Capture the standard error together with the output (default True)
+            spill_threshold (int): Size in bytes above which the output is written to a file, the Shell config value if None
+            spill_file (str): The file to spill the output to, a temporary file if None
+            close_fds (bool): Close the file descriptors of Ganga in the command (default True)
+        """
+        if threading.current_thread() is self._thread:
+            raise GangaException("ProcessEngine.run() called from the event loop, use run_async() instead")
+        return self.submit(command, **kwargs).result()
+
+    async def run_async(self, command, **kwargs):
+        """Coroutine running a command and returning its CommandResult, see run() for the arguments"""
+        # Within a coroutine this is the loop running it
+        if asyncio.get_event_loop() is self._loop:
+            return await self._run(command, **kwargs)
+        return await asyncio.wrap_future(self.submit(command, **kwargs))
+
+    async def _run(self, command, shell=True, env=None, cwd=None, input=None, timeout=None, kill_grace=5.,
+                   merge_stderr=True, spill_threshold=None, spill_file=None, close_fds=True):
+        if spill_threshold is None:
+            spill_threshold = getConfig('Shell')['OutputSpillSize']
+        if isinstance(input, str):
+            input = input.encode('utf-8')
+
+        async with self._semaphore:
+            popen_args = dict(stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+                              env=env, cwd=cwd, close_fds=close_fds, start_new_session=True)
+            if shell:
+                process = await asyncio.create_subprocess_shell(command, **popen_args)
+            else:
+                process = await asyncio.create_subprocess_exec(*command, **popen_args)
+
+            out = _OutputBuffer(spill_threshold, spill_file)
+            err = None if merge_stderr else _OutputBuffer(spill_threshold, None)
+            io_tasks = [asyncio.ensure_future(self._read(process.stdout, out))]
+            if err is not None:
+                io_tasks.append(asyncio.ensure_future(self._read(process.stderr, err)))
+            if input is not None:
+                io_tasks.append(asyncio.ensure_future(self._feed(process.stdin, input)))
+
+            timed_out = False
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                await self._kill(process, kill_grace)
+
+            # The output of a killed command may be held open by processes it left behind, don't wait for those forever
+            done, pending = await asyncio.wait(io_tasks, timeout=None if not timed_out else 1.)
+            for task in pending:
+                task.cancel()
+
+            output = out.close()
+            stderr = err.close() if err is not None else None
+            if err is not None and err.filename is not None:
+                with open(err.filename, 'rb') as err_file:
+                    stderr = err_file.read()
+                os.remove(err.filename)
+
+        return CommandResult(process.returncode, timed_out, output, out.filename, stderr)
+
+    @staticmethod
+    async def _read(stream, buf):
+        while True:
+            data = await stream.read(_read_size)
+            if not data:
+                return
+            buf.write(data)
+
+    @staticmethod
+    async def _feed(stream, data):
+        try:
+            stream.write(data)
+            await stream.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            stream.close()
+
+    @staticmethod
+    async def _kill(process, kill_grace):
+        """Kill the process group of a command which timed out, politely first if kill_grace is given"""
+        def send(sig):
+            try:
+                os.killpg(process.pid, sig)
+            except OSError as err:
+                logger.debug("Failed to send signal %s to %s: %s" % (sig, process.pid, err))
+
+        if kill_grace:
+            logger.debug('killing process %d with signal %d', process.pid, signal.SIGTERM)
+            send(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), kill_grace)
+                return
+            except asyncio.TimeoutError:
+                pass
+        logger.debug('killing process %d with signal %d', process.pid, signal.SIGKILL)
+        send(signal.SIGKILL)
+        await process.wait()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def getProcessEngine():
+    """Returns the ProcessEngine shared by Ganga, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ProcessEngine(getConfig('Shell')['MaxConcurrentCommands'])
+        return _engine
+
+
+def stopProcessEngine():
+    """Stop the event loop thread of the shared ProcessEngine, called on shutdown"""
+    with _engine_lock:
+        if _engine is not None:
+            _engine.stop()
@@ -21,6 +21,10 @@
 #
 #     rc,output,m=shell.cmd1('edg-get-job-status -all')
 #
+# The same from a coroutine, without blocking its event loop
+#
+#     rc,output,m=await shell.cmd_async('edg-get-job-status -all')
+#
 # Output is not captured. Useful for commands that require interactions
 #
 #     rc=shell.system('grid-proxy-init')
@@ -32,16 +36,14 @@
 #
 #     fullpath=shell.wrapper('lcg-cp')
 
-import errno
 import os
 import re
 import stat
 import tempfile
-import time
-import signal
 import subprocess
 
 from GangaCore.Utility.execute import execute
+from GangaCore.Utility.ProcessEngine import getProcessEngine, CommandResult
 
 import GangaCore.Utility.logging
 logger = GangaCore.Utility.logging.getLogger()
@@ -139,107 +141,101 @@ class Shell(object):
             mention_outputfile_on_errors (bool): Should we print warning pointing to output when something when something goes wrong
         """
 
-        if allowed_exit is None:
-            allowed_exit = [0]
-
         if not soutfile:
             soutfile = tempfile.NamedTemporaryFile(mode='w+t', suffix='.out', delete=False).name
 
-        logger.debug('Running shell command: %s' % cmd)
-        try:
-            t0 = time.time()
-            already_killed = False
-            timeout0 = timeout
-            launcher = ['/bin/sh', '-c']
-            args = ['%s > %s 2>&1' % (cmd, soutfile)]
-            command = launcher
-            for i in args:
-                command.append(i)
-            this_cwd = os.path.abspath(os.getcwd())
-            if not os.path.exists(this_cwd):
-                this_cwd = os.path.abspath(tempfile.gettempdir())
-            logger.debug("Using CWD: %s" % this_cwd)
-
-            process = subprocess.Popen(command, env=self.env, cwd=this_cwd, stdin = subprocess.DEVNULL)
-            pid = process.pid
-            while True:
-                wpid, sts = os.waitpid(pid, os.WNOHANG)
-                if wpid != 0:
-                    if os.WIFSIGNALED(sts):
-                        rc = -os.WTERMSIG(sts)
-                        break
-                    elif os.WIFEXITED(sts):
-                        rc = os.WEXITSTATUS(sts)
-                        break
-                if timeout and time.time() - t0 > timeout:
-                    logger.warning('Command interrupted - timeout %ss reached: %s', timeout0, cmd)
-                    if already_killed:
-                        sig = signal.SIGKILL
-                    else:
-                        sig = signal.SIGTERM
-                    logger.debug('killing process %d with signal %d', pid, sig)
-                    os.kill(pid, sig)
-                    t0 = time.time()
-                    # wait just 5 seconds before killing with SIGKILL
-                    timeout = 5
-                    already_killed = True
-                time.sleep(0.05)
+        rc, result, m = self._run(cmd, allowed_exit, timeout, mention_outputfile_on_errors, soutfile)
+        result.write_to(soutfile)
 
-        except OSError as e:
-            if e.errno == 10:
-                rc = process.returncode
-                logger.debug("Process has already exitted which will throw a 10")
-                logger.debug("Exit status is: %s" % rc)
-            else:
-                logger.warning('Problem with shell command: %s, %s', e.errno, e.strerror)
-                rc = 255
-
-        BYTES = 4096
-        if rc not in allowed_exit:
-            logger.warning('exit status [%d] of command %s', rc, cmd)
-            if mention_outputfile_on_errors:
-                logger.warning('full output is in file: %s', soutfile)
-                with open(soutfile) as sout_file:
-                    logger.warning('<first %d bytes of output>\n%s', BYTES, sout_file.read(BYTES))
-                logger.warning('<end of first %d bytes of output>', BYTES)
-
-        # FIXME /bin/sh might have also other error messages
-        m = None
-        if rc != 0:
-            with open(soutfile) as sout_file:
-                m = re.search('command not found\n', sout_file.read())
-            if m:
-                logger.warning('command %s not found', cmd)
-
-        return rc, soutfile, m is None
+        return rc, soutfile, m
 
     def cmd1(self, cmd, allowed_exit=None, capture_stderr=False, timeout=None, mention_outputfile_on_errors=False):
         """Executes an OS command and captures the stderr and stdout which are returned as a string
         Args:
             cmd (str): command to be executed in a shell
-            soutfile (str): filename of file to store the output in (optional)
             allowed_exit (list): list of numerical rc which are deemed to be a success when checking the function output. Def [0]
             capture_stderr (None): unused, kept for API compatability?
             timeout (int): length of time (sec) that a command is expected to have finished by
             mention_outputfile_on_errors (bool): Should we print warning pointing to output when something when something goes wrong
         """
 
+        rc, result, m = self._run(cmd, allowed_exit, timeout, mention_outputfile_on_errors)
+        output = result.text()
+        result.discard()
+
+        return rc, output, m
+
+    async def cmd_async(self, cmd, allowed_exit=None, timeout=None):
+        """Coroutine version of cmd1, the command is run by the shared ProcessEngine without blocking the caller's event loop
+        Args:
+            cmd (str): command to be executed in a shell
+            allowed_exit (list): list of numerical rc which are deemed to be a success when checking the function output. Def [0]
+            timeout (int): length of time (sec) that a command is expected to have finished by
+        """
+        logger.debug('Running shell command: %s' % cmd)
+        result = await getProcessEngine().run_async(['/bin/sh', '-c', cmd], shell=False, env=self.env, cwd=self._cwd(), timeout=timeout)
+        rc, m = self._check(cmd, result, allowed_exit, timeout, False, None)
+        output = result.text()
+        result.discard()
+
+        return rc, output, m
+
+    @staticmethod
+    def _cwd():
+        """The directory to run the commands in, the temporary directory if the current one has gone"""
+        this_cwd = os.path.abspath(os.getcwd())
+        if not os.path.exists(this_cwd):
+            this_cwd = os.path.abspath(tempfile.gettempdir())
+        logger.debug("Using CWD: %s" % this_cwd)
+        return this_cwd
+
+    def _run(self, cmd, allowed_exit, timeout, mention_outputfile_on_errors, soutfile=None):
+        """Run cmd with the shared ProcessEngine, the output is kept in memory unless it is large when it goes to soutfile
+        Args:
+            cmd (str): command to be executed in a shell
+            allowed_exit (list): list of numerical rc which are deemed to be a success
+            timeout (int): length of time (sec) that a command is expected to have finished by
+            mention_outputfile_on_errors (bool): Should we print warning pointing to output when something when something goes wrong
+            soutfile (str): the file the output will be stored in, if any
+        """
+        logger.debug('Running shell command: %s' % cmd)
+        try:
+            result = getProcessEngine().run(['/bin/sh', '-c', cmd], shell=False, env=self.env, cwd=self._cwd(),
+                                            timeout=timeout, spill_file=soutfile)
+        except OSError as e:
+            logger.warning('Problem with shell command: %s, %s', e.errno, e.strerror)
+            result = CommandResult(255, False, b'', None, None)
+
+        rc, m = self._check(cmd, result, allowed_exit, timeout, mention_outputfile_on_errors, soutfile)
+        return rc, result, m
+
+    @staticmethod
+    def _check(cmd, result, allowed_exit, timeout, mention_outputfile_on_errors, soutfile):
+        """Report a command which timed out or failed, returns its rc and whether the command was found"""
         if allowed_exit is None:
             allowed_exit = [0]
 
-        rc, outfile, m = self.cmd(cmd, None, allowed_exit, capture_stderr, timeout, mention_outputfile_on_errors)
+        if result.timed_out:
+            logger.warning('Command interrupted - timeout %ss reached: %s', timeout, cmd)
 
-        from contextlib import closing
-        with closing(open(outfile)) as out_file:
-            output = out_file.read()
-        try:
-            os.remove(outfile)
-        except OSError as err:
-            if err.errno != errno.ENOENT:
-                logger.debug("Err removing shell output: %s" % str(err))
-                raise err
+        rc = result.returncode
+        BYTES = 4096
+        if rc not in allowed_exit:
+            logger.warning('exit status [%d] of command %s', rc, cmd)
+            if mention_outputfile_on_errors:
+                if soutfile:
+                    logger.warning('full output is in file: %s', soutfile)
+                logger.warning('<first %d bytes of output>\n%s', BYTES, result.head(BYTES))
+                logger.warning('<end of first %d bytes of output>', BYTES)
 
-        return rc, output, m
+        # FIXME /bin/sh might have also other error messages
+        m = None
+        if rc != 0:
+            m = re.search('command not found\n', result.text())
+            if m:
+                logger.warning('command %s not found', cmd)
+
+        return rc, m is None
 
     def system(self, cmd, allowed_exit=None, stderr_file=None):
         """Execute on OS command. Useful for interactive commands. Stdout and Stderr are not
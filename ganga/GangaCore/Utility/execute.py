@@ -1,11 +1,10 @@
 import os
 import base64
-import subprocess
 import threading
 import pickle as pickle
-import signal
 from copy import deepcopy
 from GangaCore.Core.exceptions import GangaException
+from GangaCore.Utility.ProcessEngine import getProcessEngine
 from GangaCore.Utility.logging import getLogger
 logger = getLogger()
 
@@ -97,12 +96,12 @@ with os.fdopen(###PKL_FDWRITE###, 'wb') as PICKLE_STREAM:
 def __reader(pipes, output_ns, output_var, require_output):
     """ This function un-pickles a pickle from a file and return it as an element in a dictionary
     Args:
-        pipes (tuple): This is a tuple containing the (read_pipe, write_pipe) from os.pipes containing the pickled object
+        pipes (tuple): This is a tuple containing the (read_pipe, write_pipe) from os.pipes containing the pickled object,
+                       the write_pipe is closed by execute once the command has been started
         output_ns (dict): This is the dictionary we should put the un-pickled object
         output_var (str): This is the key we should use to determine where to put the object in the output_ns
         require_output (bool): Should the reader give a warning if the pickle stream is not readable
     """
-    os.close(pipes[1])
     with os.fdopen(pipes[0], 'rb') as read_file:
         try:
             # rcurrie this deepcopy hides a strange bug that the wrong dict is sometimes returned from here. Remove at your own risk
@@ -114,37 +113,6 @@ def __reader(pipes, output_ns, output_var, require_output):
                 logger.error('Error getting output stream from command: %s', err)
 
 
-def __timeout_func(process, timed_out):
-    """ This function is used to kill functions which are timing out behind the scenes and taking longer than a
-    threshold time to execute.
-    Args:
-        process (class): This is a subprocess class which knows of the pid of wrapping thread around the command we want to kill
-        timed_out (Event): A threading event to be set when the command has timed out
-    """
-        
-    if process.returncode is None:
-        timed_out.set()
-        try:
-            os.killpg(process.pid, signal.SIGKILL)
-        except Exception as e:
-            logger.error("Exception trying to kill process: %s" % e)
-
-
-def start_timer(p, timeout):
-    """ Function to construct and return the timer thread and timed_out
-    Args:
-        p (object): This is the subprocess object which will be used to run the command of interest
-        timeout (int): This is the timeout in seconds after which the command will be killed
-    """
-    # Start the background thread to catch timeout events
-    timed_out = threading.Event()
-    timer = threading.Timer(timeout, __timeout_func, args=(p, timed_out))
-    timer.daemon = True
-    if timeout is not None:
-        timer.start()
-    return timer, timed_out
-
-
 def update_thread(pipes, thread_output, output_key, require_output):
     """ Function to construct and return background thread used to read a pickled object into the thread_output for updating
         the environment after executing a users code
@@ -205,17 +173,9 @@ def execute(command,
     if env is None:
         env = os.environ
 
-    # Construct the object which will contain the environment we want to run the command in
-    p = subprocess.Popen(stream_command, shell=True, env=env, cwd=cwd, preexec_fn=os.setsid,
-                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                         universal_newlines=True, close_fds=False)
-
     # This is where we store the output
     thread_output = {}
 
-    # Start the timer thread used to kill commands which have likely stalled
-    timer, timed_out = start_timer(p, timeout)
-
     if update_env:
         env_output_key = 'env_output'
         update_env_thread = update_thread(env_file_pipes, thread_output, env_output_key, require_output=True)
@@ -223,25 +183,32 @@ def execute(command,
         pkl_output_key = 'pkl_output'
         update_pkl_thread = update_thread(pkl_file_pipes, thread_output, pkl_output_key, require_output=False)
 
-    # Execute the main command of interest
+    # Execute the main command of interest with the shared process engine, which kills the whole process group of
+    # commands which have likely stalled. The pipes are inherited by the command so the fds mustn't be closed.
     logger.debug("Executing Command:\n'%s'" % str(command))
-    stdout, stderr = p.communicate(command)
-
-    # Close the timeout watching thread
+    try:
+        result = getProcessEngine().run(stream_command, shell=True, env=env, cwd=cwd, input=command, timeout=timeout,
+                                        kill_grace=0, merge_stderr=False, close_fds=False)
+    finally:
+        # The command has its own copies of the write ends, the readers see the end of the pipes once it has finished
+        for pipes in (env_file_pipes if update_env else None, pkl_file_pipes if not shell else None):
+            if pipes is not None:
+                os.close(pipes[1])
+
+    raw_stdout = result.output()
+    result.discard()
+    stdout = raw_stdout.decode('utf-8', 'replace')
+    stderr = result.stderr.decode('utf-8', 'replace')
     logger.debug("stdout: %s" % stdout)
     logger.debug("stderr: %s" % stderr)
 
-    timer.cancel()
-    if timeout is not None:
-        timer.join()
-
     # Finish up and decide what to return
     if stderr != '':
         # this is still debug as using the environment from dirac default_env maked a stderr message dump out
         # even though it works
         logger.debug(stderr)
 
-    if timed_out.isSet():
+    if result.timed_out:
         return 'Command timed out!'
 
     # Decode any pickled objects from disk
@@ -264,14 +231,17 @@ def execute(command,
     stdout_temp = None
     try:
         # If output
-        if stdout:
-            if isinstance(stdout, bytes):
-                stdout_temp = pickle.loads(stdout)
-            else:
+        if raw_stdout:
+            try:
+                stdout_temp = pickle.loads(raw_stdout)
+            except UnicodeDecodeError:
+                stdout_temp = bytes2string(pickle.loads(raw_stdout, encoding="bytes"))
+            except pickle.UnpicklingError:
+                # A pickle printed as text by the command
                 try:
-                    stdout_temp = pickle.loads(stdout.encode("utf-8"))
-                except pickle.UnpicklingError:
                     stdout_temp = pickle.loads(stdout.encode("latin1"))
+                except UnicodeEncodeError:
+                    raise pickle.UnpicklingError("stdout is not a pickle")
     # Downsides to wanting to be explicit in how this failed is you need to know all the ways it can!
     except (pickle.UnpicklingError, EOFError, ValueError) as err:
         if not shell:
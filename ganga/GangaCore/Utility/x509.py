@@ -0,0 +1,338 @@
+##########################################################################
+# Ganga Project. http://cern.ch/ganga
+#
+# Reading of X.509 proxy files and the VOMS attributes in them without
+# calling voms-proxy-info. Only what Ganga needs is decoded and nothing is
+# verified, the grid middleware does that when the proxy is used.
+##########################################################################
+import base64
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+from GangaCore.Utility.logging import getLogger
+
+logger = getLogger()
+
+# DER tags
+_OCTET_STRING = 0x04
+_OID = 0x06
+_UTC_TIME = 0x17
+_GENERALIZED_TIME = 0x18
+_SEQUENCE = 0x30
+_SET = 0x31
+_EXPLICIT_3 = 0xa3
+
+# Proxy certificate information extension, RFC 3820 and the pre-RFC one
+_PROXY_CERT_INFO_OIDS = ('1.3.6.1.5.5.7.1.14', '1.3.6.1.4.1.3536.1.222')
+# The VOMS attribute certificates extension and the FQAN attribute in it
+_VOMS_AC_OID = '1.3.6.1.4.1.8005.100.100.5'
+_VOMS_FQAN_OID = '1.3.6.1.4.1.8005.100.100.4'
+
+# How openssl names the attributes of a distinguished name
+_DN_NAMES = {'2.5.4.3': 'CN',
+             '2.5.4.5': 'serialNumber',
+             '2.5.4.6': 'C',
+             '2.5.4.7': 'L',
+             '2.5.4.8': 'ST',
+             '2.5.4.10': 'O',
+             '2.5.4.11': 'OU',
+             '0.9.2342.19200300.100.1.1': 'UID',
+             '0.9.2342.19200300.100.1.25': 'DC',
+             '1.2.840.113549.1.9.1': 'emailAddress'}
+
+_string_codecs = {0x0c: 'utf-8', 0x13: 'ascii', 0x14: 'latin-1', 0x16: 'ascii', 0x1c: 'utf-32-be', 0x1e: 'utf-16-be'}
+
+_pem_certificate = re.compile(r'-----BEGIN CERTIFICATE-----(.*?)-----END CERTIFICATE-----', re.S)
+
+
+class ProxyError(ValueError):
+    """The file isn't a proxy this module can read"""
+    pass
+
+
+def _read(data, pos):
+    """
+    Read the DER element starting at pos
+    Args:
+        data (bytes): The DER encoded data
+        pos (int): Where the element starts
+    Returns a tuple of the tag, the start and end of the content and the start of the next element
+    """
+    try:
+        tag = data[pos]
+        length = data[pos + 1]
+        pos += 2
+        if length & 0x80:
+            n_bytes = length & 0x7f
+            length = int.from_bytes(data[pos:pos + n_bytes], 'big')
+            pos += n_bytes
+    except IndexError:
+        raise ProxyError("Truncated DER data")
+    if pos + length > len(data):
+        raise ProxyError("Truncated DER data")
+    return tag, pos, pos + length, pos + length
+
+
+def _children(data, start, end):
+    """Returns the (tag, start, end) of the elements between start and end"""
+    children = []
+    while start < end:
+        tag, c_start, c_end, start = _read(data, start)
+        children.append((tag, c_start, c_end))
+    return children
+
+
+def _oid(content):
+    """Decode the content of an OBJECT IDENTIFIER"""
+    values = []
+    value = 0
+    for byte in content:
+        value = (value << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            values.append(value)
+            value = 0
+    if not values:
+        raise ProxyError("Empty OID")
+    first = min(values[0] // 40, 2)
+    return '.'.join(str(v) for v in [first, values[0] - 40 * first] + values[1:])
+
+
+def _time(tag, content):
+    """Decode a UTCTime or GeneralizedTime to a naive UTC datetime"""
+    text = content.decode('ascii').rstrip('Z')
+    if tag == _UTC_TIME:
+        year = int(text[:2])
+        text = ('19' if year >= 50 else '20') + text
+    return datetime.strptime(text[:14], '%Y%m%d%H%M%S')
+
+
+def _string(tag, content):
+    return content.decode(_string_codecs.get(tag, 'latin-1'), 'replace')
+
+
+def _dn(data, start, end):
+    """Decode a Name into the /K=V/K=V form of openssl"""
+    parts = []
+    for _, rdn_start, rdn_end in _children(data, start, end):
+        for _, atv_start, atv_end in _children(data, rdn_start, rdn_end):
+            (_, oid_start, oid_end), (value_tag, value_start, value_end) = _children(data, atv_start, atv_end)[:2]
+            oid = _oid(data[oid_start:oid_end])
+            parts.append('%s=%s' % (_DN_NAMES.get(oid, oid), _string(value_tag, data[value_start:value_end])))
+    return '/' + '/'.join(parts)
+
+
+def _find_attribute_values(data, start, end, oid):
+    """
+    Look through the DER tree for Attribute sequences with the given OID
+    Returns the (tag, start, end) of the SET of values of each of them
+    """
+    found = []
+    for tag, c_start, c_end in _children(data, start, end):
+        if not tag & 0x20:
+            continue
+        grandchildren = _children(data, c_start, c_end)
+        if tag == _SEQUENCE and len(grandchildren) == 2 and grandchildren[0][0] == _OID and \
+                grandchildren[1][0] == _SET and _oid(data[grandchildren[0][1]:grandchildren[0][2]]) == oid:
+            found.append(grandchildren[1])
+        else:
+            found.extend(_find_attribute_values(data, c_start, c_end, oid))
+    return found
+
+
+def _find_validity(data, start, end):
+    """Returns the (notBefore, notAfter) of the first sequence of two GeneralizedTimes in the DER tree, or None"""
+    for tag, c_start, c_end in _children(data, start, end):
+        if not tag & 0x20:
+            continue
+        grandchildren = _children(data, c_start, c_end)
+        if tag == _SEQUENCE and [child[0] for child in grandchildren] == [_GENERALIZED_TIME, _GENERALIZED_TIME]:
+            return tuple(_time(t, data[s:e]) for t, s, e in grandchildren)
+        validity = _find_validity(data, c_start, c_end)
+        if validity is not None:
+            return validity
+    return None
+
+
+class Certificate(object):
+
+    """The parts of an X.509 certificate needed to describe a proxy"""
+
+    __slots__ = ('subject', 'issuer', 'not_before', 'not_after', 'is_proxy', 'fqans', 'ac_not_after')
+
+    def __init__(self, der):
+        """
+        Args:
+            der (bytes): The DER encoded certificate
+        """
+        tag, start, end, _ = _read(der, 0)
+        if tag != _SEQUENCE:
+            raise ProxyError("Not a certificate")
+        tbs_tag, tbs_start, tbs_end = _children(der, start, end)[0]
+        fields = _children(der, tbs_start, tbs_end)
+        # Skip the explicit version
+        if fields and fields[0][0] == 0xa0:
+            fields = fields[1:]
+        if len(fields) < 6:
+            raise ProxyError("Not a certificate")
+
+        self.issuer = _dn(der, fields[2][1], fields[2][2])
+        self.not_before, self.not_after = [_time(t, der[s:e]) for t, s, e in _children(der, fields[3][1], fields[3][2])][:2]
+        self.subject = _dn(der, fields[4][1], fields[4][2])
+
+        self.is_proxy = False
+        self.fqans = []
+        self.ac_not_after = None
+        for tag, s, e in fields[6:]:
+            if tag == _EXPLICIT_3:
+                self._read_extensions(der, *_children(der, s, e)[0][1:])
+
+        if not self.is_proxy and re.search('/CN=(limited )?proxy$', self.subject):
+            # Legacy globus proxies are only recognisable by their name
+            self.is_proxy = True
+
+    def _read_extensions(self, der, start, end):
+        for _, ext_start, ext_end in _children(der, start, end):
+            parts = _children(der, ext_start, ext_end)
+            oid = _oid(der[parts[0][1]:parts[0][2]])
+            value = [part for part in parts[1:] if part[0] == _OCTET_STRING][0]
+            if oid in _PROXY_CERT_INFO_OIDS:
+                self.is_proxy = True
+            elif oid == _VOMS_AC_OID:
+                self._read_voms(der, value[1], value[2])
+
+    def _read_voms(self, der, start, end):
+        """Pick the FQANs and the validity of the first attribute certificate"""
+        for _, values_start, values_end in _find_attribute_values(der, start, end, _VOMS_FQAN_OID):
+            for ietf_tag, ietf_start, ietf_end in _children(der, values_start, values_end):
+                # IetfAttrSyntax, the values are the last sequence after the optional policy authority
+                for tag, s, e in _children(der, ietf_start, ietf_end):
+                    if tag == _SEQUENCE:
+                        self.fqans.extend(_string(t, der[vs:ve]) for t, vs, ve in _children(der, s, e))
+        validity = _find_validity(der, start, end)
+        if validity is not None:
+            self.ac_not_after = validity[1]
+
+
+class ProxyInfo(object):
+
+    """What voms-proxy-info would tell about a proxy file"""
+
+    __slots__ = ('path', 'certificates', 'subject', 'issuer', 'identity', 'not_after', 'fqans', 'ac_not_after')
+
+    def __init__(self, path, certificates):
+        """
+        Args:
+            path (str): The file the proxy was read from
+            certificates (list): The Certificates in the file, the proxy first
+        """
+        if not certificates:
+            raise ProxyError("No certificate found in %s" % path)
+        self.path = path
+        self.certificates = certificates
+        proxy = certificates[0]
+        self.subject = proxy.subject
+        self.issuer = proxy.issuer
+        self.not_after = min(cert.not_after for cert in certificates)
+        end_entity = [cert for cert in certificates if not cert.is_proxy]
+        self.identity = end_entity[0].subject if end_entity else certificates[-1].issuer
+        voms = [cert for cert in certificates if cert.fqans]
+        self.fqans = voms[0].fqans if voms else []
+        self.ac_not_after = voms[0].ac_not_after if voms else None
+
+    @property
+    def vo(self):
+        """The VO of the primary FQAN, None without VOMS extension"""
+        if not self.fqans:
+            return None
+        return self.fqans[0].strip('/').split('/')[0]
+
+    @property
+    def group(self):
+        """The group (and subgroups) of the primary FQAN below the VO, e.g. 'group/subgroup'"""
+        if not self.fqans:
+            return None
+        groups = [part for part in self.fqans[0].strip('/').split('/')[1:] if '=' not in part]
+        return '/'.join(groups) or None
+
+    @property
+    def role(self):
+        """The role of the primary FQAN if there is one"""
+        if not self.fqans:
+            return None
+        for part in self.fqans[0].strip('/').split('/'):
+            if part.startswith('Role='):
+                role = part[len('Role='):]
+                return role if role != 'NULL' else None
+        return None
+
+    def time_left(self):
+        """The timedelta until the proxy expires"""
+        return max(self.not_after - datetime.utcnow(), timedelta())
+
+    def text(self):
+        """A description of the proxy in the style of voms-proxy-info -all"""
+        def hms(delta):
+            seconds = int(delta.total_seconds())
+            return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+        lines = ['subject   : %s' % self.subject,
+                 'issuer    : %s' % self.issuer,
+                 'identity  : %s' % self.identity,
+                 'path      : %s' % self.path,
+                 'timeleft  : %s' % hms(self.time_left())]
+        if self.fqans:
+            lines.append('=== VO %s extension information ===' % self.vo)
+            lines.append('VO        : %s' % self.vo)
+            lines.extend('attribute : %s' % fqan for fqan in self.fqans)
+            if self.ac_not_after is not None:
+                lines.append('timeleft  : %s' % hms(max(self.ac_not_after - datetime.utcnow(), timedelta())))
+        return '\n'.join(lines) + '\n'
+
+
+def parse_proxy(pem, path=''):
+    """
+    Read the certificates of a PEM encoded proxy
+    Args:
+        pem (str): The content of the proxy file
+        path (str): Where it came from
+    """
+    certificates = []
+    for block in _pem_certificate.findall(pem):
+        try:
+            der = base64.b64decode(''.join(block.split()))
+        except (ValueError, TypeError) as err:
+            raise ProxyError("Bad PEM data in %s: %s" % (path, err))
+        certificates.append(Certificate(der))
+    return ProxyInfo(path, certificates)
+
+
+# path -> (stat key, ProxyInfo)
+_proxy_cache = {}
+_proxy_cache_lock = threading.Lock()
+
+
+def read_proxy(path):
+    """
+    Returns the ProxyInfo of a proxy file, it's only read again once the file has been replaced or modified
+    Raises OSError if the file can't be read and ProxyError if it can't be parsed
+    Args:
+        path (str): The proxy file
+    """
+    stat = os.stat(path)
+    key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _proxy_cache_lock:
+        cached = _proxy_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(path, 'r') as proxy_file:
+        pem = proxy_file.read()
+    try:
+        info = parse_proxy(pem, path)
+    except (IndexError, ValueError, UnicodeDecodeError) as err:
+        raise ProxyError("Could not read the proxy %s: %s" % (path, err))
+    with _proxy_cache_lock:
+        _proxy_cache[path] = (key, info)
+    return info
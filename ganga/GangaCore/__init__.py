@@ -149,6 +149,8 @@ conf_config.addOption('confirm_exit', True, 'Ask the user on exit if we should e
 conf_config.addOption('force_start', False, 'Ignore disk checking on startup')
 
 conf_config.addOption('DiskIOTimeout', 45, 'Time in seconds before a ganga session (lock file) is treated as a zombie and removed')
+conf_config.addOption('SessionLockRefresh', 10, 'Time in seconds between the updates of the session files of this session, keep it well below DiskIOTimeout')
+conf_config.addOption('SessionLockCleanup', 60, 'Time in seconds between the checks for the session files of dead sessions')
 
 # runtime warnings issued by the interpreter may be suppresed
 conf_config.addOption('IgnoreRuntimeWarnings', False, "runtime warnings issued by the interpreter may be suppresed")
@@ -163,7 +165,9 @@ ipython_config.addOption('colourscheme','LightBG', 'Colour scheme to be used by
 
 # ------------------------------------------------
 # Shell
-makeConfig("Shell", "configuration parameters for internal Shell utility.")
+shell_config = makeConfig("Shell", "configuration parameters for internal Shell utility.")
+shell_config.addOption('MaxConcurrentCommands', 20, 'maximum number of shell commands run at the same time by Ganga, the others wait for their turn')
+shell_config.addOption('OutputSpillSize', 16 * 1024 * 1024, 'size in bytes above which the output of a shell command is written to a file rather than kept in memory')
 
 # ------------------------------------------------
 # Queues
@@ -279,6 +283,7 @@ root_config.addOption('version', '6.04.02', 'Version of ROOT')
 local_config = makeConfig('Local', 'parameters of the local backend (jobs in the background on localhost)')
 local_config.addOption('remove_workdir', True, 'remove automatically the local working directory when the job completed')
 local_config.addOption('location', None, 'The location where the workdir will be created. If None it defaults to the value of $TMPDIR')
+local_config.addOption('slots', 0, 'The number of local jobs run at the same time, the others wait for a free slot. 0 for the number of CPUs of the machine')
 
 # ------------------------------------------------
 # LCG
@@ -422,6 +427,8 @@ condor_config = makeConfig('Condor', 'Settings for Condor Batch system')
 
 condor_config.addOption('query_global_queues', True,
                  "Query global condor queues, i.e. use '-global' flag")
+condor_config.addOption('query_history', True,
+                 "Look up the jobs which have left the queue without their event log saying how they ended with condor_history")
 
 # ------------------------------------------------
 # LSF
@@ -462,6 +469,11 @@ def filefilter(fn):
 lsf_config.addOption('postexecute', tempstr, "String contains commands executing before submiting job to queue")
 lsf_config.addOption('jobnameopt', 'J', "String contains option name for name of job in batch system")
 lsf_config.addOption('timeout', 600, 'Timeout in seconds after which a job is declared killed if it has not touched its heartbeat file. Heartbeat is touched every 30s so do not set this below 120 or so.')
+lsf_config.addOption('bulk_status', False, 'Find the state of the jobs with one status_str query per monitoring cycle, the status files are only read for jobs which are no longer known as pending or running')
+lsf_config.addOption('status_str', 'bjobs -a -noheader %s', "String used to query the state of the jobs, %s (if given) is replaced by their space separated ids")
+lsf_config.addOption('status_res_pattern', r'^(?P<id>\d+)\s+\S+\s+(?P<status>\S+)', "String pattern matching a line of the status_str output with the job id and state")
+lsf_config.addOption('status_running_pattern', 'RUN', "String pattern of the states of running jobs")
+lsf_config.addOption('status_pending_pattern', 'PEND|PSUSP|USUSP|SSUSP|WAIT|PROV', "String pattern of the states of jobs waiting to run")
 
 # ------------------------------------------------
 # PBS
@@ -505,6 +517,11 @@ pbs_config.addOption('postexecute', tempstr,
 pbs_config.addOption('jobnameopt', 'N', "String contains option name for name of job in batch system")
 pbs_config.addOption('timeout', 600,
                  'Timeout in seconds after which a job is declared killed if it has not touched its heartbeat file. Heartbeat is touched every 30s so do not set this below 120 or so.')
+pbs_config.addOption('bulk_status', False, 'Find the state of the jobs with one status_str query per monitoring cycle, the status files are only read for jobs which are no longer known as pending or running')
+pbs_config.addOption('status_str', 'qstat %s', "String used to query the state of the jobs, %s (if given) is replaced by their space separated ids")
+pbs_config.addOption('status_res_pattern', r'^(?P<id>\d+)\.\S*\s+\S+\s+\S+\s+\S+\s+(?P<status>\S)\s', "String pattern matching a line of the status_str output with the job id and state")
+pbs_config.addOption('status_running_pattern', 'R|E', "String pattern of the states of running jobs")
+pbs_config.addOption('status_pending_pattern', 'Q|H|W|T|S', "String pattern of the states of jobs waiting to run")
 
 # ------------------------------------------------
 # SGE
@@ -547,6 +564,11 @@ sge_config.addOption('preexecute', 'os.chdir(os.environ["TMPDIR"])\nos.environ["
 sge_config.addOption('postexecute', '', "String contains commands executing before submiting job to queue")
 sge_config.addOption('jobnameopt', 'N', "String contains option name for name of job in batch system")
 sge_config.addOption('timeout', 600, 'Timeout in seconds after which a job is declared killed if it has not touched its heartbeat file. Heartbeat is touched every 30s so do not set this below 120 or so.')
+sge_config.addOption('bulk_status', False, 'Find the state of the jobs with one status_str query per monitoring cycle, the status files are only read for jobs which are no longer known as pending or running')
+sge_config.addOption('status_str', 'qstat', "String used to query the state of the jobs, %s (if given) is replaced by their space separated ids")
+sge_config.addOption('status_res_pattern', r'^\s*(?P<id>\d+)\s+\S+\s+\S+\s+\S+\s+(?P<status>\S+)', "String pattern matching a line of the status_str output with the job id and state")
+sge_config.addOption('status_running_pattern', 'r|t|Rr|Rt', "String pattern of the states of running jobs")
+sge_config.addOption('status_pending_pattern', 'qw|hqw|hRwq|s|S|T', "String pattern of the states of jobs waiting to run")
 
 # ------------------------------------------------
 # Slurm
@@ -617,6 +639,11 @@ slurm_config.addOption('postexecute', tempstr,
 slurm_config.addOption('jobnameopt', 'J', "String contains option name for name of job in batch system")
 slurm_config.addOption('timeout', 600,
                        'Timeout in seconds after which a job is declared killed if it has not touched its heartbeat file. Heartbeat is touched every 30s so do not set this below 120 or so.')
+slurm_config.addOption('bulk_status', False, 'Find the state of the jobs with one status_str query per monitoring cycle, the status files are only read for jobs which are no longer known as pending or running')
+slurm_config.addOption('status_str', "squeue -h -o '%i %t' -u $USER", "String used to query the state of the jobs, %s (if given) is replaced by their space separated ids")
+slurm_config.addOption('status_res_pattern', r'^\s*(?P<id>\d+)\s+(?P<status>\S+)', "String pattern matching a line of the status_str output with the job id and state")
+slurm_config.addOption('status_running_pattern', 'R|CG', "String pattern of the states of running jobs")
+slurm_config.addOption('status_pending_pattern', 'PD|S|CF|RQ|RS|RF', "String pattern of the states of jobs waiting to run")
 
 # ------------------------------------------------
 # Mergers
@@ -627,6 +654,7 @@ gangadir = getConfig('Configuration')['gangadir']
 merge_config.addOption('merge_output_dir', gangadir +
                  '/merge_results', "location of the merger's outputdir")
 merge_config.addOption('std_merge', 'TextMerger', 'Standard (default) merger')
+merge_config.addOption('text_merge_threads', 4, 'Number of threads decompressing (or compressing) the files merged by the TextMerger')
 
 # ------------------------------------------------
 # Preparable
@@ -956,6 +984,10 @@ reg_config = makeConfig('Registry','This config controls the speed of flushing o
 reg_config.addOption('AutoFlusherWaitTime', 30, 'Time to wait between auto-flusher runs')
 reg_config.addOption('EnableAutoFlush', True, 'Enable Registry auto-flushing feature')
 reg_config.addOption('DisableLoadCheck', True, 'Disable the checking of recent bad jobs in bad state. Mainly used in testing.')
+reg_config.addOption('IndexSegment', True, 'Keep the index of all objects of a registry in one memory-mapped file instead of one .index file per object')
+reg_config.addOption('IndexSegmentLegacyFiles', False, 'Keep the per-object .index files up to date next to the index segment, for sessions of older Ganga versions or with IndexSegment off. When False an .index file is removed once it has been copied into the segment')
+reg_config.addOption('SubjobFlushThreads', 8, 'Maximum number of threads used to write the XML of the subjobs of a job in parallel. 1 writes them one after the other')
+reg_config.addOption('SQLiteConnections', 4, 'Maximum number of connections to the database a SQLite repository keeps open')
 
 cred_config = makeConfig('Credentials', 'This configures the credentials singleton')
 cred_config.addOption('CleanDelay', 1, 'Seconds between auto-clean of credentials when proxy externally destroyed')
@@ -61,3 +61,13 @@ class TestFileChecker(GangaUnitTest):
         self.c.check(self.jobslice[0])
         self.c.check(self.jobslice[1])
         self.c.check(self.jobslice[2])
+
+    def testFileChecker_checkJobs(self):
+
+        self.c.files = ['stdout']
+        self.c.searchStrings = ['1']
+        self.c.failIfFound = False
+        self.assertEqual(self.c.checkJobs(self.jobslice), [True, False, True])
+
+        self.c.failIfFound = True
+        self.assertEqual(self.c.checkJobs(self.jobslice), [False, True, False])
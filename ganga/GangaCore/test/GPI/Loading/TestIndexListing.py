@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import pytest
+
+from GangaCore.GPIDev.Base.Proxy import stripProxy
+
+from GangaCore.testlib.decorators import add_config
+
+
+@add_config([('TestingFramework', 'AutoCleanup', 'False')])
+@pytest.mark.usefixtures('gpi')
+class TestIndexListing(object):
+
+    def test_a_CreateJobs(self):
+        """Create jobs, copy one of them as if it had been written without the index segment and break another"""
+        from GangaCore.GPI import Job
+        from GangaCore.Core.GangaRepository import getRegistry
+
+        for _ in range(3):
+            Job()
+        repo = getRegistry('jobs').repository
+        getRegistry('jobs').flush_all()
+
+        shutil.copytree(os.path.dirname(repo.get_fn(1)), os.path.dirname(repo.get_fn(5)))
+        with open(repo.get_fn(2), 'w') as f:
+            f.write('<?xml version="1.0" ?>\n<root>')
+        if os.path.exists(repo.get_fn(2) + '~'):
+            os.remove(repo.get_fn(2) + '~')
+
+    def test_b_Listing(self):
+        """Objects without an index entry are listed, an object which fails to load stays listed"""
+        from GangaCore.GPI import jobs
+        from GangaCore.Core.GangaRepository import getRegistry
+
+        registry = getRegistry('jobs')
+        assert sorted(registry.ids()) == [0, 1, 2, 5]
+
+        try:
+            stripProxy(jobs(2)).printSummaryTree()
+        except Exception:
+            pass
+        assert 2 in registry.repository.incomplete_objects
+
+        assert 2 not in registry.repository.update_index()
+        assert 2 in registry.repository.get_index_listing()
+        assert 2 in registry.repository.incomplete_objects
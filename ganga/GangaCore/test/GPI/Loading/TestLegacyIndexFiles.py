@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from GangaCore.testlib.decorators import add_config
+
+
+@add_config([('TestingFramework', 'AutoCleanup', 'False')])
+@pytest.mark.usefixtures('gpi')
+class TestLegacyIndexFiles(object):
+
+    def test_a_LegacyIndexRetired(self):
+        """An index file written without the segment is read into the segment and then removed"""
+        from GangaCore.GPI import Job
+        from GangaCore.Core.GangaRepository import getRegistry
+        from GangaCore.Core.GangaRepository.PickleStreamer import to_file
+
+        Job()
+        getRegistry('jobs').flush_all()
+        repo = getRegistry('jobs').repository
+        assert not os.path.exists(repo.get_idxfn(0))
+
+        cat, cls, cache = repo._index_segment.read(0)
+        cache['name'] = 'legacy'
+        with open(repo.get_idxfn(0), 'wb') as f:
+            to_file((cat, cls, cache), f)
+
+        repo.get_index_listing()
+        assert 0 in repo._legacy_index_ids
+        repo.index_load(0)
+        assert repo._index_segment.read(0)[2]['name'] == 'legacy'
+        assert not os.path.exists(repo.get_idxfn(0))
+        assert 0 not in repo._legacy_index_ids
+
+        getRegistry('jobs').flush_all()
+        assert not os.path.exists(repo.get_idxfn(0))
+
+
+@add_config([('TestingFramework', 'AutoCleanup', 'False'), ('Registry', 'IndexSegmentLegacyFiles', True)])
+@pytest.mark.usefixtures('gpi')
+class TestLegacyIndexFilesKept(object):
+
+    def test_a_LegacyIndexKept(self):
+        """With [Registry]IndexSegmentLegacyFiles an existing index file is kept up to date next to the segment"""
+        from GangaCore.GPI import Job
+        from GangaCore.Core.GangaRepository import getRegistry
+        from GangaCore.Core.GangaRepository.PickleStreamer import from_file, to_file
+
+        j = Job()
+        getRegistry('jobs').flush_all()
+        repo = getRegistry('jobs').repository
+        with open(repo.get_idxfn(j.id), 'wb') as f:
+            to_file(repo._index_segment.read(j.id), f)
+
+        repo.get_index_listing()
+        repo.index_load(j.id)
+        j.name = 'kept'
+        getRegistry('jobs').flush_all()
+        with open(repo.get_idxfn(j.id), 'rb') as f:
+            assert from_file(f)[0][2]['name'] == 'kept'
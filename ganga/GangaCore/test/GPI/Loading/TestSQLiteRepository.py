@@ -0,0 +1,71 @@
+import pytest
+
+from GangaCore.GPIDev.Base.Proxy import stripProxy
+
+from GangaCore.testlib.decorators import add_config
+
+
+@add_config([('TestingFramework', 'AutoCleanup', 'False'),
+             ('Configuration', 'repositorytype', 'SQLite'),
+             ('Configuration', 'lockingStrategy', 'FIXED')])
+@pytest.mark.usefixtures('gpi')
+class TestSQLiteRepository(object):
+
+    def test_a_JobConstruction(self):
+        """ First construct some jobs, one of them with subjobs"""
+
+        from GangaCore.GPI import Job, ArgSplitter, jobs
+
+        for i in range(4):
+            Job(name='job%s' % i)
+        j = Job(name='split', splitter=ArgSplitter(args=[[1], [2], [3]]))
+        j.submit()
+
+        assert len(jobs) == 5
+        assert len(j.subjobs) == 3
+
+    def test_b_SelectNotLoaded(self):
+        """ Second check that selecting on indexed columns doesn't load the jobs"""
+
+        from GangaCore.GPI import jobs, Local
+
+        assert jobs.select(name='job[12]').ids() == [1, 2]
+        assert jobs.select(status='new', backend=Local()).ids() == [0, 1, 2, 3]
+
+        for i in range(4):
+            raw_j = stripProxy(jobs(i))
+            assert not raw_j._getRegistry().has_loaded(raw_j)
+
+    def test_c_SubjobsLoaded(self):
+        """ Third check that the subjobs are read back from their table, each of them only when it's accessed"""
+
+        from GangaCore.GPI import jobs
+
+        j = jobs(4)
+        raw_subjobs = stripProxy(j).subjobs
+        assert len(j.subjobs) == 3
+        assert len(raw_subjobs.getAllSJStatus()) == 3
+        assert not any(raw_subjobs.isLoaded(i) for i in range(3))
+
+        assert j.subjobs(1).id == 1
+        assert [raw_subjobs.isLoaded(i) for i in range(3)] == [False, True, False]
+
+        for sj in j.subjobs:
+            assert sj.master.id == 4
+
+    def test_d_SubjobChanged(self):
+        """ Fourth change a single subjob, only that one is written back"""
+
+        from GangaCore.GPI import jobs
+
+        stripProxy(jobs(4).subjobs(2)).updateStatus('failed')
+
+    def test_e_SubjobChangeKept(self):
+        """ Fifth check the change was kept and the subjobs which weren't loaded are still there"""
+
+        from GangaCore.GPI import jobs
+
+        j = jobs(4)
+        assert len(j.subjobs) == 3
+        assert [sj.id for sj in j.subjobs] == [0, 1, 2]
+        assert j.subjobs(2).status == 'failed'
@@ -55,6 +55,11 @@ class TestSelect(GangaUnitTest):
         from GangaTest.Framework.utils import sleep_until_completed
         assert sleep_until_completed(j, 60)
 
+        # Nothing is left to monitor
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+        raw_j = stripProxy(j)
+        assert j.id not in raw_j._getRegistry().getActiveIds()
+
         mySlice = jobs(j.id).subjobs.select(status="completed")
 
         assert len(mySlice) == len(job_names)
@@ -64,3 +69,43 @@ class TestSelect(GangaUnitTest):
         assert len(mySlice2) == 1
         assert mySlice2[2].id == 2
 
+    def test_d_SelectNotLoaded(self):
+        """ Selecting on the indexed attributes shouldn't load the jobs"""
+        from GangaCore.GPI import jobs, Local, Executable
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+
+        mySlice = jobs.select(status='new', backend=Local, application=Executable)
+        assert mySlice.ids() == list(range(job_num))
+
+        mySlice2 = jobs.select(name='[bd]')
+        assert mySlice2.ids() == [1, 3]
+
+        assert jobs.select(status='n?w', name='[a-e]').ids() == list(range(job_num))
+
+        for i in range(job_num):
+            raw_j = stripProxy(jobs(i))
+            assert not raw_j._getRegistry().has_loaded(raw_j)
+
+    def test_e_ActiveSubjobsAfterReload(self):
+        """ The active subjobs of a reloaded job are taken from the subjob index"""
+        from GangaCore.GPI import jobs
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+        from GangaCore.Core.GangaRepository.SubJobXMLList import SubJobXMLList
+
+        raw_j = stripProxy(jobs(job_num))
+        assert isinstance(raw_j.subjobs, SubJobXMLList)
+        assert raw_j.subjobs.getActiveIds() == []
+        assert job_num not in raw_j._getRegistry().getActiveIds()
+
+    def test_f_SelectChanged(self):
+        """ Changes made to the jobs in this session are seen by select"""
+        from GangaCore.GPI import jobs, Job
+
+        j = Job()
+        assert jobs.select(name='renamed').ids() == []
+        j.name = 'renamed'
+        assert jobs.select(name='renamed').ids() == [j.id]
+
+        jobs(1).name = 'renamed'
+        assert jobs.select(name='renamed').ids() == [1, j.id]
+        assert jobs.select(name='[bd]').ids() == [3]
@@ -0,0 +1,78 @@
+from GangaCore.testlib.GangaUnitTest import GangaUnitTest
+
+
+class TestTransformChaining(GangaUnitTest):
+    """Tests of the creation and reset of the units chained to the units of another transform"""
+
+    def createTask(self, single_unit):
+        """create a task with a transform of 4 completed units and a transform chained to it"""
+        from GangaCore.GPI import CoreTask, CoreTransform, Executable, GenericSplitter, TaskChainInput, Job
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+
+        t = CoreTask()
+        parent = CoreTransform()
+        parent.application = Executable()
+        parent.unit_splitter = GenericSplitter()
+        parent.unit_splitter.attribute = "application.args"
+        parent.unit_splitter.values = ['arg %d' % i for i in range(4)]
+        t.appendTransform(parent)
+
+        child = CoreTransform()
+        child.application = Executable()
+        child.addInputData(TaskChainInput(input_trf_id=0, single_unit=single_unit))
+        t.appendTransform(child)
+
+        parent = stripProxy(t.transforms[0])
+        parent.createUnits()
+        j = Job()
+        for unit in parent.units:
+            unit.active_job_ids = [j.id]
+            unit.updateStatus("completed")
+
+        return stripProxy(t)
+
+    def test_a_per_unit(self):
+        """A unit is chained to each parent unit once, it is recreated when its parent is reset"""
+        t = self.createTask(False)
+        parent, child = t.transforms
+
+        child.createUnits()
+        assert [u.req_units for u in child.units] == [['0:%d' % i] for i in range(4)]
+        assert [u.getID() for u in child.getChainedUnits(0, 2)] == [2]
+        assert child.getChainedUnits(0) == []
+
+        # Nothing more is created for the units already chained
+        child.createUnits()
+        assert len(child.units) == 4
+
+        parent.resetUnit(2)
+        assert [u.status for u in child.units] == ['hold', 'hold', 'recreating', 'hold']
+        parent.units[2].active_job_ids = parent.units[2].prev_job_ids[-1:]
+        parent.units[2].updateStatus("completed")
+        recreated = child.units[2]
+        child.createUnits()
+        assert len(child.units) == 4
+        assert child.units[2] is not recreated
+        assert child.units[2].status == 'hold'
+        assert child.getChainedUnits(0, 2) == [child.units[2]]
+
+    def test_b_single_unit(self):
+        """A single unit is chained to all of the parent units"""
+        t = self.createTask(True)
+        parent, child = t.transforms
+
+        child.createUnits()
+        child.createUnits()
+        assert [u.req_units for u in child.units] == [['0:ALL']]
+        assert child.getChainedUnits(0) == [child.units[0]]
+
+        # The index is rebuilt when the units are changed behind its back
+        child.units[0].req_units = []
+        assert child.getChainedUnits(0) == []
+        child._chained_units = None
+        assert child._getChainedUnitsIndex() == {}
+
+        # Malformed requirements are left out of the index
+        child.units[0].req_units = ['0:ALL', '0', 'x:1', '0:1:2']
+        child._chained_units = None
+        assert child._getChainedUnitsIndex() == {(0, 'ALL'): {0}}
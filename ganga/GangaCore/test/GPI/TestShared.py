@@ -141,3 +141,29 @@ class TestShared(GangaUnitTest):
 
         assert not path.isdir(this_path)
 
+
+    def test_G_referrers(self):
+        """Test that the items referencing a shared area are tracked without looking at the jobs"""
+
+        from GangaCore.GPI import Job
+
+        shareRef = getRegistry('prep').getShareRef()
+
+        j = Job()
+        j.prepare()
+        this_ref = j.application.is_prepared.name
+
+        assert shareRef.referrers(this_ref) == [('jobs', j.id)]
+
+        j2 = j.copy()
+
+        assert shareRef.referrers(this_ref) == [('jobs', j.id), ('jobs', j2.id)]
+
+        j.unprepare()
+
+        assert shareRef.referrers(this_ref) == [('jobs', j2.id)]
+
+        j2.remove()
+
+        assert shareRef.referrers(this_ref) == []
+        assert this_ref not in shareRef.refs
@@ -0,0 +1,83 @@
+from GangaCore.testlib.GangaUnitTest import GangaUnitTest
+
+
+class TestSubjobSummary(GangaUnitTest):
+
+    def setUp(self):
+        """Make sure that the Job object isn't destroyed between tests"""
+        extra_opts = [('TestingFramework', 'AutoCleanup', 'False')]
+        super(TestSubjobSummary, self).setUp(extra_opts=extra_opts)
+
+    def test_a_transitions(self):
+        """The master status and timestamps follow the transitions of the subjobs"""
+        from GangaCore.GPI import Job, ArgSplitter, jobs
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+
+        j = Job()
+        j.splitter = ArgSplitter(args=[[str(i)] for i in range(10)])
+        j.submit()
+        # Don't let the monitoring interfere with the statuses set here
+        for sj in j.subjobs:
+            stripProxy(sj).backend.kill()
+
+        master = stripProxy(j)
+        for sj in master.subjobs:
+            if sj.status == 'submitted':
+                sj.updateStatus('running')
+        assert j.status == 'running'
+        assert master.time.timestamps['running'] == min(sj.time.timestamps['running'] for sj in master.subjobs)
+        assert master.returnSubjobStatuses() == '10/0/0/0'
+
+        for sj in master.subjobs[:9]:
+            sj.updateStatus('completed')
+        assert j.status == 'running'
+        assert master.returnSubjobStatuses() == '1/0/0/9'
+
+        master.subjobs[9].updateStatus('failed')
+        assert j.status == 'failed'
+        assert master.time.timestamps['final'] == max(sj.time.timestamps['final'] for sj in master.subjobs)
+        assert master.getSubJobStatuses() == {'completed', 'failed'}
+
+    def test_b_reload(self):
+        """After a reload the summary comes from the subjob index without loading the subjobs"""
+        from GangaCore.GPI import jobs
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+
+        master = stripProxy(jobs(0))
+        summary = master.getSubJobSummary()
+        assert dict(summary.counts) == {'completed': 9, 'failed': 1}
+        assert not any(master.subjobs.isLoaded(i) for i in range(10))
+        assert summary.timestamp('final') == master.time.timestamps['final']
+
+    def test_c_failed_resubmit(self):
+        """A resubmit which fails reverts the master to its old status in the index of active jobs too"""
+        from unittest import mock
+        from GangaCore.GPI import jobs
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+        from GangaCore.Core.exceptions import JobManagerError
+
+        master = stripProxy(jobs(0))
+        with mock.patch.object(type(master.backend), 'master_resubmit', side_effect=JobManagerError('no resubmit')):
+            self.assertRaises(JobManagerError, master.resubmit)
+        assert master.status == 'failed'
+        assert master._getRegistry()._index.value(master.id, 'status') == 'failed'
+        assert master.id not in master._getRegistry().getActiveIds()
+
+    def test_d_failed_resubmit_summary(self):
+        """The summary is counted again after a failed resubmit, subjob statuses may have been set directly"""
+        from unittest import mock
+        from GangaCore.GPI import jobs
+        from GangaCore.GPIDev.Base.Proxy import stripProxy
+        from GangaCore.Core.exceptions import JobManagerError
+
+        master = stripProxy(jobs(0))
+
+        def resubmit(rjobs, *args, **kwargs):
+            rjobs[0].updateStatus('submitting')
+            rjobs[0].status = 'submitted'
+            raise JobManagerError('no resubmit')
+
+        with mock.patch.object(type(master.backend), 'master_resubmit', side_effect=resubmit):
+            self.assertRaises(JobManagerError, master.resubmit)
+        assert master.status == 'failed'
+        assert dict(master.getSubJobSummary().counts) == {'completed': 9, 'submitted': 1}
@@ -7,8 +7,8 @@ import string
 class TestSubjobs(GangaUnitTest):
 
     def setUp(self):
-        """Make sure that the Job object isn't destroyed between tests"""
-        extra_opts = [ ('TestingFramework', 'AutoCleanup', 'False') ]
+        """Make sure that the Job object isn't destroyed between tests and that all the subjobs can run at once"""
+        extra_opts = [ ('TestingFramework', 'AutoCleanup', 'False'), ('Local', 'slots', 5) ]
         super(TestSubjobs, self).setUp(extra_opts=extra_opts)
 
     def testLargeJobSubmission(self):
@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+
+import pytest
+
+from GangaCore.Utility.Config import getConfig
+from GangaCore.Lib.Batch.Batch import Batch
+
+# This file tests the bulk status queries of the batch backends against fake_scheduler.py
+
+fake_scheduler = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_scheduler.py')
+
+
+@pytest.fixture
+def batch_states(tmpdir, monkeypatch):
+    """Returns a function setting the states known to the fake scheduler"""
+    states_file = str(tmpdir.join('states.json'))
+    monkeypatch.setenv('GANGA_FAKE_BATCH_STATES', states_file)
+
+    def set_states(states):
+        with open(states_file, 'w') as f:
+            json.dump(states, f)
+    set_states({})
+    return set_states
+
+
+@pytest.fixture
+def lsf_config():
+    """The LSF config in bulk mode with the fake scheduler"""
+    config = getConfig('LSF')
+    config.setUserValue('bulk_status', True)
+    config.setUserValue('status_str', '%s %s lsf %%s' % (sys.executable, fake_scheduler))
+    yield config
+    config.revertToSession('bulk_status')
+    config.revertToSession('status_str')
+
+
+@pytest.mark.parametrize('system', ['LSF', 'PBS', 'SGE', 'Slurm'])
+def test_query_states(system, batch_states):
+    """The output of each batch system is parsed into the job states"""
+    native = {'LSF': ('RUN', 'PEND', 'DONE'),
+              'PBS': ('R', 'Q', 'C'),
+              'SGE': ('r', 'qw', 'Eqw'),
+              'Slurm': ('R', 'PD', 'CD')}[system]
+    batch_states({'101': native[0], '102': native[1], '103': native[2]})
+
+    config = dict((name, getConfig(system)[name]) for name in ('status_res_pattern', 'status_running_pattern', 'status_pending_pattern'))
+    config['status_str'] = '%s %s %s %%s' % (sys.executable, fake_scheduler, system.lower())
+
+    states = Batch.queryBatchStates(config, ['101', '102', '103', '104'])
+    assert states == {'101': 'running', '102': 'pending', '103': 'finished'}
+
+
+def test_query_failure(batch_states):
+    """A status command which doesn't work gives no states"""
+    config = dict((name, getConfig('LSF')[name]) for name in ('status_res_pattern', 'status_running_pattern', 'status_pending_pattern'))
+    config['status_str'] = '%s %s lsf %%s' % (sys.executable, fake_scheduler)
+    assert Batch.queryBatchStates(config, ['1']) is None
+
+    config['status_str'] = 'no_such_batch_command %s'
+    assert Batch.queryBatchStates(config, ['1']) is None
+
+
+def test_query_chunks(batch_states, monkeypatch):
+    """The ids are given to the status command in chunks, the states of all of them are returned"""
+    batch_states({'101': 'RUN', '102': 'PEND', '104': 'DONE', '105': 'RUN'})
+    config = dict((name, getConfig('LSF')[name]) for name in ('status_res_pattern', 'status_running_pattern', 'status_pending_pattern'))
+    config['status_str'] = '%s %s lsf %%s' % (sys.executable, fake_scheduler)
+
+    commands = []
+    batch_module = sys.modules[Batch.__module__]
+    shell_cmd1 = batch_module.shell_cmd1
+    monkeypatch.setattr(batch_module, 'shell_cmd1', lambda cmd: commands.append(cmd) or shell_cmd1(cmd))
+    monkeypatch.setattr(Batch, 'status_chunk_size', 2)
+
+    states = Batch.queryBatchStates(config, ['101', '102', '103', '104', '105'])
+    assert states == {'101': 'running', '102': 'pending', '104': 'finished', '105': 'running'}
+    assert [cmd.split(' lsf ')[1] for cmd in commands] == ['101 102', '103 104', '105']
+
+
+def test_command(tmpdir):
+    """command stores the output in a file as it always has, command_output returns it"""
+    soutfile = str(tmpdir.join('sout'))
+    rc, out = Batch.command('echo submitted; exit 2', soutfile, allowed_exit=[0, 2])
+    assert (rc, out) == (2, soutfile)
+    with open(soutfile) as f:
+        assert f.read() == 'submitted\n'
+
+    assert Batch.command_output('echo submitted') == (0, 'submitted\n')
+
+
+class FakeBackend(object):
+    _name = 'LSF'
+
+    def __init__(self, _id):
+        self.id = _id
+        self.actualqueue = ''
+        self.actualCE = ''
+        self.exitcode = None
+        self._missing_since = 0
+
+
+class FakeWorkspace(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def getPath(self):
+        return self.path
+
+
+class FakeJob(object):
+
+    def __init__(self, _id, status, path):
+        self.backend = FakeBackend(_id)
+        self.status = status
+        self.workspace = FakeWorkspace(path)
+
+    def _getSessionLock(self):
+        pass
+
+    def getOutputWorkspace(self):
+        return self.workspace
+
+    def updateStatus(self, status):
+        self.status = status
+
+    def getFQID(self, sep):
+        return self.backend.id
+
+
+def test_bulk_monitoring(tmpdir, batch_states, lsf_config):
+    """Only the jobs the batch system has finished with have their status files read"""
+    batch_states({'1': 'PEND', '2': 'RUN', '3': 'RUN', '4': 'DONE', '5': 'EXIT'})
+
+    jobs = []
+    for _id, status in [('1', 'submitted'), ('2', 'submitted'), ('3', 'running'), ('4', 'running'), ('5', 'running'), ('6', 'submitted')]:
+        path = str(tmpdir.mkdir('job%s' % _id))
+        jobs.append(FakeJob(_id, status, path))
+
+    # A status file saying that the job failed, which mustn't be read as the batch system says the job is running
+    with open(os.path.join(jobs[2].workspace.path, '__jobstatus__'), 'w') as f:
+        f.write('PID: 3\nEXITCODE: 1\n')
+    # The finished job wrote its exit code, the one which exited and the one the batch system forgot about didn't
+    with open(os.path.join(jobs[3].workspace.path, '__jobstatus__'), 'w') as f:
+        f.write('PID: 4\nQUEUE: short\nEXITCODE: 0\n')
+    with open(os.path.join(jobs[4].workspace.path, '__jobstatus__'), 'w') as f:
+        f.write('PID: 5\nQUEUE: short\n')
+
+    Batch.updateMonitoringInformation(jobs)
+
+    # The jobs without an exit code are given the timeout to write it
+    assert [j.status for j in jobs] == ['submitted', 'running', 'running', 'completed', 'running', 'submitted']
+    assert jobs[3].backend.exitcode == 0
+
+    for j in jobs[4:]:
+        j.backend._missing_since -= lsf_config['timeout'] + 1
+    Batch.updateMonitoringInformation(jobs)
+    assert [j.status for j in jobs] == ['submitted', 'running', 'running', 'completed', 'failed', 'failed']
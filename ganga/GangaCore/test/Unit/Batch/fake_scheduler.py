@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# Stand-in for the status commands of the batch systems for the tests.
+#
+# Usage: fake_scheduler.py lsf|pbs|sge|slurm [batch id ...]
+#
+# The jobs the fake scheduler knows about are read from the json file named by $GANGA_FAKE_BATCH_STATES, a dict of
+# batch id to the state in the notation of the batch system. The jobs are printed in the format of bjobs, qstat or
+# squeue, asking for a job which isn't known fails as it does with bjobs and qstat.
+import os
+import sys
+import json
+
+formats = {'lsf': '{id:<7} user    {state:<5} short      lxplus001   b6001       job        Jan  1 00:00',
+           'pbs': '{id}.pbs          job              user            00:00:00 {state} batch',
+           'sge': '{id:>7} 0.50000 job        user         {state:<5} 01/01/2020 00:00:00 all.q@node001        1',
+           'slurm': '{id:>8} {state}'}
+headers = {'pbs': ['Job id            Name             User            Time Use S Queue',
+                   '----------------  ---------------- --------------- -------- - -----'],
+           'sge': ['job-ID  prior   name       user         state submit/start at     queue                slots',
+                   '-----------------------------------------------------------------------------------------']}
+
+
+def main():
+    system = sys.argv[1]
+    with open(os.environ['GANGA_FAKE_BATCH_STATES']) as states_file:
+        states = json.load(states_file)
+
+    ids = sys.argv[2:] or sorted(states)
+    rc = 0
+    known = [_id for _id in ids if _id in states]
+    if known:
+        for line in headers.get(system, []):
+            print(line)
+    for _id in ids:
+        if _id in states:
+            print(formats[system].format(id=_id, state=states[_id]))
+        else:
+            sys.stderr.write('Job <%s> is not found\n' % _id)
+            rc = 255
+    return rc
+
+
+if __name__ == '__main__':
+    sys.exit(main())
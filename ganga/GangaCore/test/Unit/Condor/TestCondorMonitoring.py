@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+
+import pytest
+
+from GangaCore.Lib.Condor import CondorLog
+from GangaCore.Lib.Condor.Condor import Condor
+from GangaCore.Lib.Condor.CondorLog import CondorUserLog
+
+# This file tests the monitoring of Condor jobs against fake_condor.py and synthetic event logs
+
+fake_condor = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_condor.py')
+
+
+def event(code, cluster, proc, text, body=()):
+    return ''.join(['%s (%03d.%03d.000) 10/17 08:0%s:00 %s\n' % (code, cluster, proc, code[-1], text)] +
+                   ['\t%s\n' % line for line in body] + ['...\n'])
+
+
+def submitted(cluster, proc):
+    return event('000', cluster, proc, 'Job submitted from host: <10.0.0.1:9618>')
+
+
+def executing(cluster, proc):
+    return event('001', cluster, proc, 'Job executing on host: <10.0.0.2:9618>')
+
+
+def terminated(cluster, proc, value=0):
+    return event('005', cluster, proc, 'Job terminated.',
+                 ['(1) Normal termination (return value %d)' % value,
+                  '\tUsr 0 00:00:05, Sys 0 00:00:01  -  Run Remote Usage',
+                  '\tUsr 0 00:00:00, Sys 0 00:00:00  -  Run Local Usage',
+                  '\tUsr 0 00:01:05, Sys 0 00:00:01  -  Total Remote Usage',
+                  '\tUsr 0 00:00:00, Sys 0 00:00:00  -  Total Local Usage'])
+
+
+def test_user_log(tmpdir):
+    """Only the events written since the last update are read, an event still being written is left for later"""
+    path = str(tmpdir.join('condorLog'))
+    log = CondorUserLog(path)
+    assert log.update() == [] and not log.exists
+
+    with open(path, 'w') as f:
+        f.write(submitted(7, 0) + executing(7, 0))
+    assert [e.code for e in log.update()] == ['000', '001']
+    assert log.update() == []
+
+    end = terminated(7, 0, 3)
+    with open(path, 'a') as f:
+        f.write(end[:60])
+    assert log.update() == [] and log.finished is None
+    with open(path, 'a') as f:
+        f.write(end[60:])
+    assert [e.code for e in log.update()] == ['005']
+    assert (log.finished, log.exit_code, log.cputime) == ('terminated', 3, '65.000000')
+    assert log.times['001'] == ('10/17', '08:01:00')
+    assert log.offset == os.path.getsize(path)
+
+    # A new log (e.g. after a resubmission) is read from the start
+    os.remove(path)
+    with open(path, 'w') as f:
+        f.write(event('009', 8, 0, 'Job was aborted.'))
+    assert [e.code for e in log.update()] == ['009']
+    assert log.finished == 'aborted' and log.exit_code is None
+
+
+@pytest.fixture
+def condor(tmpdir, monkeypatch):
+    """condor_q and condor_history replaced by the fake, returns a function setting the jobs it knows and the calls made"""
+    bindir = tmpdir.mkdir('bin')
+    for name in ('condor_q', 'condor_history'):
+        script = bindir.join(name)
+        script.write('#!/bin/sh\nexec %s %s %s "$@"\n' % (sys.executable, fake_condor, name))
+        script.chmod(0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (bindir, os.environ['PATH']))
+
+    jobs_file = str(tmpdir.join('jobs.json'))
+    calls_file = str(tmpdir.join('calls.json'))
+    monkeypatch.setenv('GANGA_FAKE_CONDOR_JOBS', jobs_file)
+    monkeypatch.setenv('GANGA_FAKE_CONDOR_LOG', calls_file)
+    monkeypatch.setattr(CondorLog, '_user_logs', {})
+
+    def set_jobs(queue, history):
+        with open(jobs_file, 'w') as f:
+            json.dump({'queue': queue, 'history': history}, f)
+        if os.path.exists(calls_file):
+            os.remove(calls_file)
+
+    def calls():
+        with open(calls_file) as f:
+            return [json.loads(line) for line in f]
+    set_jobs.calls = calls
+    return set_jobs
+
+
+def ad(schedd, cluster, proc, status, **attributes):
+    attributes.update(Schedd=schedd, ClusterId=cluster, ProcId=proc, JobStatus=status)
+    return attributes
+
+
+class FakeBackend(object):
+
+    def __init__(self, _id):
+        self.id = _id
+        self.status = ''
+        self.actualCE = ''
+        self.cputime = ''
+        self._stdout_check_time = 0
+
+
+class FakeWorkspace(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def getPath(self):
+        return self.path + '/'
+
+
+class FakeJob(object):
+
+    def __init__(self, _id, status, path):
+        self.backend = FakeBackend(_id)
+        self.status = status
+        self.fqid = _id
+        self.workspace = FakeWorkspace(path)
+
+    def _getSessionLock(self):
+        pass
+
+    def getOutputWorkspace(self):
+        return self.workspace
+
+    def updateStatus(self, status):
+        self.status = status
+
+    def write(self, name, content):
+        with open(os.path.join(self.workspace.path, name), 'a') as f:
+            f.write(content)
+
+
+def test_monitoring(tmpdir, condor):
+    """Each schedd is asked once about the clusters of its jobs, the jobs gone from the queue are finished from their log"""
+    jobs = {}
+    for schedd, cluster, proc, status in [('s1', 10, 0, 'submitted'), ('s1', 10, 1, 'submitted'), ('s1', 10, 2, 'running'),
+                                          ('s1', 11, 0, 'running'), ('s2', 20, 0, 'running'), ('s2', 20, 1, 'running')]:
+        _id = '%s#%d.%d#1600000000' % (schedd, cluster, proc)
+        jobs[_id] = job = FakeJob(_id, status, str(tmpdir.mkdir('%d.%d' % (cluster, proc))))
+        job.write('condorLog', submitted(cluster, proc) + executing(cluster, proc))
+
+    jobs['s1#10.2#1600000000'].write('condorLog', terminated(10, 2))
+    jobs['s1#10.2#1600000000'].write('stdout', 'output\n' * 1000 + 'Exit code: 0\n')
+    jobs['s2#20.0#1600000000'].write('stdout', 'Exit code: 0\n')
+
+    condor([ad('s1', 10, 0, 2, RemoteHost='slot1@node1', RemoteUserCpu=12.5), ad('s1', 10, 1, 1),
+            ad('s2', 30, 0, 2)],
+           [ad('s1', 11, 0, 3), ad('s2', 20, 0, 4, RemoteUserCpu=30.0), ad('s2', 21, 0, 4)])
+
+    Condor.updateMonitoringInformation(list(jobs.values()))
+
+    assert dict((_id, j.status) for _id, j in jobs.items()) == {'s1#10.0#1600000000': 'running',
+                                                                's1#10.1#1600000000': 'submitted',
+                                                                's1#10.2#1600000000': 'completed',
+                                                                's1#11.0#1600000000': 'failed',
+                                                                's2#20.0#1600000000': 'completed',
+                                                                's2#20.1#1600000000': 'running'}
+    assert jobs['s1#10.0#1600000000'].backend.actualCE == 'slot1@node1'
+    assert jobs['s1#10.2#1600000000'].backend.cputime == '65.000000'
+    assert jobs['s2#20.0#1600000000'].backend.cputime == '30.0'
+
+    calls = sorted((call['command'], call['args'][1], call['args'][3]) for call in condor.calls())
+    assert calls == [('condor_history', 's1', 'ClusterId == 11'), ('condor_history', 's2', 'ClusterId == 20'),
+                     ('condor_q', 's1', '(ClusterId >= 10 && ClusterId <= 11)'), ('condor_q', 's2', 'ClusterId == 20')]
+
+    # The job the history didn't know about is finished by the end of its log in a later cycle
+    condor([], [])
+    job = jobs['s2#20.1#1600000000']
+    job.write('condorLog', terminated(20, 1))
+    job.write('stdout', 'Exit code: 1\n')
+    Condor.updateMonitoringInformation([job])
+    assert job.status == 'completed'
+    assert [call['command'] for call in condor.calls()] == ['condor_q']
+
+
+def test_query_failure(tmpdir, condor, monkeypatch):
+    """Jobs are left alone when their schedd can't be asked about them"""
+    job = FakeJob('s1#10.0#1600000000', 'running', str(tmpdir.mkdir('job')))
+    monkeypatch.setenv('GANGA_FAKE_CONDOR_JOBS', str(tmpdir.join('missing.json')))
+    Condor.updateMonitoringInformation([job])
+    assert job.status == 'running'
+    assert [call['command'] for call in condor.calls()] == ['condor_q']
+
+
+def test_query_chunks(condor, monkeypatch):
+    """The clusters are asked about in chunks, consecutive ones as ranges, condor_history is limited to the jobs of each chunk"""
+    assert Condor.clusterConstraint(list(range(1, 6001))) == '(ClusterId >= 1 && ClusterId <= 6000)'
+    assert Condor.clusterConstraint([1, 2, 4, 6, 7, 8]) == \
+        '(ClusterId >= 1 && ClusterId <= 2) || ClusterId == 4 || (ClusterId >= 6 && ClusterId <= 8)'
+
+    monkeypatch.setattr(Condor, 'queryChunkSize', 3)
+    condor([], [ad('s1', cluster, proc, 4) for cluster, procs in ((1, 1), (2, 2), (3, 1), (4, 1), (5, 2), (8, 1))
+                for proc in range(procs)])
+    found = Condor.queryJobs('condor_history', 's1', {1, 2, 3, 5, 8}, jobCounts={1: 1, 2: 2, 3: 1, 5: 2, 8: 1})
+    assert sorted(found) == ['1.0', '2.0', '2.1', '3.0', '5.0', '5.1', '8.0']
+    assert [(call['args'][3], call['args'][5]) for call in condor.calls()] == \
+        [('(ClusterId >= 1 && ClusterId <= 3)', '4'), ('ClusterId == 5 || ClusterId == 8', '3')]
+
+
+def test_query_not_run(tmpdir, condor, monkeypatch):
+    """A query which can't be started counts as failed instead of breaking the monitoring"""
+    def run(*args, **kwargs):
+        raise OSError(7, 'Argument list too long')
+    monkeypatch.setattr(sys.modules[Condor.__module__], 'getProcessEngine', lambda: type('Engine', (), {'run': staticmethod(run)}))
+    job = FakeJob('s1#10.0#1600000000', 'running', str(tmpdir.mkdir('job')))
+    Condor.updateMonitoringInformation([job])
+    assert job.status == 'running'
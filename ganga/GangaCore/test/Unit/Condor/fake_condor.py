@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# Stand-in for condor_q and condor_history for the tests.
+#
+# Usage: fake_condor.py condor_q|condor_history [-name schedd] [-global] [-constraint expr] [-limit n] -af attr ...
+#
+# The jobs are read from the json file named by $GANGA_FAKE_CONDOR_JOBS, a dict with the lists of the ClassAds of the
+# jobs in the 'queue' and in the 'history', each ad having a 'Schedd' besides its ClassAd attributes. Constraints made
+# of comparisons joined by || and && are understood. Each call is appended to the json lines file $GANGA_FAKE_CONDOR_LOG.
+import os
+import sys
+import json
+
+
+def main():
+    command = sys.argv[1]
+    args = sys.argv[2:]
+    options = {'-name': None, '-constraint': 'true', '-limit': None}
+    attributes = []
+    while args:
+        arg = args.pop(0)
+        if arg in options:
+            options[arg] = args.pop(0)
+        elif arg == '-af':
+            attributes, args = args, []
+
+    with open(os.environ['GANGA_FAKE_CONDOR_LOG'], 'a') as log:
+        log.write(json.dumps({'command': command, 'args': sys.argv[2:]}) + '\n')
+
+    with open(os.environ['GANGA_FAKE_CONDOR_JOBS']) as jobs_file:
+        ads = json.load(jobs_file)['queue' if command == 'condor_q' else 'history']
+
+    constraint = options['-constraint'].replace('||', ' or ').replace('&&', ' and ')
+    count = 0
+    for ad in ads:
+        if options['-name'] is not None and ad['Schedd'] != options['-name']:
+            continue
+        if not eval(constraint, {'true': True, 'false': False}, dict(ad)):
+            continue
+        print(' '.join(str(ad.get(name, 'undefined')) for name in attributes))
+        count += 1
+        if options['-limit'] is not None and count == int(options['-limit']):
+            break
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+
+from GangaCore.GPIDev.Adapters.IMerger import IMerger
+from GangaCore.Lib.Mergers.Merger import TextMerger, SmartMerger
+
+# This file tests the merge of the files of the subjobs as they complete
+
+
+class FakeJob(object):
+
+    def __init__(self, outputdir, fqid, master=None):
+        self.outputdir = outputdir
+        self.fqid = fqid
+        self.master = master
+        self.subjobs = []
+        self.status = 'running'
+
+
+def make_job(tmpdir, n):
+    master = FakeJob(str(tmpdir.mkdir('master')), '0')
+    for i in range(n):
+        sj = FakeJob(str(tmpdir.mkdir('sj%d' % i)), '0.%d' % i, master)
+        with open(os.path.join(sj.outputdir, 'stdout'), 'w') as f:
+            f.write('output of %d\n' % i)
+        master.subjobs.append(sj)
+    return master
+
+
+def make_merger(cls, partial_size):
+    merger = cls()
+    merger.files = ['stdout']
+    merger.incremental = True
+    merger.partial_size = partial_size
+    return merger
+
+
+def complete(merger, sj):
+    sj.status = 'completed'
+    assert merger.execute(sj, 'completed')
+
+
+def test_incremental(tmpdir):
+    """The files are merged in partial merges as the subjobs complete, which the final merge combines"""
+    master = make_job(tmpdir, 7)
+    tm = make_merger(TextMerger, 3)
+    order = [3, 1, 4, 0, 6, 5, 2]
+    for i in order[:-1]:
+        complete(tm, master.subjobs[i])
+
+    partials_dir = os.path.join(master.outputdir, '.merge_partials')
+    assert sorted(f for f in os.listdir(partials_dir) if f.startswith('partial')) == ['partial0_stdout', 'partial1_stdout']
+
+    complete(tm, master.subjobs[order[-1]])
+    assert tm.execute(master, 'completed')
+
+    with open(os.path.join(master.outputdir, 'stdout')) as f:
+        merged = f.read()
+    assert merged.split('\n', 1)[1] == ''.join('# Start of file %s #\noutput of %d\n\n' % (os.path.join(master.subjobs[i].outputdir, 'stdout'), i)
+                                               for i in order) + '# Ganga Merge Ended Successfully #\n'
+    assert not os.path.exists(partials_dir)
+
+
+def test_incremental_smart(tmpdir):
+    """SmartMerger hands the files to the mergers by type, subjobs missed by the partial merges are still merged"""
+    master = make_job(tmpdir, 4)
+    sm = make_merger(SmartMerger, 1)
+    complete(sm, master.subjobs[0])
+    complete(sm, master.subjobs[1])
+    for sj in master.subjobs[2:]:
+        sj.status = 'completed'
+    assert sm.execute(master, 'completed')
+
+    with open(os.path.join(master.outputdir, 'stdout')) as f:
+        merged = f.read()
+    assert [line for line in merged.splitlines() if line.startswith('output')] == ['output of %d' % i for i in range(4)]
+
+
+def test_incremental_recompleted(tmpdir):
+    """A subjob completing again replaces its files in the partial merges, files changed since are merged again"""
+    master = make_job(tmpdir, 4)
+    tm = make_merger(TextMerger, 2)
+    for sj in master.subjobs[:3]:
+        complete(tm, sj)
+
+    with open(os.path.join(master.subjobs[0].outputdir, 'stdout'), 'w') as f:
+        f.write('output of 0 again\n')
+    complete(tm, master.subjobs[0])
+    with open(os.path.join(master.subjobs[2].outputdir, 'stdout'), 'w') as f:
+        f.write('output of 2 changed\n')
+    complete(tm, master.subjobs[3])
+    assert tm.execute(master, 'completed')
+
+    with open(os.path.join(master.outputdir, 'stdout')) as f:
+        merged = f.read()
+    assert sorted(line for line in merged.splitlines() if line.startswith('output')) == \
+        ['output of 0 again', 'output of 1', 'output of 2 changed', 'output of 3']
+
+
+class MasterFilesMerger(IMerger):
+
+    """A merger in the style of the experiment mergers, whose mergefiles() needs the master job"""
+
+    _name = 'MasterFilesMerger'
+    _schema = IMerger._schema.inherit_copy()
+
+    def merge(self, jobs, outputdir=None, ignorefailed=None, overwrite=None):
+        with open(os.path.join(outputdir, 'merged'), 'w') as f:
+            f.write('%d\n' % len(jobs))
+        return self.success
+
+    def mergefiles(self, masterjob, file_list, output_file):
+        raise AssertionError('not called by merge')
+
+
+def test_incremental_unsupported(tmpdir):
+    """Mergers overriding merge() or mergefiles() are merged in one go even if incremental is set"""
+    master = make_job(tmpdir, 2)
+    merger = make_merger(MasterFilesMerger, 1)
+    for sj in master.subjobs:
+        complete(merger, sj)
+    assert not os.path.exists(os.path.join(master.outputdir, '.merge_partials'))
+    assert merger.execute(master, 'completed')
+    with open(os.path.join(master.outputdir, 'merged')) as f:
+        assert f.read() == '2\n'
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+
+import pytest
+
+from GangaCore.Utility.Config import getConfig
+from GangaCore.GPIDev.Adapters.IPostProcessor import PostProcessException
+from GangaCore.Lib.Mergers import Merger
+from GangaCore.Lib.Mergers.Merger import RootMerger
+
+# This file tests the RootMerger against fake_hadd.py
+
+fake_hadd = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_hadd.py')
+
+
+@pytest.fixture
+def hadd_log(tmpdir, monkeypatch):
+    """A ROOT installation with the fake hadd, returns a function giving the merges it did"""
+    rootsys = tmpdir.mkdir('root')
+    rootsys.mkdir('bin')
+    for name, command in (('hadd', '%s %s "$@"' % (sys.executable, fake_hadd)), ('root-config', 'echo 6.30/02')):
+        script = rootsys.join('bin', name)
+        script.write('#!/bin/sh\nexec %s\n' % command)
+        script.chmod(0o755)
+
+    config = getConfig('ROOT')
+    config.setUserValue('path', str(rootsys))
+    log = str(tmpdir.join('hadd.log'))
+    monkeypatch.setenv('GANGA_FAKE_HADD_LOG', log)
+    monkeypatch.setattr(Merger, '_hadd_has_threads', {})
+
+    def merges():
+        if not os.path.exists(log):
+            return []
+        with open(log) as f:
+            return [json.loads(line) for line in f]
+    yield merges
+    config.revertToSession('path')
+
+
+@pytest.fixture
+def inputs(tmpdir):
+    files = []
+    for i in range(10):
+        path = str(tmpdir.join('hist%d.root' % i))
+        with open(path, 'w') as f:
+            f.write('%d\n' % i)
+        files.append(path)
+    return files
+
+
+def merged(output):
+    with open(output) as f:
+        return f.read()
+
+
+def test_merge(tmpdir, inputs, hadd_log):
+    """Up to fan_in files are merged in one go"""
+    rm = RootMerger()
+    output = str(tmpdir.join('merged.root'))
+    rm.mergefiles(inputs, output)
+
+    assert merged(output) == ''.join('%d\n' % i for i in range(10))
+    assert len(hadd_log()) == 1
+    assert '-f' in hadd_log()[0]['options']
+
+
+def test_tree_merge(tmpdir, inputs, hadd_log, monkeypatch):
+    """More files are merged in groups, the groups being merged in turn, with several threads if hadd can"""
+    rm = RootMerger()
+    rm.fan_in = 3
+    rm.parallel = 2
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    output = str(tmpdir.join('merged.root'))
+    rm.mergefiles(inputs, output)
+
+    assert merged(output) == ''.join('%d\n' % i for i in range(10))
+    assert sorted(len(merge['sources']) for merge in hadd_log()[:3]) == [3, 3, 3]
+    assert [len(merge['sources']) for merge in hadd_log()[3:]] == [3, 2]
+    assert all('-j4' in merge['options'] for merge in hadd_log())
+    assert not os.path.exists(output + '.merge_parts')
+
+
+def test_no_threads(tmpdir, inputs, hadd_log, monkeypatch):
+    """hadd isn't given threads when it can't use them"""
+    monkeypatch.setenv('GANGA_FAKE_HADD_NO_THREADS', '1')
+    RootMerger().mergefiles(inputs, str(tmpdir.join('merged.root')))
+    assert not any(option.startswith('-j') for option in hadd_log()[0]['options'])
+
+
+def test_resume(tmpdir, inputs, hadd_log, monkeypatch):
+    """A tree merge which failed carries on with the groups which it had not merged"""
+    rm = RootMerger()
+    rm.fan_in = 3
+    rm.parallel = 1
+    output = str(tmpdir.join('merged.root'))
+
+    monkeypatch.setenv('GANGA_FAKE_HADD_FAIL', 'hist7.root')
+    with pytest.raises(PostProcessException):
+        rm.mergefiles(inputs, output)
+    assert not os.path.exists(output)
+    assert [merge['sources'][0] for merge in hadd_log()] == [inputs[0], inputs[3], inputs[6]]
+
+    monkeypatch.delenv('GANGA_FAKE_HADD_FAIL')
+    rm.mergefiles(inputs, output)
+    assert merged(output) == ''.join('%d\n' % i for i in range(10))
+    assert [merge['sources'] for merge in hadd_log()[3:]] == [inputs[6:9],
+                                                             [output + '.merge_parts/level0_group%d.root' % i for i in range(3)],
+                                                             [output + '.merge_parts/level1_group0.root', inputs[9]]]
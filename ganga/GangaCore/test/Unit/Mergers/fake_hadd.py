@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# Stand-in for the hadd command of ROOT for the tests.
+#
+# Usage: fake_hadd.py [-f] [-j N] [other options] target source [source ...]
+#
+# The "ROOT files" are text files, merging them concatenates their lines into the target. Run without arguments it
+# prints its usage, listing -j unless $GANGA_FAKE_HADD_NO_THREADS is set. Each merge is recorded as a json line in the
+# file named by $GANGA_FAKE_HADD_LOG and a merge including a source named $GANGA_FAKE_HADD_FAIL fails.
+import os
+import sys
+import json
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print('usage: hadd [-a] [-f] [-k] [-T] [-O] %s[-n maxopenedfiles] [-v [verbosity]] targetfile source1 [source2 ...]'
+              % ('' if os.environ.get('GANGA_FAKE_HADD_NO_THREADS') else '[-j [N]] '))
+        return 1
+
+    options = []
+    while args[0].startswith('-'):
+        option = args.pop(0)
+        if option == '-j' and args[0].isdigit():
+            option += args.pop(0)
+        options.append(option)
+    target, sources = args[0], args[1:]
+
+    if 'GANGA_FAKE_HADD_LOG' in os.environ:
+        with open(os.environ['GANGA_FAKE_HADD_LOG'], 'a') as log:
+            log.write(json.dumps({'options': options, 'target': target, 'sources': sources}) + '\n')
+
+    if os.environ.get('GANGA_FAKE_HADD_FAIL') in [os.path.basename(source) for source in sources]:
+        sys.stderr.write('hadd: could not open %s\n' % os.environ['GANGA_FAKE_HADD_FAIL'])
+        return 1
+
+    with open(target, 'w') as out:
+        for source in sources:
+            with open(source) as f:
+                out.write(f.read())
+    print('hadd Target file: %s' % target)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
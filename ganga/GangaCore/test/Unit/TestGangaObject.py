@@ -315,3 +315,26 @@ class TestThreadSafeGangaObject(MultiThreadedTestCase):
                     assert o.b.a == num
 
         self.run_threads([change])
+
+
+class TestCopyFromNew(unittest.TestCase):
+
+    def test_copy(self):
+        """An object built with getNew gets its own copy of each component, which nothing done to the source changes"""
+        src = ThreadedTestGangaObject()
+        src.a = 1
+        src.b.a = 1
+        first = ThreadedTestGangaObject.getNew()
+        first.copyFrom(src, _is_new=True)
+
+        assert first.a == 1
+        assert first == src
+        assert first.b is not src.b
+        assert first.b._getParent() is first
+
+        first.b.a = 2
+        assert src.b.a == 1
+
+        src_b = src.b
+        src_b.a = 3
+        assert first.b.a == 2
@@ -0,0 +1,92 @@
+import os
+
+from GangaCore.Core.GangaRepository.IndexSegment import IndexSegment, LazyIndexCache
+
+
+def test_index_segment_roundtrip(tmpdir):
+    """Test that index caches written to a segment are read back by a new instance"""
+
+    fn = str(tmpdir.join('index.seg'))
+    seg = IndexSegment(fn)
+    assert seg.created
+
+    for i in range(100):
+        seg.write(i, 'jobs', 'Job', {'status': 'new', 'name': 'job%s' % i, 'display:backend': 'Local'})
+    # Too big for its slot, this has to be appended
+    seg.write(5, 'jobs', 'Job', {'status': 'running', 'name': 'x' * 1000})
+    seg.remove(7)
+
+    other = IndexSegment(fn)
+    assert not other.created
+    assert len(other) == 99
+    assert 7 not in other
+    assert other.read(5) == ('jobs', 'Job', {'status': 'running', 'name': 'x' * 1000})
+
+    rec = other.get_record(10)
+    assert rec.category == 'jobs'
+    assert rec.classname == 'Job'
+    assert rec.columns['backend'] == 'Local'
+
+    seg.close()
+    other.close()
+
+
+def test_index_segment_compact(tmpdir):
+    """Test that compacting the segment keeps all live records and other instances follow the new file"""
+
+    fn = str(tmpdir.join('index.seg'))
+    seg = IndexSegment(fn)
+    other = IndexSegment(fn)
+
+    for i in range(50):
+        seg.write(i, 'jobs', 'Job', {'status': 'new'})
+    for i in range(50):
+        seg.write(i, 'jobs', 'Job', {'status': 'new', 'name': 'y' * 500})
+
+    size_before = os.path.getsize(fn)
+    seg.compact()
+    assert os.path.getsize(fn) < size_before
+
+    other.write(3, 'jobs', 'Job', {'status': 'killed'})
+    seg.refresh()
+    assert len(seg) == 50
+    assert seg.read(3)[2] == {'status': 'killed'}
+
+    seg.close()
+    other.close()
+
+
+def test_lazy_index_cache(tmpdir):
+    """Test that the cache is only unpickled when a value outside of the exact columns is requested"""
+
+    fn = str(tmpdir.join('index.seg'))
+    seg = IndexSegment(fn)
+    seg.write(1, 'jobs', 'Job', {'status': 'completed', 'name': 'test', 'id': 1})
+
+    cache = LazyIndexCache(seg, 1, seg.get_record(1))
+    assert cache['status'] == 'completed'
+    assert not cache._loaded
+    assert cache['name'] == 'test'
+    assert cache._loaded
+    assert cache == {'status': 'completed', 'name': 'test', 'id': 1}
+
+    seg.close()
+
+
+def test_read_rewritten_record(tmpdir):
+    """Test that a record rewritten or moved by another instance is read as it is now rather than as first listed"""
+
+    fn = str(tmpdir.join('index.seg'))
+    seg = IndexSegment(fn)
+    other = IndexSegment(fn)
+    seg.write(1, 'jobs', 'Job', {'status': 'new'})
+    other.refresh()
+
+    # In place with a longer blob, then moved to a new slot
+    seg.write(1, 'jobs', 'Job', {'status': 'new', 'name': 'z' * 10})
+    assert other.read(1)[2] == {'status': 'new', 'name': 'z' * 10}
+    seg.write(1, 'jobs', 'Job', {'status': 'running', 'name': 'z' * 1000})
+    assert other.read(1)[2] == {'status': 'running', 'name': 'z' * 1000}
+
+    seg.close()
+    other.close()
@@ -0,0 +1,73 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from GangaCore.Lib.Localhost.LocalExecutor import LocalExecutor
+
+# This file tests the running of the local jobs in a limited number of slots
+
+
+def wait_exit(proc):
+    for _ in range(300):
+        if proc.exited:
+            return True
+        threading.Event().wait(0.1)
+    return False
+
+
+@pytest.mark.parametrize('pidfd', [True, False])
+def test_slots(tmpdir, monkeypatch, pidfd):
+    """No more processes than slots run at once, the queued ones are started as the others exit"""
+    if not pidfd:
+        # Waiting for the processes with a thread each
+        monkeypatch.delattr(os, 'pidfd_open', raising=False)
+    exited = []
+    done = threading.Event()
+
+    def on_exit(key):
+        exited.append(key)
+        if len(exited) == 5:
+            done.set()
+
+    executor = LocalExecutor(2, on_exit=on_exit)
+    log = str(tmpdir.join('log'))
+    # Each process records its start, waits a bit and records its end
+    script = "import sys, time; f = open(%r, 'a'); f.write('+\\n'); f.flush(); time.sleep(0.2); f.write('-\\n'); f.close(); sys.exit(int(sys.argv[1]))" % log
+    procs = [executor.submit(str(i), [sys.executable, '-c', script, str(i % 2)]) for i in range(5)]
+
+    assert [p.queued for p in procs] == [False, False, True, True, True]
+    assert executor.queued() == 3
+    assert done.wait(30)
+
+    running = peak = 0
+    with open(log) as f:
+        for line in f:
+            running += 1 if line.strip() == '+' else -1
+            peak = max(peak, running)
+    assert peak == 2
+
+    assert sorted(exited) == [str(i) for i in range(5)]
+    for i, proc in enumerate(procs):
+        assert executor.get(str(i)) is proc
+        assert proc.exited and proc.exitcode == i % 2
+        assert proc.walltime >= 0.2 and proc.cputime > 0 and proc.maxrss > 0
+        executor.discard(str(i))
+    assert executor.get('0') is None
+
+
+def test_cancel(tmpdir):
+    """A queued job can be taken out of the queue, a job which can't be started is reported"""
+    executor = LocalExecutor(1)
+    first = executor.submit('first', [sys.executable, '-c', 'import time; time.sleep(0.5)'])
+    executor.submit('second', ['true'])
+    missing = executor.submit('missing', [str(tmpdir.join('no_such_program'))])
+
+    assert not executor.cancel('first')
+    assert executor.cancel('second')
+    assert executor.get('second') is None
+
+    assert wait_exit(first) and wait_exit(missing)
+    assert missing.error is not None
+    assert not os.path.exists(str(tmpdir.join('no_such_program')))
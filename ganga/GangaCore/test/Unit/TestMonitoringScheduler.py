@@ -0,0 +1,28 @@
+from GangaCore.Core.MonitoringComponent.MonitoringScheduler import MonitoringScheduler
+
+
+def test_monitoring_scheduler():
+    """Test that tasks come due in order and that rescheduled or cancelled entries are ignored"""
+
+    scheduler = MonitoringScheduler()
+    assert scheduler.next_due() is None
+
+    scheduler.schedule('creds', 30.)
+    scheduler.schedule(('backend', 'Local'), 10.)
+    scheduler.schedule(('backend', 'Dirac'), 50.)
+    assert scheduler.next_due() == 10.
+
+    # Rescheduling replaces the earlier entry
+    scheduler.schedule(('backend', 'Local'), 40.)
+    assert scheduler.get(('backend', 'Local')) == 40.
+    assert scheduler.next_due() == 30.
+
+    scheduler.cancel('creds')
+    assert scheduler.get('creds') is None
+    assert scheduler.next_due() == 40.
+
+    scheduler.clear(lambda key: isinstance(key, tuple) and key[1] == 'Local')
+    assert scheduler.next_due() == 50.
+
+    scheduler.clear()
+    assert scheduler.next_due() is None
@@ -0,0 +1,96 @@
+from GangaCore.Core.GangaRepository.Registry import Registry
+from GangaCore.Core.GangaRepository.RegistryIndex import RegistryIndex
+
+
+class Obj(object):
+    pass
+
+
+class CountingRegistry(Registry):
+
+    _index_columns = ('status',)
+
+    def __init__(self):
+        super(CountingRegistry, self).__init__('test', 'test registry')
+        self._objects = {}
+        self.looked_at = []
+
+    def getIndexColumns(self, obj, cache=None):
+        self.looked_at.append(obj)
+        return {'status': cache.get('status')}
+
+
+def test_registry_index_select():
+    """Test that the inverted index matches wildcards and values and reports unknown columns"""
+
+    index = RegistryIndex()
+    objs = {}
+    for i in range(10):
+        objs[i] = Obj()
+        index.update(i, objs[i], None, {'status': 'completed' if i % 2 else 'new',
+                                        'name': 'job%s' % i,
+                                        'backend': 'Dirac' if i < 5 else 'Local'})
+    # An old cache without the backend stored
+    index.update(10, Obj(), {}, {'status': 'completed', 'name': 'old', 'backend': None})
+
+    assert index.select(status='completed', backend='Dirac') == ({1, 3}, {10})
+    assert index.select(name='job[0-2]') == ({0, 1, 2}, set())
+    assert index.select(status='comp*', name='job?') == ({1, 3, 5, 7, 9}, set())
+
+    # Updates move the id between values, removal drops it
+    index.update(1, objs[1], None, {'status': 'failed', 'name': 'job1', 'backend': 'Dirac'})
+    index.remove(3)
+    assert index.select(status='completed', backend='Dirac') == (set(), {10})
+    assert index.find(objs[1]) == 1
+    assert index.find(objs[3]) is None
+
+    # Exact lookups, as used for the set of active objects
+    assert index.lookup('status', ('new', 'failed')) == {0, 1, 2, 4, 6, 8}
+    assert index.lookup('backend', (None,)) == {10}
+    assert index.value(4, 'backend') == 'Dirac'
+    assert index.value(3, 'backend') is None
+
+    index.retain(range(5))
+    assert len(index) == 4
+    assert index.select(backend='Local') == (set(), set())
+
+
+def test_registry_index_select_large():
+    """Test that selects on a large index return exactly the matching ids"""
+    index = RegistryIndex()
+    statuses = ['new', 'submitted', 'running', 'completed', 'failed']
+    for i in range(50000):
+        index.update(i, Obj(), None, {'status': statuses[i % 5], 'name': 'job%s' % (i % 100),
+                                      'backend': 'Dirac' if i % 3 else 'Local', 'application': 'Executable'})
+
+    assert index.select(status='completed', backend='Dirac') == (set(i for i in range(50000) if i % 5 == 3 and i % 3), set())
+    assert index.select(name='job1?', backend='Local') == (set(i for i in range(50000) if 10 <= i % 100 < 20 and not i % 3), set())
+    assert index.select(status='running', name='nomatch') == (set(), set())
+
+
+def test_registry_refresh_index_stale_only():
+    """Test that only the objects marked as stale are indexed again once the index covers the registry"""
+    registry = CountingRegistry()
+    for i in range(5):
+        registry._objects[i] = Obj()
+        registry._objects[i]._index_cache_dict = {'status': 'new'}
+
+    registry._refreshIndex()
+    assert len(registry.looked_at) == 5
+    assert registry._index.lookup('status', ('new',)) == set(range(5))
+
+    del registry.looked_at[:]
+    registry._refreshIndex()
+    assert registry.looked_at == []
+
+    # Another session replaced the index cache of 3
+    registry._objects[3]._index_cache_dict = {'status': 'running'}
+    registry._markIndexStale(3)
+    registry._refreshIndex()
+    assert registry.looked_at == [registry._objects[3]]
+    assert registry._index.lookup('status', ('running',)) == {3}
+
+    # Removing an object is noticed without marking it
+    del registry._objects[0]
+    registry._refreshIndex()
+    assert len(registry._index) == 4
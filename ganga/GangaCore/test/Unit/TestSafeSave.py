@@ -33,3 +33,30 @@ def test_safe_save_threadcalls():
     assert os.path.isfile(testfn+'~')
     os.remove(testfn+'~')
     assert not os.path.isfile(testfn+'.new')
+
+
+def test_safe_save_many_dirs(tmpdir):
+    """Test that files in different directories can be saved concurrently without losing any"""
+
+    from GangaCore.Core.GangaRepository.GangaRepositoryXML import safe_save
+
+    def my_to_file(obj, fhandle, ignore_subs):
+        fhandle.write("!" * 1000)
+
+    o = LocalFile()
+    fns = [str(tmpdir.join(str(i), 'data')) for i in range(50)]
+
+    ths = []
+    for fn in fns * 4:
+        ths.append(threading.Thread(target=safe_save, args=(fn, o, my_to_file)))
+
+    for th in ths:
+        th.start()
+
+    for th in ths:
+        th.join()
+
+    for fn in fns:
+        assert os.path.isfile(fn)
+        assert os.path.isfile(fn+'~')
+        assert not os.path.isfile(fn+'.new')
@@ -0,0 +1,76 @@
+import os
+import time
+
+import pytest
+
+from GangaCore.Core.exceptions import GangaException
+from GangaCore.Core.GangaRepository.SessionLock import SessionLockRefresher
+
+
+@pytest.fixture
+def refresher(tmpdir):
+    """A refresher for a global and a repository session file, the thread isn't started"""
+    sdir = str(tmpdir)
+    gfn = os.path.join(sdir, 'host.PID.1.session')
+    fn = gfn + '.jobs.locks'
+    for f in (gfn, fn):
+        open(f, 'w').close()
+    r = SessionLockRefresher('host.PID.1.session', sdir, gfn, None, False)
+    r.addRepo(fn, 'repo')
+    yield r
+    r._closeFiles()
+    r.unregister()
+
+
+def test_update(refresher):
+    """All session files are refreshed together without forking, repeated calls are throttled"""
+    for fn in refresher.fns:
+        os.utime(fn, (0, 0))
+
+    now = refresher.updateNow()
+    assert abs(now - time.time()) < 60
+    for fn in refresher.fns:
+        assert abs(os.stat(fn).st_mtime - now) < 60
+    assert sorted(refresher._fds) == sorted(refresher.fns)
+
+    os.utime(refresher.fns[0], (0, 0))
+    refresher.updateNow()
+    assert os.stat(refresher.fns[0]).st_mtime == 0
+
+
+def test_removed_file(refresher):
+    """A session file removed by another session is noticed even though it is held open"""
+    refresher.updateNow()
+    os.unlink(refresher.fns[0])
+    with pytest.raises(GangaException):
+        refresher.updateLocksNow(0)
+
+
+
+def test_renamed_file(refresher):
+    """A session file which still has a link, as NFS keeps a removed open file, or was replaced is noticed too"""
+    refresher.updateNow()
+    os.rename(refresher.fns[0], refresher.fns[0] + '.nfs0001')
+    with pytest.raises(GangaException):
+        refresher.updateLocksNow(0)
+
+    open(refresher.fns[0], 'w').close()
+    refresher.updateLocksNow(0)
+    os.rename(refresher.fns[0], refresher.fns[0] + '.nfs0002')
+    open(refresher.fns[0], 'w').close()
+    with pytest.raises(GangaException):
+        refresher.updateLocksNow(0)
+
+
+def test_clear_dead_locks(refresher):
+    """The session and lock files of sessions which stopped updating them are removed"""
+    dead = os.path.join(refresher.sdir, 'otherhost.PID.2.session')
+    alive = os.path.join(refresher.sdir, 'otherhost.PID.3.session')
+    for f in (dead, dead + '.jobs.locks', alive, alive + '.jobs.locks'):
+        open(f, 'w').close()
+    os.utime(dead, (0, 0))
+
+    refresher.checkAndReap()
+
+    assert sorted(os.listdir(refresher.sdir)) == sorted([os.path.basename(f) for f in refresher.fns] +
+                                                        [os.path.basename(alive), os.path.basename(alive) + '.jobs.locks'])
@@ -0,0 +1,26 @@
+import datetime
+
+from GangaCore.GPIDev.Lib.Job.SubJobSummary import SubJobSummary
+
+# This file tests the running summary of the subjob statuses and timestamps of a master job
+
+
+def test_summary():
+    """The counts follow the transitions, the master timestamps are the earliest or latest of the subjobs"""
+    t0 = datetime.datetime(2020, 1, 1)
+    summary = SubJobSummary()
+    for i in range(3):
+        summary.add('submitted', {'new': t0, 'submitted': t0 + datetime.timedelta(seconds=i), 'bad': 'not a time'})
+    assert summary.statuses() == {'submitted'} and summary.total() == 3
+
+    for i in (2, 1):
+        summary.statusChanged('submitted', 'running', {'running': t0 + datetime.timedelta(minutes=i)})
+    summary.statusChanged('running', 'completed', {'final': t0 + datetime.timedelta(hours=1)})
+    summary.statusChanged('submitted', 'failed', {'final': t0 + datetime.timedelta(hours=2)})
+
+    assert dict(summary.counts) == {'running': 1, 'completed': 1, 'failed': 1}
+    assert summary.statuses() == {'running', 'completed', 'failed'}
+    assert summary.timestamp('submitted') == t0
+    assert summary.timestamp('running') == t0 + datetime.timedelta(minutes=1)
+    assert summary.timestamp('final') == t0 + datetime.timedelta(hours=2)
+    assert summary.timestamp('bad') is None and summary.timestamp('killed') is None
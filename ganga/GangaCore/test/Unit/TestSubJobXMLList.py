@@ -0,0 +1,49 @@
+import os
+
+from GangaCore.Core.GangaRepository.SubJobXMLList import SubJobXMLList
+from GangaCore.Core.GangaRepository.VStreamer import to_file
+from GangaCore.GPIDev.Lib.File.LocalFile import LocalFile
+
+
+class FakeRegistry(object):
+
+    def getIndexCache(self, obj):
+        return {'name': obj.namePattern}
+
+
+def _make_subjobs(job_dir, n):
+    """Write n LocalFile objects in the layout used for subjobs"""
+    for i in range(n):
+        os.makedirs(os.path.join(job_dir, str(i)))
+        with open(os.path.join(job_dir, str(i), 'data'), 'w') as data_file:
+            to_file(LocalFile('file%s' % i), data_file)
+
+
+def test_subjob_index_journal(tmpdir):
+    """Test that changed index entries are appended to the journal and replayed on loading"""
+
+    job_dir = str(tmpdir)
+    _make_subjobs(job_dir, 20)
+    registry = FakeRegistry()
+    journal = os.path.join(job_dir, 'subjobs.idx.journal')
+
+    sjl = SubJobXMLList(job_dir, registry)
+    sjl.write_subJobIndex()
+    assert os.path.isfile(os.path.join(job_dir, 'subjobs.idx'))
+    assert not os.path.isfile(journal)
+
+    sjl[3].namePattern = 'changed'
+    sjl.write_subJobIndex()
+    assert os.path.isfile(journal)
+
+    other = SubJobXMLList(job_dir, registry)
+    assert other.getCachedData(3)['name'] == 'changed'
+    assert other.getCachedData(4)['name'] == 'file4'
+    assert not other.isLoaded(3)
+
+    # A journal which doesn't belong to the current index is ignored and the index rewritten
+    os.utime(os.path.join(job_dir, 'subjobs.idx'), (0, 0))
+    stale = SubJobXMLList(job_dir, registry)
+    assert stale.getCachedData(3)['name'] == 'file3'
+    stale.write_subJobIndex()
+    assert not os.path.isfile(journal)
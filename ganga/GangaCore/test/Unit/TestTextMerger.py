@@ -0,0 +1,53 @@
+import gzip
+
+import pytest
+
+from GangaCore.Lib.Mergers.Merger import TextMerger
+
+
+@pytest.fixture
+def inputs(tmpdir):
+    """Some plain and some compressed files to merge, with their content"""
+    files = []
+    for i in range(12):
+        content = ('line %d of file %d\n' % (i, i)) * (i * 1000)
+        if i % 3:
+            path = str(tmpdir.join('stdout%d' % i))
+            with open(path, 'w') as f:
+                f.write(content)
+        else:
+            path = str(tmpdir.join('stdout%d.gz' % i))
+            with gzip.open(path, 'wt') as f:
+                f.write(content)
+        files.append((path, content))
+    return files
+
+
+def expected(inputs):
+    return ''.join('# Start of file %s #\n%s\n' % (path, content) for path, content in inputs) + '# Ganga Merge Ended Successfully #\n'
+
+
+@pytest.mark.parametrize('compress, gzip_members', [(False, False), (True, False), (True, True)])
+def test_merge(tmpdir, inputs, compress, gzip_members):
+    """The files are merged in order whatever the compression of the inputs and the output"""
+    tm = TextMerger()
+    tm.compress = compress
+    tm.gzip_members = gzip_members
+    output = str(tmpdir.join('merged'))
+    tm.mergefiles([path for path, content in inputs], output)
+
+    if compress:
+        with gzip.open(output + '.gz', 'rt') as f:
+            merged = f.read()
+    else:
+        with open(output) as f:
+            merged = f.read()
+
+    assert merged.startswith('# Ganga TextMergeTool - ')
+    assert merged.split('\n', 1)[1] == expected(inputs)
+
+
+def test_missing_file(tmpdir, inputs):
+    """A file which can't be read fails the merge"""
+    with pytest.raises(IOError):
+        TextMerger().mergefiles([path for path, content in inputs] + [str(tmpdir.join('missing.gz'))], str(tmpdir.join('merged')))
@@ -0,0 +1,201 @@
+import os
+import time
+import xml.parsers.expat
+from io import StringIO
+
+import pytest
+
+from GangaCore.Core.GangaRepository.VStreamer import VStreamer, to_file, from_file, value_element, decode_value
+from GangaCore.GPIDev.Base.Objects import GangaObject
+from GangaCore.GPIDev.Base.Proxy import isType
+from GangaCore.GPIDev.Lib.GangaList.GangaList import GangaList
+from GangaCore.GPIDev.Lib.File.LocalFile import LocalFile
+
+
+def _parse_value(element):
+    """Parse a single <value> element and return its type attribute and content"""
+    result = {'type': None, 'data': ''}
+
+    def start_element(name, attrs):
+        result['type'] = attrs.get('type')
+
+    def char_data(data):
+        result['data'] += data
+
+    p = xml.parsers.expat.ParserCreate()
+    p.StartElementHandler = start_element
+    p.CharacterDataHandler = char_data
+    p.Parse(element)
+    return result['type'], result['data']
+
+
+@pytest.mark.parametrize('value', [
+    'simple', '', ' padded\n  text ', 'a & <b> "c"', 1, -7, 2**70, 1.5, True, False, None,
+    ['a', 1, None, [2.5]], {'key': 'value', 'nested': {'a': [1, 2]}},
+])
+def test_typed_value_roundtrip(value):
+    """Test that simple values are tagged with a type and decoded without eval"""
+    value_type, data = _parse_value(value_element(value))
+    assert value_type is not None
+    decoded = decode_value(value_type, data)
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+@pytest.mark.parametrize('value', ['carriage\rreturn', 'control\x01char', (1, 2), {1: 'a'}, ['a', (1,)]])
+def test_untyped_value_fallback(value):
+    """Test that values which can't be stored exactly keep the old repr encoding"""
+    value_type, data = _parse_value(value_element(value))
+    assert value_type is None
+    assert eval(data) == value
+
+
+class PrintVStreamer(VStreamer):
+    """The original writer which prints every token to the output stream, used as a reference"""
+
+    def begin_root(self):
+        print('<root>', file=self.out)
+
+    def end_root(self):
+        print('</root>', file=self.out)
+
+    def nodeBegin(self, node):
+        self.level += 1
+        s = node._schema
+        print(self.indent(), '<class name="%s" version="%d.%d" category="%s">' % (s.name, s.version.major, s.version.minor, s.category), file=self.out)
+
+    def nodeEnd(self, node):
+        print(self.indent(), '</class>', file=self.out)
+        self.level -= 1
+
+    def print_value(self, x):
+        print('\n', self.indent(), value_element(x), file=self.out)
+
+    def simpleAttribute(self, node, name, value, sequence):
+        if self.showAttribute(node, name):
+            self.level += 1
+            print(self.indent(), end=' ', file=self.out)
+            print('<attribute name="%s">' % name, end=' ', file=self.out)
+            if sequence:
+                self.level += 1
+                print(file=self.out)
+                print(self.indent(), '<sequence>', file=self.out)
+                for v in value:
+                    self.acceptOptional(v)
+                print(self.indent(), '</sequence>', file=self.out)
+                self.level -= 1
+                print(self.indent(), '</attribute>', file=self.out)
+            else:
+                self.level += 1
+                if isinstance(value, GangaObject):
+                    print("", file=self.out)
+                    self.acceptOptional(value)
+                else:
+                    self.print_value(value)
+                self.level -= 1
+                print(self.indent(), end=' ', file=self.out)
+                print('</attribute>', file=self.out)
+            self.level -= 1
+
+    def acceptOptional(self, s):
+        self.level += 1
+        if s is None or isType(s, str):
+            print(self.indent(), value_element(s), file=self.out)
+        elif hasattr(s, 'accept'):
+            s.accept(self)
+        elif isType(s, (list, tuple, GangaList)):
+            print(self.indent(), '<sequence>', file=self.out)
+            for sub_s in s:
+                self.acceptOptional(sub_s)
+            print(self.indent(), '</sequence>', file=self.out)
+        else:
+            self.print_value(s)
+        self.level -= 1
+
+    def componentAttribute(self, node, name, subnode, sequence):
+        if self.showAttribute(node, name):
+            self.level += 1
+            print(self.indent(), '<attribute name="%s">' % name, file=self.out)
+            if sequence:
+                self.level += 1
+                print(self.indent(), '<sequence>', file=self.out)
+                for s in subnode:
+                    self.acceptOptional(s)
+                print(self.indent(), '</sequence>', file=self.out)
+                self.level -= 1
+            else:
+                self.acceptOptional(subnode)
+            print(self.indent(), '</attribute>', file=self.out)
+            self.level -= 1
+
+
+def print_to_file(j, fobj, ignore_subs=[]):
+    """The original to_file using the PrintVStreamer"""
+    sio = StringIO()
+    vstreamer = PrintVStreamer(out=sio, selection=ignore_subs)
+    vstreamer.begin_root()
+    j.accept(vstreamer)
+    vstreamer.end_root()
+    print(sio.getvalue(), file=fobj)
+
+
+def _make_tree(n):
+    """Return a LocalFile with n subfiles with awkward names"""
+    top = LocalFile('top & <file> "%d"' % n)
+    top.subfiles = [LocalFile('sub_%d\tname' % i, localDir='/some/dir/%d' % i) for i in range(n)]
+    return top
+
+
+def test_buffered_output_identical():
+    """Test that the buffered writer produces exactly the output of the print based one"""
+    for n in (0, 1, 10):
+        obj = _make_tree(n)
+        old, new = StringIO(), StringIO()
+        print_to_file(obj, old)
+        to_file(obj, new)
+        assert new.getvalue() == old.getvalue()
+
+    # Writing through the streamer directly keeps working too
+    obj = _make_tree(3)
+    vstreamer = VStreamer(out=StringIO(), selection=['subfiles'])
+    vstreamer.begin_root()
+    obj.accept(vstreamer)
+    vstreamer.end_root()
+    reference = StringIO()
+    print_to_file(obj, reference, ['subfiles'])
+    assert vstreamer.out.getvalue() + '\n' == reference.getvalue()
+
+
+def test_large_tree_roundtrip():
+    """Test that a large tree is written exactly as by the print based writer and is read back unchanged"""
+    obj = _make_tree(200)
+    old, new = StringIO(), StringIO()
+    print_to_file(obj, old)
+    to_file(obj, new)
+    assert new.getvalue() == old.getvalue()
+
+    loaded, errors = from_file(StringIO(new.getvalue()))
+    assert not errors
+    assert loaded.namePattern == obj.namePattern
+    assert [(f.namePattern, f.localDir) for f in loaded.subfiles] == [(f.namePattern, f.localDir) for f in obj.subfiles]
+
+
+@pytest.mark.skipif('GANGA_BENCHMARK' not in os.environ, reason='set GANGA_BENCHMARK to run the benchmarks')
+def test_to_file_benchmark():
+    """Compare the time taken by to_file with the original print based writer"""
+    obj = _make_tree(200)
+    repeat = 5
+
+    def timed(writer):
+        best = None
+        for _ in range(repeat):
+            out = StringIO()
+            start = time.time()
+            writer(obj, out)
+            taken = time.time() - start
+            best = taken if best is None else min(best, taken)
+        return best
+
+    t_print = timed(print_to_file)
+    t_buffered = timed(to_file)
+    print('to_file of %d objects: print %.4fs, buffered %.4fs' % (len(obj.subfiles) + 1, t_print, t_buffered))
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from GangaCore.Core.exceptions import GangaException
+from GangaCore.Core.GangaThread.WorkerThreads.WorkerThreadPool import WorkerThreadPool, wait_for_tasks
+
+# This file tests the futures returned by WorkerThreadPool.submit
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerThreadPool(num_worker_threads=2, worker_thread_prefix='Test_Worker_')
+    yield pool
+    pool.clear_queue()
+    pool._stop_worker_threads()
+
+
+def fail(x):
+    raise ValueError('failed %s' % x)
+
+
+def test_results_and_errors(pool):
+    """Each task gets its own result or exception, with its timing, and progress is reported as they finish"""
+    tasks = [pool.submit(pow, (i, 2)) for i in range(5)] + [pool.submit(fail, (5,), name='fail')]
+    reported = []
+    wait_for_tasks(tasks, lambda done, total, task: reported.append((done, total, task)))
+
+    assert [task.result() for task in tasks[:5]] == [0, 1, 4, 9, 16]
+    assert str(tasks[5].exception()) == 'failed 5'
+    assert [done for done, total, task in reported] == list(range(1, 7))
+    assert set(task for done, total, task in reported) == set(tasks)
+    assert all(task.started >= task.queued and task.finished >= task.started for task in tasks)
+    assert all(task.run_time() >= 0. and task.wait_time() >= 0. for task in tasks)
+
+
+def test_clear_queue(pool):
+    """The tasks dropped from the queue are cancelled rather than left pending"""
+    release = threading.Event()
+    running = [pool.submit(release.wait) for _ in range(2)]
+    while not all(task.running() for task in running):
+        time.sleep(0.01)
+    queued = pool.submit(pow, (2, 2))
+    pool.clear_queue()
+    release.set()
+    wait_for_tasks(running + [queued])
+    assert queued.cancelled()
+    assert all(task.result() for task in running)
+
+
+def test_frozen(pool):
+    """Nothing is queued while the pool is frozen, the future fails straight away"""
+    pool.freeze()
+    task = pool.submit(pow, (2, 2))
+    assert task.done()
+    assert isinstance(task.exception(), GangaException)
@@ -0,0 +1,53 @@
+import re
+
+import pytest
+
+from GangaCore.Utility import FileScan
+
+# This file tests the search of files for many patterns at once
+
+
+def write(tmpdir, name, content):
+    path = str(tmpdir.join(name))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return path
+
+
+def test_scan_file(tmpdir):
+    """All the patterns found anywhere in the file are reported, including overlapping ones"""
+    path = write(tmpdir, 'log', 'start\nvalue 12\nERROR: bad\nend\n')
+
+    assert FileScan.scan_file(path, ['1', '12', '^ERROR', 'missing', 'd$']) == {0, 1, 2, 4}
+    assert len(FileScan.scan_file(path, ['1', '12', 'ERROR'], stop_on_match=True)) == 1
+    assert FileScan.scan_file(write(tmpdir, 'empty', ''), ['x']) == set()
+
+
+def test_scan_file_per_line(tmpdir):
+    """Each pattern is matched against the lines, as re.search would do line by line, whatever its flags or groups"""
+    path = write(tmpdir, 'log', 'Error in\nstep\n\nabab\nend\n')
+    patterns = ['(?i)^error', r'(ab)\1', r'in\s+step', r'\Astep', r'^$', r'p\n$', r'[^x]+end', 'end$']
+    with open(path) as f:
+        lines = f.readlines()
+    expected = set(i for i, p in enumerate(patterns) if any(re.search(p, line) for line in lines))
+
+    assert expected == {0, 1, 3, 4, 5, 7}
+    assert FileScan.scan_file(path, patterns) == expected
+    with pytest.raises(re.error):
+        FileScan.scan_file(path, ['(unclosed'])
+
+
+def test_scan_files(tmpdir):
+    """A group of files stops being scanned at the first file deciding the outcome"""
+    paths = [write(tmpdir, 'a', 'fine\n'), write(tmpdir, 'b', 'ERROR\n'), write(tmpdir, 'c', 'ERROR\n')]
+
+    assert FileScan.scan_files(paths, ['ERROR']) == [(paths[0], set()), (paths[1], {0}), (paths[2], {0})]
+    assert FileScan.scan_files(paths, ['ERROR'], stop_on_match=True) == [(paths[0], set()), (paths[1], {0})]
+    assert FileScan.scan_files(paths, ['ERROR'], stop_on_miss=True) == [(paths[0], set())]
+
+
+def test_scan_file_text(tmpdir):
+    """The file is searched as text, so non-ASCII characters, classes like \\w and case folding work as on its lines"""
+    path = write(tmpdir, 'log', 'caf\u00e9 ok\r\nend\n')
+
+    assert FileScan.scan_file(path, [r'caf\w ok$', '(?i)CAF\u00c9', r'\bok\b', 'ok\r']) == {0, 1, 2}
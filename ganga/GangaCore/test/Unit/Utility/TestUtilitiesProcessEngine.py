@@ -0,0 +1,80 @@
+import os
+import time
+import asyncio
+
+from GangaCore.Utility.ProcessEngine import ProcessEngine
+
+# This file tests the engine which runs the shell commands of Ganga
+
+
+def test_run():
+    """The output and exit code of a command are captured"""
+    engine = ProcessEngine(4)
+    try:
+        result = engine.run('echo foo; echo bar >&2; exit 3')
+        assert result.returncode == 3
+        assert not result.timed_out
+        assert result.text() == 'foo\nbar\n'
+
+        result = engine.run(['cat'], shell=False, input='spam', merge_stderr=False)
+        assert result.text() == 'spam'
+        assert result.stderr == b''
+    finally:
+        engine.stop()
+
+
+def test_timeout():
+    """Commands running for too long are killed along with what they started"""
+    engine = ProcessEngine(4)
+    try:
+        t0 = time.time()
+        result = engine.run('sleep 30 & sleep 30', timeout=0.5, kill_grace=0)
+        assert result.timed_out
+        assert result.returncode < 0
+        assert time.time() - t0 < 10
+    finally:
+        engine.stop()
+
+
+def test_concurrency_limit():
+    """No more commands than allowed run at the same time"""
+    engine = ProcessEngine(2)
+    try:
+        t0 = time.time()
+        results = [f.result() for f in [engine.submit('sleep 0.5') for _ in range(4)]]
+        assert all(result.returncode == 0 for result in results)
+        assert time.time() - t0 >= 1.
+    finally:
+        engine.stop()
+
+
+def test_spill(tmpdir):
+    """Large outputs go to a file"""
+    engine = ProcessEngine(4)
+    try:
+        result = engine.run('head -c 5000 /dev/zero', spill_threshold=1000)
+        assert result.output_file is not None
+        assert len(result.output()) == 5000
+        target = str(tmpdir.join('out'))
+        result.write_to(target)
+        assert os.path.getsize(target) == 5000
+
+        result = engine.run('head -c 500 /dev/zero', spill_threshold=1000)
+        assert result.output_file is None
+        assert len(result.output()) == 500
+    finally:
+        engine.stop()
+
+
+def test_run_async():
+    """Commands can be awaited from another event loop"""
+    engine = ProcessEngine(4)
+
+    async def run_both():
+        return await asyncio.gather(engine.run_async('echo 1'), engine.run_async('echo 2'))
+
+    try:
+        results = asyncio.new_event_loop().run_until_complete(run_both())
+        assert [result.text() for result in results] == ['1\n', '2\n']
+    finally:
+        engine.stop()
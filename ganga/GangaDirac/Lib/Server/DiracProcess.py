@@ -1,83 +1,164 @@
 #!/usr/bin/env python
+# Long lived server which executes the Ganga DIRAC commands for a Ganga session.
+#
+# Every message in either direction is a frame: a 4 byte big-endian length followed by a pickled payload.
+# The first frame on a connection has to hold the token which was written to our stdin as raw utf-8 bytes rather than
+# pickled, so that nothing is unpickled before the client is known to be our Ganga session. Any other connection is closed.
+# After that the client sends (request_id, cwd, command) frames and gets (request_id, result) frames back. The client
+# doesn't need to wait for a reply before sending the next request, the requests are executed one after the other in
+# the order they arrived and every reply carries the id of its request.
 import sys
 import os
-import errno
 import socket
+import struct
+import pickle
+import hmac
+import threading
 import traceback
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 HOST = 'localhost'  # Standard loopback interface address (localhost)
 PORT = int(sys.argv[1])        # Port to listen on
-rand_hash = raw_input() 
-import time
-#We have to define an output function as a placeholder here.
+rand_hash = sys.stdin.readline().strip()
+# Exit once nothing has been asked of us for 30 minutes
+idle_timeout = 1800
+header = struct.Struct('!I')
+# The token frame is a uuid, anything much longer than that can't be it
+max_token_size = 256
+# Protocol 2 can be read by both python 2 and 3
+pickle_protocol = 2
+
+#We have to define an output function as a placeholder here. The diracCommand wrapper hands the result of a command to it.
 def output(data):
-    pass
-
-#A function to shutdown an existing processes
-def closeSocket():
-    sc = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sc.connect((HOST, PORT))
-    sc.sendall(b'close server')
-    sc.close()
-end_trans = '###END-TRANS###'
-#This is a wrapper for the client sockets
-class socketWrapper(object):
-
-    def __init__(self, skt):
-        self._socket = skt
-
-    def read(self):
-        cmd = ''
-        while end_trans not in cmd:
-            data = self._socket.recv(1024)
-            if not data:
-                cmd = '###BROKEN###'
-                break
-            cmd += data
-        #Check the random string is in the cmd so we know it came from a trusted source.
-        if not rand_hash in cmd:
-            return 'close-connection'
-        if cmd == '###BROKEN###':
-            return ''
-        return_string = cmd.replace(rand_hash, '')
-        return return_string.replace(end_trans, '')
+    _current['output'] = data
+
+_current = {}
+
+
+def recv_exactly(conn, size):
+    """ Read size bytes from conn, returns None if the connection was closed """
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_raw_frame(conn, max_size=None):
+    """ Read one frame from conn and return its payload as bytes, None if the connection was closed or the frame is
+    longer than max_size """
+    head = recv_exactly(conn, header.size)
+    if head is None:
+        return None
+    size = header.unpack(head)[0]
+    if max_size is not None and size > max_size:
+        return None
+    return recv_exactly(conn, size)
+
+
+def recv_frame(conn):
+    """ Read one frame from conn and return its unpickled payload, None if the connection was closed """
+    body = recv_raw_frame(conn)
+    if body is None:
+        return None
+    return pickle.loads(body)
+
+
+def send_frame(conn, payload):
+    """ Pickle payload and send it to conn as one frame """
+    try:
+        body = pickle.dumps(payload, pickle_protocol)
+    except Exception as err:
+        body = pickle.dumps((payload[0], {'OK': False, 'Message': 'Error: could not pickle the result: %s' % err}), pickle_protocol)
+    conn.sendall(header.pack(len(body)) + body)
+
+
+def run_command(cwd, cmd):
+    """ Execute cmd in cwd in the namespace of the DIRAC commands and return what it output """
+    _current.clear()
+    try:
+        if cwd:
+            os.chdir(cwd)
+        try:
+            code = compile(cmd, '<ganga>', 'eval')
+        except SyntaxError:
+            exec(cmd, globals())
+            value = None
+        else:
+            value = eval(code, globals())
+    except Exception:
+        return {'OK': False, 'Message': "Exception raised executing command (cmd) '%s'\n%s" % (cmd, traceback.format_exc())}
+    if 'output' in _current:
+        return _current['output']
+    # Plain expressions which don't go through diracCommand
+    return {'OK': True, 'Value': value}
+
+
+def read_requests(conn, requests):
+    """ Read the requests of a connection and queue them for execution, the end of the connection is queued as None """
+    try:
+        # Check the token before unpickling anything the client sends
+        token = recv_raw_frame(conn, max_token_size)
+        if token is None or not hmac.compare_digest(token, rand_hash.encode('utf-8')):
+            return
+        while True:
+            request = recv_frame(conn)
+            if request is None:
+                return
+            requests.put((conn, request))
+    except (socket.error, EOFError, pickle.UnpicklingError):
+        return
+    finally:
+        requests.put((conn, None))
+
+
+def accept_connections(s, requests):
+    """ Start a reader thread for every connection made to us """
+    while True:
+        try:
+            conn, addr = s.accept()
+        except socket.error:
+            return
+        reader = threading.Thread(target=read_requests, args=(conn, requests))
+        reader.daemon = True
+        reader.start()
 
 #Start the socket
 s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 s.bind((HOST, PORT))
-s.listen(1024)
-#Set 30 minute timeout
-s.settimeout(1800)
+s.listen(16)
+
+requests = queue.Queue()
+acceptor = threading.Thread(target=accept_connections, args=(s, requests))
+acceptor.daemon = True
+acceptor.start()
+
+# The commands are all executed by this thread as they change the working directory of the process
 while True:
     try:
-        conn, addr = s.accept()
-        sock = socketWrapper(conn)
-        cmd = sock.read()
-        #Here we define the output method to just send the output of the diracCommand wrapper.
-        def output(data):
-            conn.sendall(repr(data))
-
-        if cmd=='close-connection':
-            conn.shutdown(socket.SHUT_RDWR)
-            conn.close()
-            continue
-
-        if cmd=='close-server':
-            conn.shutdown(socket.SHUT_RDWR)
-            conn.close()
-            break
-        try:
-            print(eval(cmd))
-        except:
-            try:
-                exec(cmd)
-            except:
-                print("Exception raised executing command (cmd) '%s'\n" % cmd)
-                print(traceback.format_exc())
-
-        conn.sendall('###END-TRANS###')
+        conn, request = requests.get(timeout=idle_timeout)
     #Catch the timeout and exit
-    except socket.timeout:
+    except queue.Empty:
         break
+    if request is None:
+        try:
+            conn.close()
+        except socket.error:
+            pass
+        continue
+    request_id, cwd, cmd = request
+    if cmd == 'close-server':
+        break
+    result = run_command(cwd, cmd)
+    try:
+        send_frame(conn, (request_id, result))
+    except socket.error:
+        pass
 
-s.shutdown(socket.SHUT_RDWR)
 s.close()
@@ -0,0 +1,121 @@
+# Stand-in for DiracDefinition.py and DiracCommands.py which doesn't need DIRAC.
+# Put it in the DiracCommandFiles option instead of them to run the DIRAC server and the code talking to it without a
+# DIRAC installation, e.g. in the tests. The jobs are kept in memory and only have a status which is changed by
+# setLocalJobStatus.
+import os
+import time
+import datetime
+from functools import wraps
+
+# DIRAC id -> DIRAC status, jobs not in here are 'Running'
+local_jobs = {}
+
+def diracCommand(f):
+    '''
+    This wrapper is intended to be used to wrap all 'commands' from the Ganga DIRAC API, as the one in DiracDefinition.py
+    Args:
+        f(function): Function we are wrapping
+    '''
+    @wraps(f)
+    def diracWrapper(*args, **kwargs):
+        ''' This method does the parsing of the wrapped function and it's output '''
+
+        if kwargs.get('pipe_out', True) is False:
+            return f(*args, **kwargs)
+
+        output_dict = {}
+        try:
+            cmd_output = f(*args, **kwargs)
+            if isinstance(cmd_output, dict) and 'OK' in cmd_output and ('Value' in cmd_output or 'Message' in cmd_output):
+                output_dict = cmd_output
+            else:
+                output_dict['OK'] = True
+                output_dict['Value'] = cmd_output
+        except Exception as err:
+            output_dict['OK'] = False
+            output_dict['Message'] = 'Error: %s' % str(err)
+
+        output(output_dict)
+
+    return diracWrapper
+
+
+@diracCommand
+def setLocalJobStatus(job_ids, dirac_status):
+    ''' Set the DIRAC status of the given jobs '''
+    for _id in job_ids:
+        local_jobs[_id] = dirac_status
+    return len(job_ids)
+
+
+@diracCommand
+def getServerInfo():
+    ''' Return the process id of the server and the directory the command was executed in '''
+    return (os.getpid(), os.getcwd())
+
+
+@diracCommand
+def wait(seconds):
+    ''' Keep the server busy for a while '''
+    time.sleep(seconds)
+    return seconds
+
+
+@diracCommand
+def ping(system, service):
+    ''' Ping a given service on a given system running DIRAC '''
+    return {'OK': True, 'Value': {'service': '%s/%s' % (system, service)}}
+
+
+@diracCommand
+def status(job_ids, statusmapping, pipe_out=True):
+    ''' Return [minor status, DIRAC status, site, Ganga status, application status] for each job '''
+    status_list = []
+    for _id in job_ids:
+        dirac_status = local_jobs.get(_id, 'Running')
+        status_list.append([dirac_status, dirac_status, 'LOCAL.local.uk', statusmapping.get(dirac_status, 'failed'), 'unknown ApplicationStatus'])
+    return status_list
+
+
+@diracCommand
+def getStateTime(id, status, pipe_out=True):
+    ''' Every state of the local jobs was entered now '''
+    return datetime.datetime.utcnow().replace(microsecond=0)
+
+
+@diracCommand
+def getBulkStateTime(job_ids, status, pipe_out=True):
+    ''' Call getStateTime for each job '''
+    return dict((_id, getStateTime(_id, status, pipe_out=False)) for _id in job_ids)
+
+
+@diracCommand
+def monitorJobs(job_ids, status_mapping, pipe_out=True):
+    ''' Combines 'status' and 'getBulkStateTime' as in DiracCommands.py '''
+    status_info = status(job_ids, status_mapping, pipe_out=False)
+    state_job_status = {}
+    for job_id, this_stat_info in zip(job_ids, status_info):
+        state_job_status.setdefault(this_stat_info[3], []).append(job_id)
+    state_info = {}
+    for this_status, these_jobs in state_job_status.items():
+        state_info[this_status] = getBulkStateTime(these_jobs, this_status, pipe_out=False)
+    return (status_info, state_info)
+
+
+@diracCommand
+def finaliseJobs(inputDict, statusmapping, downloadSandbox=True, oversized=True, noJobDir=True):
+    ''' Return the finalisation information of the jobs, they have no output '''
+    returnDict = {}
+    statusList = {'OK': True, 'Value': dict((_id, {'Status': local_jobs.get(_id, 'Running')}) for _id in inputDict)}
+    for diracID in inputDict:
+        returnDict[diracID] = {'cpuTime': 0.0,
+                               'outSandbox': {'OK': True, 'Value': []} if downloadSandbox else None,
+                               'outDataInfo': {},
+                               'outStateTime': {'completed': getStateTime(diracID, 'completed', pipe_out=False)}}
+    return returnDict, statusList
+
+
+@diracCommand
+def getReplicasForJobs(lfns):
+    ''' Every LFN has one replica at a local storage element '''
+    return {'OK': True, 'Value': {'Successful': dict((lfn, {'LOCAL-SE': lfn}) for lfn in lfns), 'Failed': {}}}
@@ -105,9 +105,10 @@ def wrapped_execute(command, expected_type, new_subprocess = False):
     Args:
         command (str): This is the command to be exectuted against DIRAC
         expected_type (type): This is the type of the object which is returned from DIRAC
+        new_subprocess (bool): Execute the command in a fresh DIRAC process rather than in one of the DIRAC servers
     """
     try:
-        result = execute(command, new_subprocess)
+        result = execute(command, new_subprocess=new_subprocess)
         assert isinstance(result, expected_type)
     except AssertionError:
         raise SplitterError("Output from DIRAC expected to be of type: '%s', we got the following: '%s'" % (expected_type, result))
@@ -164,7 +165,7 @@ def getLFNReplicas(allLFNs, index, allLFNData):
         this_max = int((index + 1) * LFN_parallel_limit)
 
     try:
-        output = wrapped_execute('getReplicasForJobs(%s)' % str(allLFNs[this_min:this_max]), dict, new_subprocess = True)
+        output = wrapped_execute('getReplicasForJobs(%s)' % str(allLFNs[this_min:this_max]), dict)
     except SplitterError:
         logger.error("Failed to Get Replica Info: [%s:%s] of %s" % (str(this_min), str(this_max), len(allLFNs)))
         raise
@@ -0,0 +1,298 @@
+import os
+import time
+import uuid
+import struct
+import pickle
+import socket
+import itertools
+import threading
+import subprocess
+from concurrent import futures
+from GangaCore.Utility.Config import getConfig
+from GangaCore.Utility.logging import getLogger
+from GangaCore.GPIDev.Credentials import credential_store
+from GangaDirac.Lib.Utilities.DiracUtilities import GangaDiracError, getDiracEnv, getDiracCommandIncludes
+logger = getLogger()
+
+# The frames sent to and from the server are a 4 byte big-endian length followed by the pickled payload, apart from the
+# first one holding the token as raw bytes, see DiracProcess.py
+_header = struct.Struct('!I')
+# Protocol 2 can be read by the server whichever python version the DIRAC environment provides
+_pickle_protocol = 2
+
+HOST = 'localhost'
+
+# Cache
+# /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
+_server_pools = {}
+_server_pools_lock = threading.Lock()
+# /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
+
+
+def _recv_exactly(sock, size):
+    """
+    Read exactly size bytes from the socket
+    Args:
+        sock (socket): The connection to the server
+        size (int): The number of bytes to read
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise socket.error("Connection to the DIRAC server was closed")
+        data += chunk
+    return data
+
+
+def _send_raw_frame(sock, body):
+    """
+    Send one frame holding body as it is
+    Args:
+        sock (socket): The connection to the server
+        body (bytes): What to send
+    """
+    sock.sendall(_header.pack(len(body)) + body)
+
+
+def _send_frame(sock, payload):
+    """
+    Send one frame holding the pickled payload
+    Args:
+        sock (socket): The connection to the server
+        payload (object): What to send
+    """
+    _send_raw_frame(sock, pickle.dumps(payload, _pickle_protocol))
+
+
+def _recv_frame(sock):
+    """
+    Read one frame and return its unpickled payload. latin1 is needed for datetime objects pickled by python 2
+    Args:
+        sock (socket): The connection to the server
+    """
+    size = _header.unpack(_recv_exactly(sock, _header.size))[0]
+    return pickle.loads(_recv_exactly(sock, size), encoding='latin1')
+
+
+class DiracServerProcess(object):
+    """
+    A DIRAC server subprocess running DiracProcess.py and the persistent connection to it.
+    Requests are pipelined: submit() sends the request straight away and returns a Future which is completed by the
+    reader thread once the reply with the matching request id arrives, so any number of requests can be in flight.
+    """
+
+    def __init__(self, env):
+        """
+        Start the server in the given environment and load the DIRAC commands into it
+        Args:
+            env (dict): The DIRAC environment to run the server in, including the proxy to use
+        """
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._sock = None
+        self._closed = False
+
+        #Create a socket and bind it to 0 to find a free port
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind((HOST, 0))
+        self.port = s.getsockname()[1]
+        s.close()
+
+        #Now set a random string to make sure only commands from this sessions are executed
+        token = str(uuid.uuid4())
+        serverpath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Server', 'DiracProcess.py')
+        self._process = subprocess.Popen(['python', serverpath, str(self.port)], env=env, stdin=subprocess.PIPE)
+        self._process.stdin.write(('%s\n' % token).encode('utf-8'))
+        self._process.stdin.close()
+
+        #We have to wait a little bit for the subprocess to start the server so we try until the connection stops being refused. Set a limit of one minute.
+        connection_timeout = time.time() + 60
+        while self._sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                sock.connect((HOST, self.port))
+                self._sock = sock
+            except socket.error:
+                sock.close()
+                if time.time() > connection_timeout or self._process.poll() is not None:
+                    self._process.kill()
+                    raise GangaDiracError("Failed to start the Dirac server process!")
+                time.sleep(0.1)
+
+        _send_raw_frame(self._sock, token.encode('utf-8'))
+        self._reader = threading.Thread(target=self._read_replies, name='DiracServer_%s' % self.port)
+        self._reader.daemon = True
+        self._reader.start()
+
+        #Now setup the Dirac environment in the subprocess
+        try:
+            setup = self.submit(None, getDiracCommandIncludes()).result(getConfig('DIRAC')['Timeout'])
+        except futures.TimeoutError:
+            setup = {'OK': False, 'Message': 'Timed out'}
+        if not setup.get('OK', False):
+            self.stop()
+            raise GangaDiracError("Failed to set up the Dirac server process: %s" % setup.get('Message'))
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def isAlive(self):
+        """ Can this server still take requests """
+        return not self._closed and self._process.poll() is None
+
+    def inFlight(self):
+        """ The number of requests which haven't been answered yet """
+        return len(self._pending)
+
+    def submit(self, cwd, command):
+        """
+        Send a command to the server and return a Future for its result, the dict which DIRAC commands return
+        Args:
+            cwd (str): The directory the command is to be executed in, None to stay where the last command left off
+            command (str): The command to be executed in the DIRAC session
+        """
+        future = futures.Future()
+        with self._lock:
+            if not self.isAlive():
+                raise GangaDiracError("The Dirac server process has stopped")
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            try:
+                _send_frame(self._sock, (request_id, cwd, command))
+            except socket.error as err:
+                del self._pending[request_id]
+                self._closed = True
+                raise GangaDiracError("Failed to send the command to the Dirac server process: %s" % err)
+        return future
+
+    def _read_replies(self):
+        """ Hand the replies from the server to the Futures of their requests until the connection goes away """
+        try:
+            while True:
+                request_id, result = _recv_frame(self._sock)
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is not None:
+                    future.set_result(result)
+        except Exception as err:
+            if not self._closed:
+                logger.debug("Connection to the Dirac server process %s lost: %s" % (self.pid, err))
+        finally:
+            with self._lock:
+                self._closed = True
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(GangaDiracError("The Dirac server process stopped before replying"))
+
+    def stop(self):
+        """ Shut the server down, requests which are still in flight fail """
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+            self._sock.close()
+        except socket.error:
+            pass
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+
+class DiracServerPool(object):
+    """
+    A small pool of DIRAC server processes sharing one environment, i.e. one credential.
+    Commands go to the server with the fewest requests in flight, a new server is only started when all of them are busy
+    and the pool isn't full yet. Servers which have died are replaced on the next request.
+    """
+
+    def __init__(self, env, size):
+        """
+        Args:
+            env (dict): The DIRAC environment the servers run in
+            size (int): The maximum number of servers
+        """
+        self._env = env
+        self._size = max(int(size), 1)
+        self._servers = []
+        self._lock = threading.Lock()
+
+    def _getServer(self):
+        """ Return the server to send the next command to, starting one if needed """
+        with self._lock:
+            self._servers = [server for server in self._servers if server.isAlive()]
+            idle = [server for server in self._servers if server.inFlight() == 0]
+            if idle:
+                return idle[0]
+            if len(self._servers) < self._size:
+                server = DiracServerProcess(self._env)
+                logger.debug("Started Dirac server process %s" % server.pid)
+                self._servers.append(server)
+                return server
+            return min(self._servers, key=lambda server: server.inFlight())
+
+    def execute(self, command, cwd=None, timeout=None):
+        """
+        Execute a command in one of the servers and wait for its result
+        Args:
+            command (str): The command to be executed in the DIRAC session
+            cwd (str): The directory the command is executed in
+            timeout (int): Seconds to wait for the result, a server which doesn't answer in time is stopped
+        """
+        server = self._getServer()
+        future = server.submit(cwd, command)
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            logger.debug("Stopping the Dirac server process %s as a command timed out" % server.pid)
+            server.stop()
+            raise GangaDiracError("DIRAC command timed out")
+
+    def start(self):
+        """ Make sure that at least one server is running """
+        self._getServer()
+
+    def stop(self):
+        """ Stop all the servers of this pool """
+        with self._lock:
+            for server in self._servers:
+                server.stop()
+            self._servers = []
+
+    def pids(self):
+        """ The process ids of the running servers """
+        return [server.pid for server in self._servers if server.isAlive()]
+
+
+def getDiracServerPool(cred_req=None):
+    """
+    Returns the pool of DIRAC servers for the given credential, creating it if needed
+    Args:
+        cred_req (ICredentialRequirement): The credential the commands need, None for the default DIRAC environment
+    """
+    if cred_req is None:
+        key = (None, None)
+    else:
+        key = (cred_req.dirac_env, credential_store[cred_req].location)
+    with _server_pools_lock:
+        if key not in _server_pools:
+            if cred_req is None:
+                env = dict(getDiracEnv())
+            else:
+                env = dict(getDiracEnv(cred_req.dirac_env))
+                env['X509_USER_PROXY'] = key[1]
+                if os.getenv('KRB5CCNAME'):
+                    env['KRB5CCNAME'] = os.getenv('KRB5CCNAME')
+            _server_pools[key] = DiracServerPool(env, getConfig('DIRAC')['DiracServerProcesses'])
+        return _server_pools[key]
+
+
+def stopDiracServers():
+    """ Stop all the DIRAC server processes of this session """
+    with _server_pools_lock:
+        if _server_pools:
+            logger.info('Stopping the DIRAC processes')
+        for pool in _server_pools.values():
+            pool.stop()
+        _server_pools.clear()
@@ -6,8 +6,6 @@ import tempfile
 import shutil
 import json
 import time
-import socket
-import re
 from copy import deepcopy
 from GangaCore.Utility.Config import getConfig
 from GangaCore.Utility.logging import getLogger
@@ -23,7 +21,6 @@ DIRAC_ENV = {}
 DIRAC_INCLUDE = ''
 Dirac_Env_Lock = threading.Lock()
 Dirac_Proxy_Lock = threading.Lock()
-Dirac_Exec_Lock = threading.Lock()
 # /\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\/\
 
 class GangaDiracError(GangaException):
@@ -153,6 +150,7 @@ def getDiracCommandIncludes(force=False):
     global DIRAC_INCLUDE
     with Dirac_Env_Lock:
         if DIRAC_INCLUDE == '' or force:
+            DIRAC_INCLUDE = ''
             for fname in getConfig('DIRAC')['DiracCommandFiles']:
                 if not os.path.exists(fname):
                     raise RuntimeError("Specified Dirac command file '%s' does not exist." % fname)
@@ -207,7 +205,8 @@ def execute(command,
     """
     Execute a command on the local DIRAC server.
 
-    This function blocks until the server returns.
+    This function blocks until the server returns. The servers are kept running and other threads can have their
+    commands executed at the same time, see DiracServer.py
     
     Args:
         command (str): This is the command we're running within our DIRAC session
@@ -220,7 +219,7 @@ def execute(command,
         update_env (bool): Should this modify the given env object with the env after the command has executed
         return_raw_dict(bool): Should we return the raw dict from the DIRAC interface or parse it here
         cred_req (ICredentialRequirement): What credentials does this call need
-        new_subprocess(bool): Do we want to do this in a fresh subprocess or just connect to the DIRAC server process?
+        new_subprocess(bool): Do we want to do this in a fresh subprocess or just send it to one of the DIRAC server processes?
     """
 
     if cwd is None:
@@ -231,44 +230,10 @@ def execute(command,
         # We know were whe want to run, lets just run there
         cwd_ = cwd
 
-    from GangaDirac.BOOT import startDiracProcess
     returnable = ''
     if not new_subprocess:
-        with Dirac_Exec_Lock:
-            # First check if a Dirac process is running
-            from GangaDirac.BOOT import running_dirac_process
-            if not running_dirac_process:
-                startDiracProcess()
-            #Set up a socket to connect to the process
-            from GangaDirac.BOOT import dirac_process_ids
-            HOST = 'localhost'  # The server's hostname or IP address
-            PORT = dirac_process_ids[1]        # The port used by the server
-
-            #Put inside a try/except in case the existing process has timed out
-            try:
-                s= socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.connect((HOST, PORT))
-            except socket.error as serr:
-                #Start a new process
-                startDiracProcess()
-                from GangaDirac.BOOT import dirac_process_ids
-                PORT = dirac_process_ids[1]
-                s= socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.connect((HOST, PORT))
-
-            #Send a random string, then change the directory to carry out the command, then send the command
-            command_to_send  = str(dirac_process_ids[2])
-            command_to_send += 'os.chdir("%s")\n' % cwd_
-            command_to_send += command
-            s.sendall(('%s###END-TRANS###' % command_to_send).encode('utf-8'))
-            out = ''
-            while '###END-TRANS###' not in out:
-                data = s.recv(1024)
-                out += data.decode("utf-8")
-            s.close()
-            #Some regex nonsense to deal with the long representations in python 3
-            out = re.sub(r'((?:^|\s|,|{|\()\d+)L([^A-Za-z0-9\"\'])', r'\1\2', out)
-            returnable = eval(out)
+        from GangaDirac.Lib.Utilities.DiracServer import getDiracServerPool
+        returnable = getDiracServerPool(cred_req).execute(command, cwd=cwd_, timeout=timeout)
 
     else:
         if env is None:
@@ -35,6 +35,8 @@ if not _after_bootstrap:
                                                 os.path.join(os.path.dirname(__file__), 'Lib/Server/DiracCommands.py')],
                       'The file containing the python commands that the local DIRAC server can execute. The default DiracCommands.py is added automatically')
 
+    configDirac.addOption('DiracServerProcesses', 2, 'The maximum number of DIRAC server processes which are kept running per credential to execute DIRAC commands. More are only started when the running ones are all busy')
+
     configDirac.addOption('noInputDataBannedSites', [],
                       'List of sites to ban when a user job has no input data (this is meant to reduce the load on these sites)')
 
@@ -0,0 +1,105 @@
+import os
+import threading
+
+import pytest
+
+from GangaCore.testlib.GangaUnitTest import load_config_files, clear_config
+
+
+@pytest.yield_fixture(scope='module', autouse=True)
+def config_files():
+    """
+    Load the config files and have the DIRAC servers use the local stand-in commands
+    """
+    from GangaCore.Utility.Config import getConfig
+    from GangaDirac.Lib.Utilities.DiracUtilities import getDiracCommandIncludes
+    load_config_files()
+    local_commands = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'Lib', 'Server', 'LocalCommands.py')
+    getConfig('DIRAC').setSessionValue('DiracCommandFiles', [os.path.normpath(local_commands)])
+    getDiracCommandIncludes(force=True)
+    yield
+    clear_config()
+    getDiracCommandIncludes(force=True)
+
+
+@pytest.yield_fixture(scope='module')
+def pool():
+    from GangaDirac.Lib.Utilities.DiracServer import DiracServerPool
+    this_pool = DiracServerPool(dict(os.environ), 2)
+    yield this_pool
+    this_pool.stop()
+
+
+def test_execute(pool, tmpdir):
+    """Commands are executed in the given directory and return the dict of the diracCommand wrapper"""
+    pid, cwd = pool.execute('getServerInfo()', cwd=str(tmpdir))['Value']
+    assert cwd == str(tmpdir)
+    assert pid in pool.pids()
+
+    pool.execute('setLocalJobStatus([1, 2], "Done")')
+    statusmapping = {'Done': 'completed', 'Running': 'running'}
+    status_info, state_info = pool.execute('monitorJobs([1, 2, 3], %r)' % statusmapping)['Value']
+    assert [s[3] for s in status_info] == ['completed', 'completed', 'running']
+    assert sorted(state_info['completed']) == [1, 2]
+
+    result = pool.execute('undefinedCommand()')
+    assert not result['OK']
+    assert 'NameError' in result['Message']
+
+
+def test_pipelined_requests(pool):
+    """Requests from several threads are spread over the servers of the pool and can be in flight at the same time"""
+    results = {}
+
+    def run(i):
+        results[i] = pool.execute('wait(0.2)')['Value']
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == dict((i, 0.2) for i in range(8))
+    assert len(pool.pids()) == 2
+
+
+def test_timeout_restarts_server(pool):
+    """A server which doesn't answer in time is replaced"""
+    from GangaDirac.Lib.Utilities.DiracUtilities import GangaDiracError
+    with pytest.raises(GangaDiracError):
+        pool.execute('wait(5)', timeout=0.5)
+    assert pool.execute('ping("WorkloadManagement", "JobManager")')['OK']
+
+
+class MakeDir(object):
+    """Unpickling this creates a directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (os.mkdir, (self.path,))
+
+
+def test_token_checked_before_unpickling(pool, tmpdir):
+    """A connection which doesn't start with the raw token is closed without unpickling what it sent"""
+    import pickle
+    import socket
+    from GangaDirac.Lib.Utilities.DiracServer import HOST, _send_frame
+
+    pool.execute('getServerInfo()')
+    target = str(tmpdir.join('unpickled'))
+    sock = socket.create_connection((HOST, pool._servers[0].port))
+    try:
+        _send_frame(sock, MakeDir(target))
+        _send_frame(sock, (0, None, 'getServerInfo()'))
+        sock.settimeout(10)
+        try:
+            closed = sock.recv(1) == b''
+        except ConnectionResetError:
+            closed = True
+        assert closed
+    finally:
+        sock.close()
+    assert not os.path.exists(target)